@@ -0,0 +1,185 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The order in which ready jobs are handed out to the clients.
+
+Jobs are always handed out by recipe priority first. Jobs with the same
+priority are handed out in the order of ReadyJob.dispatch_time, which
+the policy sets when the job goes into the ready queue.
+The policy is set with settings.DISPATCH_POLICY:
+  "fifo": Jobs are handed out in the order they were created.
+  "shortest_first": Jobs that are expected to be short are handed out first.
+    The expected runtime of a job is the rolling average of the runtimes
+    of previous jobs with the same recipe file and build config (see JobRuntime).
+    A job is handed out as if it had been created its expected runtime times
+    settings.DISPATCH_SHORTEST_FIRST_WEIGHT later, but no more than
+    settings.DISPATCH_MAX_DELAY later. So a long job only has to wait for
+    short jobs created up to that long after it and can't be starved.
+    Jobs without any history are handed out in the order they were created.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.conf import settings
+from django.db import transaction
+from datetime import timedelta
+from ci import models
+import logging
+logger = logging.getLogger('ci')
+
+# Weight of the newest runtime in the rolling average of the runtimes
+RUNTIME_WEIGHT = 0.2
+
+# Statuses of the jobs whose runtime is used. Canceled jobs didn't run all the way.
+RUNTIME_STATUS = [models.JobStatus.SUCCESS, models.JobStatus.FAILED, models.JobStatus.FAILED_OK,
+        models.JobStatus.INTERMITTENT_FAILURE]
+
+class FifoPolicy(object):
+    """
+    Hands out the jobs in the order that they were created.
+    """
+    name = "fifo"
+    # Whether dispatch_time() needs the expected runtimes
+    uses_runtimes = False
+
+    def delay(self, expected_seconds):
+        """
+        How much later than its creation a job is handed out.
+        Input:
+          expected_seconds[float]: Expected runtime of the job, None if it isn't known
+        Return:
+          float: Number of seconds
+        """
+        return 0
+
+    def dispatch_time(self, job, runtimes=None):
+        """
+        Get the time that orders a job in the ready queue.
+        Input:
+          job[models.Job]: The job
+          runtimes[dict]: Expected runtimes as returned by load_runtimes(). If None they are read as needed.
+        Return:
+          datetime
+        """
+        return job.created
+
+class ShortestFirstPolicy(FifoPolicy):
+    """
+    Hands out the jobs that are expected to be short first.
+    """
+    name = "shortest_first"
+    uses_runtimes = True
+
+    def __init__(self, weight=1.0, max_delay=2*60*60):
+        """
+        Input:
+          weight[float]: Number of seconds a job is held back for each second of expected runtime
+          max_delay[float]: Max number of seconds that a job is held back
+        """
+        self.weight = weight
+        self.max_delay = max_delay
+
+    def delay(self, expected_seconds):
+        if expected_seconds is None:
+            return 0
+        return min(expected_seconds * self.weight, self.max_delay)
+
+    def dispatch_time(self, job, runtimes=None):
+        delay = self.delay(expected_seconds(job, runtimes))
+        return job.created + timedelta(seconds=delay)
+
+def create_policy(name):
+    """
+    Input:
+      name[str]: Name of the policy
+    Return:
+      The policy
+    """
+    if name == ShortestFirstPolicy.name:
+        return ShortestFirstPolicy(settings.DISPATCH_SHORTEST_FIRST_WEIGHT, settings.DISPATCH_MAX_DELAY)
+    if name != FifoPolicy.name:
+        logger.warning('Unknown DISPATCH_POLICY "%s"; using "%s"' % (name, FifoPolicy.name))
+    return FifoPolicy()
+
+def get_policy():
+    """
+    Get the policy set in settings.DISPATCH_POLICY.
+    """
+    return create_policy(getattr(settings, "DISPATCH_POLICY", FifoPolicy.name))
+
+def policy_settings():
+    """
+    Return:
+      dict: The settings that affect the order of the ready queue
+    """
+    return {"policy": getattr(settings, "DISPATCH_POLICY", FifoPolicy.name),
+            "weight": getattr(settings, "DISPATCH_SHORTEST_FIRST_WEIGHT", None),
+            "max_delay": getattr(settings, "DISPATCH_MAX_DELAY", None),
+            }
+
+def load_runtimes():
+    """
+    Read all the expected runtimes at once.
+    Return:
+      dict: (recipe filename, build config id) -> expected seconds
+    """
+    return {(r.filename, r.config_id): r.seconds for r in models.JobRuntime.objects.all()}
+
+def expected_seconds(job, runtimes=None):
+    """
+    Get the expected runtime of a job.
+    Input:
+      job[models.Job]: The job
+      runtimes[dict]: As returned by load_runtimes(). If None then it is read from the database.
+    Return:
+      float: Number of seconds, or None if there aren't any previous runs
+    """
+    if runtimes is not None:
+        return runtimes.get((job.recipe.filename, job.config_id))
+    runtime = models.JobRuntime.objects.filter(filename=job.recipe.filename, config_id=job.config_id).first()
+    return runtime.seconds if runtime else None
+
+def rolling_average(average, count, seconds):
+    """
+    Add a runtime to a rolling average.
+    Until there are enough runtimes this is just the average of them.
+    Input:
+      average[float]: The current average
+      count[int]: Number of runtimes in the current average
+      seconds[float]: The new runtime
+    Return:
+      float: The new average
+    """
+    weight = max(1.0 / (count + 1), RUNTIME_WEIGHT)
+    return average + weight * (seconds - average)
+
+@transaction.atomic
+def record_runtime(job):
+    """
+    Add the runtime of a finished job to the expected runtime of its recipe file and build config.
+    Input:
+      job[models.Job]: The finished job
+    """
+    if not job.complete or job.status not in RUNTIME_STATUS or not job.recipe.filename:
+        return
+    seconds = job.seconds.total_seconds()
+    if seconds <= 0:
+        return
+    runtime, created = (models.JobRuntime.objects
+            .select_for_update()
+            .get_or_create(filename=job.recipe.filename, config_id=job.config_id,
+                defaults={'seconds': seconds, 'count': 1}))
+    if not created:
+        runtime.seconds = rolling_average(runtime.seconds, runtime.count, seconds)
+        runtime.count += 1
+        runtime.save()
@@ -0,0 +1,177 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Replays past jobs to compare the dispatch policies (see DispatchPolicy).
+
+The finished jobs in a time range are loaded with their runtimes and the
+dependencies between the jobs of each event. The simulation then hands
+them out to a fixed number of clients for each build config:
+  - A job is ready when it was created and all the jobs it depends on
+    have finished. It then gets a dispatch time from the policy.
+  - A free client takes the ready job for its config with the highest
+    priority and the earliest dispatch time, and runs it for as long as
+    it took in real life.
+  - The expected runtimes start out empty and are learned from the jobs
+    that finish during the simulation, so the policy doesn't get to see
+    the future.
+The turnaround of an event is the time from its first job being created
+to its last job finishing.
+"""
+from __future__ import unicode_literals, absolute_import
+from ci import models, DispatchPolicy
+import heapq
+import itertools
+
+class SimJob(object):
+    """
+    A job being replayed.
+    """
+    def __init__(self, pk, event_id, is_pr, config_id, filename, priority, created, seconds, client_id=None):
+        self.pk = pk
+        self.event_id = event_id
+        self.is_pr = is_pr
+        self.config_id = config_id
+        self.filename = filename
+        self.priority = priority
+        # Seconds since the epoch
+        self.created = created
+        self.seconds = seconds
+        self.client_id = client_id
+        self.depends_on = []
+        self.dependents = []
+
+def load_history(since, until=None):
+    """
+    Load the finished jobs created in a time range.
+    Input:
+      since[datetime]: Start of the range
+      until[datetime]: End of the range. Defaults to now.
+    Return:
+      list[SimJob]: The jobs, in the order they were created
+    """
+    jobs = (models.Job.objects
+            .filter(created__gte=since, complete=True, status__in=DispatchPolicy.RUNTIME_STATUS)
+            .select_related('recipe', 'event')
+            .prefetch_related('recipe__depends_on')
+            .order_by('created'))
+    if until is not None:
+        jobs = jobs.filter(created__lt=until)
+
+    sim_jobs = []
+    by_event = {}
+    for job in jobs:
+        sim_job = SimJob(job.pk, job.event_id, job.event.cause == models.Event.PULL_REQUEST,
+                job.config_id, job.recipe.filename, job.recipe.priority,
+                job.created.timestamp(), job.seconds.total_seconds(), job.client_id)
+        sim_jobs.append(sim_job)
+        by_event.setdefault(job.event_id, []).append((job, sim_job))
+
+    # Same as JobGraph but only with the jobs that were loaded
+    for event_jobs in by_event.values():
+        by_filename = {}
+        for job, sim_job in event_jobs:
+            by_filename.setdefault(job.recipe.filename, []).append(sim_job)
+        for job, sim_job in event_jobs:
+            for r in job.recipe.depends_on.all():
+                for dep in by_filename.get(r.filename, []):
+                    if dep is not sim_job:
+                        sim_job.depends_on.append(dep)
+                        dep.dependents.append(sim_job)
+    return sim_jobs
+
+def count_clients(jobs):
+    """
+    Count the clients that ran the jobs of each build config.
+    Input:
+      jobs[list[SimJob]]: The jobs
+    Return:
+      dict: build config id -> number of clients, at least 1
+    """
+    clients = {}
+    for job in jobs:
+        config_clients = clients.setdefault(job.config_id, set())
+        if job.client_id is not None:
+            config_clients.add(job.client_id)
+    return {config_id: max(len(ids), 1) for config_id, ids in clients.items()}
+
+def simulate(jobs, policy, clients):
+    """
+    Replay the jobs with a dispatch policy.
+    Input:
+      jobs[list[SimJob]]: The jobs, as returned by load_history()
+      policy: The dispatch policy
+      clients[dict]: build config id -> number of clients
+    Return:
+      dict: event id -> turnaround seconds
+    """
+    runtimes = {}
+    free_clients = dict(clients)
+    ready = {config_id: [] for config_id in clients}
+    remaining_deps = {job: len(set(job.depends_on)) for job in jobs}
+    event_start = {}
+    event_end = {}
+    seq = itertools.count()
+    # (time, order, seq, job): order 0 is a job finishing, 1 is a job being created
+    timeline = []
+    for job in jobs:
+        event_start[job.event_id] = min(event_start.get(job.event_id, job.created), job.created)
+        heapq.heappush(timeline, (job.created, 1, next(seq), job))
+
+    def make_ready(job):
+        expected = runtimes.get((job.filename, job.config_id), (None, 0))[0]
+        dispatch_time = job.created + policy.delay(expected)
+        heapq.heappush(ready.setdefault(job.config_id, []), (-job.priority, dispatch_time, job.created, next(seq), job))
+
+    while timeline:
+        now, order, _, job = heapq.heappop(timeline)
+        if order == 0:
+            free_clients[job.config_id] = free_clients.get(job.config_id, 0) + 1
+            event_end[job.event_id] = max(event_end.get(job.event_id, now), now)
+            average, count = runtimes.get((job.filename, job.config_id), (job.seconds, 0))
+            if count:
+                average = DispatchPolicy.rolling_average(average, count, job.seconds)
+            runtimes[(job.filename, job.config_id)] = (average, count + 1)
+            for dependent in set(job.dependents):
+                remaining_deps[dependent] -= 1
+                if remaining_deps[dependent] == 0 and dependent.created <= now:
+                    make_ready(dependent)
+        elif remaining_deps[job] == 0:
+            make_ready(job)
+
+        # Don't hand out jobs until everything that happens at this time is done
+        if timeline and timeline[0][0] == now:
+            continue
+        for config_id, queue in ready.items():
+            while queue and free_clients.get(config_id, 0) > 0:
+                next_job = heapq.heappop(queue)[-1]
+                free_clients[config_id] -= 1
+                heapq.heappush(timeline, (now + next_job.seconds, 0, next(seq), next_job))
+
+    return {event_id: event_end[event_id] - start for event_id, start in event_start.items() if event_id in event_end}
+
+def mean_turnaround(jobs, turnarounds, pr_only=True):
+    """
+    Input:
+      jobs[list[SimJob]]: The jobs that were simulated
+      turnarounds[dict]: As returned by simulate()
+      pr_only[bool]: Only include pull request events
+    Return:
+      float: Mean turnaround in seconds, or None if there aren't any events
+    """
+    event_ids = set(job.event_id for job in jobs if job.is_pr or not pr_only)
+    values = [turnarounds[event_id] for event_id in event_ids if event_id in turnarounds]
+    if not values:
+        return None
+    return sum(values) / len(values)
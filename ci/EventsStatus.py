@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from ci import TimeUtils, models
+from ci import TimeUtils, models, Heartbeat
 from django.urls import reverse
 from django.utils.html import format_html, mark_safe
 from django.db.models import Prefetch
@@ -71,11 +71,10 @@ def get_single_event_for_open_prs(open_prs, last_modified=None, filter_repo_ids=
     prs = models.PullRequest.objects.filter(pk__in=open_prs)
     if filter_repo_ids is not None:
         prs = prs.filter(repository__id__in=filter_repo_ids)
-    evs = []
-    for pr in prs.all():
-        ev = pr.events.order_by('-created').first()
-        if not last_modified or ev.last_modified >= last_modified:
-            evs.append(ev)
+    evs = [pr.events.order_by('-created').first() for pr in prs.all()]
+    if last_modified:
+        times = Heartbeat.last_modified_many(evs)
+        evs = [ev for ev, t in zip(evs, times) if t >= last_modified]
     return sorted(evs, key=lambda obj: obj.created)
 
 def events_with_head(event_q=None, filter_repo_ids=None):
@@ -164,10 +163,11 @@ def events_info(events, last_modified=None, events_url=False):
       list of event info dicts
     """
     event_info = []
+    if last_modified:
+        events = list(events)
+        times = Heartbeat.last_modified_many(events)
+        events = [ev for ev, t in zip(events, times) if t > last_modified]
     for ev in events:
-        if last_modified and ev.last_modified <= last_modified:
-            continue
-
         repo_url = reverse("ci:view_repo", args=[ev.base.branch.repository.pk])
         event_url = reverse("ci:view_event", args=[ev.pk])
         repo_link = format_html('<a href="{}">{}</a>', repo_url, ev.base.branch.repository.name)
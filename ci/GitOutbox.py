@@ -0,0 +1,276 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Outbox for the updates that we send to the Git servers.
+
+The updates caused by the clients (commit statuses, PR comments, labels, etc)
+used to be sent while handling the request from the client, so a slow Git
+server slowed down the clients. If settings.GIT_SERVER_OUTBOX is set, the
+API returned by api() stores these calls as models.GitServerUpdate records
+instead and the "git_outbox" management command sends them with drain().
+Failed updates are retried with an increasing delay.
+More than one "git_outbox" process can run. An update is claimed before it
+is sent so that it only gets sent once.
+Updates that replace each other, like the status of a commit/context, share
+a key and only the latest pending one is kept.
+Calls that just read from the Git server are still done right away, except
+for the ones that are part of editing a comment. Finding the comment
+and then editing or posting it is stored as one update, see edit_comment().
+"""
+from __future__ import unicode_literals, absolute_import
+from django.apps import apps
+from django.conf import settings
+from django.db import models as db_models
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from ci import models
+import hashlib
+import json
+import traceback
+import logging
+logger = logging.getLogger('ci')
+
+# Max number of updates to send in one call to drain()
+BATCH_SIZE = 100
+# Number of times an update is tried before giving up
+MAX_ATTEMPTS = 8
+# Waits 5, 10, 20... seconds between tries
+RETRY_BACKOFF = 5
+RETRY_MAX_WAIT = 10*60
+# Seconds before an update that was claimed but never sent, because the
+# process sending it died, can be claimed again
+CLAIM_TIMEOUT = 10*60
+
+# The methods of GitAPI that can be stored
+QUEUED_METHODS = ["update_status",
+        "pr_comment",
+        "add_pr_label",
+        "remove_pr_label",
+        "create_or_update_issue",
+        "automerge",
+        "pr_review_comment",
+        ]
+
+# The functions of ProcessCommands that can be stored. They get the GitAPI as the first argument.
+COMMENT_METHODS = ["edit_comment",
+        "ensure_single_new_comment",
+        ]
+
+def _make_key(*parts):
+    return hashlib.sha1(":".join([str(p) for p in parts]).encode("utf-8")).hexdigest()
+
+def _encode(arg):
+    if isinstance(arg, db_models.Model):
+        return {"model": arg._meta.label, "pk": arg.pk}
+    return arg
+
+def _decode(arg):
+    if isinstance(arg, dict) and set(arg.keys()) == set(["model", "pk"]):
+        return apps.get_model(arg["model"]).objects.get(pk=arg["pk"])
+    return arg
+
+def enqueue(build_user, method, args, key=""):
+    """
+    Store a call to the Git server API.
+    Input:
+      build_user[models.GitUser]: The user whose API is used
+      method[str]: Name of the GitAPI method
+      args[list]: Arguments of the method. Model instances are stored by their pk.
+      key[str]: If set, any pending updates with the same key are replaced
+    Return:
+      models.GitServerUpdate
+    """
+    data = json.dumps([_encode(arg) for arg in args])
+    with transaction.atomic():
+        if key:
+            models.GitServerUpdate.objects.filter(build_user=build_user, key=key).delete()
+        return models.GitServerUpdate.objects.create(build_user=build_user, method=method, args=data, key=key)
+
+class OutboxAPI(object):
+    """
+    Wraps a GitAPI. The calls that update the Git server get stored
+    and everything else goes to the GitAPI.
+    """
+    def __init__(self, build_user):
+        self._build_user = build_user
+        self._api = build_user.api()
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    def update_status(self, base, head, state, event_url, description, context, job_stage):
+        key = _make_key("status", base.branch.repository_id, head.sha, context)
+        enqueue(self._build_user, "update_status",
+                [base, head, state, event_url, description, context, job_stage], key)
+
+    def pr_comment(self, url, msg):
+        enqueue(self._build_user, "pr_comment", [url, msg])
+
+    def pr_review_comment(self, url, sha, filepath, position, msg):
+        enqueue(self._build_user, "pr_review_comment", [url, sha, filepath, position, msg])
+
+    def add_pr_label(self, repo, pr_num, label_name):
+        key = _make_key("label", repo.pk, pr_num, label_name)
+        enqueue(self._build_user, "add_pr_label", [repo, pr_num, label_name], key)
+
+    def remove_pr_label(self, repo, pr_num, label_name):
+        key = _make_key("label", repo.pk, pr_num, label_name)
+        enqueue(self._build_user, "remove_pr_label", [repo, pr_num, label_name], key)
+
+    def create_or_update_issue(self, owner, repo, title, body, new_comment):
+        key = ""
+        if not new_comment:
+            key = _make_key("issue", owner, repo, title)
+        enqueue(self._build_user, "create_or_update_issue", [owner, repo, title, body, new_comment], key)
+
+    def automerge(self, repo, pr_num):
+        key = _make_key("automerge", repo.pk, pr_num)
+        enqueue(self._build_user, "automerge", [repo, pr_num], key)
+
+def api(build_user):
+    """
+    Get the API to use for updating the Git server.
+    Input:
+      build_user[models.GitUser]: The user whose API is used
+    Return:
+      OutboxAPI if settings.GIT_SERVER_OUTBOX is set, else the GitAPI of the user
+    """
+    if settings.GIT_SERVER_OUTBOX:
+        return OutboxAPI(build_user)
+    return build_user.api()
+
+def _comment(method, build_user, url, msg, comment_re):
+    from ci.client import ProcessCommands
+    if settings.GIT_SERVER_OUTBOX:
+        key = _make_key("comment", build_user.pk, url, comment_re)
+        enqueue(build_user, method, [build_user, url, msg, comment_re], key)
+    else:
+        getattr(ProcessCommands, method)(build_user.api(), build_user, url, msg, comment_re)
+
+def edit_comment(build_user, url, msg, comment_re):
+    """
+    Replace the comment matching comment_re with msg, or post it if there isn't one.
+    See ProcessCommands.edit_comment().
+    If settings.GIT_SERVER_OUTBOX is set, looking for the comment is done when
+    the update is sent, not when it is stored, and only the latest pending
+    one for a comment is kept. Otherwise two of them stored before either
+    was sent would both find no comment and both post one.
+    Input:
+      build_user[models.GitUser]: The user whose API is used
+      url[str]: URL of the comments
+      msg[str]: The comment
+      comment_re[str]: Regular expression that matches the comment
+    """
+    _comment("edit_comment", build_user, url, msg, comment_re)
+
+def ensure_single_new_comment(build_user, url, msg, comment_re):
+    """
+    Post a comment and remove the ones matching comment_re.
+    See ProcessCommands.ensure_single_new_comment() and edit_comment().
+    """
+    _comment("ensure_single_new_comment", build_user, url, msg, comment_re)
+
+def _retry(update, error):
+    """
+    Try the update again later, or give up if it has been tried too many times.
+    This uses update() instead of save() so that an update that got
+    replaced while we were sending it doesn't come back.
+    """
+    attempts = update.attempts + 1
+    q = models.GitServerUpdate.objects.filter(pk=update.pk)
+    if attempts >= MAX_ATTEMPTS:
+        logger.warning("Giving up on %s after %s attempts:\n%s" % (update, attempts, error))
+        q.delete()
+        return
+    wait = min(RETRY_MAX_WAIT, RETRY_BACKOFF*2**(attempts-1))
+    logger.info("Failed to send %s. Trying again in %s seconds" % (update, wait))
+    q.update(attempts=attempts, next_attempt=timezone.now() + timedelta(seconds=wait), last_error=error)
+
+def send(update):
+    """
+    Try to send an update to the Git server.
+    Input:
+      update[models.GitServerUpdate]: The update to send
+    Return:
+      bool: Whether it was sent
+    """
+    if update.method not in QUEUED_METHODS and update.method not in COMMENT_METHODS:
+        logger.warning("Removing %s: Not a valid method" % update)
+        update.delete()
+        return False
+
+    try:
+        args = [_decode(arg) for arg in json.loads(update.args)]
+    except Exception:
+        # Most likely something got deleted, nothing to update anymore
+        logger.warning("Removing %s: Bad arguments:\n%s" % (update, traceback.format_exc()))
+        update.delete()
+        return False
+
+    try:
+        git_api = update.build_user.api()
+        if update.method in COMMENT_METHODS:
+            from ci.client import ProcessCommands
+            getattr(ProcessCommands, update.method)(git_api, *args)
+        else:
+            getattr(git_api, update.method)(*args)
+        errors = git_api.errors()
+    except Exception:
+        errors = [traceback.format_exc()]
+
+    if errors:
+        _retry(update, errors[-1])
+        return False
+    models.GitServerUpdate.objects.filter(pk=update.pk).delete()
+    return True
+
+def claim(update, now):
+    """
+    Claim an update so that no other process sends it.
+    The claim pushes back next_attempt, which is only done if no one else
+    changed it since the update was read. If the update isn't sent, it can
+    be claimed again after CLAIM_TIMEOUT seconds.
+    Input:
+      update[models.GitServerUpdate]: The update, as it was read
+      now[datetime]: The current time
+    Return:
+      bool: Whether we got it
+    """
+    claimed = (models.GitServerUpdate.objects
+            .filter(pk=update.pk, next_attempt=update.next_attempt)
+            .update(next_attempt=now + timedelta(seconds=CLAIM_TIMEOUT)))
+    return claimed == 1
+
+def drain(max_updates=BATCH_SIZE):
+    """
+    Send the pending updates that are due, oldest first.
+    Updates that another process claimed first are skipped.
+    Input:
+      max_updates[int]: Max number of updates to send
+    Return:
+      int: Number of updates that were tried
+    """
+    now = timezone.now()
+    updates = list(models.GitServerUpdate.objects
+            .filter(next_attempt__lte=now)
+            .select_related('build_user__server')
+            .order_by('pk')[:max_updates])
+    tried = 0
+    for update in updates:
+        if claim(update, now):
+            send(update)
+            tried += 1
+    return tried
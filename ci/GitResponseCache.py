@@ -0,0 +1,155 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cache for the GET requests that GitAPI makes to the Git servers.
+
+Things like the permission checks and the list of open PRs download the same
+pages over and over. The responses are stored with their ETag/Last-Modified
+headers and the next GET for the same URL sends them back as
+If-None-Match/If-Modified-Since. If the Git server answers with
+304 Not Modified then the cached response is used.
+On GitHub these conditional requests don't count against the rate limit.
+Entries are keyed by the URL, the parameters and who is making the request
+so that one user never sees a response made for another user.
+settings.GIT_API_CACHE_TIMEOUT is how long (in seconds) entries are kept,
+0 turns off the cache.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.core.cache import cache
+from django.conf import settings
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+import hashlib
+import json
+
+# Bump this if the format of the entries changes
+CACHE_VERSION = 1
+HITS_KEY = "git_api_cache_hits_v%s" % CACHE_VERSION
+MISSES_KEY = "git_api_cache_misses_v%s" % CACHE_VERSION
+# Responses bigger than this (in bytes) are not cached
+MAX_ENTRY_SIZE = 1024*1024
+# Headers of a 304 response that shouldn't replace the cached ones
+BODY_HEADERS = ["content-length", "content-type", "content-encoding", "transfer-encoding"]
+
+def enabled():
+    return settings.GIT_API_CACHE_TIMEOUT > 0
+
+def entry_key(url, params, identity):
+    """
+    Get the cache key for a GET request.
+    Input:
+      url[str]: The URL
+      params[dict]: The parameters sent with the request
+      identity[str]: Who is making the request
+    Return:
+      str: The key
+    """
+    data = json.dumps([url, params, identity], sort_keys=True, default=str)
+    return "git_api_cache_v%s_%s" % (CACHE_VERSION, hashlib.sha1(data.encode("utf-8")).hexdigest())
+
+def get_entry(key):
+    return cache.get(key)
+
+def conditional_headers(entry):
+    """
+    Get the headers to make a request conditional on the cached entry.
+    Input:
+      entry[dict]: The cached entry
+    Return:
+      dict: Headers to add to the request
+    """
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def store(key, response):
+    """
+    Cache a response if the Git server gave us a way to validate it later.
+    Input:
+      key[str]: The cache key
+      response[requests.Response]: The response to cache
+    Return:
+      bool: Whether it was cached
+    """
+    if getattr(response, "status_code", None) != 200:
+        return False
+    headers = getattr(response, "headers", None)
+    content = getattr(response, "content", None)
+    if not isinstance(headers, CaseInsensitiveDict) or not isinstance(content, bytes):
+        return False
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return False
+    if len(content) > MAX_ENTRY_SIZE:
+        return False
+    entry = {"etag": etag,
+            "last_modified": last_modified,
+            "headers": dict(headers),
+            "content": content,
+            "encoding": response.encoding,
+            }
+    cache.set(key, entry, settings.GIT_API_CACHE_TIMEOUT)
+    return True
+
+def cached_response(entry, not_modified):
+    """
+    Build a response from the cached entry.
+    Input:
+      entry[dict]: The cached entry
+      not_modified[requests.Response]: The 304 response from the Git server
+    Return:
+      requests.Response: Looks like the original 200 response
+    """
+    response = Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response._content = entry["content"]
+    response.encoding = entry["encoding"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    for name, value in not_modified.headers.items():
+        if name.lower() not in BODY_HEADERS:
+            response.headers[name] = value
+    response.url = not_modified.url
+    response.request = not_modified.request
+    response.elapsed = not_modified.elapsed
+    return response
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+def record_hit():
+    _incr(HITS_KEY)
+
+def record_miss():
+    _incr(MISSES_KEY)
+
+def stats():
+    """
+    Return:
+      dict: Number of "hits" (304 responses) and "misses" (full responses)
+    """
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": values.get(HITS_KEY, 0), "misses": values.get(MISSES_KEY, 0)}
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
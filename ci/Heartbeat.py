@@ -0,0 +1,209 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Coalesces the timestamp updates that the clients cause while running jobs.
+
+Every update from a client used to save the Client (to update last_seen),
+the Job and the Event (to update last_modified), and the Job runtime.
+Instead, the time an object was touched is recorded here and
+written to the database in batches every settings.HEARTBEAT_FLUSH_INTERVAL
+seconds. A running job's runtime is recalculated from its steps when
+it is written.
+The touch times are kept in the process that recorded them, so when something
+is touched a timer is started that writes them even if the process doesn't
+get any more requests.
+
+Until they are written, the times are also kept in the cache so that
+last_modified() and last_modified_many() can be used to see if something
+changed, like the ajax views do.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, connections
+from django.db.models import F, Q, Value, Case, When, Sum, Subquery, OuterRef
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ci import models
+import threading
+import time
+import logging
+logger = logging.getLogger('ci')
+
+# The timestamp field of each model that gets touched
+TIME_FIELDS = {
+    models.Client: 'last_seen',
+    models.Job: 'last_modified',
+    models.Event: 'last_modified',
+    }
+
+# Max number of rows updated in a single query
+FLUSH_BATCH_SIZE = 200
+
+# How long the touch times are kept in the cache
+CACHE_TIMEOUT = 60*60
+
+_lock = threading.Lock()
+_dirty = {} # {(model, pk): datetime}
+_last_flush = time.time()
+_timer = None
+
+def cache_key(model, pk):
+    return "heartbeat.%s.%s" % (model._meta.label_lower, pk)
+
+def touch(obj):
+    """
+    Record that a Client was seen, or that a Job or Event was modified.
+    It is written to the database on a later call, along with anything else that was touched.
+    Input:
+      obj[models.Client, models.Job or models.Event]: The object
+    """
+    model = type(obj)
+    now = timezone.now()
+    with _lock:
+        _dirty[(model, obj.pk)] = now
+        _start_timer()
+    cache.set(cache_key(model, obj.pk), now, CACHE_TIMEOUT)
+    maybe_flush()
+
+def _start_timer():
+    """
+    Start the timer that flushes what has been touched, if it isn't already running.
+    Called with _lock held.
+    """
+    global _timer
+    if _timer is None and settings.HEARTBEAT_FLUSH_INTERVAL > 0:
+        _timer = threading.Timer(settings.HEARTBEAT_FLUSH_INTERVAL, _timed_flush)
+        _timer.daemon = True
+        _timer.start()
+
+def _timed_flush():
+    """
+    Called by the timer. Runs in its own thread, so its database connection is closed when done.
+    """
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    finally:
+        connections.close_all()
+
+def last_modified(obj):
+    """
+    The time the object was last modified, including touches that
+    haven't been written to the database yet.
+    Input:
+      obj[models.Client, models.Job or models.Event]: The object
+    Return:
+      datetime
+    """
+    return last_modified_many([obj])[0]
+
+def last_modified_many(objs):
+    """
+    Same as last_modified() but for several objects, with one cache lookup.
+    Input:
+      objs[list of models.Client, models.Job or models.Event]: The objects
+    Return:
+      list of datetime: The time for each object, in the same order
+    """
+    keys = [cache_key(type(obj), obj.pk) for obj in objs]
+    touched = cache.get_many(keys) if keys else {}
+    times = []
+    for obj, key in zip(objs, keys):
+        db_time = getattr(obj, TIME_FIELDS[type(obj)])
+        t = touched.get(key)
+        if t is not None and (db_time is None or t > db_time):
+            times.append(t)
+        else:
+            times.append(db_time)
+    return times
+
+def maybe_flush():
+    """
+    Flush if it has been at least settings.HEARTBEAT_FLUSH_INTERVAL seconds since the last flush.
+    """
+    global _last_flush
+    with _lock:
+        now = time.time()
+        if now - _last_flush < settings.HEARTBEAT_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+    flush()
+
+def _flush_model(model, touched):
+    """
+    Write the touch times for one model.
+    A time is only written if it is newer than the one in the database.
+    Input:
+      model[models.Model]: The model
+      touched[list of (int, datetime)]: The pk and touch time
+    """
+    field = TIME_FIELDS[model]
+    for i in range(0, len(touched), FLUSH_BATCH_SIZE):
+        batch = touched[i:i+FLUSH_BATCH_SIZE]
+        newer = [(Q(pk=pk, **{'%s__lt' % field: t}), t) for pk, t in batch]
+        values = {field: Case(*[When(cond, then=Value(t)) for cond, t in newer], default=F(field))}
+        if model is models.Job:
+            # The runtime only gets updated if the job hasn't been saved,
+            # possibly with its final time, since it was touched.
+            total = (models.StepResult.objects
+                    .filter(job=OuterRef('pk'))
+                    .order_by()
+                    .values('job')
+                    .annotate(total=Sum('seconds'))
+                    .values('total'))
+            seconds = Coalesce(Subquery(total), F('seconds'))
+            values['seconds'] = Case(*[When(cond, then=seconds) for cond, t in newer], default=F('seconds'))
+        model.objects.filter(pk__in=[pk for pk, t in batch]).update(**values)
+
+def flush():
+    """
+    Write everything that has been touched to the database.
+    """
+    global _dirty
+    with _lock:
+        dirty = _dirty
+        _dirty = {}
+    if not dirty:
+        return
+
+    by_model = {}
+    for (model, pk), t in dirty.items():
+        by_model.setdefault(model, []).append((pk, t))
+    try:
+        with transaction.atomic():
+            for model, touched in by_model.items():
+                _flush_model(model, touched)
+    except Exception as e:
+        logger.warning("Failed to write %s heartbeats: %s" % (len(dirty), e))
+        # Try again next time, keeping anything newer
+        with _lock:
+            for key, t in dirty.items():
+                if key not in _dirty or _dirty[key] < t:
+                    _dirty[key] = t
+            _start_timer()
+
+def clear():
+    """
+    Forget anything that hasn't been written yet. Used in testing.
+    """
+    global _dirty, _timer
+    with _lock:
+        _dirty = {}
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
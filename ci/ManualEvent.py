@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from ci import models, GitCommitData
+from ci import models, GitCommitData, ResultReuse
 import logging
 logger = logging.getLogger('ci')
 
@@ -116,6 +116,7 @@ class ManualEvent(object):
           ev: models.Event
           recipes: Iterable of recipes to process.
         """
+        reused = False
         existing_recipes = []
         for j in ev.jobs.all():
             existing_recipes.append(j.recipe.filename)
@@ -135,5 +136,8 @@ class ManualEvent(object):
                         job.status = models.JobStatus.ACTIVATION_REQUIRED
                     job.save()
                     logger.info('Created job {}: {} on {}'.format(job.pk, job, r.repository))
+                    reused = ResultReuse.reuse_prior_result(job) or reused
 
+        if reused:
+            ev.set_complete_if_done()
         ev.make_jobs_ready()
@@ -0,0 +1,90 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cache for the HTML rendered from step output.
+
+Converting terminal output to HTML is expensive for large outputs and the same
+output gets rendered on every view of the job page.
+Entries are keyed by the step result and store the length and hash of the output
+they were rendered from, so they are only used if the output hasn't changed.
+While a step is running its output only gets appended to, so just the new
+output is rendered.
+There isn't a shared index of the entries since keeping one up to date costs
+a read and write of the whole index on every miss and concurrent writers would
+lose entries. Instead the eviction is left to the cache backend, with sizes
+taken into account by:
+  - Not caching anything bigger than settings.RENDERED_OUTPUT_CACHE_SIZE
+  - Keeping entries bigger than LARGE_ENTRY_SIZE for less time than
+    settings.RENDERED_OUTPUT_CACHE_TIMEOUT, in proportion to their size,
+    since they are what uses up most of the memory.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.core.cache import cache
+from django.conf import settings
+import hashlib
+
+# Bump this if the rendering changes so that old entries don't get used
+CACHE_VERSION = 1
+# Entries bigger than this (in characters) are kept for less time
+LARGE_ENTRY_SIZE = 1024*1024
+
+def _entry_key(name):
+    return "rendered_output_v%s_%s" % (CACHE_VERSION, name)
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()
+
+def _entry_timeout(size):
+    """
+    Number of seconds to keep an entry of the given size.
+    """
+    timeout = settings.RENDERED_OUTPUT_CACHE_TIMEOUT
+    if size > LARGE_ENTRY_SIZE:
+        timeout = max(1, int(timeout * LARGE_ENTRY_SIZE / size))
+    return timeout
+
+def get_rendered(name, text, render, incremental=False):
+    """
+    Get the rendered version of text.
+    Input:
+      name[str]: Unique name of what is being rendered, like the StepResult pk
+      text[str]: The text to render
+      render[function]: Takes a str and returns the rendered str
+      incremental[bool]: Whether it is OK to just render the new text and append
+        it to the cached version. This is faster but state (like terminal colors)
+        doesn't carry over from the cached part.
+    Return:
+      str: The rendered text
+    """
+    key = _entry_key(name)
+    digest = _digest(text)
+    entry = cache.get(key)
+    exact = True
+    rendered = None
+    if entry is not None:
+        length, old_digest, old_rendered, old_exact = entry
+        if length == len(text) and old_digest == digest and (old_exact or incremental):
+            return old_rendered
+        if incremental and length < len(text) and old_digest == _digest(text[:length]):
+            rendered = old_rendered + render(text[length:])
+            exact = False
+    if rendered is None:
+        rendered = render(text)
+
+    size = len(rendered)
+    if size <= settings.RENDERED_OUTPUT_CACHE_SIZE:
+        cache.set(key, (len(text), digest, rendered, exact), _entry_timeout(size))
+    return rendered
@@ -0,0 +1,134 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Shared cache for the permission checks done against the Git servers.
+
+Whether a user is a collaborator on a repository, a member of a team or
+can view a repository is stored in the Django cache, keyed by the user
+and the repository/team. All the sessions of a user share these so a
+new session doesn't need to ask the Git server again.
+The sessions only need to know who is signed in.
+Negative results are cached as well, for
+settings.PERMISSION_NEGATIVE_CACHE_TIMEOUT (but never longer than
+settings.PERMISSION_CACHE_TIMEOUT) so that being added to a team or
+a repository shows up sooner.
+Each user has a generation that is part of their keys. Bumping it with
+clear_user(), like when they sign in, makes their entries invalid.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.core.cache import cache
+from django.conf import settings
+import hashlib
+import uuid
+
+# Bump this if the format of the entries changes
+CACHE_VERSION = 1
+# The kinds of permissions that are cached
+COLLABORATOR = "collaborator"
+TEAM_MEMBER = "team"
+VIEW_REPO = "view_repo"
+VIEWABLE_REPOS = "viewable_repos"
+SEE_CLIENTS = "see_clients"
+
+def _generation_key(user):
+    return "permissions_v%s_gen_%s_%s" % (CACHE_VERSION, user.server_id, user.pk)
+
+def _generation(user):
+    key = _generation_key(user)
+    gen = cache.get(key)
+    if gen is None:
+        gen = uuid.uuid4().hex
+        if not cache.add(key, gen, None):
+            gen = cache.get(key, gen)
+    return gen
+
+def _entry_key(gen, user, kind, name):
+    digest = hashlib.sha1(str(name).encode("utf-8")).hexdigest()
+    return "permissions_v%s_%s_%s_%s_%s_%s" % (CACHE_VERSION, user.server_id, user.pk, gen, kind, digest)
+
+def _timeout(value):
+    timeout = settings.PERMISSION_CACHE_TIMEOUT
+    if not value:
+        timeout = min(timeout, settings.PERMISSION_NEGATIVE_CACHE_TIMEOUT)
+    return timeout
+
+def lookup(user, kind, name):
+    """
+    Get a cached permission.
+    Input:
+      user[models.GitUser]: The user the permission is for
+      kind[str]: The kind of permission, like COLLABORATOR
+      name[str]: What the permission is on, like the repository or team name
+    Return:
+      The cached value or None if it isn't cached
+    """
+    return lookup_many(user, kind, [name]).get(name)
+
+def lookup_many(user, kind, names):
+    """
+    Get several cached permissions at once.
+    Input:
+      user[models.GitUser]: The user the permissions are for
+      kind[str]: The kind of permission, like VIEW_REPO
+      names[list[str]]: What the permissions are on
+    Return:
+      dict: name -> value of the permissions that are cached
+    """
+    if not names:
+        return {}
+    gen = _generation(user)
+    keys = {_entry_key(gen, user, kind, name): name for name in names}
+    values = cache.get_many(list(keys.keys()))
+    return {keys[key]: value for key, value in values.items()}
+
+def store(user, kind, name, value):
+    """
+    Cache a permission.
+    Input:
+      user[models.GitUser]: The user the permission is for
+      kind[str]: The kind of permission, like COLLABORATOR
+      name[str]: What the permission is on
+      value: The value to cache. Anything false is a negative result.
+    """
+    store_many(user, kind, {name: value})
+
+def store_many(user, kind, values):
+    """
+    Cache several permissions at once.
+    Input:
+      user[models.GitUser]: The user the permissions are for
+      kind[str]: The kind of permission, like VIEW_REPO
+      values[dict]: name -> value
+    """
+    gen = _generation(user)
+    positive = {}
+    negative = {}
+    for name, value in values.items():
+        key = _entry_key(gen, user, kind, name)
+        if value:
+            positive[key] = value
+        else:
+            negative[key] = value
+    for entries, timeout in [(positive, _timeout(True)), (negative, _timeout(False))]:
+        if entries and timeout > 0:
+            cache.set_many(entries, timeout)
+
+def clear_user(user):
+    """
+    Forget all the cached permissions of a user.
+    Input:
+      user[models.GitUser]: The user
+    """
+    cache.set(_generation_key(user), uuid.uuid4().hex, None)
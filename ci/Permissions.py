@@ -15,14 +15,14 @@
 
 from __future__ import unicode_literals, absolute_import
 import logging
-from ci import models, TimeUtils
+from ci import models, PermissionCache, TimeUtils
 from django.conf import settings
 logger = logging.getLogger('ci')
 
 def is_collaborator(request_session, build_user, repo, user=None):
     """
     Checks to see if the signed in user is a collaborator on a repo.
-    This will cache the value for a time specified by settings.PERMISSION_CACHE_TIMEOUT
+    The value is cached in PermissionCache.
     Input:
       request_session: A session from HttpRequest.session
       build_user: models.GitUser who has access to check collaborators
@@ -40,21 +40,13 @@ def is_collaborator(request_session, build_user, repo, user=None):
     if user.is_admin():
         return True
 
-    auth = server.auth()
-    if auth._collaborators_key in request_session:
-        collab_dict = request_session[auth._collaborators_key]
-        val = collab_dict.get(str(repo))
-        timestamp = TimeUtils.get_local_timestamp()
-        # Check to see if their permissions are still valid
-        if val and timestamp < val[1]:
-            return val[0]
+    val = PermissionCache.lookup(user, PermissionCache.COLLABORATOR, str(repo))
+    if val is not None:
+        return val
 
     api = build_user.api()
-
-    collab_dict = request_session.get(auth._collaborators_key, {})
     val = api.is_collaborator(user, repo)
-    collab_dict[str(repo)] = (val, TimeUtils.get_local_timestamp() + settings.PERMISSION_CACHE_TIMEOUT)
-    request_session[auth._collaborators_key] = collab_dict
+    PermissionCache.store(user, PermissionCache.COLLABORATOR, str(repo), val)
     logger.info("Is collaborator for user '%s' on %s: %s" % (user, repo, val))
     return val
 
@@ -148,41 +140,93 @@ def viewable_repos(session):
 
     In this case, only _active_ repos are viewable.
 
-    Uses caching to avoid git calls for being able to see repos.
+    The IDs for each signed in user are cached in PermissionCache
+    so that all their sessions share them. When not signed in, the IDs
+    of the public repos are cached in the session.
     """
-    cache_key = 'viewable_repos_cache'
-    cache = session.get(cache_key, [])
+    repo_ids = []
+    for server in settings.INSTALLED_GITSERVERS:
+        try:
+            gs = models.GitServer.objects.get(host_type=server["type"], name=server["hostname"])
+        except models.GitServer.DoesNotExist: # Happens in testing
+            continue
 
+        user = gs.signed_in_user(session)
+        repos_q = models.Repository.objects.filter(active=True, user__server=gs).select_related('user__server')
+        if user is None:
+            repo_ids.extend(_public_repos(session, gs, repos_q))
+        elif user.is_admin():
+            repo_ids.extend(repos_q.values_list('id', flat=True))
+        else:
+            ids = PermissionCache.lookup(user, PermissionCache.VIEWABLE_REPOS, gs.pk)
+            if ids is None:
+                ids = _user_viewable_repos(user, repos_q)
+                PermissionCache.store(user, PermissionCache.VIEWABLE_REPOS, gs.pk, ids)
+            repo_ids.extend(ids)
+    return repo_ids
+
+def _public_repos(session, gs, repos_q):
+    """
+    Gets the IDs of the public repos, cached in the session.
+    The cache is removed from the session when signing in or out.
+    Input:
+      session: A session from HttpRequest.session
+      gs[models.GitServer]: The server of the repos
+      repos_q[QuerySet]: The repos to check
+    Return:
+      list[int]: The repo IDs
+    """
+    cache_key = 'viewable_repos_cache'
     timeout_key = 'viewable_repos_timeout'
-    timeout = session.get(timeout_key, 0)
-
-    # Need to regenerate
-    if timeout <= TimeUtils.get_local_timestamp():
-        logger.info('Rebuilding viewable repos')
-        cache = []
-
-        for server in settings.INSTALLED_GITSERVERS:
-            try:
-                gs = models.GitServer.objects.get(host_type=server["type"], name=server["hostname"])
-            except models.GitServer.DoesNotExist: # Happens in testing
-                continue
-
-            user = gs.signed_in_user(session)
-            all_repos = user.api().get_all_repos(None) if (user is not None and not user.is_admin()) else []
-
-            logger.info(f'Rebuilding viewable repos for user {user} on {gs}')
-
-            repos_q = models.Repository.objects.filter(active=True, user__server=gs)
-            for repo in repos_q.all():
-                if repo.public() or (user is not None and
-                                     (user.is_admin() or (str(repo) in all_repos)
-                                      or user.api().can_view_repo(repo.user.name, repo.name))):
-                    cache.append(repo.id)
+    # The session is stored as JSON so the keys need to be strings
+    server_key = str(gs.pk)
+    cache = session.get(cache_key, {})
+    if session.get(timeout_key, 0) <= TimeUtils.get_local_timestamp() or not isinstance(cache, dict):
+        cache = {}
+        session[timeout_key] = TimeUtils.get_local_timestamp() + settings.PERMISSION_CACHE_TIMEOUT
 
+    ids = cache.get(server_key)
+    if ids is None:
+        logger.info('Rebuilding public repos on %s' % gs)
+        ids = [repo.id for repo in repos_q.all() if repo.public()]
+        cache[server_key] = ids
         session[cache_key] = cache
-        session[timeout_key] = TimeUtils.get_local_timestamp() + settings.PERMISSION_CACHE_TIMEOUT
+    return ids
 
-    return cache
+def _user_viewable_repos(user, repos_q):
+    """
+    Gets the IDs of the repos that the user can view.
+    Only the private repos that aren't in PermissionCache are checked
+    on the Git server.
+    Input:
+      user[models.GitUser]: A signed in user that isn't an admin
+      repos_q[QuerySet]: The repos to check
+    Return:
+      list[int]: The repo IDs
+    """
+    logger.info('Rebuilding viewable repos for user %s on %s' % (user, user.server))
+    repo_ids = []
+    private = {}
+    for repo in repos_q.all():
+        if repo.public():
+            repo_ids.append(repo.id)
+        else:
+            private[str(repo)] = repo
+
+    can_view = PermissionCache.lookup_many(user, PermissionCache.VIEW_REPO, list(private.keys()))
+    missing = [name for name in private.keys() if name not in can_view]
+    if missing:
+        api = user.api()
+        all_repos = api.get_all_repos(None)
+        checked = {}
+        for name in missing:
+            repo = private[name]
+            checked[name] = bool(name in all_repos or api.can_view_repo(repo.user.name, repo.name))
+        PermissionCache.store_many(user, PermissionCache.VIEW_REPO, checked)
+        can_view.update(checked)
+
+    repo_ids.extend([repo.id for name, repo in private.items() if can_view[name]])
+    return repo_ids
 
 def can_view_repo(session, repo):
     """
@@ -194,15 +238,13 @@ def is_team_member(session, api, team, user):
     """
     Checks to see if a user is a team member and caches the results
     """
-    teams = session.get("teams", {})
-    # Check to see if their permissions are still valid
-    if teams and team in teams and TimeUtils.get_local_timestamp() < teams[team][1]:
-        return teams[team][0]
+    is_member = PermissionCache.lookup(user, PermissionCache.TEAM_MEMBER, team)
+    if is_member is not None:
+        return is_member
 
     is_member = api.is_member(team, user)
     logger.info("User '%s' member status of '%s': %s" % (user, team, is_member))
-    teams[team] = (is_member, TimeUtils.get_local_timestamp() + settings.PERMISSION_CACHE_TIMEOUT)
-    session["teams"] = teams
+    PermissionCache.store(user, PermissionCache.TEAM_MEMBER, team, is_member)
     return is_member
 
 def is_allowed_to_see_clients(session):
@@ -211,13 +253,6 @@ def is_allowed_to_see_clients(session):
     We do this by checking the "authorized_users"
     "authorized_users" can contain orgs and teams
     """
-    val = session.get("allowed_to_see_clients")
-    # Check to see if their permissions are still valid
-    if val and TimeUtils.get_local_timestamp() < val[1]:
-        return val[0]
-
-    user = None
-
     for server in settings.INSTALLED_GITSERVERS:
         gitserver = models.GitServer.objects.get(host_type=server["type"], name=server["hostname"])
         auth = gitserver.auth()
@@ -225,13 +260,21 @@ def is_allowed_to_see_clients(session):
         if not user:
             continue
 
-        api = user.api()
-        for authed_user in server.get("authorized_users", []):
-            if user.name == authed_user or is_team_member(session, api, authed_user, user):
-                logger.info("'%s' is a member of '%s' and is allowed to see clients" % (user, authed_user))
-                session["allowed_to_see_clients"] = (True,
-                        TimeUtils.get_local_timestamp() + settings.PERMISSION_CACHE_TIMEOUT)
-                return True
-        logger.info("%s is NOT allowed to see clients on %s" % (user, gitserver))
-    session["allowed_to_see_clients"] = (False, TimeUtils.get_local_timestamp() + settings.PERMISSION_CACHE_TIMEOUT)
+        authorized_users = server.get("authorized_users", [])
+        # So that changing authorized_users doesn't use the old value
+        name = ",".join(authorized_users)
+        allowed = PermissionCache.lookup(user, PermissionCache.SEE_CLIENTS, name)
+        if allowed is None:
+            allowed = False
+            api = user.api()
+            for authed_user in authorized_users:
+                if user.name == authed_user or is_team_member(session, api, authed_user, user):
+                    logger.info("'%s' is a member of '%s' and is allowed to see clients" % (user, authed_user))
+                    allowed = True
+                    break
+            if not allowed:
+                logger.info("%s is NOT allowed to see clients on %s" % (user, gitserver))
+            PermissionCache.store(user, PermissionCache.SEE_CLIENTS, name, allowed)
+        if allowed:
+            return True
     return False
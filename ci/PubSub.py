@@ -0,0 +1,168 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Simple publish/subscribe for pushing updates to the web pages.
+
+The client endpoints publish messages on channels when a job changes
+and the streaming views subscribe to those channels.
+Clients waiting in get_job subscribe to the ready channels of their
+build configs so that they are woken up when a job becomes ready.
+The backend is set with settings.PUBSUB_BACKEND:
+  "local": Messages are only passed inside this process. Good for testing
+    and single process servers.
+  "redis": Messages are passed through Redis so that they work across processes.
+    Requires the redis package and settings.PUBSUB_REDIS_URL.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.conf import settings
+import collections
+import threading
+import time
+import json
+import logging
+logger = logging.getLogger('ci')
+
+MAIN_CHANNEL = "civet.main"
+
+def job_channel(job_id):
+    return "civet.job.%s" % job_id
+
+def event_channel(event_id):
+    return "civet.event.%s" % event_id
+
+def ready_channel(config_name):
+    return "civet.ready.%s" % config_name
+
+class LocalSubscription(object):
+    def __init__(self, backend, channels):
+        self._backend = backend
+        self._channels = set(channels)
+        self._last_seq = backend.last_seq()
+
+    def get(self, timeout):
+        """
+        Wait for messages.
+        Input:
+          timeout[float]: Max number of seconds to wait
+        Return:
+          list[(str, dict)]: (channel, data) of each message. Empty if we timed out.
+        """
+        messages, self._last_seq = self._backend.wait(self._channels, self._last_seq, timeout)
+        return messages
+
+    def close(self):
+        pass
+
+class LocalBackend(object):
+    """
+    Only passes messages between threads of this process.
+    A limited number of recent messages are kept so that a subscriber
+    doesn't miss messages published while it wasn't waiting.
+    """
+    def __init__(self, history=1000):
+        self._cond = threading.Condition()
+        self._messages = collections.deque(maxlen=history)
+        self._seq = 0
+
+    def last_seq(self):
+        with self._cond:
+            return self._seq
+
+    def publish(self, channel, data):
+        with self._cond:
+            self._seq += 1
+            self._messages.append((self._seq, channel, data))
+            self._cond.notify_all()
+
+    def subscribe(self, channels):
+        return LocalSubscription(self, channels)
+
+    def _new_messages(self, channels, last_seq):
+        return [(c, d) for s, c, d in self._messages if s > last_seq and c in channels]
+
+    def wait(self, channels, last_seq, timeout):
+        end = time.time() + timeout
+        with self._cond:
+            while True:
+                messages = self._new_messages(channels, last_seq)
+                remaining = end - time.time()
+                if messages or remaining <= 0:
+                    return messages, self._seq
+                self._cond.wait(remaining)
+
+class RedisSubscription(object):
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout):
+        messages = []
+        msg = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        while msg:
+            channel = msg["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode("utf-8")
+            messages.append((channel, json.loads(msg["data"])))
+            msg = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=0)
+        return messages
+
+    def close(self):
+        self._pubsub.close()
+
+class RedisBackend(object):
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, channel, data):
+        self._redis.publish(channel, json.dumps(data))
+
+    def subscribe(self, channels):
+        pubsub = self._redis.pubsub()
+        pubsub.subscribe(*channels)
+        return RedisSubscription(pubsub)
+
+_backend_lock = threading.Lock()
+_backend = (None, None)
+
+def get_backend():
+    """
+    Get the backend as set in settings.PUBSUB_BACKEND.
+    The backend is created once per process.
+    """
+    global _backend
+    name = getattr(settings, "PUBSUB_BACKEND", "local")
+    with _backend_lock:
+        if _backend[0] != name:
+            if name == "redis":
+                _backend = (name, RedisBackend(settings.PUBSUB_REDIS_URL))
+            else:
+                _backend = (name, LocalBackend())
+        return _backend[1]
+
+def publish(channel, data):
+    """
+    Publish a message. Failures are just logged since nothing depends
+    on the message being received.
+    Input:
+      channel[str]: Channel to publish on
+      data[dict]: Must be JSON serializable
+    """
+    try:
+        get_backend().publish(channel, data)
+    except Exception as e:
+        logger.warning("Failed to publish to %s: %s" % (channel, e))
+
+def subscribe(channels):
+    return get_backend().subscribe(channels)
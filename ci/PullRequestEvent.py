@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from ci import models, Permissions, event
+from ci import models, Permissions, event, ResultReuse
 from django.urls import reverse
 import traceback
 import logging
@@ -258,6 +258,7 @@ class PullRequestEvent(object):
                     job.status = models.JobStatus.ACTIVATION_REQUIRED
                 job.save()
                 logger.info('Created job {}: {}: on {}'.format(job.pk, job, recipe.repository))
+                ResultReuse.reuse_prior_result(job)
                 jobs.append(job)
 
             else:
@@ -275,6 +276,9 @@ class PullRequestEvent(object):
         """
         server = ev.base.server()
         for job in jobs:
+            if job.reused_from:
+                ResultReuse.update_remote_status(git_api, job)
+                continue
             abs_job_url = job.absolute_url()
             msg = 'Waiting'
             git_status = git_api.PENDING
@@ -333,6 +337,8 @@ class PullRequestEvent(object):
             for r in recipes:
                 jobs.extend(self._check_recipe(session, git_api, pr, ev, r))
             self._update_remote(git_api, ev, jobs)
+            if any(job.reused_from for job in jobs):
+                ev.set_complete_if_done()
             ev.make_jobs_ready()
             ev.save()
         except Exception:
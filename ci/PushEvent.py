@@ -14,7 +14,7 @@
 
 from __future__ import unicode_literals, absolute_import
 import logging
-from ci import models, views, event
+from ci import models, views, event, ResultReuse
 from django.urls import reverse
 logger = logging.getLogger('ci')
 
@@ -93,6 +93,7 @@ class PushEvent(object):
         self._process_recipes(ev, recipes)
 
     def _process_recipes(self, ev, recipes):
+        reused = []
         for r in recipes:
             if not r.active:
                 continue
@@ -107,6 +108,13 @@ class PushEvent(object):
                     job.complete = False
                     job.save()
                     logger.info('Created job {}: {}: on {}'.format(job.pk, job, r.repository))
+                    if ResultReuse.reuse_prior_result(job):
+                        reused.append(job)
+        if reused:
+            git_api = ev.build_user.api()
+            for job in reused:
+                ResultReuse.update_remote_status(git_api, job)
+            ev.set_complete_if_done()
         ev.make_jobs_ready()
 
     def _auto_cancel_jobs(self, ev, recipes):
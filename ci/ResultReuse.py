@@ -0,0 +1,170 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Reuse the results of a previous job instead of running an identical one.
+
+Recipes that set "reuse_results" in their [Main] section opt in to this.
+A job is identical to a previous one if it has the same version of the
+recipe file, the same build config, the same contents of the scripts that
+are sent to the client, and tests the same code. It tests the same code
+if the tree of head merged with base is the same (see Event.tested_tree),
+or if the Git server can't tell us the tree, the same head and base SHAs.
+For example, this happens when a PR gets retitled, or when a PR gets
+merged and the push to the branch has the same tree that the PR tested.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.conf import settings
+from django.urls import reverse
+from django.db.models import Q
+from ci import models
+from ci.recipe import ScriptCache
+import hashlib
+import logging
+logger = logging.getLogger('ci')
+
+def scripts_sha(prestep_sources, step_scripts):
+    """
+    Get a SHA of the contents of the scripts of a job.
+    Input:
+      prestep_sources[list[str]]: Contents of the prestep sources
+      step_scripts[list[str]]: Contents of the step scripts
+    Return:
+      str: The SHA
+    """
+    sha = hashlib.sha1()
+    for section in [prestep_sources, step_scripts]:
+        for contents in section:
+            sha.update(contents.encode("utf-8"))
+            sha.update(b"\0")
+        sha.update(b"\1")
+    return sha.hexdigest()
+
+def recipe_scripts_sha(recipe):
+    """
+    Get the SHA of the scripts that a job for the recipe would run
+    if it were sent to a client now. This matches what get_job_info() sends.
+    Input:
+      recipe[models.Recipe]: The recipe
+    Return:
+      str: The SHA
+    """
+    base_file_dir = settings.RECIPE_BASE_DIR
+    recipe_repo_sha = ScriptCache.current_sha()
+    prestep_sources = []
+    for prestep in recipe.prestepsources.all():
+        if prestep.filename:
+            contents = ScriptCache.get_contents(base_file_dir, recipe_repo_sha, prestep.filename)
+            if contents:
+                prestep_sources.append(contents)
+
+    step_scripts = []
+    for step in recipe.steps.order_by('position'):
+        if step.filename:
+            contents = ScriptCache.get_contents(base_file_dir, recipe_repo_sha, step.filename)
+            step_scripts.append(str(contents))
+    return scripts_sha(prestep_sources, step_scripts)
+
+def event_tree_sha(ev):
+    """
+    Get the SHA of the tree that the jobs of an event test.
+    It is looked up on the Git server the first time and saved on the event.
+    Input:
+      ev[models.Event]: The event
+    Return:
+      str: SHA of the tree, blank if it isn't known
+    """
+    if ev.tested_tree is None:
+        repo = ev.base.branch.repository
+        pr_num = ev.pull_request.number if ev.pull_request else None
+        tree = ev.build_user.api().tested_tree_sha(repo.user.name, repo.name, ev.base.sha, ev.head.sha, pr_num)
+        ev.tested_tree = tree or ""
+        models.Event.objects.filter(pk=ev.pk).update(tested_tree=ev.tested_tree)
+    return ev.tested_tree
+
+def find_prior_job(job):
+    """
+    Find a previous job that passed that this job can reuse the results of.
+    Input:
+      job[models.Job]: The new job
+    Return:
+      models.Job or None if the recipe doesn't reuse results or there isn't one
+    """
+    recipe = job.recipe
+    if not recipe.reuse_results or not recipe.filename_sha:
+        return None
+
+    same_code = Q(event__head__sha=job.event.head.sha, event__base__sha=job.event.base.sha)
+    tree = event_tree_sha(job.event)
+    if tree:
+        same_code |= Q(event__tested_tree=tree)
+
+    # Jobs that reused results don't have a scripts_sha so we always
+    # point back to the job that actually ran.
+    return (models.Job.objects
+            .filter(same_code,
+                recipe__filename_sha=recipe.filename_sha,
+                config=job.config,
+                scripts_sha=recipe_scripts_sha(recipe),
+                complete=True,
+                status=models.JobStatus.SUCCESS,
+                )
+            .exclude(pk=job.pk)
+            .order_by('-created')
+            .first())
+
+def reuse_prior_result(job):
+    """
+    If possible, mark a newly created job as passed with the results of a previous job.
+    The job won't get sent to a client.
+    Input:
+      job[models.Job]: The new job
+    Return:
+      bool: True if the job reused a previous result
+    """
+    if not job.active:
+        return False
+    prior = find_prior_job(job)
+    if prior is None:
+        return False
+
+    job.reused_from = prior
+    job.complete = True
+    job.ready = False
+    job.status = models.JobStatus.SUCCESS
+    job.seconds = prior.seconds
+    job.save()
+    prior_url = reverse('ci:view_job', args=[prior.pk])
+    message = "Reused the results of <a href='%s'>job %s</a>" % (prior_url, prior.pk)
+    models.JobChangeLog.objects.create(job=job, message=message)
+    logger.info('Job {}: {}: reused the results of job {}'.format(job.pk, job, prior.pk))
+    return True
+
+def update_remote_status(git_api, job):
+    """
+    Set the status of a job that reused results on the Git server.
+    Input:
+      git_api[GitAPI]: Git API for the build_user
+      job[models.Job]: Job that reused results
+    """
+    ev = job.event
+    git_api.update_status(
+        ev.base,
+        ev.head,
+        git_api.SUCCESS,
+        job.absolute_url(),
+        "Passed (reused results)",
+        job.unique_name(),
+        git_api.STATUS_JOB_COMPLETE,
+        )
@@ -0,0 +1,182 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streams the output of jobs as a .tar.gz archive.
+
+The archive is generated while it is being sent so that memory
+use doesn't depend on how much output there is.
+The output is read from the database a piece at a time, the terminal
+color codes are stripped and it is compressed as it goes.
+Since a tar header needs the size of the file, the output of each step
+is first written to a temporary file that is only kept in memory while
+it is smaller than SPOOL_SIZE.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.utils.text import get_valid_filename
+import tarfile
+import tempfile
+import time
+import zlib
+import re
+
+# Longest color code that we will hold back waiting for the rest of it
+MAX_CODE_LENGTH = 32
+COLOR_RE = re.compile(re.escape("\33[") + r"(1m|(1;)*(\d{1,2})m)")
+# Files bigger than this (in bytes) are written to disk while they are being added
+SPOOL_SIZE = 4*1024*1024
+# Number of bytes to send at a time
+READ_SIZE = 64*1024
+
+def plain_pieces(pieces):
+    """
+    Strip the terminal color codes out of the output.
+    A color code could be split across pieces, so the end of a piece
+    that could be the start of a code is held until the next piece.
+    Input:
+      pieces[iterable of str]: The output
+    Return:
+      generator of str: The output without color codes
+    """
+    carry = ""
+    for piece in pieces:
+        text = carry + piece
+        carry = ""
+        idx = text.rfind("\33")
+        if idx >= 0 and len(text) - idx < MAX_CODE_LENGTH and "m" not in text[idx:]:
+            carry = text[idx:]
+            text = text[:idx]
+        if text:
+            yield COLOR_RE.sub("", text)
+    if carry:
+        yield COLOR_RE.sub("", carry)
+
+def result_pieces(result):
+    """
+    The encoded contents of the file for a StepResult.
+    Input:
+      result[models.StepResult]: The step result
+    Return:
+      generator of bytes
+    """
+    for text in plain_pieces(result.output_pieces()):
+        yield text.replace('\u2018', "'").replace("\u2019", "'").encode("utf-8", "replace")
+
+def _tar_entry(name, pieces, mtime):
+    """
+    Generates the tar blocks for a single file.
+    Input:
+      name[str]: Name of the file in the archive
+      pieces[iterable of bytes]: The file contents
+      mtime[float]: Modification time of the file
+    Return:
+      generator of bytes
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+        for piece in pieces:
+            spool.write(piece)
+        size = spool.tell()
+        info = tarfile.TarInfo(name=name)
+        info.size = size
+        info.mtime = mtime
+        yield info.tobuf(format=tarfile.DEFAULT_FORMAT, encoding=tarfile.ENCODING, errors="surrogateescape")
+
+        spool.seek(0)
+        while True:
+            data = spool.read(READ_SIZE)
+            if not data:
+                break
+            yield data
+    remainder = size % tarfile.BLOCKSIZE
+    if remainder:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+
+def tar_stream(files):
+    """
+    Generates an uncompressed tar archive.
+    Input:
+      files[iterable of (str, iterable of bytes)]: Name and contents of each file
+    Return:
+      generator of bytes
+    """
+    mtime = time.time()
+    total = 0
+    for name, pieces in files:
+        for block in _tar_entry(name, pieces, mtime):
+            total += len(block)
+            yield block
+    end = tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+    total += len(end)
+    remainder = total % tarfile.RECORDSIZE
+    if remainder:
+        end += tarfile.NUL * (tarfile.RECORDSIZE - remainder)
+    yield end
+
+def gzip_stream(pieces, level=6):
+    """
+    Compress the pieces into gzip format as they come.
+    Input:
+      pieces[iterable of bytes]: Data to compress
+      level[int]: Compression level
+    Return:
+      generator of bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def job_base_name(job):
+    return 'results_{}_{}'.format(job.pk, get_valid_filename(job.recipe.name))
+
+def job_files(job, base_name):
+    """
+    The files in the archive for a job.
+    Input:
+      job[models.Job]: The job
+      base_name[str]: Directory in the archive to put the files in
+    Return:
+      generator of (str, generator of bytes) as expected by tar_stream()
+    """
+    # Don't load the output of all the steps at once
+    for result in job.step_results.defer('stored_output').order_by('position').iterator():
+        name = '{}/{:02}_{}'.format(base_name, result.position, get_valid_filename(result.name))
+        yield name, result_pieces(result)
+
+def job_archive(job):
+    """
+    Generates the .tar.gz of the output of a job.
+    """
+    return gzip_stream(tar_stream(job_files(job, job_base_name(job))))
+
+def event_base_name(ev):
+    return 'results_event_{}'.format(ev.pk)
+
+def event_archive(ev, jobs):
+    """
+    Generates the .tar.gz of the output of all the jobs of an event.
+    Each job gets its own directory.
+    Input:
+      ev[models.Event]: The event
+      jobs[iterable of models.Job]: Jobs to include
+    """
+    base_name = event_base_name(ev)
+    def files():
+        for job in jobs:
+            name = '{}/{}_{}'.format(base_name, job.pk, get_valid_filename(job.unique_name()))
+            for f in job_files(job, name):
+                yield f
+    return gzip_stream(tar_stream(files()))
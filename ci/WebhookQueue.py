@@ -0,0 +1,284 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Queue for the webhook calls from the Git servers.
+
+Processing a push or pull request (creating the event and jobs, getting
+the changed files, setting the statuses, etc) can take long enough that
+the Git server times out and sends the webhook again.
+If settings.WEBHOOK_QUEUE is set, the webhook views just store the payload
+as a models.WebhookDelivery and reply right away. Deliveries that we already
+have (by the delivery ID the Git server sends) are ignored.
+The "process_webhooks" command then processes them with the same code
+that the webhook views used. Any number of these can be running.
+Deliveries for the same repository are processed one at a time, in the
+order they were received.
+While a worker processes a delivery it keeps updating the time it claimed
+it, so a delivery is only taken by another worker if the first one died.
+A delivery that fails with an exception or a server error is tried again
+with an increasing delay, holding up the later ones for the repository,
+until it has been tried MAX_ATTEMPTS times. One that gets a client error
+(4xx), like an event that we don't handle, is not tried again.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.conf import settings
+from django.db import IntegrityError, transaction, connections
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from datetime import timedelta
+from ci import models
+import hashlib
+import json
+import threading
+import traceback
+import uuid
+import logging
+logger = logging.getLogger('ci')
+
+# Headers the Git servers use for the ID of a delivery
+DELIVERY_HEADERS = ["HTTP_X_GITHUB_DELIVERY", # GitHub
+        "HTTP_X_GITLAB_EVENT_UUID", # GitLab
+        "HTTP_X_REQUEST_UUID", # BitBucket
+        ]
+# If a worker hasn't updated its claim on a delivery for this long (in seconds)
+# then it is assumed to have died and another worker can take it.
+CLAIM_TIMEOUT = 5*60
+# How often (in seconds) a worker updates its claim while processing a delivery
+CLAIM_HEARTBEAT = 60
+# Number of times a delivery is tried before giving up
+MAX_ATTEMPTS = 6
+# Waits 30, 60, 120... seconds between tries
+RETRY_BACKOFF = 30
+RETRY_MAX_WAIT = 30*60
+# How often (in seconds) a worker removes old processed deliveries
+CLEANUP_INTERVAL = 60*60
+# Processed deliveries are kept this long to catch redeliveries
+KEEP_PROCESSED = timedelta(days=7)
+# Max number of deliveries looked at when looking for one to process
+CLAIM_CANDIDATES = 50
+
+def delivery_id(request):
+    """
+    Get the ID of a delivery.
+    If the Git server doesn't send one, a hash of the payload is used.
+    Input:
+      request[HttpRequest]: The webhook request
+    Return:
+      str: The ID
+    """
+    for header in DELIVERY_HEADERS:
+        value = request.META.get(header)
+        if value:
+            return value[:120]
+    return hashlib.sha1(request.body).hexdigest()
+
+def repo_key(data):
+    """
+    Get the name of the repository that a payload is for.
+    Input:
+      data[dict]: The webhook payload
+    Return:
+      str: The full name of the repository, or "" if there isn't one
+    """
+    for outer, inner in [("repository", "full_name"), ("project", "path_with_namespace")]:
+        value = data.get(outer)
+        if isinstance(value, dict) and value.get(inner):
+            return str(value[inner])[:255]
+    return ""
+
+def queue_delivery(request, user, data):
+    """
+    Store a webhook payload to be processed later.
+    Input:
+      request[HttpRequest]: The webhook request
+      user[models.GitUser]: The user the webhook is for
+      data[dict]: The payload
+    Return:
+      HttpResponse
+    """
+    delivery = delivery_id(request)
+    try:
+        with transaction.atomic():
+            models.WebhookDelivery.objects.create(build_user=user,
+                    delivery_id=delivery,
+                    payload=json.dumps(data),
+                    repo_key=repo_key(data))
+    except IntegrityError:
+        logger.info("Ignoring redelivery %s for %s" % (delivery, user))
+        return HttpResponse('OK')
+    logger.info("Queued webhook delivery %s for %s" % (delivery, user))
+    return HttpResponse('OK')
+
+def _claimable(now):
+    """
+    Filter for deliveries that aren't being processed and are due to be tried.
+    """
+    stale = now - timedelta(seconds=CLAIM_TIMEOUT)
+    return (Q(processed=False)
+            & (Q(claimed=None) | Q(claimed__lte=stale))
+            & (Q(next_attempt=None) | Q(next_attempt__lte=now)))
+
+def claim_next():
+    """
+    Claim the next delivery to process.
+    This is the oldest delivery of a repository that doesn't have
+    another delivery being processed or waiting to be tried again.
+    Return:
+      models.WebhookDelivery or None if there isn't one
+    """
+    now = timezone.now()
+    pending = models.WebhookDelivery.objects.filter(processed=False)
+    busy = set(pending.exclude(_claimable(now)).values_list('repo_key', flat=True))
+    candidates = (pending
+            .exclude(repo_key__in=busy)
+            .order_by('pk')
+            .only('pk', 'repo_key')[:CLAIM_CANDIDATES])
+    seen = set()
+    for delivery in candidates:
+        if delivery.repo_key in seen:
+            # An older one for the same repository is ahead of this one
+            continue
+        seen.add(delivery.repo_key)
+        claimed = (models.WebhookDelivery.objects
+                .filter(_claimable(now), pk=delivery.pk)
+                .update(claimed=now, claim_id=uuid.uuid4().hex))
+        if claimed:
+            return models.WebhookDelivery.objects.select_related('build_user__server').get(pk=delivery.pk)
+    return None
+
+def _process_event(host_type):
+    """
+    The function of the webhook views that processes a payload.
+    Imported here since the views use this module.
+    """
+    if host_type == settings.GITSERVER_GITHUB:
+        from ci.github import views
+    elif host_type == settings.GITSERVER_GITLAB:
+        from ci.gitlab import views
+    else:
+        from ci.bitbucket import views
+    return views.process_event
+
+def extend_claim(delivery):
+    """
+    Update the time of the claim on a delivery so that other workers don't take it.
+    Input:
+      delivery[models.WebhookDelivery]: The claimed delivery
+    Return:
+      bool: Whether we still have the claim
+    """
+    return (models.WebhookDelivery.objects
+            .filter(pk=delivery.pk, claim_id=delivery.claim_id, processed=False)
+            .update(claimed=timezone.now())) == 1
+
+def _keep_claimed(delivery, done):
+    """
+    Runs in a thread while a delivery is processed.
+    Input:
+      delivery[models.WebhookDelivery]: The claimed delivery
+      done[threading.Event]: Set when the processing is done
+    """
+    try:
+        while not done.wait(CLAIM_HEARTBEAT):
+            if not extend_claim(delivery):
+                logger.warning("Lost the claim on webhook delivery %s" % delivery)
+                break
+    except Exception:
+        logger.warning("Failed to extend the claim on webhook delivery %s: %s" % (delivery, traceback.format_exc()))
+    finally:
+        connections.close_all()
+
+def _failed(delivery, error):
+    """
+    Try the delivery again later, or give up if it has been tried too many times.
+    """
+    attempts = delivery.attempts + 1
+    q = models.WebhookDelivery.objects.filter(pk=delivery.pk, claim_id=delivery.claim_id)
+    if attempts >= MAX_ATTEMPTS:
+        logger.warning("Giving up on webhook delivery %s after %s attempts: %s" % (delivery, attempts, error))
+        q.update(processed=True, attempts=attempts, error=error, last_modified=timezone.now())
+        return
+    wait = min(RETRY_MAX_WAIT, RETRY_BACKOFF*2**(attempts-1))
+    logger.warning("Failed to process webhook delivery %s. Trying again in %s seconds: %s"
+            % (delivery, wait, error))
+    q.update(claimed=None,
+            claim_id="",
+            attempts=attempts,
+            next_attempt=timezone.now() + timedelta(seconds=wait),
+            error=error,
+            last_modified=timezone.now())
+
+def process(delivery):
+    """
+    Process a delivery.
+    The claim on it is kept up to date while it is processed.
+    If there is an exception or a server error (5xx) it is tried again later.
+    A client error (4xx), like an event that we don't handle or a bad
+    payload, won't go away by trying again, so the delivery is done and
+    only the error is recorded.
+    Input:
+      delivery[models.WebhookDelivery]: The claimed delivery
+    Return:
+      bool: Whether it was processed without error
+    """
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_keep_claimed, args=(delivery, done))
+    heartbeat.daemon = True
+    heartbeat.start()
+    error = ""
+    retry = False
+    try:
+        data = json.loads(delivery.payload)
+        process_event = _process_event(delivery.build_user.server.host_type)
+        response = process_event(delivery.build_user, data)
+        if response.status_code != 200:
+            error = response.content.decode("utf-8", "replace")
+            retry = response.status_code >= 500
+    except Exception:
+        error = traceback.format_exc()
+        retry = True
+    finally:
+        done.set()
+        heartbeat.join()
+
+    if retry:
+        _failed(delivery, error)
+        return False
+    if error:
+        logger.warning("Webhook delivery %s was rejected: %s" % (delivery, error))
+    (models.WebhookDelivery.objects
+            .filter(pk=delivery.pk, claim_id=delivery.claim_id)
+            .update(processed=True, error=error, last_modified=timezone.now()))
+    return not error
+
+def process_next():
+    """
+    Claim and process the next delivery.
+    Return:
+      bool: Whether there was a delivery to process
+    """
+    delivery = claim_next()
+    if delivery is None:
+        return False
+    process(delivery)
+    return True
+
+def cleanup():
+    """
+    Remove old processed deliveries.
+    """
+    old = timezone.now() - KEEP_PROCESSED
+    models.WebhookDelivery.objects.filter(processed=True, last_modified__lt=old).delete()
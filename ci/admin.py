@@ -94,7 +94,7 @@ class PullRequestAdmin(admin.ModelAdmin):
 
 class StepResultInline(admin.TabularInline):
     model = models.StepResult
-    exclude = ['output', 'position']
+    exclude = ['stored_output', 'position']
     readonly_fields = ['name', 'filename', 'abort_on_failure', 'allowed_to_fail', 'seconds', 'exit_status']
     can_delete = False
     max_num = 0
@@ -142,6 +142,7 @@ class StepEnvironmentAdmin(admin.ModelAdmin):
 class StepResultAdmin(admin.ModelAdmin):
     search_fields = ['filename', 'name']
     list_display = ['result_display']
+    exclude = ['stored_output']
     readonly_fields = ['output']
 
     def result_display(self, obj):
@@ -20,9 +20,10 @@ from django.utils.html import escape
 from ci.tests import utils
 from mock import patch
 from ci.github import api
-from ci import models, Permissions
+from ci import models, Permissions, PubSub
 from ci.tests import DBTester
 from django.test import override_settings
+import json
 
 @override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
 class Tests(DBTester.DBTester):
@@ -253,6 +254,146 @@ class Tests(DBTester.DBTester):
             response = self.client.get(url, data)
             self.assertEqual(response.status_code, 403)
 
+    @patch.object(api.GitHubAPI, 'is_collaborator')
+    @patch.object(Permissions, 'is_allowed_to_see_clients')
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0)
+    def test_job_results_offsets(self, mock_allowed, mock_is_collaborator):
+        mock_is_collaborator.return_value = False
+        mock_allowed.return_value = True
+        url = reverse('ci:ajax:job_results')
+        step_result = utils.create_step_result()
+        step_result.append_output("foo\n")
+        repo = step_result.job.recipe.repository
+        repo.active = True
+        repo.save()
+        recipe = step_result.job.recipe
+        recipe.private = False
+        recipe.save()
+
+        data = {'last_request': 10, 'job_id': step_result.job.pk, 'offsets': 'not json'}
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 400)
+
+        data['offsets'] = '[1, 2]'
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 400)
+
+        # No offset, get everything
+        data['offsets'] = '{}'
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results'][0]
+        self.assertEqual(result['output'], 'foo<br/>')
+        self.assertEqual(result['output_offset'], 4)
+        self.assertFalse(result['output_append'])
+
+        # Only the new output
+        step_result.append_output("\33[30mbar\33[0m")
+        data['offsets'] = json.dumps({step_result.pk: result['output_offset']})
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results'][0]
+        self.assertEqual(result['output'], '<span class="ansi30">bar</span>')
+        self.assertEqual(result['output_offset'], 16)
+        self.assertTrue(result['output_append'])
+
+        # Nothing new
+        data['offsets'] = json.dumps({step_result.pk: result['output_offset']})
+        response = self.client.get(url, data)
+        result = response.json()['results'][0]
+        self.assertEqual(result['output'], '')
+        self.assertEqual(result['output_offset'], 16)
+        self.assertTrue(result['output_append'])
+
+        # Output got replaced, get everything
+        step_result.output = "replaced"
+        step_result.save()
+        response = self.client.get(url, data)
+        result = response.json()['results'][0]
+        self.assertEqual(result['output'], 'replaced')
+        self.assertEqual(result['output_offset'], 8)
+        self.assertFalse(result['output_append'])
+
+        # Too big
+        step_result.output = "a" * 1024 * 1024 * 3
+        step_result.save()
+        response = self.client.get(url, data)
+        result = response.json()['results'][0]
+        self.assertTrue(result['output'].startswith("Output too large"))
+        self.assertEqual(result['output_offset'], None)
+        self.assertFalse(result['output_append'])
+
+    @patch.object(api.GitHubAPI, 'is_collaborator')
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0, STREAM_TIMEOUT=10)
+    def test_job_stream(self, mock_is_collaborator):
+        mock_is_collaborator.return_value = False
+        step_result = utils.create_step_result()
+        job = step_result.job
+        job.recipe.private = False
+        job.recipe.save()
+        job.recipe.repository.active = True
+        job.recipe.repository.save()
+        url = reverse('ci:ajax:job_stream', args=[job.pk])
+
+        with self.settings(STREAM_UPDATES=False):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400)
+
+        with self.settings(STREAM_UPDATES=True):
+            response = self.client.get(reverse('ci:ajax:job_stream', args=[1000]))
+            self.assertEqual(response.status_code, 404)
+
+            job.recipe.private = True
+            job.recipe.save()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 403)
+
+            job.recipe.private = False
+            job.recipe.save()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = iter(response.streaming_content)
+            self.assertEqual(next(stream), b'retry: 2000\n\n')
+            PubSub.publish(PubSub.job_channel(job.pk + 1), {'job_id': job.pk + 1})
+            PubSub.publish(PubSub.job_channel(job.pk), {'job_id': job.pk})
+            self.assertEqual(next(stream), ('data: {"job_id": %s}\n\n' % job.pk).encode())
+            response.close()
+
+        with self.settings(STREAM_UPDATES=True, STREAM_TIMEOUT=0.1):
+            with patch('ci.ajax.views.STREAM_KEEPALIVE', 0.01):
+                response = self.client.get(url)
+                content = list(response.streaming_content)
+                self.assertEqual(content[0], b'retry: 2000\n\n')
+                self.assertIn(b': keepalive\n\n', content)
+
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0, STREAM_UPDATES=True, STREAM_TIMEOUT=10)
+    def test_event_stream(self):
+        ev = utils.create_event()
+        url = reverse('ci:ajax:event_stream', args=[ev.pk])
+        with patch.object(Permissions, 'can_view_repo') as mock_view:
+            mock_view.return_value = False
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 403)
+
+            mock_view.return_value = True
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            stream = iter(response.streaming_content)
+            next(stream)
+            PubSub.publish(PubSub.event_channel(ev.pk), {'event_id': ev.pk})
+            self.assertEqual(next(stream), ('data: {"event_id": %s}\n\n' % ev.pk).encode())
+            response.close()
+
+        url = reverse('ci:ajax:main_stream')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        stream = iter(response.streaming_content)
+        next(stream)
+        PubSub.publish(PubSub.MAIN_CHANNEL, {'event_id': ev.pk})
+        self.assertEqual(next(stream), ('data: {"event_id": %s}\n\n' % ev.pk).encode())
+        response.close()
+
     @override_settings(PERMISSION_CACHE_TIMEOUT=0)
     def test_repo_update(self):
         url = reverse('ci:ajax:repo_update')
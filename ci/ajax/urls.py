@@ -27,6 +27,9 @@ urlpatterns = [
   re_path(r'^event_update/(?P<event_id>[0-9]+)/$', views.event_update, name='event_update'),
   re_path(r'^job_results/', views.job_results, name='job_results'),
   re_path(r'^job_results_html/', views.job_results_html, name='job_results_html'),
+  re_path(r'^job_stream/(?P<job_id>[0-9]+)/$', views.job_stream, name='job_stream'),
+  re_path(r'^event_stream/(?P<event_id>[0-9]+)/$', views.event_stream, name='event_stream'),
+  re_path(r'^main_stream/$', views.main_stream, name='main_stream'),
   re_path(r'^repo_update/', views.repo_update, name='repo_update'),
   re_path(r'^clients/', views.clients_update, name='clients'),
   re_path(r'^(?P<owner>[A-Za-z0-9]+)/(?P<repo>[A-Za-z0-9-_]+)/branches_status',
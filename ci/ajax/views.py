@@ -15,12 +15,15 @@
 
 from __future__ import unicode_literals, absolute_import
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from ci import models, views
 import datetime
-from ci import Permissions, TimeUtils, EventsStatus, RepositoryStatus
+import json
+import time
+from ci import Permissions, TimeUtils, EventsStatus, RepositoryStatus, PubSub, Heartbeat
 import logging
 logger = logging.getLogger('ci')
 
@@ -49,7 +52,7 @@ def event_update(request, event_id):
 
     ev_data = {'id': ev.pk,
         'complete': ev.complete,
-        'last_modified': TimeUtils.display_time_str(ev.last_modified),
+        'last_modified': TimeUtils.display_time_str(Heartbeat.last_modified(ev)),
         'created': TimeUtils.display_time_str(ev.created),
         'status': ev.status_slug(),
       }
@@ -144,15 +147,28 @@ def job_results(request):
       job_id: The pk of the job
       last_request: A timestamp of when client last requested this information. If the job
         hasn't been updated since that time we don't have to send as much information.
+      offsets: Optional JSON dict of result id to the length of the output the client already has.
+        For these results only the new output is sent.
     """
     if 'last_request' not in request.GET or 'job_id' not in request.GET:
         return HttpResponseBadRequest('Missing parameters')
 
+    offsets = {}
+    if 'offsets' in request.GET:
+        try:
+            offsets = json.loads(request.GET['offsets'])
+            if not isinstance(offsets, dict):
+                raise ValueError("Not a dict")
+            offsets = {str(key): int(value) for key, value in offsets.items() if value is not None}
+        except (ValueError, TypeError):
+            return HttpResponseBadRequest('Bad offsets')
+
     this_request = TimeUtils.get_local_timestamp()
     job_id = int(request.GET['job_id'])
     last_request = int(float(request.GET['last_request'])) # in case it has decimals
     dt = timezone.localtime(timezone.make_aware(datetime.datetime.utcfromtimestamp(last_request)))
     job = get_object_or_404(models.Job.objects.select_related("recipe", "client").prefetch_related("step_results"), pk=job_id)
+    job_last_modified = Heartbeat.last_modified(job)
     if not Permissions.can_view_repo(request.session, job.recipe.repository):
         return HttpResponseForbidden("Can't see repo")
     if not Permissions.can_see_results(request.session, job.recipe):
@@ -166,7 +182,7 @@ def job_results(request):
         'ready': job.ready,
         'invalidated': job.invalidated,
         'active': job.active,
-        'last_modified': TimeUtils.display_time_str(job.last_modified),
+        'last_modified': TimeUtils.display_time_str(job_last_modified),
         'created': TimeUtils.display_time_str(job.created),
         'client_name': '',
         'client_url': '',
@@ -174,7 +190,7 @@ def job_results(request):
         'recipe_sha': job.recipe.filename_sha[:6],
         }
 
-    if job.last_modified < dt:
+    if job_last_modified < dt:
         # always return the basic info since we need to update the
         # "natural" time
         return JsonResponse({'job_info': job_info, 'results': [], 'last_request': this_request})
@@ -193,11 +209,14 @@ def job_results(request):
         exit_status = ''
         if result.complete:
             exit_status = result.exit_status
+        output, output_offset, output_append = result.clean_output_since(offsets.get(str(result.id)))
         info = {'id': result.id,
             'name': result.name,
             'runtime': str(result.seconds),
             'exit_status': exit_status,
-            'output': result.clean_output(),
+            'output': output,
+            'output_offset': output_offset,
+            'output_append': output_append,
             'status': result.status_slug(),
             'running': result.status != models.JobStatus.NOT_STARTED,
             'complete': result.complete,
@@ -215,6 +234,74 @@ def job_results_html(request):
     return render(request, 'ci/ajax_test.html', {'content': response.content})
 
 
+# How often to send something on an idle stream so that
+# proxies don't close the connection
+STREAM_KEEPALIVE = 15
+
+def stream_messages(channels, timeout):
+    """
+    Generator of Server-Sent Events for messages published on channels.
+    Input:
+      channels[list[str]]: Channels to subscribe to
+      timeout[float]: Stop after this many seconds. The browser will reconnect.
+    """
+    subscription = PubSub.subscribe(channels)
+    try:
+        yield "retry: 2000\n\n"
+        end = time.time() + timeout
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            messages = subscription.get(min(remaining, STREAM_KEEPALIVE))
+            if not messages:
+                yield ": keepalive\n\n"
+            for channel, data in messages:
+                yield "data: %s\n\n" % json.dumps(data)
+    finally:
+        subscription.close()
+
+def stream_response(channels):
+    if not settings.STREAM_UPDATES:
+        return HttpResponseBadRequest('Streaming not enabled')
+    response = StreamingHttpResponse(stream_messages(channels, settings.STREAM_TIMEOUT),
+            content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the response
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def job_stream(request, job_id):
+    """
+    Server-Sent Events with updates for a job.
+    Each message has the job_id and whether the job page should refresh
+    all of its information. If a step result changed then its status
+    and any new output are included.
+    """
+    job = get_object_or_404(models.Job.objects.select_related("recipe__repository"), pk=job_id)
+    if not Permissions.can_view_repo(request.session, job.recipe.repository):
+        return HttpResponseForbidden("Can't see repo")
+    if not Permissions.can_see_results(request.session, job.recipe):
+        return HttpResponseForbidden("Can't see results")
+    return stream_response([PubSub.job_channel(job.pk)])
+
+def event_stream(request, event_id):
+    """
+    Server-Sent Events that get sent when any job on the event changes.
+    """
+    ev = get_object_or_404(models.Event.objects.select_related('base__branch__repository'), pk=event_id)
+    if not Permissions.can_view_repo(request.session, ev.base.repo()):
+        return HttpResponseForbidden("Can't see repo")
+    return stream_response([PubSub.event_channel(ev.pk)])
+
+def main_stream(request):
+    """
+    Server-Sent Events that get sent when any job changes.
+    These only have the job and event IDs, the page will still need
+    to get the information it is allowed to see.
+    """
+    return stream_response([PubSub.MAIN_CHANNEL])
+
 def clients_update(request):
     """
     Get the updates for the clients page.
@@ -15,9 +15,10 @@
 
 from __future__ import unicode_literals, absolute_import
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
 import logging, traceback
-from ci import models, PushEvent, PullRequestEvent, GitCommitData
+from ci import models, PushEvent, PullRequestEvent, GitCommitData, WebhookQueue
 import json
 
 logger = logging.getLogger('ci')
@@ -137,6 +138,9 @@ def webhook(request, build_key):
         logger.warning("User '%s' does not have any recipes" % user)
         return HttpResponseBadRequest("Error")
 
+    if settings.WEBHOOK_QUEUE:
+        return WebhookQueue.queue_delivery(request, user, data)
+
     return process_event(user, data)
 
 def process_event(user, json_data):
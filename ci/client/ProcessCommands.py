@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from ci import models
+from ci import models, GitOutbox
 import re
 
 def find_in_output(output, key):
@@ -49,7 +49,7 @@ def check_submodule_update(job, position):
     if not job.event.pull_request or not job.event.pull_request.review_comments_url:
         return False
     for mod in modules.split():
-        api = job.event.build_user.api()
+        api = GitOutbox.api(job.event.build_user)
         url = job.event.pull_request.review_comments_url
         sha = job.event.head.sha
         msg = "**Caution!** This contains a submodule update"
@@ -98,18 +98,17 @@ def check_post_comment(job, position, edit, delete):
         msg = f'Job [{job.unique_name()}]({job.absolute_url()}), step {step_name} on ' \
               f'{job.event.head.short_sha()} wanted to post the following:\n\n' \
               f'{message}'
-        api = builduser.api()
         url = job.event.comments_url
         comment_re = r"^Job \[%s\]\(.*\), step %s on \w+ wanted to post the following:" % (job.unique_name(),
                                                                                            step_name)
 
         if edit:
             msg = "%s\n\nThis comment will be updated on new commits." % msg
-            edit_comment(api, builduser, url, msg, comment_re)
+            GitOutbox.edit_comment(builduser, url, msg, comment_re)
         elif delete:
-            ensure_single_new_comment(api, builduser, url, msg, comment_re)
+            GitOutbox.ensure_single_new_comment(builduser, url, msg, comment_re)
         else:
-            api.pr_comment(url, msg)
+            GitOutbox.api(builduser).pr_comment(url, msg)
         return True
     return False
 
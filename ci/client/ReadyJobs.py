@@ -13,8 +13,11 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from ci import models
+from ci import models, DispatchPolicy
+from django.db import transaction, connection
 from django.db.models import Q
+import logging
+logger = logging.getLogger('ci')
 
 def get_ready_jobs():
     jobs = (models.Job.objects
@@ -43,3 +46,83 @@ def get_ready_jobs():
           ready_jobs.append(job)
 
     return ready_jobs
+
+@transaction.atomic
+def rebuild_ready_queue():
+    """
+    Rebuild the ready job queue from scratch.
+    The queue is kept up to date as jobs change so this is only
+    needed to populate it initially and to pick up anything that
+    was changed behind our back, like a branch setting.
+    Return:
+      int: Number of jobs in the queue
+    """
+    models.ReadyJob.objects.all().delete()
+    policy = DispatchPolicy.get_policy()
+    runtimes = DispatchPolicy.load_runtimes() if policy.uses_runtimes else None
+    entries = {}
+    for job in get_ready_jobs():
+        if job.pk not in entries:
+            entries[job.pk] = models.ReadyJob(job=job, **models.ReadyJob.values_for_job(job, policy, runtimes))
+    entries = list(entries.values())
+    # Another process could be rebuilding at the same time
+    models.ReadyJob.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+def ready_queue(client, build_keys, build_config):
+    """
+    Get the entries in the ready job queue that a client could claim, in
+    the order that they should be handed out.
+    The entries are read one at a time since normally the first one gets claimed.
+    If the database supports it, the entry is locked and entries that are
+    locked by other clients are skipped. This needs to be called in a transaction.
+    Input:
+      client[models.Client]: The client looking for a job
+      build_keys[list]: Build keys the client has
+      build_config[str]: Name of the build config
+    Return:
+      generator of models.ReadyJob
+    """
+    build_users = models.GitUser.objects.filter(build_key__in=build_keys)
+    q = (models.ReadyJob.objects
+            .filter(config__name=build_config, build_user__in=build_users)
+            .filter(Q(client=None) | Q(client__name=client.name))
+            .select_related('job__config', 'job__client', 'job__recipe__build_user', 'job__event'))
+    features = connection.features
+    if features.has_select_for_update_skip_locked and features.has_select_for_update_of:
+        q = q.select_for_update(skip_locked=True, of=('self',))
+
+    # Same order as get_ready_jobs(), except that the dispatch policy
+    # decides the order of the jobs with the same priority
+    for ordered in [q.filter(current_push=False).order_by('-priority', 'dispatch_time', 'created'),
+            q.filter(current_push=True).order_by('created', '-priority')]:
+        seen = []
+        while True:
+            entry = ordered.exclude(pk__in=seen).first()
+            if entry is None:
+                break
+            seen.append(entry.pk)
+            yield entry
+
+def claim_job(job, client):
+    """
+    Atomically claim a job for a client.
+    The job is only updated if it is still ready to run, so if multiple
+    clients try to claim the same job only one of them gets it.
+    Input:
+      job[models.Job]: The job to claim
+      client[models.Client]: The client claiming the job
+    Return:
+      bool: Whether the client got the job
+    """
+    claimed = (models.Job.objects
+            .filter(pk=job.pk,
+                complete=False,
+                active=True,
+                ready=True,
+                status=models.JobStatus.NOT_STARTED)
+            .update(client=client, status=models.JobStatus.RUNNING))
+    if claimed:
+        job.client = client
+        job.status = models.JobStatus.RUNNING
+    return claimed == 1
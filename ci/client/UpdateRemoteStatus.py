@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from ci import models
+from ci import models, GitOutbox
 from django.urls import reverse
 from ci.client import ProcessCommands
 from ci.client import ParseOutput
@@ -46,7 +46,7 @@ def job_started(job):
     This will update the CI status on the Git server.
     """
     if job.event.cause == models.Event.PULL_REQUEST:
-        git_api = job.event.build_user.api()
+        git_api = GitOutbox.api(job.event.build_user)
         git_api.update_status(
             job.event.base,
             job.event.head,
@@ -66,7 +66,7 @@ def step_start_pr_status(step_result, job):
     if job.event.cause != models.Event.PULL_REQUEST:
         return
 
-    git_api = job.event.build_user.api()
+    git_api = GitOutbox.api(job.event.build_user)
     status = git_api.RUNNING
     desc = '({}/{}) {}'.format(step_result.position+1, job.step_results.count(), step_result.name)
     job_stage = git_api.STATUS_CONTINUE_RUNNING
@@ -90,7 +90,7 @@ def job_complete_status(job, do_status_update=True):
     try to add a comment.
     """
     if job.event.cause == models.Event.PULL_REQUEST or job.event.cause == models.Event.PUSH:
-        git_api = job.event.build_user.api()
+        git_api = GitOutbox.api(job.event.build_user)
         if do_status_update:
             status_dict = { models.JobStatus.FAILED_OK:(git_api.SUCCESS, "Failed but allowed"),
                 models.JobStatus.CANCELED: (git_api.CANCELED, "Canceled"),
@@ -122,7 +122,7 @@ def create_issue_on_fail(job):
             ):
         return
 
-    git_api = job.event.build_user.api()
+    git_api = GitOutbox.api(job.event.build_user)
 
     job_url = job.absolute_url()
     commit = job.event.head
@@ -151,7 +151,7 @@ def check_automerge(event):
             or not repo.auto_merge_enabled()):
         return
 
-    git_api = event.build_user.api()
+    git_api = GitOutbox.api(event.build_user)
     git_api.automerge(repo, event.pull_request.number)
 
 def job_wont_run(job):
@@ -160,7 +160,7 @@ def job_wont_run(job):
     This will update the CI status on the Git server.
     """
     if job.event.cause == models.Event.PULL_REQUEST:
-        git_api = job.event.build_user.api()
+        git_api = GitOutbox.api(job.event.build_user)
         git_api.update_status(
             job.event.base,
             job.event.head,
@@ -198,8 +198,7 @@ def create_event_summary(event):
                         failed = " : %s" % result.name
                 msg += "[%s](%s) : **%s**%s%s  \n" % (j.unique_name(), abs_job_url, j.status_str(), failed, inv)
 
-    git_api = event.build_user.api()
-    ProcessCommands.edit_comment(git_api, event.build_user, event.comments_url, msg, msg_re)
+    GitOutbox.edit_comment(event.build_user, event.comments_url, msg, msg_re)
 
 def event_complete(event):
     """
@@ -220,7 +219,7 @@ def event_complete(event):
     if not label:
         return
 
-    git_api = event.build_user.api()
+    git_api = GitOutbox.api(event.build_user)
     if event.status == models.JobStatus.FAILED_OK:
         git_api.add_pr_label(event.base.repo(), event.pull_request.number, label)
     else:
@@ -0,0 +1,117 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from datetime import timedelta
+from ci import models
+from ci.client import views
+from ci.tests import utils, DBTester
+import time
+import logging
+logger = logging.getLogger('ci')
+
+def create_job_with_steps(user, num_steps, num_env=3, name="benchmark"):
+    recipe = utils.create_recipe(name=name, user=user)
+    for i in range(num_steps):
+        step = utils.create_step(name="step %s" % i, recipe=recipe, position=i)
+        for j in range(num_env):
+            utils.create_step_environment(name="ENV_%s" % j, value=str(i), step=step)
+    return utils.create_job(recipe=recipe, user=user)
+
+def per_step_results(job):
+    """
+    How the step results used to be created, one step at a time.
+    Used as the baseline.
+    """
+    job.step_results.all().delete()
+    for step in job.recipe.steps.order_by('position'):
+        step_result, created = models.StepResult.objects.get_or_create(
+            job=job,
+            name=step.name,
+            position=step.position,
+            abort_on_failure=step.abort_on_failure,
+            allowed_to_fail=step.allowed_to_fail,
+            filename=step.filename)
+        step_result.output = ''
+        step_result.complete = False
+        step_result.seconds = timedelta(seconds=0)
+        step_result.status = models.JobStatus.NOT_STARTED
+        step_result.save()
+        {env.name: env.value for env in step.step_environment.all()}
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+class Tests(DBTester.DBTester):
+    def setUp(self):
+        super(Tests, self).setUp()
+        self.recipe_dir = utils.RecipeDir()
+        self.user = utils.get_test_user()
+
+    def tearDown(self):
+        super(Tests, self).tearDown()
+        self.recipe_dir.__exit__(None, None, None)
+
+    def count_queries(self, func, job):
+        with CaptureQueriesContext(connection) as queries:
+            func(job)
+        return len(queries)
+
+    def time_calls(self, func, job, num_calls=20):
+        start = time.perf_counter()
+        for i in range(num_calls):
+            func(job)
+        return (time.perf_counter() - start)/num_calls
+
+    def test_get_job_info_queries(self):
+        small_job = create_job_with_steps(self.user, 1, name="small")
+        big_job = create_job_with_steps(self.user, 15, name="big")
+        # Prime the script cache and the related objects of the jobs
+        views.get_job_info(small_job)
+        views.get_job_info(big_job)
+
+        # The number of queries doesn't depend on the number of steps
+        small_queries = self.count_queries(views.get_job_info, small_job)
+        big_queries = self.count_queries(views.get_job_info, big_job)
+        self.assertEqual(small_queries, big_queries)
+
+        data = views.get_job_info(big_job)
+        self.assertEqual(len(data['steps']), 15)
+        results = {r.pk: r for r in big_job.step_results.all()}
+        self.assertEqual(len(results), 15)
+        for i, step in enumerate(data['steps']):
+            self.assertEqual(step['step_num'], i)
+            self.assertEqual(step['step_name'], "step %s" % i)
+            self.assertEqual(step['environment']['ENV_0'], str(i))
+            self.assertEqual(step['environment']['CIVET_STEP_NAME'], "step %s" % i)
+            result = results[step['stepresult_id']]
+            self.assertEqual(result.position, i)
+            self.assertEqual(result.name, step['step_name'])
+            self.assertEqual(result.status, models.JobStatus.NOT_STARTED)
+            self.assertEqual(result.output, '')
+
+    def test_claim_latency(self):
+        job = create_job_with_steps(self.user, 15)
+        views.get_job_info(job)
+
+        baseline_queries = self.count_queries(per_step_results, job)
+        claim_queries = self.count_queries(views.get_job_info, job)
+        # This includes everything else for the job, not just the step results
+        self.assertLess(claim_queries, baseline_queries/2)
+
+        baseline = self.time_calls(per_step_results, job)
+        claim = self.time_calls(views.get_job_info, job)
+        logger.info("Step results for a 15 step job: per step %.2fms, %s queries. get_job_info %.2fms, %s queries"
+                % (baseline*1000, baseline_queries, claim*1000, claim_queries))
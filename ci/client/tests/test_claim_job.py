@@ -0,0 +1,106 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import TransactionTestCase, override_settings
+from django.db import connection
+from mock import patch
+from ci import models
+from ci.client import views, ReadyJobs
+from ci.tests import utils, DBTester
+import threading
+
+def create_ready_jobs(user, num_jobs):
+    recipe = utils.create_recipe(user=user)
+    jobs = []
+    for i in range(num_jobs):
+        event = utils.create_event(user=user, commit1=str(1000 + i))
+        job = utils.create_job(recipe=recipe, event=event, user=user)
+        utils.update_job(job, ready=True, active=True)
+        jobs.append(job)
+    return jobs
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+class Tests(DBTester.DBTester):
+    def test_claim_race(self):
+        """
+        Another client claims the job after we picked it but before we claimed it.
+        """
+        user = utils.get_test_user()
+        jobs = create_ready_jobs(user, 2)
+        client = utils.create_client(name="client")
+        other_client = utils.create_client(name="other client")
+        real_claim = ReadyJobs.claim_job
+
+        def racing_claim(job, claim_client):
+            if job.pk == jobs[0].pk:
+                self.assertTrue(real_claim(models.Job.objects.get(pk=job.pk), other_client))
+            return real_claim(job, claim_client)
+
+        with patch.object(views, "claim_job", side_effect=racing_claim):
+            job, job_info, build_key = views.get_cached_job(client, [user.build_key], [jobs[0].config.name])
+        self.assertEqual(job.pk, jobs[1].pk)
+        self.assertEqual(job.client, client)
+        self.assertEqual(build_key, user.build_key)
+        jobs[0].refresh_from_db()
+        self.assertEqual(jobs[0].client, other_client)
+
+        # Claiming a job that isn't ready anymore fails
+        self.assertFalse(ReadyJobs.claim_job(jobs[1], other_client))
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+class StressTests(TransactionTestCase):
+    def test_concurrent_claims(self):
+        """
+        Lots of clients asking for jobs at the same time should
+        never get the same job.
+        """
+        num_jobs = 40
+        num_clients = 8
+        user = utils.get_test_user()
+        jobs = create_ready_jobs(user, num_jobs)
+        config = jobs[0].config.name
+        clients = [utils.create_client(name="client%s" % i) for i in range(num_clients)]
+        claimed = []
+        errors = []
+        start = threading.Barrier(num_clients)
+
+        def poll(client):
+            try:
+                start.wait()
+                while True:
+                    job, job_info, build_key = views.get_cached_job(client, [user.build_key], [config])
+                    if job is None:
+                        break
+                    claimed.append((job.pk, client.pk))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=poll, args=(c,)) for c in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        claimed_jobs = [pk for pk, client_pk in claimed]
+        self.assertEqual(sorted(claimed_jobs), sorted([j.pk for j in jobs]))
+        for pk, client_pk in claimed:
+            job = models.Job.objects.get(pk=pk)
+            self.assertEqual(job.status, models.JobStatus.RUNNING)
+            self.assertEqual(job.client_id, client_pk)
+        self.assertEqual(models.ReadyJob.objects.count(), 0)
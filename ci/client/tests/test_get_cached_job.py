@@ -17,7 +17,8 @@ from __future__ import unicode_literals, absolute_import
 from django.test import override_settings
 from django.conf import settings
 import  time
-from ci import models
+from mock import patch
+from ci import models, PubSub
 from ci.client import views
 from ci.tests import utils
 from ci.client.tests import ClientTester
@@ -44,50 +45,91 @@ class Tests(ClientTester.ClientTester):
 
         self.event_counter = 0
 
-    def create_ready_job(self, config=None):
+    def create_ready_job(self, config=None, recipe=None):
         event = utils.create_event(user=self.user, commit1=1234 + self.event_counter)
         self.event_counter += 1
-        job = utils.create_job(user=self.user, event=event, config=config)
+        job = utils.create_job(user=self.user, event=event, config=config, recipe=recipe)
         job.ready = True
         job.active = True
         job.status = models.JobStatus.NOT_STARTED
         job.save()
         return job
 
-    def test_cached(self):
-        # Should have no cache at this point
-        cached_jobs = self.get_cached_jobs()
-        self.assertIsNone(cached_jobs)
-
+    def test_ready_queue(self):
         # Nothing available
         self.assertIsNone(self.get_cached_job())
-        cached_jobs = self.get_cached_jobs()
-        self.assertIsNotNone(cached_jobs)
-        cached_jobs_expires = cached_jobs.get('expires')
+        self.assertIsNotNone(cache.get(views.ready_queue_rebuilt_key()))
 
-        # Create a job
+        # A new ready job is available right away
         job = self.create_ready_job()
+        self.assertEqual(models.ReadyJob.objects.count(), 1)
+        get_job = self.get_cached_job()
+        self.assertIsNotNone(get_job)
+        self.assertEqual(get_job.pk, job.pk)
+        self.assertEqual(get_job.status, models.JobStatus.RUNNING)
+        self.assertEqual(models.ReadyJob.objects.count(), 0)
+        self.assertIsNone(self.get_cached_job())
 
-        # Should still be nothing available
-        cached_jobs = self.get_cached_jobs()
-        self.assertEqual(cached_jobs['expires'], cached_jobs_expires)
+        # Invalidated jobs go back in the queue once they are ready
+        job.refresh_from_db()
+        job.set_invalidated("test")
+        self.assertEqual(models.ReadyJob.objects.count(), 0)
+        job.event.make_jobs_ready()
+        self.assertEqual(models.ReadyJob.objects.count(), 1)
+
+        # Canceled jobs are removed
+        job.refresh_from_db()
+        views.views.set_job_canceled(job)
+        self.assertEqual(models.ReadyJob.objects.count(), 0)
         self.assertIsNone(self.get_cached_job())
 
-        # Eventually a job should be available
-        for i in range(self.poll_time):
-            time.sleep(1)
-            get_job = self.get_cached_job()
+    def test_rebuild(self):
+        self.assertEqual(views.update_cached_jobs(), 0)
+        job = self.create_ready_job()
+        # Lost from the queue behind our back
+        models.ReadyJob.objects.all().delete()
+        self.assertIsNone(self.get_cached_job())
 
-            if get_job is not None:
-                cached_jobs = self.get_cached_jobs()
-                self.assertNotEqual(cached_jobs.get('expires'), cached_jobs_expires)
-                get_job_again = self.get_cached_job()
-                self.assertIsNone(get_job_again)
-                break
-        self.assertGreater(i, 0)
+        # Eventually the queue is rebuilt
+        cache.set(views.ready_queue_rebuilt_key(), time.time() - self.poll_time)
+        get_job = self.get_cached_job()
         self.assertIsNotNone(get_job)
         self.assertEqual(get_job.pk, job.pk)
 
+        # Never rebuilt with an interval of 0
+        job2 = self.create_ready_job()
+        models.ReadyJob.objects.all().delete()
+        cache.set(views.ready_queue_rebuilt_key(), time.time() - self.poll_time)
+        with self.settings(GET_JOB_UPDATE_INTERVAL=0):
+            self.assertIsNone(self.get_cached_job())
+        # Unless it was never built
+        cache.delete(views.ready_queue_rebuilt_key())
+        self.assertEqual(self.get_cached_job().pk, job2.pk)
+
+    def test_order(self):
+        job1 = self.create_ready_job()
+        job2 = self.create_ready_job()
+        recipe = utils.create_recipe(name="other recipe", user=self.user)
+        job3 = self.create_ready_job(recipe=recipe)
+        # Changing the priority of the recipe updates the queue
+        recipe.priority = 10
+        recipe.save()
+        self.assertEqual(self.get_cached_job().pk, job3.pk)
+        self.assertEqual(self.get_cached_job().pk, job1.pk)
+        self.assertEqual(self.get_cached_job().pk, job2.pk)
+        self.assertIsNone(self.get_cached_job())
+
+        # Rebuilding the queue gives the same order
+        job1.refresh_from_db()
+        job1.set_invalidated("test")
+        job3.refresh_from_db()
+        job3.set_invalidated("test")
+        utils.update_job(job1, ready=True)
+        utils.update_job(job3, ready=True)
+        self.assertEqual(views.update_cached_jobs(), 2)
+        self.assertEqual(self.get_cached_job().pk, job3.pk)
+        self.assertEqual(self.get_cached_job().pk, job1.pk)
+
     def test_config_priority(self):
         other_build_config = utils.create_build_config('testOtherBuildConfig')
         build_configs = [str(other_build_config)] + self.build_configs
@@ -101,27 +143,15 @@ class Tests(ClientTester.ClientTester):
         self.assertEqual(second_job.config, other_build_config)
 
         # Should get the second job first, even though it was added second
-        for i in range(self.poll_time):
-            job, _, _ = views.get_cached_job(self.client, self.build_keys, build_configs)
-
-            if job is not None:
-                self.assertEqual(other_build_config, job.config)
-                break
-        self.assertGreater(i, 0)
+        job, _, _ = views.get_cached_job(self.client, self.build_keys, build_configs)
+        self.assertEqual(other_build_config, job.config)
+        job, _, _ = views.get_cached_job(self.client, self.build_keys, build_configs)
+        self.assertEqual(first_job, job)
 
     def test_job_changed(self):
-        def check(before_action, after_action, modify_job=None):
-            cached_jobs = views.update_cached_jobs()
-            self.assertEqual(len(cached_jobs['jobs_by_config']), 0)
+        def check(before_action, after_action):
+            self.assertEqual(views.update_cached_jobs(), 0)
             job = self.create_ready_job()
-            if modify_job is not None:
-                modify_job(job)
-            cached_jobs = views.update_cached_jobs()
-            self.assertEqual(len(cached_jobs['jobs_by_config']), 1)
-            self.assertIn(self.build_configs[0], cached_jobs['jobs_by_config'])
-            jobs = cached_jobs['jobs_by_config'][self.build_configs[0]]
-            self.assertEqual(len(jobs), 1)
-            self.assertEqual(jobs[0]['pk'], job.pk)
 
             state = {}
             before_action(job, state)
@@ -130,7 +160,7 @@ class Tests(ClientTester.ClientTester):
             after_action(job, state)
             get_job = self.get_cached_job()
             self.assertIsNotNone(get_job)
-            self.assertEqual(cached_jobs['jobs_by_config'][self.build_configs[0]][0]['pk'], job.pk)
+            self.assertEqual(get_job.pk, job.pk)
 
         def set_running(job, state):
             job.status = models.JobStatus.RUNNING
@@ -157,17 +187,86 @@ class Tests(ClientTester.ClientTester):
         def change_back_build_key(job, state):
             self.user.build_key = state['build_key']
             self.user.save()
-        check(change_build_config, change_back_build_config)
+        check(change_build_key, change_back_build_key)
 
+        other_client = utils.create_client(name="other client")
         def set_client(job, state):
-            job.client = self.client
+            job.client = other_client
             job.save()
         def remove_client(job, state):
             job.client = None
             job.save()
         check(set_client, remove_client)
 
-        def modify_job(job):
-            job.client = self.client
+    @override_settings(GET_JOB_MAX_WAIT=30)
+    def test_notify_ready(self):
+        sub = PubSub.subscribe([PubSub.ready_channel(self.build_configs[0])])
+        # Clients are only notified once the job is committed
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = self.create_ready_job()
+            self.assertEqual(sub.get(0), [])
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(sub.get(0), [(PubSub.ready_channel(self.build_configs[0]), {'job_id': job.pk})])
+
+        # Saving a job already in the queue doesn't notify again
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
             job.save()
-        check(remove_client, set_client, modify_job)
+        self.assertEqual(len(callbacks), 0)
+
+        # Not notified if clients can't wait
+        job.set_invalidated("test")
+        with self.settings(GET_JOB_MAX_WAIT=0):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                models.Event.objects.get(pk=job.event_id).make_jobs_ready()
+        self.assertEqual(models.ReadyJob.objects.count(), 1)
+        self.assertEqual(len(callbacks), 0)
+        sub.close()
+
+    @override_settings(GET_JOB_MAX_WAIT=30)
+    def test_wait_for_job(self):
+        wait_for_job = lambda wait: views.wait_for_job(self.client, self.build_keys, self.build_configs, wait)[0]
+
+        # Not waiting
+        start = time.time()
+        self.assertIsNone(wait_for_job(0))
+        self.assertLess(time.time() - start, 1)
+
+        # Nothing becomes ready
+        start = time.time()
+        self.assertIsNone(wait_for_job(0.2))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+        # A job is there already
+        job = self.create_ready_job()
+        self.assertEqual(wait_for_job(10).pk, job.pk)
+
+        # The job becomes ready while the client is waiting.
+        # Simulate another request making it ready after the first look.
+        job = self.create_ready_job()
+        job.ready = False
+        job.save()
+        orig_get_cached_job = views.get_cached_job
+        calls = []
+        def make_ready(*args):
+            ret = orig_get_cached_job(*args)
+            if not calls:
+                with self.captureOnCommitCallbacks(execute=True):
+                    job.ready = True
+                    job.save()
+            calls.append(ret)
+            return ret
+        start = time.time()
+        with patch.object(views, 'get_cached_job', side_effect=make_ready):
+            self.assertEqual(wait_for_job(10).pk, job.pk)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(GET_JOB_MAX_WAIT=0.2)
+    def test_get_job_wait(self):
+        self.assertEqual(views.get_job_wait({}), 0)
+        self.assertEqual(views.get_job_wait({'wait': 0.1}), 0.1)
+        self.assertEqual(views.get_job_wait({'wait': 100}), 0.2)
+        self.assertEqual(views.get_job_wait({'wait': -1}), 0)
+        self.assertEqual(views.get_job_wait({'wait': 'foo'}), 0)
+        self.assertEqual(views.get_job_wait({'wait': None}), 0)
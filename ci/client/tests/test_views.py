@@ -17,10 +17,13 @@ from __future__ import unicode_literals, absolute_import
 from django.urls import reverse
 from django.http import HttpResponseNotAllowed, HttpResponseBadRequest
 from django.test import override_settings
+from django.conf import settings
+from django.db import connection
 import json
+import gzip
 from mock import patch
-from ci import models, Permissions
-from ci.client import views
+from ci import models, Permissions, PubSub
+from ci.client import views, UpdateRemoteStatus
 from ci.recipe import file_utils
 from ci.tests import utils
 from ci.github.api import GitHubAPI
@@ -209,6 +212,52 @@ class Tests(ClientTester.ClientTester):
         self.assertNotEqual(data, None)
         self.assertTrue(isinstance(response, HttpResponseBadRequest))
 
+    def gzip_post_request(self, body):
+        return self.factory.post('/', body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+
+    def test_check_post_gzip(self):
+        required = ['foo',]
+        body = gzip.compress(json.dumps({'foo': 'bar'}).encode('utf-8'))
+        request = self.gzip_post_request(body)
+        data, response = views.check_post(request, required)
+        self.assertEqual(data, {'foo': 'bar'})
+        self.assertEqual(response, None)
+
+        # not actually gzipped
+        request = self.gzip_post_request(json.dumps({'foo': 'bar'}))
+        data, response = views.check_post(request, required)
+        self.assertEqual(data, None)
+        self.assertTrue(isinstance(response, HttpResponseBadRequest))
+
+        # truncated
+        request = self.gzip_post_request(body[:-10])
+        data, response = views.check_post(request, required)
+        self.assertEqual(data, None)
+        self.assertTrue(isinstance(response, HttpResponseBadRequest))
+
+        # decompresses to too much
+        with self.settings(CLIENT_MAX_DECOMPRESSED_SIZE=5):
+            request = self.gzip_post_request(body)
+            data, response = views.check_post(request, required)
+            self.assertEqual(data, None)
+            self.assertEqual(response.status_code, 413)
+
+        # Goes all the way through a view
+        user = utils.get_test_user()
+        job = utils.create_job(user=user)
+        result = utils.create_step_result(job=job)
+        client = utils.create_client()
+        job.client = client
+        job.status = models.JobStatus.RUNNING
+        job.save()
+        post_data = {'step_num': result.position, 'output': 'gzipped output', 'time': 1, 'complete': False, 'exit_status': 0}
+        url = reverse('ci:client:update_step_result', args=[user.build_key, client.name, result.pk])
+        body = gzip.compress(json.dumps(post_data).encode('utf-8'))
+        response = self.client.post(url, body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        result.refresh_from_db()
+        self.assertIn('gzipped output', result.output)
+
     @patch.object(file_utils, 'get_contents')
     def test_get_job_info(self, contents_mock):
         with utils.RecipeDir():
@@ -220,13 +269,32 @@ class Tests(ClientTester.ClientTester):
             utils.create_step_environment(step=step)
             utils.create_recipe_environment(recipe=job.recipe)
             self.assertEqual(job.recipe_repo_sha, "")
+            recipe_repo = models.RecipeRepository.load()
+            recipe_repo.sha = file_utils.get_repo_sha(settings.RECIPE_BASE_DIR)
+            recipe_repo.save()
             self.set_counts()
             data = views.get_job_info(job)
             self.compare_counts()
             job.refresh_from_db()
-            self.assertNotEqual(job.recipe_repo_sha, "")
+            self.assertEqual(job.recipe_repo_sha, recipe_repo.sha)
             # hex shas are 40 characters
             self.assertEqual(len(job.recipe_repo_sha), 40)
+            self.assertEqual(data['steps'][0]['script'], 'contents')
+            self.assertEqual(data['prestep_sources'], ['contents'])
+            # Only read once
+            self.assertEqual(contents_mock.call_count, 1)
+            views.get_job_info(job)
+            self.assertEqual(contents_mock.call_count, 1)
+
+            # The recipes got reloaded
+            recipe_repo.sha = "1"*40
+            recipe_repo.save()
+            contents_mock.return_value = 'new contents'
+            data = views.get_job_info(job)
+            self.assertEqual(contents_mock.call_count, 2)
+            self.assertEqual(data['steps'][0]['script'], 'new contents')
+            job.refresh_from_db()
+            self.assertEqual(job.recipe_repo_sha, recipe_repo.sha)
             self.assertIn('recipe_name', data)
             self.assertIn('environment', data)
             self.assertIn('job_id', data)
@@ -686,6 +754,16 @@ class Tests(ClientTester.ClientTester):
         self.assertEqual(data["command"], None)
         result.refresh_from_db()
         self.assertEqual(result.status, models.JobStatus.RUNNING)
+        self.assertEqual(result.output, "output")
+
+        # output gets appended as a new chunk
+        post_data["output"] = " more"
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        result.refresh_from_db()
+        self.assertEqual(result.chunks.count(), 2)
+        self.assertEqual(result.output, "output more")
+        post_data["output"] = "output"
 
         # test when the user invalidates a job while it is running
         job.status = models.JobStatus.NOT_STARTED
@@ -903,6 +981,100 @@ class Tests(ClientTester.ClientTester):
         self.assertEqual(result.status, models.JobStatus.FAILED_OK)
         self.assertEqual(result.job.failed_step, result.name)
 
+    def test_complete_step_result_replaces_output(self):
+        job, result = self.create_running_job()
+        result.append_output("partial output")
+        post_data = self.create_complete_step_result_post_data(result.position, output="full output")
+        url = self.complete_step_result_url(job)
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        result.refresh_from_db()
+        self.assertEqual(result.chunks.count(), 0)
+        self.assertEqual(result.output, "full output")
+
+        # not complete, just append
+        post_data = self.create_complete_step_result_post_data(result.position, output=" more", complete=False)
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        result.refresh_from_db()
+        self.assertEqual(result.output, "full output more")
+
+    @override_settings(STREAM_UPDATES=True)
+    def test_publish_job_update(self):
+        job, result = self.create_running_job()
+        build_key = job.recipe.build_user.build_key
+        job_sub = PubSub.subscribe([PubSub.job_channel(job.pk)])
+        event_sub = PubSub.subscribe([PubSub.event_channel(job.event.pk), PubSub.MAIN_CHANNEL])
+
+        url = reverse('ci:client:start_step_result', args=[build_key, job.client.name, result.pk])
+        post_data = self.create_complete_step_result_post_data(result.position, output="", complete=False)
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        msgs = job_sub.get(0)
+        self.assertEqual(len(msgs), 1)
+        data = msgs[0][1]
+        self.assertEqual(data["job_id"], job.pk)
+        self.assertFalse(data["refresh"])
+        self.assertEqual(data["result"]["id"], result.pk)
+        self.assertEqual(data["result"]["status"], "Running")
+        self.assertNotIn("output", data["result"])
+        # Only a change in the status of the job goes to the event and main pages
+        self.assertEqual(event_sub.get(0), [])
+
+        # New output gets sent along, the event doesn't need to know
+        url = reverse('ci:client:update_step_result', args=[build_key, job.client.name, result.pk])
+        post_data["output"] = "foo\n"
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        post_data["output"] = "bar"
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        msgs = job_sub.get(0)
+        self.assertEqual(len(msgs), 2)
+        data = msgs[1][1]["result"]
+        self.assertEqual(data["output"], "bar")
+        self.assertEqual(data["output_start"], 4)
+        self.assertEqual(data["output_offset"], 7)
+        self.assertEqual(data["output_size"], "7.0 B")
+        self.assertEqual(event_sub.get(0), [])
+
+        # Completing replaces the output, so the page needs to refresh
+        url = self.complete_step_result_url(job)
+        post_data = self.create_complete_step_result_post_data(result.position, output="foo\nbar")
+        response = self.client_post_json(url, post_data)
+        self.assertEqual(response.status_code, 200)
+        msgs = job_sub.get(0)
+        self.assertEqual(len(msgs), 1)
+        self.assertTrue(msgs[0][1]["refresh"])
+        self.assertTrue(msgs[0][1]["result"]["complete"])
+        self.assertNotIn("output", msgs[0][1]["result"])
+        self.assertEqual(event_sub.get(0), [])
+
+        url = reverse('ci:client:job_finished', args=[build_key, job.client.name, job.pk])
+        response = self.client_post_json(url, {'seconds': 0, 'complete': True})
+        self.assertEqual(response.status_code, 200)
+        msgs = job_sub.get(0)
+        self.assertEqual(len(msgs), 1)
+        self.assertTrue(msgs[0][1]["refresh"])
+        self.assertNotIn("result", msgs[0][1])
+        self.assertEqual(len(event_sub.get(0)), 2)
+
+        with self.settings(STREAM_UPDATES=False):
+            views.publish_job_update(job, refresh=True, event_changed=True)
+            self.assertEqual(job_sub.get(0), [])
+            self.assertEqual(event_sub.get(0), [])
+
+    def test_update_step_result_bad_output(self):
+        job, result = self.create_running_job()
+        post_data = self.create_complete_step_result_post_data(result.position, complete=False)
+        url = reverse('ci:client:update_step_result', args=[job.recipe.build_user.build_key, job.client.name, result.pk])
+        with patch.object(models.StepResult, 'append_output') as mock_append:
+            mock_append.side_effect = [Exception("BAM!"), None]
+            response = self.client_post_json(url, post_data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mock_append.call_count, 2)
+            self.assertIn("BAM!", mock_append.call_args[0][0])
+
     def test_complete_step_result_bad_output(self):
         job, result = self.create_running_job()
         post_data = self.create_complete_step_result_post_data(result.position, exit_status=1)
@@ -914,6 +1086,93 @@ class Tests(ClientTester.ClientTester):
             self.compare_counts()
             self.assertEqual(response.status_code, 200)
 
+    def test_batch_update(self):
+        job, result = self.create_running_job()
+        result2 = utils.create_step_result(job=job, name="step 2", position=1)
+        build_key = job.recipe.build_user.build_key
+        url = reverse('ci:client:batch_update', args=[build_key, job.client.name, job.pk])
+        start_data = self.create_complete_step_result_post_data(result.position, output="", complete=False)
+        update_data = self.create_complete_step_result_post_data(result.position, output="some ", complete=False)
+        complete_data = self.create_complete_step_result_post_data(result.position, output="some output", exit_status=1)
+        updates = [{'type': 'start_step_result', 'stepresult_id': result.pk, 'data': start_data},
+            {'type': 'update_step_result', 'stepresult_id': result.pk, 'data': update_data},
+            {'type': 'complete_step_result', 'stepresult_id': result.pk, 'data': complete_data},
+            {'type': 'start_step_result', 'stepresult_id': result2.pk, 'data': start_data},
+            ]
+
+        # only post allowed
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 405)
+
+        # bad updates
+        for bad in [{'updates': 'foo'},
+                {'updates': [{'type': 'foo', 'stepresult_id': result.pk, 'data': start_data}]},
+                {'updates': [{'type': 'start_step_result', 'stepresult_id': result.pk, 'data': {}}]},
+                {'updates': [{'type': 'start_step_result', 'data': start_data}]},
+                {'updates': [{'type': 'start_step_result', 'stepresult_id': 0, 'data': start_data}]},
+                ]:
+            response = self.client_post_json(url, bad)
+            self.assertEqual(response.status_code, 400)
+
+        # step result of another job
+        other_result = utils.create_step_result()
+        bad = {'updates': [{'type': 'start_step_result', 'stepresult_id': other_result.pk, 'data': start_data}]}
+        response = self.client_post_json(url, bad)
+        self.assertEqual(response.status_code, 400)
+
+        # bad build key
+        bad_url = reverse('ci:client:batch_update', args=[build_key+1, job.client.name, job.pk])
+        response = self.client_post_json(bad_url, {'updates': updates})
+        self.assertEqual(response.status_code, 400)
+
+        # unknown client
+        bad_url = reverse('ci:client:batch_update', args=[build_key, 'unknown_client', job.pk])
+        response = self.client_post_json(bad_url, {'updates': updates})
+        self.assertEqual(response.status_code, 400)
+
+        # ok
+        self.set_counts()
+        response = self.client_post_json(url, {'updates': updates})
+        self.compare_counts()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['status'], 'OK')
+        self.assertEqual(data['command'], None)
+        self.assertEqual(len(data['results']), 4)
+        result.refresh_from_db()
+        self.assertEqual(result.status, models.JobStatus.FAILED)
+        self.assertEqual(result.output, "some output")
+        result2.refresh_from_db()
+        self.assertEqual(result2.status, models.JobStatus.RUNNING)
+        job.refresh_from_db()
+        self.assertEqual(job.failed_step, result.name)
+        self.assertEqual(job.running_step, "2/2")
+
+        # The job got canceled
+        job.status = models.JobStatus.CANCELED
+        job.save()
+        updates = [{'type': 'update_step_result', 'stepresult_id': result2.pk, 'data': update_data},
+            {'type': 'job_finished', 'data': {'seconds': 1, 'complete': True, 'canceled': True}},
+            ]
+        # The Git server is told after the transaction
+        depth = len(connection.savepoint_ids)
+        savepoints = []
+        real_job_complete = UpdateRemoteStatus.job_complete
+        def job_complete(job):
+            savepoints.append(len(connection.savepoint_ids))
+            return real_job_complete(job)
+        self.set_counts()
+        with patch.object(UpdateRemoteStatus, 'job_complete', side_effect=job_complete):
+            response = self.client_post_json(url, {'updates': updates})
+        self.compare_counts(num_jobs_completed=1, num_events_completed=1, events_canceled=1, active_branches=1)
+        self.assertEqual(savepoints, [depth])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['command'], 'cancel')
+        job.refresh_from_db()
+        self.assertTrue(job.complete)
+        self.assertEqual(job.status, models.JobStatus.CANCELED)
+
     @patch.object(Permissions, 'is_collaborator')
     def test_update_remote_job_status(self, mock_collab):
         mock_collab.return_value = False
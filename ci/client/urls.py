@@ -29,6 +29,8 @@ urlpatterns = [
       views.start_step_result, name='start_step_result'),
   re_path(r'^complete_step_result/(?P<build_key>[0-9]+)/(?P<client_name>[-\w.]+)/(?P<stepresult_id>[0-9]+)/$',
       views.complete_step_result, name='complete_step_result'),
+  re_path(r'^batch_update/(?P<build_key>[0-9]+)/(?P<client_name>[-\w.]+)/(?P<job_id>[0-9]+)/$',
+      views.batch_update, name='batch_update'),
   re_path(r'^ping/(?P<client_name>[-\w.]+)/$', views.client_ping, name='client_ping'),
   re_path(r'^update_remote_job_status/(?P<job_id>[0-9]+)/$', views.update_remote_job_status, name='update_remote_job_status'),
   ]
@@ -15,19 +15,23 @@
 
 from __future__ import unicode_literals, absolute_import
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponseNotAllowed, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponse
 import json
-from ci import models, views, Permissions
-from ci.recipe import file_utils
+import zlib
+import hashlib
+from ci import models, views, Permissions, PubSub, Heartbeat, ResultReuse, DispatchPolicy
+from ci.recipe import ScriptCache
 import logging
 from django.conf import settings
 from datetime import timedelta
 from ci.client import UpdateRemoteStatus
 from django.shortcuts import render, redirect, get_object_or_404
 from django.core.cache import cache
-from .ReadyJobs import get_ready_jobs
+from .ReadyJobs import rebuild_ready_queue, ready_queue, claim_job
 from datetime import datetime
-from django.db import transaction
+from django.db import transaction, connection, OperationalError
+import random
+import time
 
 logger = logging.getLogger('ci')
 
@@ -45,139 +49,153 @@ def get_or_create_client(name, ip):
         logger.debug('New client %s : %s seen' % (name, ip))
     return client
 
-def update_cached_jobs():
-    # Key in the cache used for storing the polled jobs
-    cached_jobs_key = 'cached_jobs'
-
-    logger.info('Rebuilding ready job cache')
-    cached_jobs = {'expires': None, 'jobs_by_config': {}}
-    jobs_by_config = cached_jobs.get('jobs_by_config')
-    ready_jobs = 0
-    for job in get_ready_jobs():
-        client_user = job.recipe.client_runner_user
-        build_key = None
-        client_build_key = None
-        if client_user is None:
-            build_key = job.recipe.build_user.build_key
-        else:
-            client_build_key = client_user.build_key
-
-        entry = {'pk': job.pk,
-                 'build_key': build_key,
-                 'client_build_key': client_build_key,
-                 'client': job.client.name if job.client else None}
+def ready_queue_rebuilt_key():
+    """
+    Key in the cache holding when the ready job queue was last rebuilt.
+    The branch settings in settings.INSTALLED_GITSERVERS and the dispatch
+    policy settings affect the order of the queue so the key changes with
+    them, which causes the queue to be rebuilt when they change.
+    """
+    servers = json.dumps([settings.INSTALLED_GITSERVERS, DispatchPolicy.policy_settings()],
+            sort_keys=True, default=str)
+    return 'ready_queue_rebuilt_%s' % hashlib.sha1(servers.encode('utf-8')).hexdigest()
 
-        if job.config.name not in jobs_by_config:
-            jobs_by_config[job.config.name] = []
-        jobs_by_config[job.config.name].append(entry)
-        ready_jobs += 1
+def update_cached_jobs():
+    """
+    Rebuild the ready job queue from scratch.
+    Return:
+      int: Number of ready jobs
+    """
+    logger.info('Rebuilding ready job queue')
+    ready_jobs = rebuild_ready_queue()
+    logger.info(f'Ready job queue rebuilt with {ready_jobs} ready job(s)')
+    cache.set(ready_queue_rebuilt_key(), datetime.now().timestamp(), None)
+    return ready_jobs
 
-    logger.info(f'Job cache rebuilt with {ready_jobs} ready job(s)')
-    cached_jobs['expires'] = datetime.now().timestamp() + settings.GET_JOB_UPDATE_INTERVAL / 1000
-    cache.set(cached_jobs_key, cached_jobs)
+def check_ready_queue():
+    """
+    Rebuild the ready job queue if it hasn't been built yet
+    or if it is time to rebuild it.
+    """
+    rebuilt = cache.get(ready_queue_rebuilt_key())
+    if rebuilt is None:
+        logger.info('Rebuilding ready job queue as it has not been built yet')
+        update_cached_jobs()
+    elif settings.GET_JOB_UPDATE_INTERVAL > 0 and \
+            rebuilt + settings.GET_JOB_UPDATE_INTERVAL / 1000 <= datetime.now().timestamp():
+        logger.info('Rebuilding ready job queue because it is expired')
+        update_cached_jobs()
+
+# Max number of seconds to keep trying to claim a job when SQLite says the database is locked
+CLAIM_LOCKED_TIMEOUT = 30
+# Max number of seconds to wait between those tries
+CLAIM_LOCKED_MAX_WAIT = 0.5
 
-    return cached_jobs
+def get_cached_job(client, build_keys, build_configs):
+    """
+    Claim the next ready job for a client.
+    There is no global lock; each job is claimed with a conditional update
+    so that concurrent clients can never get the same job. Where the
+    database supports it, jobs being claimed by other clients are skipped
+    instead of waited on.
+    Input:
+      client[models.Client]: The client looking for a job
+      build_keys[list]: Build keys the client has
+      build_configs[list]: Names of the build configs the client supports, in order of preference
+    Return:
+      (models.Job, dict, int): The job, the job info for the client and the
+        build key used. All None if there wasn't a job.
+    """
+    end = time.time() + CLAIM_LOCKED_TIMEOUT
+    attempt = 0
+    while True:
+        try:
+            return claim_next_job(client, build_keys, build_configs)
+        except OperationalError as e:
+            # SQLite locks the whole database while writing instead of
+            # using row locks, so concurrent claims can fail with the
+            # database being busy or locked. The transaction was rolled
+            # back so just try again.
+            if connection.vendor != 'sqlite' or 'locked' not in str(e) or time.time() >= end:
+                raise
+            # Back off so that a busy server doesn't keep the writer from finishing
+            time.sleep(random.uniform(0, min(CLAIM_LOCKED_MAX_WAIT, 0.01 * 2**attempt)))
+            attempt += 1
 
 @transaction.atomic(durable=True)
-def get_cached_job(client, build_keys, build_configs):
-    # Key in the cache used for storing the polled jobs
-    cached_jobs_key = 'cached_jobs'
-
-    # For thread locking if we have a cache that supports it
-    lock_context = None
-    if hasattr(cache, 'lock'):
-        acquire_timeout = 2
-        lock_context = cache.lock('get_cached_job_lock',
-                                   blocking_timeout=acquire_timeout)
-
-    def run_locked():
-        build_key = None
-        job_info = None
-        job = None
-
-        cached_jobs = cache.get(cached_jobs_key)
-        rebuild_cache = False
-        now = datetime.now().timestamp()
-        if cached_jobs is None:
-            logger.info('Rebuilding job cache as it is not yet built')
-            rebuild_cache = True
-        elif cached_jobs['expires'] <= now:
-            logger.info('Rebuilding job cache because it is expired')
-            rebuild_cache = True
-        if rebuild_cache:
-            cached_jobs = update_cached_jobs()
-
-        # Sort through the cached jobs by our build configs; this lets
-        # a client prioritize build config. That is, if any jobs exist
-        # with the first config, they will take prioriy. Then the second,
-        # and so on
-        jobs_by_config = cached_jobs['jobs_by_config']
-        for build_config in build_configs:
-            # No jobs by this config found
-            if build_config not in jobs_by_config:
+def claim_next_job(client, build_keys, build_configs):
+    check_ready_queue()
+
+    # Go through the ready jobs by our build configs; this lets
+    # a client prioritize build config. That is, if any jobs exist
+    # with the first config, they will take prioriy. Then the second,
+    # and so on
+    for build_config in build_configs:
+        for entry in ready_queue(client, build_keys, build_config):
+            job = entry.job
+            build_key = job.recipe.build_user.build_key
+            if not job.can_be_dispatched() or \
+                job.config.name != build_config or \
+                build_key not in build_keys or \
+                (job.client is not None and job.client.name != client.name):
+                logger.warning(f'Job {job.pk} is in different state than the ready queue')
+                job.update_ready_queue()
                 continue
 
-            jobs = jobs_by_config[build_config]
-            for job_i in range(len(jobs)):
-                job_entry = jobs[job_i]
-                job_build_key = job_entry['build_key']
-                job_client_build_key = job_entry['client_build_key']
-                # Job isn't for this build key
-                if job_build_key is not None and job_build_key in build_keys:
-                    build_key = job_build_key
-                elif job_client_build_key is not None and job_client_build_key in build_keys:
-                    build_key = job_client_build_key
-                else:
-                    continue
-                # Job has a client set and it's not this one
-                if job_entry['client'] is not None and job_entry['client'] != client.name:
-                    continue
-                # We could check server here, but I don't think it's necessary beacuse
-                # the build keys should be unique
-
-                job = (models.Job.objects
-                    .select_related('config', 'client', 'recipe', 'event')
-                    .get(pk=job_entry['pk']))
-
-                if job.status != models.JobStatus.NOT_STARTED:
-                    logger.warning(f'Job {job.pk} is cached but has already started')
-                    job = None
-                    continue
-                if job.config.name != build_config or \
-                    job.recipe.build_user.build_key != job_entry['build_key'] or \
-                    (job.client is not None and job_entry['client'] != job.client.name) or \
-                    (job.client is None and job_entry['client'] is not None):
-                    logger.warning(f'Job {job.pk} is in different state than cache')
-                    job = None
-                    continue
-
-                job_info = get_job_info(job)
-                job.client = client
-                job.set_status(models.JobStatus.RUNNING) # will save
-
-                # Remove this job from being available in the cache
-                del cached_jobs['jobs_by_config'][build_config][job_i]
-                cache.set(cached_jobs_key, cached_jobs)
-
-                break
-
-            if job:
-                break
-
-        return job, job_info, build_key
-
-    if lock_context is None:
-        return run_locked()
-    else:
-        from redis.exceptions import LockError
-        try:
-            with lock_context:
-                return run_locked()
-        except LockError:
-            logger.warning(f'Failed to acquire cached job lock for {client.name}')
+            if not claim_job(job, client):
+                logger.info(f'Job {job.pk} was claimed by another client')
+                continue
+
+            job_info = get_job_info(job)
+            job.set_status(models.JobStatus.RUNNING) # will save and remove it from the queue
+            return job, job_info, build_key
 
     return None, None, None
 
+def get_job_wait(data):
+    """
+    How long the client asked to wait for a job, limited by settings.GET_JOB_MAX_WAIT.
+    Input:
+      data[dict]: The POST data from the client
+    Return:
+      float: Number of seconds to wait. 0 means not to wait.
+    """
+    try:
+        wait = float(data.get('wait', 0))
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(wait, settings.GET_JOB_MAX_WAIT))
+
+def wait_for_job(client, build_keys, build_configs, wait):
+    """
+    Claim the next ready job for a client, waiting for one to
+    become ready if there isn't one.
+    Input:
+      client[models.Client]: The client looking for a job
+      build_keys[list]: Build keys the client has
+      build_configs[list]: Names of the build configs the client supports, in order of preference
+      wait[float]: Max number of seconds to wait
+    Return:
+      Same as get_cached_job()
+    """
+    if wait <= 0:
+        return get_cached_job(client, build_keys, build_configs)
+
+    # Subscribe before looking so that a job that becomes ready
+    # in the meantime isn't missed.
+    subscription = PubSub.subscribe([PubSub.ready_channel(c) for c in build_configs])
+    try:
+        end = time.time() + wait
+        while True:
+            job, job_info, build_key = get_cached_job(client, build_keys, build_configs)
+            remaining = end - time.time()
+            if job is not None or remaining <= 0:
+                return job, job_info, build_key
+            # Either a job became ready or we timed out. Either way, look again.
+            subscription.get(remaining)
+    finally:
+        subscription.close()
+
 @csrf_exempt
 def get_job(request):
     data, response = check_post(request, ['client_name', 'build_keys', 'build_configs'])
@@ -205,7 +223,7 @@ def get_job(request):
     client.save()
 
     # This is atomic
-    job, job_info, build_key = get_cached_job(client, build_keys, build_configs)
+    job, job_info, build_key = wait_for_job(client, build_keys, build_configs, get_job_wait(data))
 
     # No job found
     if job is None:
@@ -219,22 +237,89 @@ def get_job(request):
     logger.info('Client %s got job %s: %s: on %s' % (client_name, job.pk, job, job.recipe.repository))
 
     UpdateRemoteStatus.job_started(job)
+    publish_job_update(job, refresh=True, event_changed=True)
     return json_claim_response(job.pk, job.config.name, True, 'Success', build_key, job_info)
 
+class BodyTooLarge(Exception):
+    pass
+
+def request_body(request):
+    """
+    Get the body of a request, decompressing it if the client gzipped it.
+    Input:
+      request[HttpRequest]: The request
+    Return:
+      bytes: The body
+    Raises:
+      BodyTooLarge if it decompresses to more than settings.CLIENT_MAX_DECOMPRESSED_SIZE
+      zlib.error if it isn't valid gzip data
+    """
+    if request.headers.get('Content-Encoding', '').strip().lower() != 'gzip':
+        return request.body
+    max_size = settings.CLIENT_MAX_DECOMPRESSED_SIZE
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Limit the output so a small body can't decompress to something huge
+    body = decompressor.decompress(request.body, max_size + 1)
+    if len(body) > max_size:
+        raise BodyTooLarge()
+    if not decompressor.eof:
+        raise zlib.error('Truncated gzip data')
+    return body
+
 def check_post(request, required_keys):
     if request.method != 'POST':
         return None, HttpResponseNotAllowed(['POST'])
     try:
-        data = json.loads(request.body)
+        data = json.loads(request_body(request))
         required = set(required_keys)
         available = set(data.keys())
         if not required.issubset(available):
             logger.debug('Bad POST data.\nRequest: %s' % data)
             return data, HttpResponseBadRequest('Bad POST data')
         return data, None
-    except ValueError:
+    except BodyTooLarge:
+        logger.warning('Request body decompresses to more than %s bytes' % settings.CLIENT_MAX_DECOMPRESSED_SIZE)
+        return None, HttpResponse('Request body too large', status=413)
+    except (ValueError, zlib.error):
         return None, HttpResponseBadRequest('Invalid JSON')
 
+def publish_job_update(job, step_result=None, chunk=None, refresh=False, event_changed=False):
+    """
+    Let any pages watching the job know that it changed.
+    Input:
+      job[models.Job]: The job that changed
+      step_result[models.StepResult]: If not None, the step result that changed
+      chunk[models.StepResultChunk]: If not None, new output for the step result.
+        This is sent along so that the job page doesn't have to ask for it.
+      refresh[bool]: Whether the job page should get all the job information again
+      event_changed[bool]: Whether the status of the job changed, so the event and main pages
+        should be notified as well. The steps don't show up on those pages.
+    """
+    if not settings.STREAM_UPDATES:
+        return
+
+    data = {'job_id': job.pk, 'refresh': refresh}
+    if step_result is not None:
+        result = {'id': step_result.pk,
+            'status': step_result.status_slug(),
+            'runtime': str(step_result.seconds),
+            'complete': step_result.complete,
+            'exit_status': step_result.exit_status if step_result.complete else '',
+            }
+        if chunk is not None:
+            start = len(step_result.stored_output) + chunk.start
+            result['output'] = models.terminalize_output(chunk.output)
+            result['output_start'] = start
+            result['output_offset'] = start + len(chunk.output)
+            result['output_size'] = models.humanize_bytes(result['output_offset'])
+        data['result'] = result
+    PubSub.publish(PubSub.job_channel(job.pk), data)
+
+    if event_changed:
+        event_data = {'event_id': job.event_id, 'job_id': job.pk}
+        PubSub.publish(PubSub.event_channel(job.event_id), event_data)
+        PubSub.publish(PubSub.MAIN_CHANNEL, event_data)
+
 def get_job_info(job):
     """
     Gather all the information required to run a job to
@@ -281,42 +366,45 @@ def get_job_info(job):
     job_dict['environment'] = recipe_env
 
     base_file_dir = settings.RECIPE_BASE_DIR
+    recipe_repo_sha = ScriptCache.current_sha()
     prestep_env = []
     for prestep in job.recipe.prestepsources.all():
         if prestep.filename:
-            contents = file_utils.get_contents(base_file_dir, prestep.filename)
+            contents = ScriptCache.get_contents(base_file_dir, recipe_repo_sha, prestep.filename)
             if contents:
                 prestep_env.append(contents)
 
     job_dict['prestep_sources'] = prestep_env
 
     job.step_results.all().delete()
+    steps = list(job.recipe.steps.order_by('position').prefetch_related('step_environment'))
+    step_results = models.StepResult.objects.bulk_create([models.StepResult(
+        job=job,
+        name=step.name,
+        position=step.position,
+        abort_on_failure=step.abort_on_failure,
+        allowed_to_fail=step.allowed_to_fail,
+        filename=step.filename,
+        ) for step in steps])
+    if step_results and step_results[0].pk is None:
+        # The database doesn't return the ids of bulk created rows
+        result_ids = dict(job.step_results.values_list('position', 'pk'))
+    else:
+        result_ids = {result.position: result.pk for result in step_results}
+    logger.info('Created {} step results for {}: {}'.format(len(step_results), job.pk, job))
+
     step_recipes = []
-    for step in job.recipe.steps.order_by('position'):
+    step_scripts = []
+    for step in steps:
         step_dict = {
             'step_num': step.position,
             'step_position': step.position,
             'step_name': step.name,
             'abort_on_failure': step.abort_on_failure,
             'allowed_to_fail': step.allowed_to_fail,
+            'stepresult_id': result_ids[step.position],
             }
 
-        step_result, created = models.StepResult.objects.get_or_create(
-            job=job,
-            name=step.name,
-            position=step.position,
-            abort_on_failure=step.abort_on_failure,
-            allowed_to_fail=step.allowed_to_fail,
-            filename=step.filename)
-
-        logger.info('Created step result for {}: {}: {}: {}'.format(job.pk, job, step_result.pk, step.name))
-        step_result.output = ''
-        step_result.complete = False
-        step_result.seconds = timedelta(seconds=0)
-        step_result.status = models.JobStatus.NOT_STARTED
-        step_result.save()
-        step_dict['stepresult_id'] = step_result.pk
-
         step_env = {
             'CIVET_STEP_NUM': step_dict["step_num"],
             'CIVET_STEP_POSITION': step_dict["step_position"],
@@ -329,14 +417,16 @@ def get_job_info(job):
         step_dict['environment'] = step_env
 
         if step.filename:
-            contents = file_utils.get_contents(base_file_dir, step.filename)
+            contents = ScriptCache.get_contents(base_file_dir, recipe_repo_sha, step.filename)
             step_dict['script'] = str(contents) # in case of empty file, use str
+            step_scripts.append(step_dict['script'])
 
         step_recipes.append(step_dict)
 
     job_dict['environment']['CIVET_NUM_STEPS'] = str(len(step_recipes))
     job_dict['steps'] = step_recipes
-    job.recipe_repo_sha = file_utils.get_repo_sha(base_file_dir)
+    job.recipe_repo_sha = recipe_repo_sha
+    job.scripts_sha = ResultReuse.scripts_sha(prestep_env, step_scripts)
     job.save()
 
     return job_dict
@@ -355,8 +445,11 @@ def json_claim_response(job_id, config_name, claimed, msg, build_key, job_info=N
 def json_finished_response(status, msg):
     return JsonResponse({'status': status, 'message': msg})
 
+# The keys required in the data posted to job_finished()
+JOB_FINISHED_KEYS = ['seconds', 'complete']
+
 def check_job_finished_post(request, build_key, client_name, job_id):
-    data, response = check_post(request, ['seconds', 'complete'])
+    data, response = check_post(request, JOB_FINISHED_KEYS)
 
     if response:
         return response, None, None, None
@@ -384,6 +477,31 @@ def job_finished(request, build_key, client_name, job_id):
     if response:
         return response
 
+    return JsonResponse(process_job_finished(data, client, job))
+
+def notify(func, deferred=None):
+    """
+    Call func now, or later if deferred is a list.
+    batch_update() uses this to tell the Git server and the web pages
+    about the updates after its transaction, so that slow calls to the
+    Git server aren't made while holding the locks.
+    Input:
+      func: The function to call
+      deferred[list]: If not None, func is appended to it instead of being called
+    """
+    if deferred is None:
+        func()
+    else:
+        deferred.append(func)
+
+def process_job_finished(data, client, job, deferred=None):
+    """
+    Does the work of job_finished()
+    Input:
+      deferred[list]: See notify()
+    Return:
+      dict: The reply to send to the client
+    """
     job.running_step = ""
     job.seconds = timedelta(seconds=data['seconds'])
     job.complete = data['complete']
@@ -399,27 +517,36 @@ def job_finished(request, build_key, client_name, job_id):
     if job.status == models.JobStatus.CANCELED:
         status = job.status
     job.set_status(status=status, calc_event=True)
+    DispatchPolicy.record_runtime(job)
 
     client.status = models.Client.IDLE
     client.status_message = 'Finished job {}: {}'.format(job.pk, job)
     client.save()
-    if not UpdateRemoteStatus.job_complete(job):
-        job.event.make_jobs_ready()
-    return json_finished_response('OK', 'Success')
 
+    def job_complete():
+        if not UpdateRemoteStatus.job_complete(job):
+            job.event.make_jobs_ready()
+        publish_job_update(job, refresh=True, event_changed=True)
+    notify(job_complete, deferred)
+    return {'status': 'OK', 'message': 'Success'}
 
-def json_update_response(status, msg, cmd=None):
+
+def update_response_data(status, msg, cmd=None):
     """
     status: current status of the job
     msg: "success" so that the client knows everything was handled properly
     cmd : None or "cancel" if the job got canceled
     """
-    data = {'status': status, 'message': msg, 'command': cmd}
-    return JsonResponse(data)
+    return {'status': status, 'message': msg, 'command': cmd}
+
+def json_update_response(status, msg, cmd=None):
+    return JsonResponse(update_response_data(status, msg, cmd))
+
+# The keys required in the data posted to the step result endpoints
+STEP_RESULT_KEYS = ['step_num', 'output', 'time', 'complete', 'exit_status']
 
 def check_step_result_post(request, build_key, client_name, stepresult_id):
-    data, response = check_post(request,
-        ['step_num', 'output', 'time', 'complete', 'exit_status'])
+    data, response = check_post(request, STEP_RESULT_KEYS)
 
     if response:
         return response, None, None, None
@@ -450,6 +577,16 @@ def start_step_result(request, build_key, client_name, stepresult_id):
     if response:
         return response
 
+    return JsonResponse(process_start_step_result(data, client, step_result))
+
+def process_start_step_result(data, client, step_result, deferred=None):
+    """
+    Does the work of start_step_result()
+    Input:
+      deferred[list]: See notify()
+    Return:
+      dict: The reply to send to the client
+    """
     cmd = None
     # could have been canceled in between getting the job and starting the job
     status = models.JobStatus.RUNNING
@@ -461,16 +598,20 @@ def start_step_result(request, build_key, client_name, stepresult_id):
     step_result.job.running_step = '{}/{}'.format(step_result.position+1, step_result.job.step_results.count())
     step_result.save()
     step_result.job.seconds = step_result.job.calc_total_time()
-    step_result.job.save() # update timestamp
-    client.status_msg = 'Starting {} on job {}'.format(step_result.name, step_result.job)
-    client.save()
-    step_result.job.event.save() # update timestamp
-    UpdateRemoteStatus.step_start_pr_status(step_result, step_result.job)
-    return json_update_response('OK', 'success', cmd)
+    step_result.job.save()
+    Heartbeat.touch(client)
+    Heartbeat.touch(step_result.job.event)
+    def step_started():
+        UpdateRemoteStatus.step_start_pr_status(step_result, step_result.job)
+        publish_job_update(step_result.job, step_result)
+    notify(step_started, deferred)
+    return update_response_data('OK', 'success', cmd)
 
 def save_step_result(step_result):
     try:
-        step_result.save()
+        # Savepoint so that a failure doesn't break a surrounding transaction
+        with transaction.atomic():
+            step_result.save()
     except Exception as e:
         # We could potentially have bad output that causes errors when saving.
         # For example, on Postgresql:
@@ -478,13 +619,33 @@ def save_step_result(step_result):
         step_result.output = "Failed to save output:\n%s" % e
         step_result.save()
 
-def step_result_from_data(step_result, data, status):
+def append_step_result_output(step_result, output):
+    try:
+        with transaction.atomic():
+            return step_result.append_output(output)
+    except Exception as e:
+        # Same as in save_step_result(), the output could be something
+        # that the DB doesn't like.
+        return step_result.append_output("Failed to save output:\n%s" % e)
+
+def step_result_from_data(step_result, data, status, replace_output=False):
+    """
+    Update the step result from the data the client sent.
+    Normally the output gets appended to the existing output.
+    If replace_output is True then the output replaces the existing output.
+    Return:
+      models.StepResultChunk: The new output that was appended, if any
+    """
     step_result.seconds = timedelta(seconds=data['time'])
-    step_result.output = step_result.output + data['output']
     step_result.complete = data['complete']
     step_result.exit_status = int(data['exit_status'])
     step_result.status = status
+    if replace_output:
+        step_result.output = data['output']
+        save_step_result(step_result)
+        return None
     save_step_result(step_result)
+    return append_step_result_output(step_result, data['output'])
 
 @csrf_exempt
 def complete_step_result(request, build_key, client_name, stepresult_id):
@@ -492,6 +653,16 @@ def complete_step_result(request, build_key, client_name, stepresult_id):
     if response:
         return response
 
+    return JsonResponse(process_complete_step_result(data, client, step_result))
+
+def process_complete_step_result(data, client, step_result, deferred=None):
+    """
+    Does the work of complete_step_result()
+    Input:
+      deferred[list]: See notify()
+    Return:
+      dict: The reply to send to the client
+    """
     status = models.JobStatus.SUCCESS
     if data.get('canceled'):
         status = models.JobStatus.CANCELED
@@ -507,19 +678,16 @@ def complete_step_result(request, build_key, client_name, stepresult_id):
         if step_result.allowed_to_fail:
             status = models.JobStatus.FAILED_OK
 
-    step_result_from_data(step_result, data, status)
+    # When the step is complete the client sends all of the output
+    chunk = step_result_from_data(step_result, data, status, replace_output=data['complete'])
 
     step_result.job.seconds = step_result.job.calc_total_time()
-    step_result.job.save() # update timestamp
-    step_result.job.event.save() # update timestamp
-    if data['complete']:
-        step_result.output = data['output']
-        save_step_result(step_result)
-
-        client.status_msg = 'Completed {}: {}'.format(step_result.job, step_result.name)
-        client.save()
+    step_result.job.save()
+    Heartbeat.touch(client)
+    Heartbeat.touch(step_result.job.event)
 
-    return json_update_response('OK', 'success')
+    notify(lambda: publish_job_update(step_result.job, step_result, chunk, refresh=data['complete']), deferred)
+    return update_response_data('OK', 'success')
 
 @csrf_exempt
 def update_step_result(request, build_key, client_name, stepresult_id):
@@ -527,7 +695,17 @@ def update_step_result(request, build_key, client_name, stepresult_id):
     if response:
         return response
 
-    step_result_from_data(step_result, data, models.JobStatus.RUNNING)
+    return JsonResponse(process_update_step_result(data, client, step_result))
+
+def process_update_step_result(data, client, step_result, deferred=None):
+    """
+    Does the work of update_step_result()
+    Input:
+      deferred[list]: See notify()
+    Return:
+      dict: The reply to send to the client
+    """
+    chunk = step_result_from_data(step_result, data, models.JobStatus.RUNNING)
     job = step_result.job
 
     cmd = None
@@ -537,17 +715,106 @@ def update_step_result(request, build_key, client_name, stepresult_id):
         step_result.save()
         cmd = 'cancel'
 
-    client.status_msg = 'Running {} ({}): {} : {}'.format(step_result.job,
-            step_result.job.pk,
-            step_result.name,
-            step_result.seconds)
-    client.save()
+    # The runtime of the job gets updated along with its timestamp
+    Heartbeat.touch(client)
+    Heartbeat.touch(job)
+    Heartbeat.touch(job.event)
 
-    job.seconds = job.calc_total_time()
-    job.save()
-    job.event.save() # update timestamp
+    notify(lambda: publish_job_update(job, step_result, chunk), deferred)
+    return update_response_data('OK', 'success', cmd)
+
+# The keys required in the data of each type of update in a batch
+BATCH_UPDATE_KEYS = {
+    'start_step_result': STEP_RESULT_KEYS,
+    'update_step_result': STEP_RESULT_KEYS,
+    'complete_step_result': STEP_RESULT_KEYS,
+    'job_finished': JOB_FINISHED_KEYS,
+    }
+
+def check_batch_update(data):
+    """
+    Checks that the updates in a batch are well formed.
+    Input:
+      data[dict]: The posted data
+    Return:
+      str: An error message if there is a problem, else None
+    """
+    updates = data['updates']
+    if not isinstance(updates, list):
+        return 'Bad updates'
+    for update in updates:
+        if not isinstance(update, dict) or update.get('type') not in BATCH_UPDATE_KEYS:
+            return 'Bad update type'
+        update_data = update.get('data')
+        if not isinstance(update_data, dict) or not set(BATCH_UPDATE_KEYS[update['type']]).issubset(update_data.keys()):
+            return 'Bad update data'
+        if update['type'] != 'job_finished' and not isinstance(update.get('stepresult_id'), int):
+            return 'Bad stepresult id'
+    return None
+
+@csrf_exempt
+def batch_update(request, build_key, client_name, job_id):
+    """
+    Applies a list of updates for a job in one go.
+    The client uses this to catch up instead of sending each update separately.
+    Each update is a dict with keys:
+      type: One of "start_step_result", "update_step_result", "complete_step_result", "job_finished"
+      stepresult_id: The step result to update. Not needed for "job_finished".
+      data: The same data that would have been posted to the corresponding endpoint.
+    The updates are applied in order in a single transaction.
+    The Git server and the web pages are told about them after the
+    transaction is committed.
+    The reply has the replies of each update in "results". If any of them
+    has a command for the client, that command is in "command".
+    """
+    data, response = check_post(request, ['updates'])
+    if response is not None:
+        return response
+    error = check_batch_update(data)
+    if error:
+        return HttpResponseBadRequest(error)
+
+    try:
+        client = models.Client.objects.get(name=client_name, ip=get_client_ip(request))
+    except models.Client.DoesNotExist:
+        return HttpResponseBadRequest('Invalid client')
+
+    try:
+        job = (models.Job.objects
+                .select_related('event__base__branch__repository', 'event__pull_request', 'client')
+                .get(pk=job_id, client=client, event__build_user__build_key=build_key))
+    except models.Job.DoesNotExist:
+        return HttpResponseBadRequest('Invalid job/build_key')
+
+    step_result_ids = set([u['stepresult_id'] for u in data['updates'] if u['type'] != 'job_finished'])
+    step_results = {sr.pk: sr for sr in models.StepResult.objects.filter(job=job, pk__in=step_result_ids)}
+    if len(step_results) != len(step_result_ids):
+        return HttpResponseBadRequest('Invalid stepresult id')
+    # Share the job so that each update sees the changes of the previous ones
+    for step_result in step_results.values():
+        step_result.job = job
 
-    return json_update_response('OK', 'success', cmd)
+    results = []
+    cmd = None
+    deferred = []
+    with transaction.atomic():
+        for update in data['updates']:
+            if update['type'] == 'job_finished':
+                reply = process_job_finished(update['data'], client, job, deferred)
+            else:
+                step_result = step_results[update['stepresult_id']]
+                func = {'start_step_result': process_start_step_result,
+                        'update_step_result': process_update_step_result,
+                        'complete_step_result': process_complete_step_result,
+                        }[update['type']]
+                reply = func(update['data'], client, step_result, deferred)
+            results.append(reply)
+            if reply.get('command'):
+                cmd = reply['command']
+    for func in deferred:
+        func()
+
+    return JsonResponse({'status': 'OK', 'message': 'success', 'command': cmd, 'results': results})
 
 @csrf_exempt
 def client_ping(request, client_name):
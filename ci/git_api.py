@@ -21,9 +21,19 @@ class GitException(Exception):
 
 import logging
 import json
+import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections
+from ci import GitResponseCache
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+try:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
 logger = logging.getLogger('ci')
 
 def copydoc(fromfunc, sep="\n"):
@@ -68,11 +78,26 @@ class GitAPI(object):
         self._errors = []
         self._per_page = 50
         self._per_page_key = "per_page"
+        self._page_key = "page"
+        self._page_workers = config.get("page_workers", 4)
         self._default_params = {}
         self._get_params = {}
+        self._local = threading.local()
         self._bad_response = False
         self._session = None
 
+    @property
+    def _bad_response(self):
+        """
+        Whether the last request in this thread had a problem.
+        This is per thread since get_all_pages() can get pages in other threads.
+        """
+        return getattr(self._local, "bad_response", False)
+
+    @_bad_response.setter
+    def _bad_response(self, value):
+        self._local.bad_response = value
+
     def _timeout(self, timeout):
         """
         Utility function to get the timeout value used in requests
@@ -167,16 +192,42 @@ class GitAPI(object):
             requests.Reponse or None if there was a requests exception
         """
         self._bad_response = False
+        key = None
+        entry = None
+        headers = self._headers
         try:
             timeout = self._timeout(timeout)
             params = self._params(params, True)
+            if GitResponseCache.enabled():
+                key = GitResponseCache.entry_key(url, params, self._cache_identity())
+                entry = GitResponseCache.get_entry(key)
+                if entry is not None:
+                    headers = dict(self._headers)
+                    headers.update(GitResponseCache.conditional_headers(entry))
             response = self._session.get(url,
-                    params=params, timeout=timeout, headers=self._headers, verify=self._ssl_cert)
+                    params=params, timeout=timeout, headers=headers, verify=self._ssl_cert)
         except Exception as e:
             return self._response_exception(url, "GET", e, params=params)
 
+        if key is not None:
+            if entry is not None and response.status_code == 304:
+                GitResponseCache.record_hit()
+                return GitResponseCache.cached_response(entry, response)
+            GitResponseCache.record_miss()
+            GitResponseCache.store(key, response)
         return self._check_response(response, params=params, log=log)
 
+    def _cache_identity(self):
+        """
+        Who the requests are made for.
+        Used so that cached GET responses are only used for the same user.
+        """
+        if self._access_user is not None:
+            return "user:%s" % self._access_user.pk
+        if self._token is not None:
+            return "token:%s" % hashlib.sha1(str(self._token).encode("utf-8")).hexdigest()
+        return ""
+
     def post(self, url, params=None, data=None, timeout=None, log=True):
         """
         Post to a URL.
@@ -275,6 +326,8 @@ class GitAPI(object):
     def get_all_pages(self, url, params=None, timeout=None, log=True):
         """
         Get all the pages for a URL by following the "next" links on a response.
+        If the Git server gives a "last" link then the rest of the pages are
+        gotten at the same time.
         Input:
             url[str]: URL to get
             params[dict]: Dictionary of extra parameters to send in the request
@@ -291,6 +344,17 @@ class GitAPI(object):
 
         all_json = response.json()
         try:
+            page_urls = self._page_urls(response.links)
+            if page_urls is not None:
+                for page_json in self._get_pages(page_urls, params, timeout, log):
+                    if page_json is None:
+                        # The page was gotten in another thread, so the
+                        # callers wouldn't see that it failed
+                        self._bad_response = True
+                        break
+                    all_json.extend(page_json)
+                return all_json
+
             while 'next' in response.links:
                 response = self.get(response.links["next"]["url"],
                         params=params, timeout=timeout, log=log)
@@ -303,6 +367,77 @@ class GitAPI(object):
                 url, self._format_json(params), e), log)
         return all_json
 
+    def _page_urls(self, links):
+        """
+        Get the URLs of the rest of the pages from the links on the first page.
+        Input:
+            links[dict]: The links on the response for the first page
+        Return:
+            list[str]: URLs of the rest of the pages, in order.
+                None if they can't be determined from the links.
+        """
+        if self._page_workers < 2 or not isinstance(links, dict):
+            return None
+        if "next" not in links or "last" not in links:
+            return None
+
+        def page_number(link):
+            query = dict(parse_qsl(urlsplit(link["url"]).query))
+            return int(query[self._page_key])
+
+        try:
+            first = page_number(links["next"])
+            last = page_number(links["last"])
+        except (KeyError, ValueError):
+            return None
+
+        parts = urlsplit(links["last"]["url"])
+        query = parse_qsl(parts.query)
+        urls = []
+        for page in range(first, last+1):
+            page_query = [(key, str(page) if key == self._page_key else value) for key, value in query]
+            urls.append(urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(page_query), parts.fragment)))
+        return urls
+
+    def _get_page(self, url, params, timeout, log):
+        """
+        Get the data on a single page.
+        Return:
+            list or None if there was a problem
+        """
+        response = self.get(url, params=params, timeout=timeout, log=log)
+        if response is None or self._bad_response:
+            return None
+        return response.json()
+
+    def _get_page_in_thread(self, url, params, timeout, log):
+        """
+        Same as _get_page() but for the threads of _get_pages().
+        The session can save a refreshed OAuth token to the database, so the
+        database connections of the thread are closed when done.
+        """
+        try:
+            return self._get_page(url, params, timeout, log)
+        finally:
+            connections.close_all()
+
+    def _get_pages(self, urls, params, timeout, log):
+        """
+        Get a list of pages, self._page_workers at a time.
+        Input:
+            urls[list[str]]: URLs of the pages
+            params[dict]: Parameters to send with each request
+            timeout[int]: Specify a timeout other than the default.
+        Return:
+            list: The data of each page, in the same order as urls.
+                Pages that had a problem are None.
+        """
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self._page_workers, len(urls))) as pool:
+            futures = [pool.submit(self._get_page_in_thread, url, dict(params), timeout, log) for url in urls]
+            return [f.result() for f in futures]
+
     @abc.abstractmethod
     def sign_in_url(self):
         """
@@ -410,6 +545,21 @@ class GitAPI(object):
           str: Last SHA of the branch or None if there was a problem
         """
 
+    def tested_tree_sha(self, owner, repo, base_sha, head_sha, pr_num=None):
+        """
+        Get the SHA of the tree that gets tested when head is merged with base.
+        Servers that don't support this return None.
+        Input:
+          owner[str]: owner of the repository
+          repo[str]: name of the repository
+          base_sha[str]: SHA of the base commit
+          head_sha[str]: SHA of the head commit
+          pr_num[int]: Number of the PR, if this is for a PR
+        Return:
+          str: SHA of the tree or None if it couldn't be determined
+        """
+        return None
+
     @abc.abstractmethod
     def install_webhooks(self, user, repo):
         """
@@ -320,6 +320,42 @@ class GitHubAPI(GitAPI):
                 return data['commit']['sha']
         self._add_error("Failed to get last SHA for %s/%s:%s" % (owner, repo, branch))
 
+    def _git_commit(self, owner, repo, sha):
+        """
+        Get the git data of a commit.
+        Return:
+          dict: The commit data or None if there was a problem
+        """
+        url = "%s/repos/%s/%s/git/commits/%s" % (self._api_url, owner, repo, sha)
+        response = self.get(url)
+        if not self._bad_response:
+            return response.json()
+
+    @copydoc(GitAPI.tested_tree_sha)
+    def tested_tree_sha(self, owner, repo, base_sha, head_sha, pr_num=None):
+        url = "%s/repos/%s/%s/compare/%s...%s" % (self._api_url, owner, repo, base_sha, head_sha)
+        response = self.get(url, params={"per_page": 1})
+        if self._bad_response:
+            return None
+        if response.json().get("status") in ["ahead", "identical"]:
+            # Head already has base, so merging doesn't change it
+            data = self._git_commit(owner, repo, head_sha)
+            return data["tree"]["sha"] if data else None
+        if pr_num is None:
+            return None
+
+        # GitHub keeps a test merge of the PR. It is the same merge if it was done with the same base.
+        url = "%s/repos/%s/%s/pulls/%s" % (self._api_url, owner, repo, pr_num)
+        response = self.get(url)
+        if self._bad_response:
+            return None
+        merge_sha = response.json().get("merge_commit_sha")
+        if not merge_sha:
+            return None
+        data = self._git_commit(owner, repo, merge_sha)
+        if data and [p["sha"] for p in data.get("parents", [])] == [base_sha, head_sha]:
+            return data["tree"]["sha"]
+
     def _tag_sha(self, owner, repo, tag):
         """
         Get the SHA for a tag
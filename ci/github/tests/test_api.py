@@ -230,6 +230,44 @@ class Tests(DBTester.DBTester):
         # 1 for the bad response and 1 for the error message
         self.assertEqual(len(api.errors()), 2)
 
+    @patch.object(requests, 'get')
+    def test_tested_tree_sha(self, mock_get):
+        api = self.server.api()
+        owner = self.build_user.name
+        repo = self.branch.repository.name
+        head_commit = utils.Response({"sha": "head", "tree": {"sha": "head_tree"}})
+        merge_commit = utils.Response({"sha": "merge", "tree": {"sha": "merge_tree"},
+            "parents": [{"sha": "base"}, {"sha": "head"}]})
+
+        # Head already has base
+        mock_get.side_effect = [utils.Response({"status": "ahead"}), head_commit]
+        self.assertEqual(api.tested_tree_sha(owner, repo, "base", "head"), "head_tree")
+        self.assertEqual(mock_get.call_count, 2)
+
+        # Needs a merge, only known for PRs
+        mock_get.side_effect = [utils.Response({"status": "diverged"})]
+        self.assertIsNone(api.tested_tree_sha(owner, repo, "base", "head"))
+
+        # The test merge of the PR has the same parents
+        mock_get.side_effect = [utils.Response({"status": "diverged"}),
+                utils.Response({"merge_commit_sha": "merge"}), merge_commit]
+        self.assertEqual(api.tested_tree_sha(owner, repo, "base", "head", 1), "merge_tree")
+
+        # The test merge was done with a different base
+        mock_get.side_effect = [utils.Response({"status": "diverged"}),
+                utils.Response({"merge_commit_sha": "merge"}), merge_commit]
+        self.assertIsNone(api.tested_tree_sha(owner, repo, "other", "head", 1))
+
+        # Not merged yet
+        mock_get.side_effect = [utils.Response({"status": "diverged"}),
+                utils.Response({"merge_commit_sha": None})]
+        self.assertIsNone(api.tested_tree_sha(owner, repo, "base", "head", 1))
+        self.assertEqual(api.errors(), [])
+
+        mock_get.side_effect = [utils.Response(status_code=404)]
+        self.assertIsNone(api.tested_tree_sha(owner, repo, "base", "head", 1))
+        self.assertEqual(len(api.errors()), 1)
+
     @patch.object(requests, 'get')
     def test_tag_sha(self, mock_get):
         jdata = [{"name": "tagname",
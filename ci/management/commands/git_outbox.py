@@ -0,0 +1,44 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from ci import GitOutbox
+import time
+import traceback
+
+class Command(BaseCommand):
+    help = ('Send the pending updates to the Git servers. See GIT_SERVER_OUTBOX in settings.py. '
+            'More than one can run at the same time, each update is only sent once.')
+    def add_arguments(self, parser):
+        parser.add_argument('--once', default=False, action='store_true',
+                help='Just send the updates that are due and exit')
+        parser.add_argument('--poll', default=2, type=float,
+                help='Seconds to wait before checking again when there is nothing to send')
+
+    def handle(self, *args, **options):
+        once = options["once"]
+        poll = options["poll"]
+        while True:
+            close_old_connections()
+            try:
+                num = GitOutbox.drain()
+            except Exception:
+                self.stderr.write("Failed to send updates: %s" % traceback.format_exc())
+                num = 0
+            if once and num < GitOutbox.BATCH_SIZE:
+                break
+            if num == 0:
+                time.sleep(poll)
@@ -0,0 +1,64 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from ci import WebhookQueue
+import multiprocessing
+import time
+import traceback
+
+class Command(BaseCommand):
+    help = 'Process the queued webhook calls. See WEBHOOK_QUEUE in settings.py'
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default=1, type=int,
+                help='Number of worker processes')
+        parser.add_argument('--once', default=False, action='store_true',
+                help='Just process what is queued and exit')
+        parser.add_argument('--poll', default=1, type=float,
+                help='Seconds to wait before checking again when there is nothing to process')
+
+    def work(self, once, poll):
+        last_cleanup = 0
+        while True:
+            close_old_connections()
+            try:
+                found = WebhookQueue.process_next()
+            except Exception:
+                self.stderr.write("Failed to process webhook: %s" % traceback.format_exc())
+                found = False
+            if not found:
+                if once:
+                    break
+                if time.time() - last_cleanup >= WebhookQueue.CLEANUP_INTERVAL:
+                    WebhookQueue.cleanup()
+                    last_cleanup = time.time()
+                time.sleep(poll)
+
+    def handle(self, *args, **options):
+        once = options["once"]
+        poll = options["poll"]
+        num_workers = options["workers"]
+        if num_workers <= 1:
+            self.work(once, poll)
+            return
+
+        # The workers need their own database connections
+        connections.close_all()
+        workers = [multiprocessing.Process(target=self.work, args=(once, poll)) for i in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,67 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import unicode_literals, absolute_import
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from ci import TimeUtils, DispatchPolicy, DispatchSimulator
+from datetime import timedelta
+
+class Command(BaseCommand):
+    help = 'Replay past jobs to compare the mean turnaround of pull requests with the dispatch policies'
+    def add_arguments(self, parser):
+        parser.add_argument('--days', default=30, type=int,
+                help='Replay the jobs created in this many past days')
+        parser.add_argument('--clients', type=int,
+                help='Number of clients for each build config. Defaults to the number that ran jobs of the config.')
+        parser.add_argument('--weight', default=settings.DISPATCH_SHORTEST_FIRST_WEIGHT, type=float,
+                help='DISPATCH_SHORTEST_FIRST_WEIGHT to use for the shortest_first policy')
+        parser.add_argument('--max-delay', default=settings.DISPATCH_MAX_DELAY, type=float,
+                help='DISPATCH_MAX_DELAY to use for the shortest_first policy')
+
+    def handle(self, *args, **options):
+        if options["days"] <= 0:
+            raise CommandError("--days must be positive")
+        since = TimeUtils.get_local_time() - timedelta(days=options["days"])
+        jobs = DispatchSimulator.load_history(since)
+        if not jobs:
+            self.stdout.write("No finished jobs in the last %s days" % options["days"])
+            return
+
+        clients = DispatchSimulator.count_clients(jobs)
+        if options["clients"]:
+            clients = {config_id: options["clients"] for config_id in clients}
+        self.stdout.write("Replaying %s jobs on %s clients" % (len(jobs), sum(clients.values())))
+
+        policies = [DispatchPolicy.FifoPolicy(),
+                DispatchPolicy.ShortestFirstPolicy(options["weight"], options["max_delay"])]
+        results = []
+        for policy in policies:
+            turnarounds = DispatchSimulator.simulate(jobs, policy, clients)
+            pr_mean = DispatchSimulator.mean_turnaround(jobs, turnarounds)
+            all_mean = DispatchSimulator.mean_turnaround(jobs, turnarounds, pr_only=False)
+            results.append(pr_mean)
+            self.stdout.write("%s: mean PR turnaround: %s, mean event turnaround: %s" % (policy.name,
+                self.format_seconds(pr_mean), self.format_seconds(all_mean)))
+
+        fifo, shortest = results
+        if fifo and shortest is not None:
+            self.stdout.write("%s improves the mean PR turnaround by %.1f%%" % (policies[1].name,
+                100.0 * (fifo - shortest) / fifo))
+
+    def format_seconds(self, seconds):
+        if seconds is None:
+            return "no events"
+        return str(timedelta(seconds=int(seconds)))
@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.urls import reverse
 from six import python_2_unicode_compatible
@@ -27,12 +27,13 @@ from ci.github import oauth as github_auth
 import random, re
 from django.utils import timezone
 from datetime import timedelta, datetime
-from ci import TimeUtils
+from ci import TimeUtils, OutputCache, PubSub
 import json
 import ansi2html
 import logging
 import pytz
 from django.db.models import Sum
+from django.db.models.functions import Length, Substr
 logger = logging.getLogger('ci')
 
 class DBException(Exception):
@@ -344,6 +345,129 @@ class PullRequest(models.Model):
         self.status = ev.status
         self.save()
 
+# Incremented whenever a job is saved so that cached JobGraphs are rebuilt
+_job_generation = 0
+
+class JobGraph(object):
+    """
+    The dependencies between the jobs of an event.
+    Built once from the jobs so that the different views of it
+    don't each have to rescan all the jobs.
+    """
+    # Statuses of a dependency that allow a job to run
+    PASSED_STATUS = [JobStatus.FAILED_OK, JobStatus.SUCCESS, JobStatus.INTERMITTENT_FAILURE, JobStatus.SKIPPED]
+    # Statuses of a dependency that mean a job won't run
+    FAILED_STATUS = [JobStatus.FAILED, JobStatus.CANCELED]
+
+    def __init__(self, jobs):
+        """
+        Input:
+          jobs[list[Job]]: All the jobs of the event, with recipe__depends_on prefetched
+        """
+        self.jobs = jobs
+        by_filename = {}
+        for j in jobs:
+            by_filename.setdefault(j.recipe.filename, []).append(j)
+
+        self.depends_on = {}
+        self.dependents = {j: [] for j in jobs}
+        for j in jobs:
+            deps = []
+            for r in j.recipe.depends_on.all():
+                for j2 in by_filename.get(r.filename, []):
+                    if j2 != j:
+                        deps.append(j2)
+                        self.dependents[j2].append(j)
+            self.depends_on[j] = deps
+        self._unrunnable = None
+        self._layers = None
+
+    def deps_passed(self, job):
+        """
+        Whether all the dependencies of a job finished in a way that lets it run.
+        """
+        for d in self.depends_on[job]:
+            if not d.complete or d.status not in self.PASSED_STATUS:
+                return False
+        return True
+
+    def ready(self):
+        """
+        Get the jobs that can be made ready.
+        Return:
+          list[Job]: Active jobs that aren't ready or complete and have all dependencies passed
+        """
+        return [j for j in self.jobs if not j.complete and not j.ready and j.active and self.deps_passed(j)]
+
+    def blocked(self):
+        """
+        Get the jobs that are waiting on their dependencies.
+        Return:
+          list[Job]: Incomplete jobs that don't have all dependencies passed but could still run
+        """
+        unrunnable = self.unrunnable()
+        return [j for j in self.jobs if not j.complete and j not in unrunnable and not self.deps_passed(j)]
+
+    def unrunnable(self):
+        """
+        Get the jobs that won't run due to failed dependencies.
+        This covers the whole dependency chain so if we have
+        j0 -> j1 -> j2 and j0 fails then j1 and j2 won't run.
+        Return:
+          set[Job]
+        """
+        if self._unrunnable is None:
+            wont_run = set()
+            todo = []
+            for j in self.jobs:
+                if j.complete and j.status in self.FAILED_STATUS:
+                    todo.extend(self.dependents[j])
+            while todo:
+                j = todo.pop()
+                if j not in wont_run:
+                    wont_run.add(j)
+                    todo.extend(self.dependents[j])
+            self._unrunnable = wont_run
+        return self._unrunnable
+
+    def layers(self):
+        """
+        Get the jobs in groups where each group only depends on the groups before it.
+        Jobs in a dependency cycle all go in the last group.
+        Return:
+          list[list[Job]]: The groups, each in the order of the jobs
+        """
+        if self._layers is None:
+            remaining = {j: len(set(self.depends_on[j])) for j in self.jobs}
+            layer = [j for j in self.jobs if remaining[j] == 0]
+            placed = 0
+            layers = []
+            while layer:
+                layers.append(layer)
+                placed += len(layer)
+                next_layer = set()
+                for j in layer:
+                    for dependent in set(self.dependents[j]):
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            next_layer.add(dependent)
+                layer = [j for j in self.jobs if j in next_layer]
+            if placed < len(self.jobs):
+                done = set(j for layer in layers for j in layer)
+                layers.append([j for j in self.jobs if j not in done])
+            self._layers = layers
+        return self._layers
+
+    def done(self):
+        """
+        Whether all the jobs have either completed or won't run.
+        """
+        unrunnable = self.unrunnable()
+        for j in self.jobs:
+            if not j.complete and j not in unrunnable:
+                return False
+        return True
+
 @python_2_unicode_compatible
 class Event(models.Model):
     """
@@ -380,6 +504,9 @@ class Event(models.Model):
     json_data = models.TextField(blank=True)
     changed_files = models.TextField(blank=True)
     update_branch_status = models.BooleanField(default=True) # Ignored for PRs
+    # SHA of the tree that gets tested, head merged with base. Used to reuse results.
+    # None if it hasn't been looked up, blank if it isn't known.
+    tested_tree = models.CharField(max_length=120, null=True, blank=True, db_index=True)
 
     last_modified = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(db_index=True, auto_now_add=True)
@@ -425,22 +552,38 @@ class Event(models.Model):
         data = json.loads(self.json_data)
         return data
 
+    def job_graph(self):
+        """
+        Get the dependency graph of the jobs attached to this event.
+        It is kept until a job gets saved so that it can be
+        used repeatedly while handling a request.
+        Return:
+          JobGraph
+        """
+        cached = getattr(self, '_job_graph', None)
+        if cached is not None and cached[0] == _job_generation:
+            return cached[1]
+
+        if 'jobs' in getattr(self, '_prefetched_objects_cache', {}):
+            jobs = list(self.jobs.all())
+            models.prefetch_related_objects(jobs, 'recipe__depends_on')
+        else:
+            jobs = list(self.jobs.select_related('recipe', 'config').prefetch_related('recipe__depends_on'))
+        graph = JobGraph(jobs)
+        self._job_graph = (_job_generation, graph)
+        return graph
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(Event, self).refresh_from_db(*args, **kwargs)
+        self._job_graph = None
+
     def get_job_depends_on(self):
         """
         For each job attached to this event, get a list of dependencies.
         Return:
           dict: jobs are keys with a list of jobs as values
         """
-        depends_on = {}
-        all_jobs = [j for j in self.jobs.all()]
-        for j in all_jobs:
-            deps = []
-            for r in j.recipe.depends_on.all():
-                for j2 in all_jobs:
-                    if j2 != j and j2.recipe.filename == r.filename:
-                        deps.append(j2)
-            depends_on[j] = deps
-        return depends_on
+        return self.job_graph().depends_on
 
     def get_unrunnable_jobs(self):
         """
@@ -448,24 +591,8 @@ class Event(models.Model):
         Return:
           list[Job]: jobs that won't run
         """
-        wont_run = []
-        depends = self.get_job_depends_on()
-        # We want to check the whole dependecy chain.
-        # So if we have j0 -> j1 -> j2 and j0 fails
-        # we want the list to have j1 and j2.
-        while True:
-            added = False
-            for job, deps in depends.items():
-                if job in wont_run:
-                    continue
-                for d in deps:
-                    if (d in wont_run or
-                            (d.complete and d.status in [JobStatus.FAILED, JobStatus.CANCELED])):
-                        wont_run.append(job)
-                        added = True
-            if not added:
-                break
-        return wont_run
+        unrunnable = self.job_graph().unrunnable()
+        return [j for j in self.job_graph().jobs if j in unrunnable]
 
     @staticmethod
     def sorted_jobs(jobs):
@@ -484,43 +611,13 @@ class Event(models.Model):
         Return:
           list: Each entry is a list of sorted jobs
         """
-        job_depends = self.get_job_depends_on()
-        added_jobs = set()
-        other = []
-        job_groups = []
-
-        other = list(job_depends.keys())
-        while other:
-            new_other = []
-            new_group = []
-            for job in other:
-                deps = set(job_depends.get(job, []))
-                if deps.issubset(added_jobs):
-                    new_group.append(job)
-                else:
-                    new_other.append(job)
-            if not new_group:
-                """
-                If we haven't made any progress just stop.
-                """
-                new_group.extend(other)
-                other = []
-            else:
-                other = new_other
-            added_jobs |= set(new_group)
-            job_groups.append(self.sorted_jobs(new_group))
-
-        return job_groups
+        return [self.sorted_jobs(group) for group in self.job_graph().layers()]
 
     def check_done(self):
         """
         Check to see if the event is done running jobs
         """
-        unrunnable_jobs = self.get_unrunnable_jobs()
-        for j in self.jobs.all():
-            if not j.complete and j not in unrunnable_jobs:
-                return False
-        return True
+        return self.job_graph().done()
 
     def set_complete_if_done(self):
         """
@@ -570,8 +667,9 @@ class Event(models.Model):
         """
         self.complete = True
         status = set()
-        unrunnable_jobs = self.get_unrunnable_jobs()
-        for j in self.jobs.all():
+        graph = self.job_graph()
+        unrunnable_jobs = graph.unrunnable()
+        for j in graph.jobs:
             if j.complete and j not in unrunnable_jobs:
                 status.add(j.status)
         self.set_status(complete_status(status))
@@ -590,22 +688,16 @@ class Event(models.Model):
             logger.info('Event {}: {} complete'.format(self.pk, self))
             return
 
-        job_depends = self.get_job_depends_on()
-        for job, deps in job_depends.items():
-            if job.complete or job.ready or not job.active:
-                continue
-            ready = True
-            for d in deps:
-                if not d.complete or d.status not in [JobStatus.FAILED_OK, JobStatus.SUCCESS, JobStatus.INTERMITTENT_FAILURE, JobStatus.SKIPPED]:
-                    logger.info('job {}: {} does not have depends met: {}'.format(job.pk, job, d))
-                    ready = False
-                    break
-
-            if ready:
-                job.ready = ready
-                job.save()
-                logger.info('{}: {}: {} : ready: {} : on {}'.format(job.event,
-                    job.pk, job, job.ready, job.recipe.repository))
+        graph = self.job_graph()
+        for job in graph.blocked():
+            if job.active and not job.ready:
+                logger.info('job {}: {} does not have depends met'.format(job.pk, job))
+
+        for job in graph.ready():
+            job.ready = True
+            job.save()
+            logger.info('{}: {}: {} : ready: {} : on {}'.format(job.event,
+                job.pk, job, job.ready, job.recipe.repository))
 
     def auto_cancel_event_except_current(self):
         return self.base.branch.get_branch_setting("auto_cancel_push_events_except_current", False)
@@ -707,6 +799,8 @@ class Recipe(models.Model):
     create_issue_on_fail_message = models.TextField(blank=True, default="")
     # If True, create a new comment on each fail instead of just updating the issue body
     create_issue_on_fail_new_comment = models.BooleanField(default=False)
+    # If True, a job can reuse the results of a previous identical job instead of running
+    reuse_results = models.BooleanField(default=False)
     # depends_on depend on other recipes which means that it isn't symmetrical
     depends_on = models.ManyToManyField('Recipe', symmetrical=False, blank=True)
     automatic = models.IntegerField(choices=AUTO_CHOICES, default=FULL_AUTO)
@@ -724,6 +818,11 @@ class Recipe(models.Model):
     class Meta:
         get_latest_by = 'last_modified'
 
+    def save(self, *args, **kwargs):
+        super(Recipe, self).save(*args, **kwargs)
+        # Keep the order of the ready job queue up to date
+        ReadyJob.objects.filter(job__recipe=self).exclude(priority=self.priority).update(priority=self.priority)
+
     def cause_str(self):
         if self.CAUSE_PUSH == self.cause:
             return 'Push {}'.format(self.branch.name)
@@ -909,6 +1008,11 @@ class Job(models.Model):
     seconds = models.DurationField(default=timedelta)
     # the sha of civet_recipes for the scripts in this job
     recipe_repo_sha = models.CharField(max_length=120, blank=True)
+    # the sha of the contents of the scripts sent to the client for this job
+    scripts_sha = models.CharField(max_length=120, blank=True)
+    # the job whose results were reused instead of running this one
+    reused_from = models.ForeignKey('Job', null=True, blank=True, related_name='reused_by',
+            on_delete=models.SET_NULL)
     failed_step = models.CharField(max_length=120, blank=True)
     # Just a cached value of the current running step
     running_step = models.CharField(max_length=120, blank=True)
@@ -920,9 +1024,68 @@ class Job(models.Model):
         get_latest_by = 'last_modified'
         unique_together = ['recipe', 'event', 'config']
 
+    # Whether the job could be in the ready queue. None if not known.
+    _maybe_queued = None
+
     def __str__(self):
         return '{}:{}'.format(self.recipe.name, self.config.name)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        job = super(Job, cls).from_db(db, field_names, values)
+        if not job.get_deferred_fields():
+            job._maybe_queued = job._ready_to_run()
+        return job
+
+    def save(self, *args, **kwargs):
+        global _job_generation
+        super(Job, self).save(*args, **kwargs)
+        _job_generation += 1
+        self.update_ready_queue()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(Job, self).refresh_from_db(*args, **kwargs)
+        self._maybe_queued = None
+
+    def _ready_to_run(self):
+        return not self.complete and self.active and self.ready and self.status == JobStatus.NOT_STARTED
+
+    def can_be_dispatched(self):
+        """
+        Whether a client can claim this job.
+        Jobs with a client runner user are not handed out to clients.
+        """
+        return self._ready_to_run() and self.recipe.client_runner_user_id is None
+
+    def update_ready_queue(self):
+        """
+        Add, update, or remove this job in the ready job queue
+        according to its current state.
+        This gets called whenever the job is saved so that the queue
+        follows jobs being made ready, invalidated, canceled, or claimed.
+        """
+        if self.pk is None:
+            return
+        if self.can_be_dispatched():
+            entry, created = ReadyJob.objects.update_or_create(job=self, defaults=ReadyJob.values_for_job(self))
+            self._maybe_queued = True
+            if created:
+                self.notify_ready()
+        elif self._maybe_queued is not False:
+            ReadyJob.objects.filter(job_id=self.pk).delete()
+            self._maybe_queued = False
+
+    def notify_ready(self):
+        """
+        Wake up any clients waiting in get_job for a job with this config.
+        This is done once the transaction is committed so that they can see the job.
+        """
+        if settings.GET_JOB_MAX_WAIT <= 0:
+            return
+        channel = PubSub.ready_channel(self.config.name)
+        data = {'job_id': self.pk}
+        transaction.on_commit(lambda: PubSub.publish(channel, data))
+
     def str_with_client(self):
         if self.client:
             return "%s on %s" % (self, self.client)
@@ -955,7 +1118,7 @@ class Job(models.Model):
     def total_output_size(self):
         total = 0
         for result in self.step_results.all():
-            total += len(result.output)
+            total += result.output_length()
         return humanize_bytes(total)
 
     def unique_name(self):
@@ -998,6 +1161,7 @@ class Job(models.Model):
         if latest_recipe.count():
             self.recipe = latest_recipe.first()
         self.invalidated = True
+        self.reused_from = None
         self.same_client = same_client
         self.seconds = timedelta(seconds=0)
         if client:
@@ -1054,6 +1218,79 @@ class Job(models.Model):
                 rec.save()
                 break
 
+@python_2_unicode_compatible
+class ReadyJob(models.Model):
+    """
+    The queue of jobs that are ready to be claimed by a client.
+    Entries are added and removed as jobs change (see Job.update_ready_queue)
+    so that a client looking for work just needs an indexed lookup
+    instead of going through all the jobs that are ready.
+    """
+    job = models.OneToOneField(Job, primary_key=True, related_name='ready_entry', on_delete=models.CASCADE)
+    config = models.ForeignKey(BuildConfig, on_delete=models.CASCADE)
+    # The user whose build key is required to claim the job
+    build_user = models.ForeignKey(GitUser, on_delete=models.CASCADE)
+    # If set then only this client can claim the job
+    client = models.ForeignKey(Client, null=True, blank=True, on_delete=models.CASCADE)
+    priority = models.IntegerField(default=0)
+    created = models.DateTimeField()
+    # Jobs with the same priority are handed out in this order. Set by the dispatch policy.
+    dispatch_time = models.DateTimeField()
+    # Jobs on a push event of a branch that auto cancels all but the current event.
+    # These get handed out after all the other jobs.
+    current_push = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['config', 'build_user', 'current_push', '-priority', 'dispatch_time'])]
+
+    def __str__(self):
+        return '{}:{}'.format(self.job_id, self.config)
+
+    @staticmethod
+    def values_for_job(job, policy=None, runtimes=None):
+        """
+        Get the values of the queue entry for a job.
+        Input:
+          job[Job]: The job
+          policy: The dispatch policy. Defaults to the one in settings.
+          runtimes[dict]: Passed to the dispatch policy
+        Return:
+          dict: Field values
+        """
+        # DispatchPolicy uses the models
+        from ci import DispatchPolicy
+        if policy is None:
+            policy = DispatchPolicy.get_policy()
+        ev = job.event
+        current_push = ev.cause == Event.PUSH and ev.auto_cancel_event_except_current()
+        return {'config_id': job.config_id,
+                'build_user_id': job.recipe.build_user_id,
+                'client_id': job.client_id,
+                'priority': job.recipe.priority,
+                'created': job.created,
+                'dispatch_time': policy.dispatch_time(job, runtimes),
+                'current_push': bool(current_push),
+                }
+
+@python_2_unicode_compatible
+class JobRuntime(models.Model):
+    """
+    Rolling average of the runtime of the jobs of a recipe file on a build config.
+    Used to estimate how long a job will take (see DispatchPolicy).
+    """
+    filename = models.CharField(max_length=120)
+    config = models.ForeignKey(BuildConfig, on_delete=models.CASCADE)
+    seconds = models.FloatField(default=0)
+    # Number of runtimes that went into the average
+    count = models.IntegerField(default=0)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['filename', 'config']
+
+    def __str__(self):
+        return '{}:{}: {:.0f}s'.format(self.filename, self.config, self.seconds)
+
 @python_2_unicode_compatible
 class JobTestStatistics(models.Model):
     """
@@ -1122,10 +1359,18 @@ class StepResult(models.Model):
     exit_status = models.IntegerField(default=0) # return value of the script
     status = models.IntegerField(choices=JobStatus.STATUS_CHOICES, default=JobStatus.NOT_STARTED)
     complete = models.BooleanField(default=False)
-    output = models.TextField(blank=True) # output of the step
+    # Output that was set in one go. Output that gets appended while the
+    # step is running is stored in StepResultChunk.
+    # Older results have all of their output here.
+    stored_output = models.TextField(blank=True, db_column='output')
     seconds = models.DurationField(default=timedelta) #run time
     last_modified = models.DateTimeField(auto_now=True)
 
+    # Cache of the reassembled output
+    _output = None
+    # Whether the chunks need to be removed on the next save
+    _replace_chunks = False
+
     def __str__(self):
         return '{}:{}'.format(self.job, self.name)
 
@@ -1133,14 +1378,171 @@ class StepResult(models.Model):
         unique_together = ['job', 'position']
         ordering = ['position',]
 
+    @property
+    def output(self):
+        """
+        The full output of the step.
+        This is assembled from the stored output and any appended chunks.
+        """
+        if self._output is None:
+            if self.pk is None:
+                self._output = self.stored_output
+            else:
+                self._output = self.stored_output + "".join([c.output for c in self.chunks.all()])
+        return self._output
+
+    @output.setter
+    def output(self, value):
+        """
+        Replaces all the output. Any existing chunks will be removed on save()
+        """
+        self.stored_output = value
+        self._output = value
+        self._replace_chunks = self.pk is not None
+
+    def save(self, *args, **kwargs):
+        super(StepResult, self).save(*args, **kwargs)
+        if self._replace_chunks:
+            self._replace_chunks = False
+            self.chunks.all().delete()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(StepResult, self).refresh_from_db(*args, **kwargs)
+        self._output = None
+        self._replace_chunks = False
+
+    def _last_chunk(self):
+        """
+        Get the sequence number and end offset of the last chunk.
+        Return:
+          (int, int): The sequence number and the offset of the end of the
+            last chunk relative to the start of the chunked output.
+            (None, 0) if there are no chunks.
+        """
+        last = (self.chunks
+                .annotate(length=Length('output'))
+                .order_by('-seq')
+                .values_list('seq', 'start', 'length')
+                .first())
+        if last is None:
+            return None, 0
+        return last[0], last[1] + last[2]
+
+    def append_output(self, output):
+        """
+        Appends output to the step.
+        Only the new output gets written, the existing output is not touched.
+        Input:
+          output[str]: Output to append
+        Return:
+          StepResultChunk: The new chunk, None if there wasn't any output
+        """
+        if not output:
+            return None
+        last_seq, end = self._last_chunk()
+        seq = 0 if last_seq is None else last_seq + 1
+        chunk = StepResultChunk.objects.create(step_result=self, seq=seq, start=end, output=output)
+        if self._output is not None:
+            self._output += output
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        prefetched.pop('chunks', None)
+        return chunk
+
+    def output_length(self):
+        """
+        Get the length of the output without having to assemble it.
+        """
+        if self._output is not None or self.pk is None:
+            return len(self.output)
+        if 'chunks' in getattr(self, '_prefetched_objects_cache', {}):
+            return len(self.output)
+        return len(self.stored_output) + self._last_chunk()[1]
+
+    def output_since(self, offset):
+        """
+        Get the output that was added after the caller already had
+        the output up to offset.
+        Since the output can be replaced, if the new output can't be
+        continued from offset then all of the output is returned.
+        Input:
+          offset[int]: The length of the output the caller already has. None to get all the output.
+        Return:
+          (str, int, bool): The output, the offset of the end of the output
+            and whether the output should be appended to what the caller already has.
+        """
+        stored_length = len(self.stored_output)
+        if offset is not None and self.pk is not None and offset >= stored_length:
+            chunk_offset = offset - stored_length
+            new_chunks = list(self.chunks.filter(start__gte=chunk_offset))
+            if new_chunks and new_chunks[0].start == chunk_offset:
+                last = new_chunks[-1]
+                output = "".join([c.output for c in new_chunks])
+                return output, stored_length + last.start + len(last.output), True
+            if not new_chunks and self._last_chunk()[1] == chunk_offset:
+                return "", offset, True
+        output = self.output
+        return output, len(output), False
+
     def status_slug(self):
         return JobStatus.to_slug(self.status)
 
     def clean_output(self):
         # If the output is over 2Mb then just return a too big message.
-        if len(self.output) > (1024*1024*2):
+        if self.output_length() > (1024*1024*2):
             return "Output too large. You will need to download the results to see this."
-        return terminalize_output(self.output)
+        if self.pk is None:
+            return terminalize_output(self.output)
+        return OutputCache.get_rendered("step_result_%s" % self.pk,
+                self.output,
+                terminalize_output,
+                incremental=not self.complete)
+
+    def clean_output_since(self, offset):
+        """
+        Same as output_since() but with the output converted to HTML.
+        If the output is too large then the offset returned is None.
+        """
+        if self.output_length() > (1024*1024*2):
+            return self.clean_output(), None, False
+        output, new_offset, append = self.output_since(offset)
+        return terminalize_output(output), new_offset, append
+
+    def output_pieces(self, chunk_size=100, piece_size=1024*1024):
+        """
+        Generator over the output, in order, without assembling it.
+        The chunks are read from the database in batches so that
+        large output doesn't need to be held in memory all at once.
+        If stored_output was deferred it is read in pieces as well.
+        Input:
+          chunk_size[int]: Number of chunks to read from the database at a time
+          piece_size[int]: Number of characters of stored_output to read at a time
+        """
+        if self._output is not None or self.pk is None:
+            # The chunks were already assembled (or there aren't any)
+            if self.output:
+                yield self.output
+            return
+        if 'stored_output' in self.get_deferred_fields():
+            for piece in self._stored_output_pieces(piece_size):
+                yield piece
+        elif self.stored_output:
+            yield self.stored_output
+        for output in self.chunks.order_by('seq').values_list('output', flat=True).iterator(chunk_size=chunk_size):
+            yield output
+
+    def _stored_output_pieces(self, piece_size):
+        """
+        Read stored_output from the database a piece at a time.
+        """
+        q = StepResult.objects.filter(pk=self.pk)
+        length = q.annotate(length=Length('stored_output')).values_list('length', flat=True).first()
+        for start in range(0, length or 0, piece_size):
+            # Substr() starts at 1
+            piece = (q.annotate(piece=Substr('stored_output', start + 1, piece_size))
+                    .values_list('piece', flat=True)
+                    .first())
+            if piece:
+                yield piece
 
     def plain_output(self):
         prefix = re.escape("\33[")
@@ -1149,7 +1551,29 @@ class StepResult(models.Model):
         return new_out
 
     def output_size(self):
-        return humanize_bytes(len(self.output))
+        return humanize_bytes(self.output_length())
+
+@python_2_unicode_compatible
+class StepResultChunk(models.Model):
+    """
+    A piece of output of a StepResult.
+    While a step is running the client sends its output in pieces.
+    Storing each piece separately means we only have to write the
+    new output instead of rewriting all of the output each time.
+    """
+    step_result = models.ForeignKey(StepResult, related_name='chunks', on_delete=models.CASCADE)
+    seq = models.PositiveIntegerField(default=0)
+    # Offset of this chunk relative to the start of the chunked output
+    start = models.PositiveIntegerField(default=0)
+    output = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{}:{}'.format(self.step_result, self.seq)
+
+    class Meta:
+        unique_together = ['step_result', 'seq']
+        ordering = ['seq',]
 
 def incomplete_status(status):
     """
@@ -1212,3 +1636,59 @@ class RepositoryBadge(models.Model):
 
     def __str__(self):
         return "%s:%s" % (self.repository, self.name)
+
+@python_2_unicode_compatible
+class GitServerUpdate(models.Model):
+    """
+    A call to the API of a Git server, like setting a commit status or
+    adding a PR comment, that is waiting to be sent.
+    These are sent by the "git_outbox" management command. See ci/GitOutbox.py
+    """
+    build_user = models.ForeignKey(GitUser, related_name='git_server_updates', on_delete=models.CASCADE)
+    method = models.CharField(max_length=120)
+    args = models.TextField() # JSON encoded arguments of the method
+    # A newer update with the same key replaces a pending one.
+    # For example, only the latest status of a commit/context is sent.
+    key = models.CharField(max_length=255, blank=True, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return "%s:%s" % (self.build_user, self.method)
+
+@python_2_unicode_compatible
+class WebhookDelivery(models.Model):
+    """
+    The payload of a webhook call from a Git server that is waiting to be
+    processed by the "process_webhooks" command. See ci/WebhookQueue.py
+    """
+    build_user = models.ForeignKey(GitUser, related_name='webhook_deliveries', on_delete=models.CASCADE)
+    # ID the Git server gave the delivery. Used to ignore redeliveries.
+    delivery_id = models.CharField(max_length=120)
+    payload = models.TextField()
+    # Deliveries for the same repository are processed in order
+    repo_key = models.CharField(max_length=255, blank=True)
+    # When a worker last said it was processing it
+    claimed = models.DateTimeField(null=True, blank=True)
+    # Which claim it is, so that a worker only updates it if it still has it
+    claim_id = models.CharField(max_length=40, blank=True)
+    processed = models.BooleanField(default=False)
+    # Number of times processing it failed and when to try again
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['pk']
+        unique_together = ['build_user', 'delivery_id']
+        indexes = [models.Index(fields=['processed', 'repo_key'])]
+
+    def __str__(self):
+        return "%s:%s" % (self.build_user, self.delivery_id)
@@ -18,6 +18,7 @@ from django.shortcuts import redirect
 from requests_oauthlib import OAuth2Session
 from django.contrib import messages
 import ci.models
+from ci import PermissionCache
 import json
 import logging
 
@@ -175,6 +176,7 @@ class OAuth(object):
         # Get rid of these keys on login
         for key in self._addition_keys:
             session.pop(key, None)
+        PermissionCache.clear_user(user)
 
     def update_user(self, session):
         """
@@ -187,6 +189,8 @@ class OAuth(object):
         gituser, created = ci.models.GitUser.objects.get_or_create(server=server, name=user)
         gituser.token = json.dumps(token)
         gituser.save()
+        # Signing in again picks up any changes in permissions
+        PermissionCache.clear_user(gituser)
 
     def get_json_value(self, response, name):
         """
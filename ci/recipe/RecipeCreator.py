@@ -16,7 +16,7 @@
 from __future__ import unicode_literals, absolute_import
 from django.conf import settings
 from django.db import transaction
-from ci.recipe import RecipeRepoReader, file_utils
+from ci.recipe import RecipeRepoReader, file_utils, ScriptCache
 from ci import models
 
 class RecipeCreator(object):
@@ -192,6 +192,7 @@ class RecipeCreator(object):
             self._recipe_repo_rec.sha = self._repo_sha
             self._recipe_repo_rec.save()
             self._update_pull_requests()
+            ScriptCache.load(self._recipes_dir, self._repo_sha)
         return removed, new, changed
 
     def install_webhooks(self):
@@ -408,6 +409,7 @@ class RecipeCreator(object):
         recipe.private = recipe_dict["private"]
         recipe.activate_label = recipe_dict["activate_label"]
         recipe.pr_base_ref_override = recipe_dict["pr_base_ref_override"]
+        recipe.reuse_results = recipe_dict["reuse_results"]
         recipe.cause = cause
 
         recipe.priority = recipe_dict[self._priority_map[cause]]
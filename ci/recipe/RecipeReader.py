@@ -328,6 +328,7 @@ class RecipeReader(object):
                 "create_issue_on_fail_message", "")
         recipe["create_issue_on_fail_new_comment"] = self.get_option("Main",
                 "create_issue_on_fail_new_comment", False)
+        recipe["reuse_results"] = self.get_option("Main", "reuse_results", False)
         repo_data = self.parse_repo(recipe["repository"])
         if repo_data:
             recipe["repository_server"] = repo_data[0]
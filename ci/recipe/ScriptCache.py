@@ -0,0 +1,133 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Process wide cache of the contents of the step scripts and prestep sources.
+
+When a client claims a job we send it the contents of all the scripts of
+the recipe. Instead of reading them from RECIPE_BASE_DIR on every claim,
+they are all read once for each version of the recipe repository, as
+recorded in models.RecipeRepository when the recipes are loaded.
+When the recorded SHA changes the cache is reloaded.
+The contents are stored by their hash so that scripts used by many
+recipes are only stored once.
+"""
+from __future__ import unicode_literals, absolute_import
+from ci import models
+from ci.recipe import file_utils
+import hashlib
+import threading
+
+_lock = threading.Lock()
+_key = None # (base_dir, sha) that is loaded
+_files = {} # {filename: digest}
+_contents = {} # {digest: contents}
+
+def _digest(contents):
+    if contents is None:
+        return None
+    return hashlib.sha1(contents.encode("utf-8", "replace")).hexdigest()
+
+def _store(files, contents, filename, data):
+    digest = _digest(data)
+    files[filename] = digest
+    if digest is not None:
+        contents[digest] = data
+
+def current_sha():
+    """
+    The SHA of the recipe repository that was last loaded.
+    Return:
+      str: The SHA, or "" if the recipes haven't been loaded
+    """
+    sha = models.RecipeRepository.objects.values_list("sha", flat=True).first()
+    return sha or ""
+
+def recipe_filenames():
+    """
+    Get the filenames of all the scripts used by the recipes.
+    Return:
+      set[str]: filenames relative to the recipe directory
+    """
+    steps = models.Step.objects.exclude(filename="").values_list("filename", flat=True).distinct()
+    presteps = models.PreStepSource.objects.exclude(filename="").values_list("filename", flat=True).distinct()
+    return set(steps) | set(presteps)
+
+def load(base_dir, sha):
+    """
+    Read all the scripts used by the recipes into the cache.
+    Input:
+      base_dir[str]: The recipe directory
+      sha[str]: SHA of the recipe repository
+    """
+    global _key, _files, _contents
+    files = {}
+    contents = {}
+    for filename in recipe_filenames():
+        _store(files, contents, filename, file_utils.get_contents(base_dir, filename))
+    with _lock:
+        _key = (base_dir, sha)
+        _files = files
+        _contents = contents
+
+def _lookup(key, filename):
+    """
+    Should be called with _lock held.
+    Return:
+      (bool, str): Whether the file was found and its contents
+    """
+    if _key != key or filename not in _files:
+        return False, None
+    return True, _contents.get(_files[filename])
+
+def get_contents(base_dir, sha, filename):
+    """
+    Get the contents of a script.
+    Input:
+      base_dir[str]: The recipe directory
+      sha[str]: SHA of the recipe repository, see current_sha()
+      filename[str]: filename relative to base_dir
+    Return:
+      str of the contents of the file, or None if it isn't a valid file. See file_utils.get_contents()
+    """
+    key = (base_dir, sha)
+    with _lock:
+        loaded = _key == key
+        found, data = _lookup(key, filename)
+    if found:
+        return data
+
+    if not loaded:
+        load(base_dir, sha)
+        with _lock:
+            found, data = _lookup(key, filename)
+        if found:
+            return data
+
+    # Not used by any recipe when the cache was loaded
+    data = file_utils.get_contents(base_dir, filename)
+    with _lock:
+        if _key == key:
+            _store(_files, _contents, filename, data)
+    return data
+
+def clear():
+    """
+    Empty the cache. Used in testing.
+    """
+    global _key, _files, _contents
+    with _lock:
+        _key = None
+        _files = {}
+        _contents = {}
@@ -18,9 +18,10 @@ from ci.recipe.tests import RecipeTester
 from ci.tests import utils as test_utils
 from ci import models
 from mock import patch
+import os
 from django.test import override_settings
 from ci.github import api
-from ci.recipe import RecipeCreator
+from ci.recipe import RecipeCreator, ScriptCache, file_utils
 
 @override_settings(INSTALLED_GITSERVERS=[test_utils.github_config()])
 class Tests(RecipeTester.RecipeTester):
@@ -107,6 +108,15 @@ class Tests(RecipeTester.RecipeTester):
                     num_recipe_envs=4,
                     num_prestep=4)
 
+            # The scripts are already in the cache
+            sha = models.RecipeRepository.load().sha
+            step = models.Step.objects.first()
+            with open(os.path.join(recipes_dir, step.filename), "r") as f:
+                contents = f.read()
+            with patch.object(file_utils, 'get_contents') as mock_contents:
+                self.assertEqual(ScriptCache.get_contents(recipes_dir, sha, step.filename), contents)
+                self.assertEqual(mock_contents.call_count, 0)
+
     def test_repo_changed(self):
         with test_utils.RecipeDir() as recipes_dir:
             # OK
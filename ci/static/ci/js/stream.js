@@ -0,0 +1,64 @@
+/*
+ * Copyright 2016-2025 Battelle Energy Alliance, LLC
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+/* Listen for updates pushed from the server.
+ * on_message gets called with the data of each message.
+ * on_open gets called whenever the connection is (re)opened so that
+ * the page can catch up on anything it missed while not connected.
+ * Returns false if the browser doesn't support Server-Sent Events,
+ * in which case the page should just poll.
+ */
+function streamUpdates( url, on_message, on_open )
+{
+  if( typeof(EventSource) === "undefined" ){
+    return false;
+  }
+  var source = new EventSource(url);
+  source.onmessage = function(e) {
+    on_message(JSON.parse(e.data));
+  };
+  source.onopen = function(e) {
+    on_open();
+  };
+  return true;
+}
+
+/* Returns a function that calls func at most once every wait milliseconds.
+ * The first call goes through right away. Calls during the wait are
+ * combined into one call at the end of it, so a burst of messages only
+ * causes one more update.
+ */
+function throttleUpdate( func, wait )
+{
+  var timeout_id = 0;
+  var pending = false;
+  var done_waiting = function() {
+    timeout_id = 0;
+    if( pending ){
+      pending = false;
+      func();
+      timeout_id = setTimeout(done_waiting, wait);
+    }
+  };
+  return function() {
+    if( timeout_id == 0 ){
+      func();
+      timeout_id = setTimeout(done_waiting, wait);
+    } else {
+      pending = true;
+    }
+  };
+}
@@ -16,8 +16,10 @@
 from __future__ import unicode_literals, absolute_import
 from django.test import TestCase, Client
 from django.conf import settings
-from ci import models
+from django.core.cache import cache
+from ci import models, Heartbeat
 from ci.tests import utils
+from ci.recipe import ScriptCache
 from django.test.client import RequestFactory
 
 class DBCompare(object):
@@ -175,3 +177,6 @@ class DBTester(TestCase, DBCompare):
     def setUp(self):
         self.client = Client()
         self.factory = RequestFactory()
+        Heartbeat.clear()
+        ScriptCache.clear()
+        cache.clear()
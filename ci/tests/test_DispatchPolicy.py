@@ -0,0 +1,139 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import override_settings, SimpleTestCase
+from datetime import timedelta
+from ci import models, DispatchPolicy, DispatchSimulator
+from ci.client import views as client_views
+from ci.tests import DBTester, utils
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+class Tests(DBTester.DBTester):
+    def create_ready_job(self, name, seconds=None):
+        user = utils.get_test_user()
+        recipe = utils.create_recipe(name=name, user=user)
+        event = utils.create_event(user=user, commit1=name)
+        if seconds is not None:
+            models.JobRuntime.objects.create(filename=recipe.filename, config=recipe.build_configs.first(),
+                    seconds=seconds, count=1)
+        job = utils.create_job(recipe=recipe, event=event)
+        utils.update_job(job, ready=True, active=True, status=models.JobStatus.NOT_STARTED)
+        return job
+
+    def test_delay(self):
+        self.assertEqual(DispatchPolicy.FifoPolicy().delay(100), 0)
+        policy = DispatchPolicy.ShortestFirstPolicy(weight=2, max_delay=500)
+        self.assertEqual(policy.delay(None), 0)
+        self.assertEqual(policy.delay(100), 200)
+        self.assertEqual(policy.delay(1000), 500)
+
+    def test_dispatch_time(self):
+        job = self.create_ready_job("job", seconds=100)
+        # The runtimes aren't looked up when they aren't used
+        fifo = DispatchPolicy.FifoPolicy()
+        self.assertFalse(fifo.uses_runtimes)
+        with self.assertNumQueries(0):
+            self.assertEqual(fifo.dispatch_time(job), job.created)
+        policy = DispatchPolicy.ShortestFirstPolicy(weight=2, max_delay=500)
+        self.assertTrue(policy.uses_runtimes)
+        self.assertEqual(policy.dispatch_time(job), job.created + timedelta(seconds=200))
+        self.assertEqual(policy.dispatch_time(job, {}), job.created)
+
+        with self.settings(DISPATCH_POLICY="shortest_first"):
+            self.assertEqual(DispatchPolicy.get_policy().name, "shortest_first")
+        with self.settings(DISPATCH_POLICY="foo"):
+            self.assertEqual(DispatchPolicy.get_policy().name, "fifo")
+
+    def test_record_runtime(self):
+        job = utils.create_job()
+        job.seconds = timedelta(seconds=10)
+        # Not finished
+        DispatchPolicy.record_runtime(job)
+        self.assertEqual(models.JobRuntime.objects.count(), 0)
+
+        utils.update_job(job, status=models.JobStatus.CANCELED, complete=True)
+        DispatchPolicy.record_runtime(job)
+        self.assertEqual(models.JobRuntime.objects.count(), 0)
+
+        utils.update_job(job, status=models.JobStatus.SUCCESS)
+        DispatchPolicy.record_runtime(job)
+        runtime = models.JobRuntime.objects.get()
+        self.assertEqual(runtime.seconds, 10)
+        self.assertEqual(runtime.count, 1)
+        self.assertEqual(DispatchPolicy.expected_seconds(job), 10)
+        self.assertEqual(DispatchPolicy.load_runtimes(), {(job.recipe.filename, job.config_id): 10})
+
+        # Just the average at first
+        job.seconds = timedelta(seconds=20)
+        DispatchPolicy.record_runtime(job)
+        runtime.refresh_from_db()
+        self.assertEqual(runtime.seconds, 15)
+        self.assertEqual(runtime.count, 2)
+
+        # Then newer runtimes count for more
+        self.assertEqual(DispatchPolicy.rolling_average(10, 100, 20), 12)
+
+    def test_ready_queue(self):
+        client = utils.create_client()
+        build_keys = [utils.get_test_user().build_key]
+        configs = [utils.create_build_config().name]
+
+        with self.settings(DISPATCH_POLICY="shortest_first", DISPATCH_SHORTEST_FIRST_WEIGHT=1.0,
+                DISPATCH_MAX_DELAY=60*60):
+            long_job = self.create_ready_job("long", seconds=4*60*60)
+            short_job = self.create_ready_job("short", seconds=3*60)
+            unknown_job = self.create_ready_job("unknown")
+            entry = models.ReadyJob.objects.get(job=long_job)
+            self.assertEqual(entry.dispatch_time, long_job.created + timedelta(seconds=60*60))
+
+            # No history goes first, then the short one
+            self.assertEqual(client_views.get_cached_job(client, build_keys, configs)[0], unknown_job)
+            self.assertEqual(client_views.get_cached_job(client, build_keys, configs)[0], short_job)
+            self.assertEqual(client_views.get_cached_job(client, build_keys, configs)[0], long_job)
+
+        # The key changes with the policy so the queue gets rebuilt
+        key = client_views.ready_queue_rebuilt_key()
+        with self.settings(DISPATCH_POLICY="shortest_first"):
+            self.assertNotEqual(key, client_views.ready_queue_rebuilt_key())
+
+class SimulatorTests(SimpleTestCase):
+    def sim_job(self, pk, filename, created, seconds):
+        return DispatchSimulator.SimJob(pk, pk, True, 1, filename, 0, created, seconds)
+
+    def test_simulate(self):
+        # Earlier runs give the expected runtimes
+        jobs = [self.sim_job(1, "long", -5000, 1000),
+                self.sim_job(2, "short", -3000, 10),
+                self.sim_job(3, "other", 0, 100),
+                self.sim_job(4, "long", 10, 1000),
+                self.sim_job(5, "short", 20, 10),
+                ]
+        clients = {1: 1}
+        fifo = DispatchSimulator.simulate(jobs, DispatchPolicy.FifoPolicy(), clients)
+        self.assertEqual(fifo[4], 1090)
+        self.assertEqual(fifo[5], 1090)
+        shortest = DispatchSimulator.simulate(jobs, DispatchPolicy.ShortestFirstPolicy(1, 60*60), clients)
+        self.assertEqual(shortest[4], 1100)
+        self.assertEqual(shortest[5], 90)
+        self.assertLess(DispatchSimulator.mean_turnaround(jobs, shortest), DispatchSimulator.mean_turnaround(jobs, fifo))
+
+        # Dependencies
+        jobs[4].depends_on.append(jobs[3])
+        jobs[3].dependents.append(jobs[4])
+        shortest = DispatchSimulator.simulate(jobs, DispatchPolicy.ShortestFirstPolicy(1, 60*60), clients)
+        self.assertEqual(shortest[5], 1110 - 20)
+
+        self.assertEqual(DispatchSimulator.count_clients(jobs), {1: 1})
+        self.assertIsNone(DispatchSimulator.mean_turnaround([], fifo))
@@ -0,0 +1,262 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import override_settings
+from django.core import management
+from django.utils import timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import timedelta
+from mock import patch
+from ci import models, GitOutbox
+from ci.client import UpdateRemoteStatus
+from ci.github import api
+from ci.tests import DBTester, utils
+from io import StringIO
+import threading
+import json
+import os
+
+class FakeGitServer(object):
+    """
+    A local HTTP server that records the requests sent to it.
+    The first "fail" requests get a 502 response.
+    """
+    def __init__(self, fail=0):
+        self.requests = []
+        self.fail = fail
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                fake.requests.append((self.command, self.path, json.loads(body or b"{}")))
+                status = 201
+                if fake.fail > 0:
+                    fake.fail -= 1
+                    status = 502
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%s" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def config(self):
+        config = utils.github_config(remote_update=True)
+        config["api_url"] = self.url
+        return config
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+@override_settings(GIT_SERVER_OUTBOX=True)
+class Tests(DBTester.DBTester):
+    def setUp(self):
+        super(Tests, self).setUp()
+        self.job = utils.create_job()
+        self.ev = self.job.event
+        self.build_user = self.ev.build_user
+        self.repo = self.ev.base.repo()
+
+    def status_request(self, git_api, desc, context="context"):
+        git_api.update_status(self.ev.base, self.ev.head, git_api.RUNNING, "url", desc, context,
+                git_api.STATUS_JOB_STARTED)
+
+    def test_api(self):
+        git_api = GitOutbox.api(self.build_user)
+        self.assertIsInstance(git_api, GitOutbox.OutboxAPI)
+        # Everything else goes to the real API
+        self.assertEqual(git_api.PENDING, api.GitHubAPI.PENDING)
+        self.assertEqual(git_api.errors(), [])
+
+        with self.settings(GIT_SERVER_OUTBOX=False):
+            self.assertIsInstance(GitOutbox.api(self.build_user), api.GitHubAPI)
+
+    @patch.object(api.GitHubAPI, 'update_status')
+    @patch.object(api.GitHubAPI, 'pr_comment')
+    def test_coalesce(self, mock_comment, mock_status):
+        git_api = GitOutbox.api(self.build_user)
+        self.status_request(git_api, "first")
+        self.status_request(git_api, "second")
+        self.status_request(git_api, "other", context="other context")
+        git_api.pr_comment("url", "comment 1")
+        git_api.pr_comment("url", "comment 2")
+        git_api.add_pr_label(self.repo, 1, "label")
+        git_api.remove_pr_label(self.repo, 1, "label")
+        git_api.add_pr_label(self.repo, 1, "other label")
+        # Nothing actually sent
+        self.assertEqual(mock_status.call_count, 0)
+        self.assertEqual(mock_comment.call_count, 0)
+
+        updates = [(u.method, json.loads(u.args)) for u in models.GitServerUpdate.objects.all()]
+        self.assertEqual(len(updates), 6)
+        self.assertEqual(updates[0][0], "update_status")
+        self.assertEqual(updates[0][1][4], "second")
+        self.assertEqual(updates[1][1][4], "other")
+        self.assertEqual(updates[2], ("pr_comment", ["url", "comment 1"]))
+        self.assertEqual(updates[3], ("pr_comment", ["url", "comment 2"]))
+        self.assertEqual(updates[4][0], "remove_pr_label")
+        self.assertEqual(updates[5][0], "add_pr_label")
+
+        self.assertEqual(GitOutbox.drain(), 6)
+        self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+        self.assertEqual(mock_status.call_count, 2)
+        args = mock_status.call_args_list[0][0]
+        self.assertEqual(args[0], self.ev.base)
+        self.assertEqual(args[1], self.ev.head)
+        self.assertEqual(args[4], "second")
+        self.assertEqual(mock_comment.call_count, 2)
+
+    @patch.object(api.GitHubAPI, 'get_pr_comments')
+    @patch.object(api.GitHubAPI, 'edit_pr_comment')
+    @patch.object(api.GitHubAPI, 'pr_comment')
+    def test_edit_comment(self, mock_comment, mock_edit, mock_get_comments):
+        mock_get_comments.return_value = []
+        GitOutbox.edit_comment(self.build_user, "url", "first", "^summary")
+        GitOutbox.edit_comment(self.build_user, "url", "second", "^summary")
+        GitOutbox.edit_comment(self.build_user, "url", "other", "^other")
+        # Nothing looked up or sent yet
+        self.assertEqual(mock_get_comments.call_count, 0)
+        self.assertEqual(mock_comment.call_count, 0)
+        updates = [(u.method, json.loads(u.args)[1:]) for u in models.GitServerUpdate.objects.all()]
+        self.assertEqual(updates, [("edit_comment", ["url", "second", "^summary"]),
+            ("edit_comment", ["url", "other", "^other"])])
+
+        self.assertEqual(GitOutbox.drain(), 2)
+        self.assertEqual(mock_get_comments.call_count, 2)
+        mock_get_comments.assert_called_with("url", self.build_user.name, "^other")
+        self.assertEqual(mock_comment.call_count, 2)
+        mock_comment.assert_any_call("url", "second")
+
+        # There is a comment now, so it gets edited
+        mock_get_comments.return_value = [{"id": 1}]
+        GitOutbox.edit_comment(self.build_user, "url", "third", "^summary")
+        GitOutbox.drain()
+        self.assertEqual(mock_comment.call_count, 2)
+        mock_edit.assert_called_once_with({"id": 1}, "third")
+
+        # Sent right away without the outbox
+        with self.settings(GIT_SERVER_OUTBOX=False):
+            GitOutbox.ensure_single_new_comment(self.build_user, "url", "new", "^summary")
+        self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+        mock_comment.assert_called_with("url", "new")
+
+    @patch.object(api.GitHubAPI, 'update_status')
+    def test_update_remote_status(self, mock_status):
+        self.ev.cause = models.Event.PULL_REQUEST
+        self.ev.save()
+        step_result = utils.create_step_result(job=self.job)
+        UpdateRemoteStatus.job_started(self.job)
+        UpdateRemoteStatus.step_start_pr_status(step_result, self.job)
+        self.assertEqual(mock_status.call_count, 0)
+        self.assertEqual(models.GitServerUpdate.objects.count(), 1)
+        GitOutbox.drain()
+        self.assertEqual(mock_status.call_count, 1)
+        self.assertIn(step_result.name, mock_status.call_args[0][4])
+
+    @patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+    def test_fake_server(self):
+        with FakeGitServer() as fake, self.settings(INSTALLED_GITSERVERS=[fake.config()]):
+            git_api = GitOutbox.api(self.build_user)
+            self.status_request(git_api, "first")
+            self.status_request(git_api, "second")
+            git_api.pr_comment("%s/comments" % fake.url, "comment")
+            self.assertEqual(fake.requests, [])
+
+            out = StringIO()
+            management.call_command("git_outbox", "--once", stdout=out)
+            self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+            self.assertEqual(len(fake.requests), 2)
+            method, path, data = fake.requests[0]
+            self.assertEqual(method, "POST")
+            self.assertEqual(path, "/repos/%s/%s/statuses/%s" % (self.repo.user.name, self.repo.name, self.ev.head.sha))
+            self.assertEqual(data["description"], "second")
+            self.assertEqual(fake.requests[1], ("POST", "/comments", {"body": "comment"}))
+
+    @patch.dict(os.environ, {"OAUTHLIB_INSECURE_TRANSPORT": "1"})
+    def test_retry(self):
+        with FakeGitServer(fail=1) as fake, self.settings(INSTALLED_GITSERVERS=[fake.config()]):
+            git_api = GitOutbox.api(self.build_user)
+            self.status_request(git_api, "status")
+
+            self.assertEqual(GitOutbox.drain(), 1)
+            self.assertEqual(len(fake.requests), 1)
+            update = models.GitServerUpdate.objects.get()
+            self.assertEqual(update.attempts, 1)
+            self.assertGreater(update.next_attempt, timezone.now())
+            self.assertIn("502", update.last_error)
+
+            # Not due yet
+            self.assertEqual(GitOutbox.drain(), 0)
+            self.assertEqual(len(fake.requests), 1)
+
+            update.next_attempt = timezone.now()
+            update.save()
+            self.assertEqual(GitOutbox.drain(), 1)
+            self.assertEqual(len(fake.requests), 2)
+            self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+
+            # Another process is sending it
+            self.status_request(git_api, "status")
+            update = models.GitServerUpdate.objects.get()
+            self.assertTrue(GitOutbox.claim(update, timezone.now()))
+            self.assertFalse(GitOutbox.claim(update, timezone.now()))
+            self.assertEqual(GitOutbox.drain(), 0)
+            self.assertEqual(len(fake.requests), 2)
+            # It died
+            models.GitServerUpdate.objects.update(next_attempt=timezone.now())
+            self.assertEqual(GitOutbox.drain(), 1)
+            self.assertEqual(len(fake.requests), 3)
+            self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+
+            # Give up after too many attempts
+            fake.fail = 1
+            self.status_request(git_api, "status")
+            models.GitServerUpdate.objects.update(attempts=GitOutbox.MAX_ATTEMPTS-1)
+            self.assertEqual(GitOutbox.drain(), 1)
+            self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+
+    @patch.object(api.GitHubAPI, 'add_pr_label')
+    def test_bad_update(self, mock_label):
+        git_api = GitOutbox.api(self.build_user)
+        git_api.add_pr_label(self.repo, 1, "label")
+        GitOutbox.enqueue(self.build_user, "delete", [])
+        models.Repository.objects.filter(pk=self.repo.pk).delete()
+        self.assertEqual(GitOutbox.drain(), 2)
+        self.assertEqual(models.GitServerUpdate.objects.count(), 0)
+        self.assertEqual(mock_label.call_count, 0)
+
+        # An exception gets retried
+        git_api = GitOutbox.api(self.build_user)
+        GitOutbox.enqueue(self.build_user, "pr_comment", ["url", "msg"])
+        with patch.object(api.GitHubAPI, 'pr_comment', side_effect=Exception("BAM!")):
+            GitOutbox.drain()
+        update = models.GitServerUpdate.objects.get()
+        self.assertEqual(update.attempts, 1)
+        self.assertIn("BAM!", update.last_error)
+        self.assertGreater(update.next_attempt, timezone.now() + timedelta(seconds=GitOutbox.RETRY_BACKOFF-1))
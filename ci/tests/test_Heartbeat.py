@@ -0,0 +1,172 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from datetime import timedelta
+import time
+from mock import patch
+from ci import models, Heartbeat
+from ci.tests import utils, DBTester
+from ci.github import api
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=1000)
+class Tests(DBTester.DBTester):
+    def setUp(self):
+        super(Tests, self).setUp()
+        cache.clear()
+        self.job = utils.create_job()
+        self.job.status = models.JobStatus.RUNNING
+        self.job.save()
+        self.step_result = utils.create_step_result(job=self.job)
+        self.step_result.seconds = timedelta(seconds=10)
+        self.step_result.save()
+        self.ci_client = utils.create_client()
+        self.job.refresh_from_db()
+        self.ci_client.refresh_from_db()
+
+    def test_touch(self):
+        job_time = self.job.last_modified
+        client_time = self.ci_client.last_seen
+        ev_time = self.job.event.last_modified
+
+        self.set_counts()
+        Heartbeat.touch(self.job)
+        Heartbeat.touch(self.job.event)
+        Heartbeat.touch(self.ci_client)
+        self.compare_counts()
+
+        # Not written yet
+        self.job.refresh_from_db()
+        self.ci_client.refresh_from_db()
+        self.assertEqual(self.job.last_modified, job_time)
+        self.assertEqual(self.job.seconds, timedelta(seconds=0))
+        self.assertEqual(self.ci_client.last_seen, client_time)
+        # But they show up as modified
+        self.assertGreater(Heartbeat.last_modified(self.job), job_time)
+        self.assertGreater(Heartbeat.last_modified(self.ci_client), client_time)
+        touched_job_time = Heartbeat.last_modified(self.job)
+        touched_ev_time = Heartbeat.last_modified(self.job.event)
+        self.assertGreater(touched_ev_time, ev_time)
+        # All at once with a single cache lookup
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as mock_get_many:
+            times = Heartbeat.last_modified_many([self.job, self.ci_client, self.job.event])
+            self.assertEqual(mock_get_many.call_count, 1)
+        self.assertEqual(times, [touched_job_time, Heartbeat.last_modified(self.ci_client), touched_ev_time])
+        self.assertEqual(Heartbeat.last_modified_many([]), [])
+
+        # One update per model, plus the savepoint
+        with self.assertNumQueries(5):
+            Heartbeat.flush()
+        self.job.refresh_from_db()
+        self.ci_client.refresh_from_db()
+        ev = models.Event.objects.get(pk=self.job.event.pk)
+        self.assertEqual(self.job.last_modified, touched_job_time)
+        self.assertEqual(self.job.seconds, timedelta(seconds=10))
+        self.assertGreater(self.ci_client.last_seen, client_time)
+        self.assertEqual(ev.last_modified, touched_ev_time)
+        self.assertEqual(Heartbeat.last_modified(self.job), touched_job_time)
+
+        # Nothing left to do
+        with self.assertNumQueries(0):
+            Heartbeat.flush()
+
+    def test_saved_after_touch(self):
+        Heartbeat.touch(self.job)
+        # The job finished with the time that the client sent
+        self.job.seconds = timedelta(seconds=20)
+        self.job.complete = True
+        self.job.save()
+        saved_time = self.job.last_modified
+        Heartbeat.flush()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.seconds, timedelta(seconds=20))
+        self.assertEqual(self.job.last_modified, saved_time)
+        self.assertEqual(Heartbeat.last_modified(self.job), saved_time)
+
+    def test_maybe_flush(self):
+        Heartbeat.flush()
+        # Too soon
+        Heartbeat.touch(self.ci_client)
+        client_time = self.ci_client.last_seen
+        self.ci_client.refresh_from_db()
+        self.assertEqual(self.ci_client.last_seen, client_time)
+
+        # Written right away
+        with self.settings(HEARTBEAT_FLUSH_INTERVAL=0):
+            Heartbeat.touch(self.ci_client)
+            self.ci_client.refresh_from_db()
+            self.assertGreater(self.ci_client.last_seen, client_time)
+
+    def test_timer(self):
+        Heartbeat.touch(self.ci_client)
+        timer = Heartbeat._timer
+        self.assertIsNotNone(timer)
+        self.assertTrue(timer.daemon)
+        # Only one timer at a time
+        Heartbeat.touch(self.job)
+        self.assertIs(Heartbeat._timer, timer)
+        timer.cancel()
+
+        # Written when the timer goes off, without another touch
+        client_time = self.ci_client.last_seen
+        with patch.object(Heartbeat.connections, 'close_all') as mock_close:
+            Heartbeat._timed_flush()
+            self.assertEqual(mock_close.call_count, 1)
+        self.assertIsNone(Heartbeat._timer)
+        self.ci_client.refresh_from_db()
+        self.assertGreater(self.ci_client.last_seen, client_time)
+
+        Heartbeat.clear()
+        self.assertIsNone(Heartbeat._timer)
+
+    def test_flush_failed(self):
+        Heartbeat.touch(self.ci_client)
+        client_time = self.ci_client.last_seen
+        with patch.object(Heartbeat, '_flush_model', side_effect=Exception("BAM!")):
+            Heartbeat.flush()
+        self.ci_client.refresh_from_db()
+        self.assertEqual(self.ci_client.last_seen, client_time)
+        # Tried again
+        Heartbeat.flush()
+        self.ci_client.refresh_from_db()
+        self.assertGreater(self.ci_client.last_seen, client_time)
+
+    @patch.object(api.GitHubAPI, 'is_collaborator')
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0)
+    def test_job_results(self, mock_is_collaborator):
+        mock_is_collaborator.return_value = False
+        repo = self.job.recipe.repository
+        repo.active = True
+        repo.save()
+        self.job.recipe.private = False
+        self.job.recipe.save()
+        an_hour_ago = self.job.last_modified - timedelta(hours=1)
+        models.Job.objects.filter(pk=self.job.pk).update(last_modified=an_hour_ago)
+        models.StepResult.objects.filter(pk=self.step_result.pk).update(last_modified=an_hour_ago)
+        url = reverse('ci:ajax:job_results')
+        data = {'last_request': int(time.time()) - 60, 'job_id': self.job.pk}
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+        # The ajax view sees that the job was touched even though it hasn't been written
+        self.step_result.save()
+        Heartbeat.touch(self.job)
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
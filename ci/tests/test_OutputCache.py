@@ -0,0 +1,75 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase, override_settings
+from django.core.cache import cache
+from ci import OutputCache
+from mock import MagicMock, patch
+
+class Tests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.render = MagicMock(side_effect=lambda text: "<%s>" % text)
+
+    def test_get_rendered(self):
+        self.assertEqual(OutputCache.get_rendered("foo", "abc", self.render), "<abc>")
+        self.assertEqual(self.render.call_count, 1)
+        # Cached
+        self.assertEqual(OutputCache.get_rendered("foo", "abc", self.render), "<abc>")
+        self.assertEqual(self.render.call_count, 1)
+
+        # Appended text, but not incremental
+        self.assertEqual(OutputCache.get_rendered("foo", "abcd", self.render), "<abcd>")
+        self.assertEqual(self.render.call_count, 2)
+        self.render.assert_called_with("abcd")
+
+        # Appended text, only render the new part
+        self.assertEqual(OutputCache.get_rendered("foo", "abcdef", self.render, incremental=True), "<abcd><ef>")
+        self.assertEqual(self.render.call_count, 3)
+        self.render.assert_called_with("ef")
+        self.assertEqual(OutputCache.get_rendered("foo", "abcdef", self.render, incremental=True), "<abcd><ef>")
+        self.assertEqual(self.render.call_count, 3)
+
+        # Same text, but the cached version isn't exact
+        self.assertEqual(OutputCache.get_rendered("foo", "abcdef", self.render), "<abcdef>")
+        self.assertEqual(self.render.call_count, 4)
+
+        # Changed text
+        self.assertEqual(OutputCache.get_rendered("foo", "xbcdefg", self.render, incremental=True), "<xbcdefg>")
+        self.assertEqual(self.render.call_count, 5)
+        self.assertEqual(OutputCache.get_rendered("foo", "xb", self.render, incremental=True), "<xb>")
+        self.assertEqual(self.render.call_count, 6)
+
+    @override_settings(RENDERED_OUTPUT_CACHE_SIZE=12)
+    def test_too_big(self):
+        OutputCache.get_rendered("foo", "abc", self.render)
+        self.assertIsNotNone(cache.get(OutputCache._entry_key("foo")))
+        OutputCache.get_rendered("big", "a"*20, self.render)
+        self.assertIsNone(cache.get(OutputCache._entry_key("big")))
+        OutputCache.get_rendered("big", "a"*20, self.render)
+        self.assertEqual(self.render.call_count, 3)
+
+    @override_settings(RENDERED_OUTPUT_CACHE_TIMEOUT=100)
+    def test_entry_timeout(self):
+        with patch.object(OutputCache, "LARGE_ENTRY_SIZE", 10):
+            self.assertEqual(OutputCache._entry_timeout(5), 100)
+            self.assertEqual(OutputCache._entry_timeout(10), 100)
+            self.assertEqual(OutputCache._entry_timeout(20), 50)
+            self.assertEqual(OutputCache._entry_timeout(100000), 1)
+
+            with patch.object(OutputCache.cache, "set") as mock_set:
+                OutputCache.get_rendered("foo", "a"*38, self.render)
+                self.assertEqual(mock_set.call_args[0][2], 25)
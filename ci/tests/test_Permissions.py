@@ -15,7 +15,8 @@
 
 from __future__ import unicode_literals, absolute_import
 from mock import patch
-from ci import models, Permissions
+from ci import models, Permissions, PermissionCache
+from ci.github.api import GitHubAPI
 from django.test import override_settings
 from . import utils
 from ci.tests import DBTester
@@ -184,6 +185,7 @@ class Tests(DBTester.DBTester):
 
         # there was an exception somewhere
         session = self.client.session
+        PermissionCache.clear_user(user)
         mock_get.side_effect = Exception("Boom!")
         ret = Permissions.job_permissions(session, job)
         self.assertFalse(ret['is_owner'])
@@ -211,12 +213,21 @@ class Tests(DBTester.DBTester):
             self.assertEqual(mock_get.call_count, 1)
             session.save()
 
-            # This time it should hit cache
-            with self.assertNumQueries(0):
+            # This time it should hit cache. The only queries are to get the signed in user.
+            with self.assertNumQueries(2):
                 allowed = Permissions.is_allowed_to_see_clients(session)
             self.assertFalse(allowed)
             self.assertEqual(mock_get.call_count, 1)
 
+            # Another session of the same user uses the same cache
+            other_session = session.__class__()
+            for key, value in session.items():
+                other_session[key] = value
+            with self.assertNumQueries(2):
+                allowed = Permissions.is_allowed_to_see_clients(other_session)
+            self.assertFalse(allowed)
+            self.assertEqual(mock_get.call_count, 1)
+
             # Clear the cache and try the success route
         with self.settings(INSTALLED_GITSERVERS=[utils.github_config(authorized_users=[user.name])]):
             utils.simulate_login(self.client.session, user)
@@ -230,7 +241,7 @@ class Tests(DBTester.DBTester):
             session.save()
 
             # Should hit cache
-            with self.assertNumQueries(0):
+            with self.assertNumQueries(2):
                 allowed = Permissions.is_allowed_to_see_clients(session)
             self.assertTrue(allowed)
             self.assertEqual(mock_get.call_count, 1)
@@ -251,7 +262,7 @@ class Tests(DBTester.DBTester):
         self.assertFalse(is_member)
         self.assertEqual(mock_get.call_count, 1)
 
-        session = self.client.session # clears the cache
+        PermissionCache.clear_user(user)
         # A member
         is_member = Permissions.is_team_member(session, api, user.name, user)
         self.assertTrue(is_member)
@@ -300,7 +311,7 @@ class Tests(DBTester.DBTester):
         self.assertEqual(mock_get.call_count, 1)
 
         # A normal user that is a collaborator
-        session = self.client.session # so we don't hit the cache
+        PermissionCache.clear_user(user)
         mock_get.return_value = utils.Response(status_code=204) # a collaborator
         mock_get.call_count = 0
         ret = Permissions.can_see_results(session, recipe)
@@ -314,7 +325,7 @@ class Tests(DBTester.DBTester):
         self.assertEqual(mock_get.call_count, 0)
 
         # Now try with teams
-        session = self.client.session # so we don't hit the cache
+        PermissionCache.clear_user(user)
         data = {"login": "some team"}
         mock_get.return_value = utils.Response([data])
         models.RecipeViewableByTeam.objects.create(team="foo", recipe=recipe)
@@ -331,7 +342,7 @@ class Tests(DBTester.DBTester):
         self.assertEqual(mock_get.call_count, 0)
 
         # A valid member of the team
-        session = self.client.session # clear the cache
+        PermissionCache.clear_user(user)
         data["login"] = "foo"
         mock_get.return_value = utils.Response([data])
         ret = Permissions.can_see_results(session, recipe)
@@ -343,3 +354,62 @@ class Tests(DBTester.DBTester):
         ret = Permissions.can_see_results(session, recipe)
         self.assertTrue(ret)
         self.assertEqual(mock_get.call_count, 0)
+
+    @patch.object(GitHubAPI, 'can_view_repo')
+    @patch.object(GitHubAPI, 'get_all_repos')
+    @patch.object(models.Repository, 'public')
+    def test_viewable_repos(self, mock_public, mock_all_repos, mock_can_view):
+        mock_public.return_value = False
+        owner = utils.create_user(name="owner")
+        repos = [utils.create_repo(name="repo%s" % i, user=owner, active=True) for i in range(3)]
+        utils.create_repo(name="inactive", user=owner, active=False)
+        mock_all_repos.return_value = [str(repos[0])]
+        mock_can_view.side_effect = lambda owner, name: name == "repo1"
+
+        # Not signed in, only public repos
+        session = self.client.session
+        self.assertEqual(Permissions.viewable_repos(session), [])
+        mock_public.return_value = True
+        # Cached in the session
+        self.assertEqual(Permissions.viewable_repos(session), [])
+        self.assertEqual(mock_public.call_count, 3)
+        session = self.client.session
+        self.assertEqual(sorted(Permissions.viewable_repos(session)), [r.id for r in repos])
+        self.assertEqual(mock_public.call_count, 6)
+        mock_public.return_value = False
+
+        user = utils.create_user(name="auth user")
+        utils.simulate_login(self.client.session, user)
+        session = self.client.session
+        self.assertEqual(sorted(Permissions.viewable_repos(session)), [repos[0].id, repos[1].id])
+        self.assertEqual(mock_all_repos.call_count, 1)
+        self.assertEqual(mock_can_view.call_count, 2)
+        self.assertTrue(Permissions.can_view_repo(session, repos[1]))
+        self.assertFalse(Permissions.can_view_repo(session, repos[2]))
+        self.assertEqual(mock_all_repos.call_count, 1)
+
+        # Another session of the same user
+        other_session = session.__class__()
+        for key, value in session.items():
+            other_session[key] = value
+        self.assertEqual(sorted(Permissions.viewable_repos(other_session)), [repos[0].id, repos[1].id])
+        self.assertEqual(mock_all_repos.call_count, 1)
+        self.assertEqual(mock_can_view.call_count, 2)
+
+        # Only repos without a cached result get checked
+        with self.settings(PERMISSION_NEGATIVE_CACHE_TIMEOUT=0):
+            PermissionCache.clear_user(user)
+            self.assertEqual(sorted(Permissions._user_viewable_repos(user, models.Repository.objects.filter(active=True))),
+                    [repos[0].id, repos[1].id])
+            self.assertEqual(mock_all_repos.call_count, 2)
+            self.assertEqual(mock_can_view.call_count, 4)
+            self.assertEqual(sorted(Permissions._user_viewable_repos(user, models.Repository.objects.filter(active=True))),
+                    [repos[0].id, repos[1].id])
+            self.assertEqual(mock_all_repos.call_count, 3)
+            self.assertEqual(mock_can_view.call_count, 5)
+            mock_can_view.assert_called_with("owner", "repo2")
+
+        # Admins can see everything
+        with patch.object(models.GitUser, 'is_admin') as mock_admin:
+            mock_admin.return_value = True
+            self.assertEqual(sorted(Permissions.viewable_repos(session)), [r.id for r in repos])
@@ -0,0 +1,87 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase, override_settings
+from ci import PubSub
+from mock import patch, MagicMock
+import threading
+import json
+
+class Tests(SimpleTestCase):
+    def test_channels(self):
+        self.assertEqual(PubSub.job_channel(1), "civet.job.1")
+        self.assertEqual(PubSub.event_channel(2), "civet.event.2")
+
+    def test_local(self):
+        backend = PubSub.LocalBackend(history=2)
+        sub = backend.subscribe(["foo", "bar"])
+        # Messages before subscribing aren't seen
+        backend.publish("foo", {"msg": 0})
+        sub2 = backend.subscribe(["foo"])
+        self.assertEqual(sub.get(0), [("foo", {"msg": 0})])
+        self.assertEqual(sub.get(0), [])
+
+        backend.publish("other", {"msg": 1})
+        backend.publish("bar", {"msg": 2})
+        self.assertEqual(sub.get(0), [("bar", {"msg": 2})])
+        self.assertEqual(sub2.get(0), [])
+        sub.close()
+
+        # Make sure a waiting subscriber gets woken up
+        t = threading.Timer(0.1, backend.publish, args=("foo", {"msg": 3}))
+        t.start()
+        self.assertEqual(sub2.get(10), [("foo", {"msg": 3})])
+        t.join()
+
+    def test_redis(self):
+        mock_redis_module = MagicMock()
+        mock_pubsub = MagicMock()
+        mock_redis_module.Redis.from_url.return_value.pubsub.return_value = mock_pubsub
+        with patch.dict("sys.modules", {"redis": mock_redis_module}):
+            backend = PubSub.RedisBackend("redis://localhost")
+        backend.publish("foo", {"msg": 1})
+        mock_redis_module.Redis.from_url.return_value.publish.assert_called_once_with("foo", json.dumps({"msg": 1}))
+
+        sub = backend.subscribe(["foo", "bar"])
+        mock_pubsub.subscribe.assert_called_once_with("foo", "bar")
+        mock_pubsub.get_message.side_effect = [{"channel": b"foo", "data": '{"msg": 1}'},
+                {"channel": "bar", "data": '{"msg": 2}'},
+                None,
+                None]
+        self.assertEqual(sub.get(1), [("foo", {"msg": 1}), ("bar", {"msg": 2})])
+        self.assertEqual(sub.get(1), [])
+        sub.close()
+        mock_pubsub.close.assert_called_once_with()
+
+    def test_get_backend(self):
+        with override_settings(PUBSUB_BACKEND="local"):
+            backend = PubSub.get_backend()
+            self.assertIsInstance(backend, PubSub.LocalBackend)
+            self.assertIs(backend, PubSub.get_backend())
+            sub = PubSub.subscribe(["foo"])
+            PubSub.publish("foo", {"msg": 1})
+            self.assertEqual(sub.get(0), [("foo", {"msg": 1})])
+
+        with override_settings(PUBSUB_BACKEND="redis", PUBSUB_REDIS_URL="redis://localhost"):
+            with patch.dict("sys.modules", {"redis": MagicMock()}):
+                backend = PubSub.get_backend()
+                self.assertIsInstance(backend, PubSub.RedisBackend)
+
+        with override_settings(PUBSUB_BACKEND="local"):
+            with patch.object(PubSub.LocalBackend, "publish") as mock_publish:
+                mock_publish.side_effect = Exception("BAM!")
+                # Shouldn't raise
+                PubSub.publish("foo", {"msg": 1})
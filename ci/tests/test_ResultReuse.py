@@ -0,0 +1,179 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import override_settings
+from django.urls import reverse
+from mock import patch
+from datetime import timedelta
+from ci import models, ResultReuse, PushEvent
+from ci.client import views as client_views
+from ci.tests import DBTester, utils
+from ci.github import api
+import os
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+class Tests(DBTester.DBTester):
+    def setUp(self):
+        super(Tests, self).setUp()
+        patcher = patch.object(api.GitHubAPI, 'tested_tree_sha', return_value=None)
+        self.mock_tree = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recipe_dir = utils.RecipeDir()
+        self.recipe = utils.create_recipe()
+        self.recipe.reuse_results = True
+        self.recipe.filename_sha = "1" * 40
+        self.recipe.save()
+        utils.create_prestepsource(filename="scripts/1.sh", recipe=self.recipe)
+        utils.create_step(filename="scripts/2.sh", recipe=self.recipe)
+        self.prior = utils.create_job(recipe=self.recipe)
+        # get_job_info() records the scripts that were sent
+        client_views.get_job_info(self.prior)
+        self.prior.refresh_from_db()
+        self.prior.seconds = timedelta(seconds=10)
+        utils.update_job(self.prior, status=models.JobStatus.SUCCESS, complete=True)
+        self.event = self.create_event("push_user", models.Event.PUSH)
+
+    def tearDown(self):
+        super(Tests, self).tearDown()
+        self.recipe_dir.__exit__(None, None, None)
+
+    def create_event(self, user_name, cause):
+        # Same SHAs as the prior job
+        ev = self.prior.event
+        user = utils.create_user_with_token(name=user_name)
+        return utils.create_event(user=user, commit1=ev.head.sha, commit2=ev.base.sha, cause=cause)
+
+    def new_job(self):
+        return utils.create_job(recipe=self.recipe, event=self.event)
+
+    def test_scripts_sha(self):
+        sha = ResultReuse.scripts_sha(["a"], ["b", "c"])
+        self.assertEqual(len(sha), 40)
+        self.assertEqual(sha, ResultReuse.scripts_sha(["a"], ["b", "c"]))
+        self.assertNotEqual(sha, ResultReuse.scripts_sha(["a", "b"], ["c"]))
+        self.assertNotEqual(sha, ResultReuse.scripts_sha([], ["a", "b", "c"]))
+        self.assertNotEqual(sha, ResultReuse.scripts_sha(["a"], ["bc"]))
+
+        self.assertEqual(self.prior.scripts_sha, ResultReuse.recipe_scripts_sha(self.recipe))
+
+    def test_find_prior_job(self):
+        job = self.new_job()
+        self.assertEqual(ResultReuse.find_prior_job(job), self.prior)
+
+        # Recipe didn't opt in
+        self.recipe.reuse_results = False
+        self.recipe.save()
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+        self.recipe.reuse_results = True
+        self.recipe.save()
+
+        # Only jobs that passed
+        utils.update_job(self.prior, status=models.JobStatus.FAILED)
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+        utils.update_job(self.prior, status=models.JobStatus.SUCCESS)
+
+        # The scripts changed
+        with open(os.path.join(self.recipe_dir.name, "scripts", "2.sh"), "w") as f:
+            f.write("changed")
+        # Only seen once the recipes are loaded again
+        self.assertEqual(ResultReuse.find_prior_job(job), self.prior)
+        recipe_repo = models.RecipeRepository.load()
+        recipe_repo.sha = "2"*40
+        recipe_repo.save()
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+
+    def test_find_prior_job_different_shas(self):
+        other_event = utils.create_event(user=self.event.build_user, commit1="other",
+                commit2=self.event.base.sha, cause=models.Event.PUSH)
+        self.assertEqual(other_event.base.sha, self.prior.event.base.sha)
+        job = utils.create_job(recipe=self.recipe, event=other_event)
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+
+        config = utils.create_build_config(name="otherConfig")
+        self.recipe.build_configs.add(config)
+        job = utils.create_job(recipe=self.recipe, event=self.event, config=config)
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+
+    def test_find_prior_job_tree(self):
+        # A push with different SHAs that tests the same tree as the prior PR
+        self.prior.event.tested_tree = "tree"
+        self.prior.event.save()
+        other_event = utils.create_event(user=self.event.build_user, commit1="merged",
+                commit2="before", cause=models.Event.PUSH)
+        job = utils.create_job(recipe=self.recipe, event=other_event)
+        self.mock_tree.return_value = "tree"
+        self.assertEqual(ResultReuse.find_prior_job(job), self.prior)
+        self.mock_tree.assert_called_once_with(other_event.base.branch.repository.user.name,
+                other_event.base.branch.repository.name, "before", "merged", None)
+        other_event.refresh_from_db()
+        self.assertEqual(other_event.tested_tree, "tree")
+
+        # Only looked up once
+        self.assertEqual(ResultReuse.find_prior_job(job), self.prior)
+        self.assertEqual(self.mock_tree.call_count, 1)
+
+        # A different tree
+        other_event.tested_tree = None
+        other_event.save()
+        job.event.tested_tree = None
+        self.mock_tree.return_value = "other tree"
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+
+        # The tree isn't known
+        job.event.tested_tree = None
+        self.mock_tree.return_value = None
+        self.assertIsNone(ResultReuse.find_prior_job(job))
+        job.event.refresh_from_db()
+        self.assertEqual(job.event.tested_tree, "")
+
+    def test_reuse_prior_result(self):
+        job = self.new_job()
+        utils.update_job(job, active=False)
+        self.assertFalse(ResultReuse.reuse_prior_result(job))
+
+        utils.update_job(job, active=True)
+        self.set_counts()
+        self.assertTrue(ResultReuse.reuse_prior_result(job))
+        self.compare_counts(num_jobs_completed=1, num_changelog=1)
+        job.refresh_from_db()
+        self.assertEqual(job.reused_from, self.prior)
+        self.assertEqual(job.status, models.JobStatus.SUCCESS)
+        self.assertEqual(job.seconds, timedelta(seconds=10))
+        self.assertFalse(job.ready)
+        self.assertFalse(job.can_be_dispatched())
+        self.assertIn(reverse('ci:view_job', args=[self.prior.pk]), job.changelog.first().message)
+
+        # Another job links to the job that actually ran
+        self.event = self.create_event("manual_user", models.Event.MANUAL)
+        job = self.new_job()
+        self.assertEqual(ResultReuse.find_prior_job(job), self.prior)
+
+        # Invalidating runs it for real
+        job = models.Job.objects.get(reused_from=self.prior)
+        job.set_invalidated("Run it")
+        job.refresh_from_db()
+        self.assertIsNone(job.reused_from)
+
+    @patch.object(api.GitHubAPI, 'update_status')
+    def test_push_event(self, mock_status):
+        self.event.jobs.all().delete()
+        push = PushEvent.PushEvent()
+        push._process_recipes(self.event, [self.recipe])
+        job = self.event.jobs.get()
+        self.assertEqual(job.reused_from, self.prior)
+        self.assertEqual(mock_status.call_count, 1)
+        self.event.refresh_from_db()
+        self.assertTrue(self.event.complete)
+        self.assertEqual(self.event.status, models.JobStatus.SUCCESS)
@@ -0,0 +1,51 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase
+from ci import ResultsArchive
+from io import BytesIO
+from mock import patch
+import tarfile
+import gzip
+
+class Tests(SimpleTestCase):
+    def test_plain_pieces(self):
+        out = "".join(ResultsArchive.plain_pieces(["a\33[1mb\33[1;3", "1mc\33", "[0m", "d\33"]))
+        self.assertEqual(out, "abcd\33")
+        # An escape that doesn't turn into a color code isn't held forever
+        out = "".join(ResultsArchive.plain_pieces(["a\33" + "x"*40, "b"]))
+        self.assertEqual(out, "a\33" + "x"*40 + "b")
+
+    def test_tar_stream(self):
+        files = [("dir/one", iter([b"a"*600, b"b"])),
+                ("dir/two", iter([])),
+                ]
+        data = b"".join(ResultsArchive.gzip_stream(ResultsArchive.tar_stream(files)))
+        raw = gzip.decompress(data)
+        self.assertEqual(len(raw) % tarfile.RECORDSIZE, 0)
+        tar = tarfile.open(fileobj=BytesIO(data), mode="r:gz")
+        self.assertEqual(tar.getnames(), ["dir/one", "dir/two"])
+        self.assertEqual(tar.extractfile("dir/one").read(), b"a"*600 + b"b")
+        self.assertEqual(tar.extractfile("dir/two").read(), b"")
+
+    def test_spooled(self):
+        # Big files go to disk and are sent in pieces
+        pieces = [b"a"*1000, b"b"*1000, b"c"]
+        with patch.object(ResultsArchive, "SPOOL_SIZE", 100), patch.object(ResultsArchive, "READ_SIZE", 300):
+            blocks = list(ResultsArchive.tar_stream([("big", iter(pieces))]))
+        self.assertEqual([len(b) for b in blocks[1:8]], [300]*6 + [201])
+        tar = tarfile.open(fileobj=BytesIO(b"".join(blocks)))
+        self.assertEqual(tar.extractfile("big").read(), b"".join(pieces))
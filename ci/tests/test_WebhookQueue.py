@@ -0,0 +1,199 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import override_settings
+from django.core import management
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseServerError
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from mock import patch
+from ci import models, WebhookQueue
+from ci.github import views as github_views
+from ci.tests import DBTester, utils
+from io import StringIO
+import json
+
+@override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
+@override_settings(WEBHOOK_QUEUE=True)
+class Tests(DBTester.DBTester):
+    def setUp(self):
+        super(Tests, self).setUp()
+        self.user = utils.get_test_user()
+        utils.create_recipe(user=self.user)
+        self.url = reverse('ci:github:webhook', args=[self.user.build_key])
+
+    def post(self, data, delivery=None):
+        headers = {}
+        if delivery:
+            headers["HTTP_X_GITHUB_DELIVERY"] = delivery
+        return self.client.post(self.url, json.dumps(data), content_type='application/json', **headers)
+
+    def create_delivery(self, delivery, repo):
+        data = {"repository": {"full_name": repo}, "delivery": delivery}
+        return models.WebhookDelivery.objects.create(build_user=self.user,
+                delivery_id=delivery,
+                payload=json.dumps(data),
+                repo_key=repo)
+
+    def test_queue_delivery(self):
+        data = {"commits": [], "repository": {"full_name": "owner/repo"}}
+        self.set_counts()
+        with patch.object(github_views, 'process_push') as mock_push:
+            response = self.post(data, "id0")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mock_push.call_count, 0)
+        self.compare_counts()
+        delivery = models.WebhookDelivery.objects.get()
+        self.assertEqual(delivery.delivery_id, "id0")
+        self.assertEqual(delivery.repo_key, "owner/repo")
+        self.assertEqual(json.loads(delivery.payload), data)
+        self.assertFalse(delivery.processed)
+
+        # Redelivered
+        response = self.post(data, "id0")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.WebhookDelivery.objects.count(), 1)
+
+        # No delivery ID, use the payload
+        data["other"] = 1
+        self.post(data)
+        self.post(data)
+        self.assertEqual(models.WebhookDelivery.objects.count(), 2)
+
+        # Still checks the build key
+        url = reverse('ci:github:webhook', args=[10000])
+        response = self.client.post(url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.WebhookDelivery.objects.count(), 2)
+
+    def test_repo_key(self):
+        self.assertEqual(WebhookQueue.repo_key({"repository": {"full_name": "owner/repo"}}), "owner/repo")
+        self.assertEqual(WebhookQueue.repo_key({"project": {"path_with_namespace": "owner/repo"}}), "owner/repo")
+        self.assertEqual(WebhookQueue.repo_key({"zen": "ping"}), "")
+
+    def test_claim_next(self):
+        d0 = self.create_delivery("0", "repo0")
+        d1 = self.create_delivery("1", "repo0")
+        d2 = self.create_delivery("2", "repo1")
+        self.assertEqual(WebhookQueue.claim_next(), d0)
+        # repo0 is busy
+        self.assertEqual(WebhookQueue.claim_next(), d2)
+        self.assertIsNone(WebhookQueue.claim_next())
+
+        models.WebhookDelivery.objects.filter(pk=d0.pk).update(processed=True)
+        self.assertEqual(WebhookQueue.claim_next(), d1)
+        self.assertIsNone(WebhookQueue.claim_next())
+
+        # The worker processing d2 died
+        stale = timezone.now() - timedelta(seconds=WebhookQueue.CLAIM_TIMEOUT+1)
+        models.WebhookDelivery.objects.filter(pk=d2.pk).update(claimed=stale)
+        self.assertEqual(WebhookQueue.claim_next(), d2)
+
+    def test_process(self):
+        d0 = self.create_delivery("0", "repo0")
+        d1 = self.create_delivery("1", "repo0")
+        d2 = self.create_delivery("2", "repo0")
+        with patch.object(github_views, 'process_event') as mock_process:
+            mock_process.side_effect = [HttpResponse('OK'), HttpResponseServerError('Bad')]
+            self.assertTrue(WebhookQueue.process_next())
+            self.assertEqual(mock_process.call_count, 1)
+            self.assertEqual(mock_process.call_args[0][0], self.user)
+            self.assertEqual(mock_process.call_args[0][1]["delivery"], "0")
+            self.assertTrue(WebhookQueue.process_next())
+            self.assertEqual(mock_process.call_args[0][1]["delivery"], "1")
+            # d1 failed and holds up d2 until it is tried again
+            self.assertFalse(WebhookQueue.process_next())
+        d0.refresh_from_db()
+        self.assertTrue(d0.processed)
+        self.assertEqual(d0.error, "")
+        d1.refresh_from_db()
+        self.assertFalse(d1.processed)
+        self.assertEqual(d1.error, "Bad")
+        self.assertEqual(d1.attempts, 1)
+        self.assertIsNone(d1.claimed)
+        self.assertGreater(d1.next_attempt, timezone.now() + timedelta(seconds=WebhookQueue.RETRY_BACKOFF-5))
+
+        # Tried again
+        models.WebhookDelivery.objects.filter(pk=d1.pk).update(next_attempt=timezone.now())
+        with patch.object(github_views, 'process_event') as mock_process:
+            mock_process.side_effect = [Exception("BAM!"), HttpResponse('OK')]
+            self.assertTrue(WebhookQueue.process_next())
+            d1.refresh_from_db()
+            self.assertEqual(d1.attempts, 2)
+            self.assertIn("BAM!", d1.error)
+
+            # Give up after too many attempts
+            models.WebhookDelivery.objects.filter(pk=d1.pk).update(next_attempt=timezone.now(),
+                    attempts=WebhookQueue.MAX_ATTEMPTS-1)
+            mock_process.side_effect = [HttpResponseServerError('Bad'), HttpResponse('OK')]
+            self.assertTrue(WebhookQueue.process_next())
+            d1.refresh_from_db()
+            self.assertTrue(d1.processed)
+            self.assertEqual(d1.error, "Bad")
+            self.assertTrue(WebhookQueue.process_next())
+            self.assertEqual(mock_process.call_args[0][1]["delivery"], "2")
+
+        # A bad request won't get better by trying again
+        d3 = self.create_delivery("3", "repo0")
+        d4 = self.create_delivery("4", "repo0")
+        with patch.object(github_views, 'process_event') as mock_process:
+            mock_process.side_effect = [HttpResponseBadRequest('Unknown'), HttpResponse('OK')]
+            self.assertTrue(WebhookQueue.process_next())
+            d3.refresh_from_db()
+            self.assertTrue(d3.processed)
+            self.assertEqual(d3.error, "Unknown")
+            self.assertEqual(d3.attempts, 0)
+            # So it doesn't hold up the next one
+            self.assertTrue(WebhookQueue.process_next())
+            self.assertEqual(mock_process.call_args[0][1]["delivery"], "4")
+
+        # Old ones get removed
+        models.WebhookDelivery.objects.filter(pk=d0.pk).update(
+                last_modified=timezone.now() - WebhookQueue.KEEP_PROCESSED - timedelta(days=1))
+        WebhookQueue.cleanup()
+        self.assertEqual(list(models.WebhookDelivery.objects.all()), [d1, d2, d3, d4])
+
+    def test_extend_claim(self):
+        self.create_delivery("0", "repo0")
+        delivery = WebhookQueue.claim_next()
+        stale = timezone.now() - timedelta(seconds=WebhookQueue.CLAIM_TIMEOUT+1)
+        models.WebhookDelivery.objects.filter(pk=delivery.pk).update(claimed=stale)
+        self.assertTrue(WebhookQueue.extend_claim(delivery))
+        # Still being processed, so no one else can take it
+        self.assertIsNone(WebhookQueue.claim_next())
+
+        # Another worker took it after the claim went stale
+        models.WebhookDelivery.objects.filter(pk=delivery.pk).update(claimed=stale)
+        other = WebhookQueue.claim_next()
+        self.assertEqual(other, delivery)
+        self.assertNotEqual(other.claim_id, delivery.claim_id)
+        self.assertFalse(WebhookQueue.extend_claim(delivery))
+        self.assertTrue(WebhookQueue.extend_claim(other))
+
+    def test_command(self):
+        # A ping
+        response = self.post({"zen": "Hello", "hook_id": 1}, "ping")
+        self.assertEqual(response.status_code, 200)
+        self.create_delivery("0", "repo0")
+        out = StringIO()
+        management.call_command("process_webhooks", "--once", stdout=out)
+        self.assertEqual(models.WebhookDelivery.objects.get(delivery_id="ping").error, "")
+        self.assertTrue(models.WebhookDelivery.objects.get(delivery_id="ping").processed)
+        # Not something we handle, so it isn't tried again
+        delivery = models.WebhookDelivery.objects.get(delivery_id="0")
+        self.assertTrue(delivery.processed)
+        self.assertIn("Unknown post", delivery.error)
+        self.assertEqual(delivery.attempts, 0)
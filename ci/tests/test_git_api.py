@@ -15,11 +15,32 @@
 
 from __future__ import unicode_literals, absolute_import
 from django.test import override_settings
+from django.core.cache import cache
 from ci.git_api import GitAPI
+from ci import git_api
+from ci import GitResponseCache
 from ci.tests import utils
 from mock import patch
 from ci.tests import DBTester
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
 import requests
+import json
+
+def http_response(status_code, data=None, headers={}):
+    """
+    A real requests.Response, since the cache needs the headers and content
+    """
+    response = Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = b""
+    if data is not None:
+        response._content = json.dumps(data).encode("utf-8")
+    response.encoding = "utf-8"
+    response.url = "url"
+    response.request = utils.RequestInResponse()
+    return response
 
 @override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
 class Tests(DBTester.DBTester):
@@ -88,3 +109,112 @@ class Tests(DBTester.DBTester):
         mock_get.side_effect = [response3, response4]
         data = self.api.get_all_pages("url")
         self.assertEqual(data, data3)
+
+    @patch.object(requests, 'get')
+    def test_get_cached(self, mock_get):
+        cache.clear()
+        headers = {"ETag": '"abc"', "Link": '<next_url>; rel="next"'}
+        mock_get.return_value = http_response(200, ["foo"], headers)
+        response = self.api.get("url", params={"p": 1})
+        self.assertEqual(response.json(), ["foo"])
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+        self.assertEqual(GitResponseCache.stats(), {"hits": 0, "misses": 1})
+
+        # Not modified, use the cached version
+        mock_get.return_value = http_response(304, headers={"X-RateLimit-Remaining": "10"})
+        response = self.api.get("url", params={"p": 1})
+        self.assertEqual(mock_get.call_args[1]["headers"]["If-None-Match"], '"abc"')
+        self.assertNotIn("If-None-Match", self.api._headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), ["foo"])
+        self.assertEqual(response.links["next"]["url"], "next_url")
+        self.assertEqual(response.headers["X-RateLimit-Remaining"], "10")
+        self.assertIs(self.api._bad_response, False)
+        self.assertEqual(GitResponseCache.stats(), {"hits": 1, "misses": 1})
+
+        # Different params and different users don't share entries
+        self.api.get("url", params={"p": 2})
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+        token_api = self.server.api(token="1234")
+        token_api.get("url", params={"p": 1})
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+
+        # Changed
+        mock_get.return_value = http_response(200, ["bar"], {"Last-Modified": "yesterday"})
+        response = self.api.get("url", params={"p": 1})
+        self.assertEqual(response.json(), ["bar"])
+        mock_get.return_value = http_response(304)
+        response = self.api.get("url", params={"p": 1})
+        self.assertEqual(mock_get.call_args[1]["headers"]["If-Modified-Since"], "yesterday")
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+        self.assertEqual(response.json(), ["bar"])
+
+        # Bad responses and responses without validators aren't cached
+        GitResponseCache.reset_stats()
+        mock_get.return_value = http_response(200, ["baz"])
+        self.api.get("other_url")
+        mock_get.return_value = http_response(404, {"message": "Not found"}, {"ETag": '"abc"'})
+        self.api.get("bad_url")
+        self.assertIs(self.api._bad_response, True)
+        self.api.get("other_url")
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+        self.api.get("bad_url")
+        self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+        self.assertEqual(GitResponseCache.stats(), {"hits": 0, "misses": 4})
+
+        with self.settings(GIT_API_CACHE_TIMEOUT=0):
+            mock_get.return_value = http_response(200, ["foo"], headers)
+            self.api.get("url", params={"p": 1})
+            self.assertNotIn("If-None-Match", mock_get.call_args[1]["headers"])
+            self.assertEqual(GitResponseCache.stats(), {"hits": 0, "misses": 4})
+
+    @patch.object(requests, 'get')
+    def test_get_all_pages_cached(self, mock_get):
+        cache.clear()
+        page0 = http_response(200, ["foo"], {"ETag": '"0"', "Link": '<next_url>; rel="next"'})
+        page1 = http_response(200, ["bar"], {"ETag": '"1"'})
+        mock_get.side_effect = [page0, page1]
+        self.assertEqual(self.api.get_all_pages("url"), ["foo", "bar"])
+
+        mock_get.side_effect = [http_response(304), http_response(304)]
+        self.assertEqual(self.api.get_all_pages("url"), ["foo", "bar"])
+        self.assertEqual(mock_get.call_args_list[2][1]["headers"]["If-None-Match"], '"0"')
+        self.assertEqual(mock_get.call_args_list[3][1]["headers"]["If-None-Match"], '"1"')
+        self.assertEqual(GitResponseCache.stats(), {"hits": 2, "misses": 2})
+
+    @patch.object(requests, 'get')
+    def test_get_all_pages_concurrent(self, mock_get):
+        def link(page):
+            return "http://server/items?per_page=50&page=%s" % page
+        links = '<%s>; rel="next", <%s>; rel="last"' % (link(2), link(4))
+        pages = {"url": http_response(200, ["p1"], {"Link": links})}
+        for page in range(2, 5):
+            pages[link(page)] = http_response(200, ["p%s" % page])
+        mock_get.side_effect = lambda url, **kwargs: pages[url]
+
+        with patch.object(git_api.connections, "close_all") as mock_close:
+            self.assertEqual(self.api.get_all_pages("url"), ["p1", "p2", "p3", "p4"])
+            # Each thread closes its database connections
+            self.assertEqual(mock_close.call_count, 3)
+        self.assertEqual(mock_get.call_count, 4)
+        self.assertEqual(self.api.errors(), [])
+
+        # A bad page stops it and is a bad response, like getting them one at a time does
+        pages[link(3)] = http_response(500, {"message": "error"})
+        self.assertEqual(self.api.get_all_pages("url"), ["p1", "p2"])
+        self.assertIs(self.api._bad_response, True)
+        self.assertEqual(len(self.api.errors()), 1)
+
+        # Without a last link they are gotten one at a time
+        pages[link(3)] = http_response(200, ["p3"])
+        self.assertEqual(self.api._page_urls({"next": {"url": link(2)}}), None)
+        self.assertEqual(self.api._page_urls({"next": {"url": "next_url"}, "last": {"url": "last_url"}}), None)
+        self.assertEqual(self.api._page_urls({"next": {"url": link(2)}, "last": {"url": link(4)}}),
+                [link(2), link(3), link(4)])
+        self.api._page_workers = 1
+        mock_get.reset_mock()
+        self.assertEqual(self.api._page_urls({"next": {"url": link(2)}, "last": {"url": link(4)}}), None)
+        pages["url"] = http_response(200, ["p1"], {"Link": '<%s>; rel="next"' % link(2)})
+        pages[link(2)] = http_response(200, ["p2"], {"Link": '<%s>; rel="next"' % link(3)})
+        self.assertEqual(self.api.get_all_pages("url"), ["p1", "p2", "p3"])
+        self.assertEqual(mock_get.call_count, 3)
@@ -17,7 +17,9 @@ from __future__ import unicode_literals, absolute_import
 from django.test import TestCase
 from django.conf import settings
 from django.test import override_settings
-from ci import models
+from ci import models, EventsStatus
+from django.core.cache import cache
+from mock import patch
 from . import utils
 import math
 
@@ -174,6 +176,61 @@ class Tests(TestCase):
         self.assertEqual(len(unrunnable), 1)
         self.assertIn(j2, unrunnable)
 
+    def test_job_graph(self):
+        event = utils.create_event()
+        # r0 -> r1 -> r3
+        #    -> r2
+        # r4 <-> r5 is a cycle
+        recipes = [utils.create_recipe(name='r%s' % i) for i in range(6)]
+        recipes[1].depends_on.add(recipes[0])
+        recipes[2].depends_on.add(recipes[0])
+        recipes[3].depends_on.add(recipes[1])
+        recipes[4].depends_on.add(recipes[5])
+        recipes[5].depends_on.add(recipes[4])
+        jobs = [utils.create_job(recipe=r, event=event) for r in recipes]
+        for j in jobs:
+            j.active = True
+            j.save()
+
+        event = models.Event.objects.get(pk=event.pk)
+        # One query for the jobs, one for the dependencies
+        with self.assertNumQueries(2):
+            graph = event.job_graph()
+        self.assertIs(graph, event.job_graph())
+        self.assertEqual(graph.depends_on[jobs[3]], [jobs[1]])
+        layers = [set(layer) for layer in graph.layers()]
+        self.assertEqual(layers, [{jobs[0]}, {jobs[1], jobs[2]}, {jobs[3]}, {jobs[4], jobs[5]}])
+        self.assertEqual(graph.ready(), [jobs[0]])
+        self.assertEqual(set(graph.blocked()), set(jobs[1:]))
+        self.assertEqual(graph.unrunnable(), set())
+        self.assertFalse(graph.done())
+
+        # Saving a job rebuilds the graph
+        jobs[0].complete = True
+        jobs[0].status = models.JobStatus.FAILED
+        jobs[0].save()
+        graph = event.job_graph()
+        self.assertEqual(graph.unrunnable(), set(jobs[1:4]))
+        self.assertEqual(set(event.get_unrunnable_jobs()), set(jobs[1:4]))
+        self.assertEqual(graph.ready(), [])
+        self.assertEqual(set(graph.blocked()), set(jobs[4:]))
+
+        jobs[0].status = models.JobStatus.SUCCESS
+        jobs[0].save()
+        graph = event.job_graph()
+        self.assertEqual(set(graph.ready()), set(jobs[1:3]))
+        event.make_jobs_ready()
+        for j in jobs[1:3]:
+            j.refresh_from_db()
+            self.assertTrue(j.ready)
+        jobs[3].refresh_from_db()
+        self.assertFalse(jobs[3].ready)
+
+        # Uses the prefetched jobs
+        event = EventsStatus.get_default_events_query().get(pk=event.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(event.job_graph().jobs), len(jobs))
+
     def test_event(self):
         event = utils.create_event()
         self.assertTrue(isinstance(event, models.Event))
@@ -468,6 +525,89 @@ class Tests(TestCase):
         sr.save()
         self.assertTrue(sr.clean_output().startswith("Output too large"))
 
+    def test_stepresult_clean_output_cache(self):
+        cache.clear()
+        sr = utils.create_step_result()
+        sr.output = "foo\n"
+        sr.save()
+        with patch.object(models, 'terminalize_output', wraps=models.terminalize_output) as mock_term:
+            self.assertEqual(sr.clean_output(), "foo<br/>")
+            self.assertEqual(sr.clean_output(), "foo<br/>")
+            self.assertEqual(mock_term.call_count, 1)
+            # Running step, only render the new output
+            sr.append_output("\33[30mbar\33[0m")
+            self.assertEqual(sr.clean_output(), 'foo<br/><span class="ansi30">bar</span>')
+            self.assertEqual(mock_term.call_count, 2)
+            mock_term.assert_called_with("\33[30mbar\33[0m")
+            # When complete, render it all once
+            sr.complete = True
+            sr.save()
+            self.assertEqual(sr.clean_output(), 'foo<br/><span class="ansi30">bar</span>')
+            self.assertEqual(sr.clean_output(), 'foo<br/><span class="ansi30">bar</span>')
+            self.assertEqual(mock_term.call_count, 3)
+            mock_term.assert_called_with('foo\n\33[30mbar\33[0m')
+
+    def test_stepresult_chunks(self):
+        sr = utils.create_step_result()
+        sr.output = "start\n"
+        sr.save()
+        sr.append_output("foo\n")
+        sr.append_output("")
+        sr.append_output("bar\n")
+        self.assertEqual(sr.chunks.count(), 2)
+        self.assertEqual(sr.output, "start\nfoo\nbar\n")
+        self.assertEqual(sr.output_length(), len("start\nfoo\nbar\n"))
+
+        sr = models.StepResult.objects.get(pk=sr.pk)
+        self.assertEqual(sr.output_length(), len("start\nfoo\nbar\n"))
+        self.assertEqual(sr.output, "start\nfoo\nbar\n")
+        self.assertEqual(sr.plain_output(), "start\nfoo\nbar\n")
+        self.assertEqual(sr.clean_output(), "start<br/>foo<br/>bar<br/>")
+
+        sr.append_output("baz")
+        sr.refresh_from_db()
+        self.assertEqual(sr.output, "start\nfoo\nbar\nbaz")
+        self.assertEqual(sr.chunks.last().seq, 2)
+
+        # Setting the output replaces everything
+        sr.output = "new"
+        self.assertEqual(sr.output, "new")
+        sr.save()
+        self.assertEqual(sr.chunks.count(), 0)
+        sr.refresh_from_db()
+        self.assertEqual(sr.output, "new")
+
+        sr.append_output("more")
+        chunk = sr.chunks.first()
+        self.assertIn(sr.name, str(chunk))
+        self.assertEqual(sr.output_since(None), ("newmore", 7, False))
+        self.assertEqual(sr.output_since(0), ("newmore", 7, False))
+        self.assertEqual(sr.output_since(3), ("more", 7, True))
+        self.assertEqual(sr.output_since(5), ("newmore", 7, False))
+        self.assertEqual(sr.output_since(7), ("", 7, True))
+        self.assertEqual(sr.output_since(8), ("newmore", 7, False))
+        self.assertEqual(sr.clean_output_since(3), ("more", 7, True))
+        job = models.Job.objects.prefetch_related("step_results__chunks").get(pk=sr.job.pk)
+        result = job.step_results.first()
+        self.assertEqual(result.output_length(), 7)
+        self.assertEqual(result.output, "newmore")
+
+    def test_stepresult_output_pieces(self):
+        sr = utils.create_step_result()
+        sr.output = "0123456789"
+        sr.save()
+        sr.append_output("ab")
+        sr.append_output("cd")
+        self.assertEqual(list(sr.output_pieces()), ["0123456789abcd"])
+
+        sr = models.StepResult.objects.get(pk=sr.pk)
+        self.assertEqual(list(sr.output_pieces()), ["0123456789", "ab", "cd"])
+
+        # The stored output is read a piece at a time if it wasn't loaded
+        sr = models.StepResult.objects.defer("stored_output").get(pk=sr.pk)
+        self.assertEqual(list(sr.output_pieces(piece_size=4)), ["0123", "4567", "89", "ab", "cd"])
+        self.assertIn("stored_output", sr.get_deferred_fields())
+
     def test_generate_build_key(self):
         build_key = models.generate_build_key()
         self.assertNotEqual('', build_key)
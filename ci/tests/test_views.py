@@ -21,6 +21,8 @@ from ci import models, views, Permissions, PullRequestEvent, GitCommitData
 from ci.tests import utils, DBTester
 from ci.github import api
 import datetime
+import tarfile
+from io import BytesIO
 from requests_oauthlib import OAuth2Session
 
 @override_settings(INSTALLED_GITSERVERS=[utils.github_config()])
@@ -1162,9 +1164,68 @@ class Tests(DBTester.DBTester):
         utils.simulate_login(self.client.session, user)
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
+        tar = tarfile.open(fileobj=BytesIO(b"".join(response.streaming_content)), mode='r:gz')
+        members = tar.getmembers()
+        self.assertEqual(len(members), 1)
+        self.assertEqual(tar.extractfile(members[0]).read(), b"some output")
+
+        # output in chunks with color codes
+        sr.append_output("\33[1;31mred\33[0m\n")
+        response = self.client.get(url)
+        tar = tarfile.open(fileobj=BytesIO(b"".join(response.streaming_content)), mode='r:gz')
+        self.assertEqual(tar.extractfile(tar.getmembers()[0]).read(), b"some outputred\n")
 
         self.check_private_repo(url)
 
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0)
+    def test_get_event_results(self):
+        # bad pk
+        url = reverse('ci:event_results', args=[1000])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+        user = utils.get_test_user()
+        job = utils.create_job(user=user)
+        job.recipe.private = True
+        job.recipe.save()
+        sr = utils.create_step_result(job=job)
+        sr.output = "job 1"
+        sr.save()
+        recipe = utils.create_recipe(name="other recipe", user=user, repo=job.recipe.repository)
+        recipe.private = False
+        recipe.save()
+        job2 = utils.create_job(recipe=recipe, event=job.event, user=user)
+        sr2 = utils.create_step_result(job=job2)
+        sr2.append_output("job 2")
+
+        repo = job.recipe.repository
+        repo.active = True
+        repo.save()
+
+        url = reverse('ci:event_results', args=[job.event.pk])
+        # Not logged in, can only see the public job
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tar = tarfile.open(fileobj=BytesIO(b"".join(response.streaming_content)), mode='r:gz')
+        members = tar.getmembers()
+        self.assertEqual(len(members), 1)
+        self.assertEqual(tar.extractfile(members[0]).read(), b"job 2")
+
+        # Logged in as the owner, get both
+        utils.simulate_login(self.client.session, user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tar = tarfile.open(fileobj=BytesIO(b"".join(response.streaming_content)), mode='r:gz')
+        contents = sorted([tar.extractfile(m).read() for m in tar.getmembers()])
+        self.assertEqual(contents, [b"job 1", b"job 2"])
+
+        # No jobs that can be seen
+        self.client.logout()
+        recipe.private = True
+        recipe.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
     def test_mooseframework(self):
         # no moose repo
         response = self.client.get(reverse('ci:mooseframework'))
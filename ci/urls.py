@@ -33,6 +33,7 @@ urlpatterns = [
     re_path(r'^pr/(?P<pr_id>[0-9]+)/$', views.view_pr, name='view_pr'),
     re_path(r'^job/(?P<job_id>[0-9]+)/$', views.view_job, name='view_job'),
     re_path(r'^job_results/(?P<job_id>[0-9]+)/$', views.get_job_results, name='job_results'),
+    re_path(r'^event_results/(?P<event_id>[0-9]+)/$', views.get_event_results, name='event_results'),
     re_path(r'^view_client/(?P<client_id>[0-9]+)/$', views.view_client, name='view_client'),
     re_path(r'^recipe_events/(?P<recipe_id>[0-9]+)/$', views.recipe_events, name='recipe_events'),
     re_path(r'^recipe_crons/(?P<recipe_id>[0-9]+)/$', views.recipe_crons, name='recipe_crons'),
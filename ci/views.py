@@ -17,6 +17,7 @@ from __future__ import unicode_literals, absolute_import
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseForbidden, Http404
+from django.http import StreamingHttpResponse
 from django.urls import reverse
 from django.core.exceptions import PermissionDenied
 from django.conf import settings
@@ -25,12 +26,10 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
 from django.db.models import Prefetch
 from datetime import timedelta
-import time
-import tarfile
-from io import BytesIO
 from ci import RepositoryStatus, EventsStatus, Permissions, PullRequestEvent, ManualEvent, TimeUtils
+from ci import ResultsArchive, Heartbeat
 from django.utils.html import escape
-from django.utils.text import get_valid_filename
+from django.utils import timezone
 from django.views.decorators.cache import never_cache
 from ci.client import UpdateRemoteStatus
 import os, re
@@ -128,6 +127,7 @@ def main(request):
           'last_request': TimeUtils.get_local_timestamp(),
           'event_limit': limit,
           'update_interval': settings.HOME_PAGE_UPDATE_INTERVAL,
+          'stream_updates': settings.STREAM_UPDATES,
           'default_view': default,
         })
 
@@ -305,15 +305,30 @@ def view_event(request, event_id):
         'events': evs_info,
         'allowed_to_cancel': allowed,
         "update_interval": settings.EVENT_PAGE_UPDATE_INTERVAL,
+        "stream_updates": settings.STREAM_UPDATES,
         "has_unactivated": has_unactivated,
         }
     return render(request, 'ci/event.html', context)
 
+def archive_response(generator, base_name):
+    """
+    Stream a .tar.gz archive to the user.
+    Input:
+      generator: Generates the contents of the archive
+      base_name[str]: Name of the archive without the extension
+    Return:
+      StreamingHttpResponse
+    """
+    response = StreamingHttpResponse(generator, content_type='application/x-gzip')
+    response['Content-Disposition'] = 'attachment; filename="{}.tar.gz"'.format(base_name)
+    return response
+
 def get_job_results(request, job_id):
     """
     Just download all the output of the job into a tarball.
+    The tarball is streamed so that large output doesn't need to be in memory.
     """
-    q = models.Job.objects.select_related('recipe__repository').prefetch_related('step_results')
+    q = models.Job.objects.select_related('recipe__repository')
     job = get_object_or_404(q, pk=job_id)
 
     unauthorized = render_unauthorized_repo(request, job.recipe.repository)
@@ -324,19 +339,28 @@ def get_job_results(request, job_id):
     if not perms['can_see_results']:
         return HttpResponseForbidden('Not allowed to see results')
 
-    response = HttpResponse(content_type='application/x-gzip')
-    base_name = 'results_{}_{}'.format(job.pk, get_valid_filename(job.recipe.name))
-    response['Content-Disposition'] = 'attachment; filename="{}.tar.gz"'.format(base_name)
-    tar = tarfile.open(fileobj=response, mode='w:gz')
-    for result in job.step_results.all():
-        info = tarfile.TarInfo(name='{}/{:02}_{}'.format(base_name, result.position, get_valid_filename(result.name)))
-        s = BytesIO(result.plain_output().replace('\u2018', "'").replace("\u2019", "'").encode("utf-8", "replace"))
-        buf = s.getvalue()
-        info.size = len(buf)
-        info.mtime = time.time()
-        tar.addfile(tarinfo=info, fileobj=s)
-    tar.close()
-    return response
+    return archive_response(ResultsArchive.job_archive(job), ResultsArchive.job_base_name(job))
+
+def get_event_results(request, event_id):
+    """
+    Download the output of all the jobs of an event into a tarball.
+    Only jobs that the user can see the results of are included.
+    """
+    ev = get_object_or_404(models.Event.objects.select_related('base__branch__repository'), pk=event_id)
+
+    unauthorized = render_unauthorized_repo(request, ev.base.repo())
+    if unauthorized is not None:
+        return unauthorized
+
+    q = (ev.jobs
+            .select_related('recipe__repository', 'recipe__build_user__server', 'config', 'event__base__branch__repository__user__server')
+            .prefetch_related('recipe__build_configs')
+            .order_by('-recipe__priority', 'recipe__display_name', 'pk'))
+    jobs = [job for job in q if Permissions.job_permissions(request.session, job)['can_see_results']]
+    if not jobs:
+        return HttpResponseForbidden('Not allowed to see results')
+
+    return archive_response(ResultsArchive.event_archive(ev, jobs), ResultsArchive.event_base_name(ev))
 
 def view_job(request, job_id):
     """
@@ -353,7 +377,7 @@ def view_job(request, job_id):
                 'config',
                 'client',)
             .prefetch_related(Prefetch("recipe", queryset=recipe_q),
-                'step_results',
+                'step_results__chunks',
                 'changelog'))
     job = get_object_or_404(q, pk=job_id)
 
@@ -368,6 +392,7 @@ def view_job(request, job_id):
     perms['job'] = job
     perms['clients'] = clients
     perms['update_interval'] = settings.JOB_PAGE_UPDATE_INTERVAL
+    perms['stream_updates'] = settings.STREAM_UPDATES
     return render(request, 'ci/job.html', perms)
 
 def get_paginated(request, obj_list, obj_per_page=30):
@@ -607,18 +632,22 @@ def clients_info():
     sclients = sorted_clients(models.Client.objects.exclude(status=models.Client.DOWN))
     active_clients = [] # clients that we've seen in <= 60 s
     inactive_clients = [] # clients that we've seen in > 60 s
-    for c in sclients:
+    now = timezone.now()
+    # The clients could have been seen more recently than what is in the DB
+    seen = Heartbeat.last_modified_many(sclients)
+    for c, last_seen in zip(sclients, seen):
+        unseen_seconds = (now - last_seen).total_seconds()
         d = {'pk': c.pk,
             "ip": c.ip,
             "name": c.name,
             "message": c.status_message,
             "status": c.status_str(),
-            "lastseen": TimeUtils.human_time_str(c.last_seen),
+            "lastseen": TimeUtils.human_time_str(last_seen),
             }
-        if c.unseen_seconds() > 2*7*24*60*60: # 2 weeks
+        if unseen_seconds > 2*7*24*60*60: # 2 weeks
             # do it like this so that last_seen doesn't get updated
             models.Client.objects.filter(pk=c.pk).update(status=models.Client.DOWN)
-        elif c.unseen_seconds() > 160:
+        elif unseen_seconds > 160:
             d["status_class"] = "client_NotSeen"
             inactive_clients.append(d)
         else:
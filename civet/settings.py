@@ -249,7 +249,18 @@ GITSERVER_BITBUCKET = 2
 # (member of a team, repo visibility, etc), we cache the results
 # for this amount of time. Once this has expired then we
 # recheck.
+# The results are shared by all the sessions of a user.
 PERMISSION_CACHE_TIMEOUT = 60*60
+# Negative results (not a member of a team, etc) are cached
+# for this amount of time, if it is less than PERMISSION_CACHE_TIMEOUT.
+PERMISSION_NEGATIVE_CACHE_TIMEOUT = 10*60
+
+# GET responses from the Git servers are cached for this amount of
+# time (in seconds). Requests for a cached URL are sent with the
+# ETag/Last-Modified of the cached response and the cached response
+# is used if the Git server says it hasn't changed.
+# 0 means to not cache the responses.
+GIT_API_CACHE_TIMEOUT = 24*60*60
 
 # The absolute url for the server. This is used
 # in places where we need to send links to outside
@@ -263,10 +274,80 @@ HOME_PAGE_UPDATE_INTERVAL = 20000
 JOB_PAGE_UPDATE_INTERVAL = 20000
 EVENT_PAGE_UPDATE_INTERVAL = 20000
 
-# Internal (in milliseconds) at which to rebuild the cache for available jobs
-# 0 means to always update
+# If True, the job, event and main pages get pushed updates through
+# Server-Sent Events instead of polling on the intervals above.
+# Each open page holds a connection for up to STREAM_TIMEOUT seconds
+# before reconnecting, so the server needs to be able to handle that
+# many concurrent connections.
+STREAM_UPDATES = False
+STREAM_TIMEOUT = 60
+# How the client endpoints pass updates to the streams.
+# "local" only works if the server runs in a single process.
+# "redis" requires the redis package and works across processes.
+PUBSUB_BACKEND = "local"
+PUBSUB_REDIS_URL = "redis://localhost:6379/0"
+
+# The HTML rendered from the output of steps is cached.
+# This is the max size (in characters) of the HTML rendered for one step
+# that is cached and how long (in seconds) each entry is kept.
+# Entries over 1MB are kept for proportionally less time.
+RENDERED_OUTPUT_CACHE_SIZE = 20*1024*1024
+RENDERED_OUTPUT_CACHE_TIMEOUT = 24*60*60
+
+# Interval (in milliseconds) at which to rebuild the queue of ready jobs from scratch.
+# The queue is updated as jobs change so this is just to pick up anything that
+# was missed, like a changed branch setting. It is also built the first time it is needed.
+# 0 means to never rebuild it
 GET_JOB_UPDATE_INTERVAL = 0
 
+# The order in which ready jobs with the same recipe priority are handed out to the clients.
+# "fifo": In the order they were created
+# "shortest_first": Jobs that are expected to be short go first. The expected
+#   runtime is the rolling average of previous jobs of the same recipe file and
+#   build config. A job is held back by its expected runtime times
+#   DISPATCH_SHORTEST_FIRST_WEIGHT, but never more than DISPATCH_MAX_DELAY
+#   seconds, so long jobs still get handed out.
+# "./manage.py simulate_dispatch" shows how the policies compare on past jobs.
+DISPATCH_POLICY = "fifo"
+DISPATCH_SHORTEST_FIRST_WEIGHT = 1.0
+DISPATCH_MAX_DELAY = 2*60*60
+
+# Max number of seconds that a client can ask get_job to wait for a job
+# to become ready before returning with no job (long polling).
+# Each waiting client holds a connection open this long, so the server needs
+# to be able to handle that many concurrent connections. Keep this well
+# under 160 seconds so that waiting clients don't show up as not seen.
+# With more than one server process PUBSUB_BACKEND needs to be "redis" so that
+# the waiting clients are woken up.
+# 0 means clients never wait
+GET_JOB_MAX_WAIT = 0
+
+# Clients gzip large updates. This is the max size (in bytes) that
+# a request body is allowed to decompress to. Anything bigger gets a 413
+# response, which tells the client to stop the job.
+CLIENT_MAX_DECOMPRESSED_SIZE = 50*1024*1024
+
+# While running jobs, the clients cause a lot of updates to when
+# clients were last seen and when jobs and events were last modified.
+# These are written to the database in batches at this interval (in seconds).
+# The runtime of running jobs is updated at the same time.
+# 0 means to write them right away
+HEARTBEAT_FLUSH_INTERVAL = 10
+
+# If True, updates to the Git servers caused by the clients (commit statuses,
+# PR comments, labels, etc) are stored and then sent by the
+# "./manage.py git_outbox" command instead of being sent while handling
+# the request from the client. This keeps a slow Git server from slowing
+# down the clients. The git_outbox command needs to be running.
+GIT_SERVER_OUTBOX = False
+
+# If True, the webhook views just store the payloads and reply right away.
+# They are then processed by the "./manage.py process_webhooks" command,
+# which needs to be running.
+# This keeps the Git servers from timing out and sending the webhook again
+# when processing takes a while, like for large pushes.
+WEBHOOK_QUEUE = False
+
 # This allows for cross origin resource sharing.
 # Mainly so that mooseframework.org can have access
 # to the mooseframework view.
@@ -336,6 +417,7 @@ github_config = {"type": GITSERVER_GITHUB,
         "recipe_label_activation_additive": {},
         "authorized_users": ['idaholab'],
         "request_timeout": 5,
+        "page_workers": 4,
         "icon_class": "fa fa-github fa-lg",
         "civet_base_url": ABSOLUTE_BASE_URL,
         "repository_settings": github_repo_settings,
@@ -359,6 +441,7 @@ gitlab_config = {"type": GITSERVER_GITLAB,
         "recipe_label_activation_additive": {},
         "authorized_users": [],
         "request_timeout": 5,
+        "page_workers": 4,
         "icon_class": "fa fa-gitlab fa-lg",
         "civet_base_url": ABSOLUTE_BASE_URL,
         "login_label": "External Login" #modify this to change the text on the login button
@@ -379,6 +462,7 @@ bitbucket_config = {"type": GITSERVER_BITBUCKET,
         "recipe_label_activation_additive": {},
         "authorized_users": [],
         "request_timeout": 5,
+        "page_workers": 4,
         "icon_class": "fa fa-bitbucket fa-lg",
         "civet_base_url": ABSOLUTE_BASE_URL,
         "login_label": "External Login" #modify this to change the text on the login button
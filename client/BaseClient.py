@@ -17,6 +17,8 @@ from __future__ import unicode_literals, absolute_import
 import logging, logging.handlers
 from client.JobGetter import JobGetter
 from client.JobRunner import JobRunner
+from client.JobSlots import JobSlots
+from client.JobPipeline import JobPipeline
 from client.ServerUpdater import ServerUpdater
 from client.InterruptHandler import InterruptHandler
 import os, signal, sys
@@ -258,13 +260,234 @@ class BaseClient(object):
         self.runner_error = runner.error
         self.runner_killed = runner.job_killed
 
+    def poll_sleep(self, start):
+        """
+        Sleep until the next time to poll for jobs.
+        When the server was asked to wait for a job (long polling) some
+        or all of the poll time has already gone by.
+        Input:
+          start[float]: time.time() when the servers started being polled
+        """
+        remaining = self.get_client_info('poll') - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def create_job_slots(self):
+        """
+        Create the slots for running several jobs at the same time.
+        The cancel signal cancels the jobs in all the slots.
+        Return:
+          JobSlots
+        """
+        slots = JobSlots(self.client_info, pre_step=self._runner_pre_step, post_step=self._runner_post_step,
+                         thread_join_wait=self.thread_join_wait)
+        self.cancel_signal.message_q = slots.command_q
+        self.cancel_signal.set_message({"command": "cancel"})
+        return slots
+
+    def wait_for_slots(self, slots, start, claimed):
+        """
+        Wait until it is time to look for more jobs while running jobs in slots.
+        Input:
+          slots[JobSlots]: The slots
+          start[float]: time.time() when the servers started being polled
+          claimed[bool]: Whether any jobs were claimed
+        """
+        if not slots.free_slots():
+            slots.wait_for_free_slot()
+        elif not claimed:
+            self.poll_sleep(start)
+
+    def run_slots(self):
+        """
+        Main client loop when running several jobs at the same time.
+        Claims jobs for the free slots and runs them.
+        """
+        slots = self.create_job_slots()
+        slots.start()
+        try:
+            while True:
+                claimed = False
+                start = time.time()
+                try:
+                    server = self.get_client_info('server')
+                    for slot in slots.free_slots():
+                        job = slots.get_job(slot, server, self.get_client_info('build_keys'), self.client_info["ssl_verify"])
+                        if not job:
+                            break
+                        slots.run_job(slot, server, job)
+                        claimed = True
+                except Exception:
+                    logger.warning("Error: %s" % traceback.format_exc())
+
+                if self.cancel_signal.triggered or self.graceful_signal.triggered:
+                    logger.info("Received signal...exiting")
+                    break
+
+                if slots.runner_error:
+                    logger.info("Error occurred in runner...exiting")
+                    break
+
+                if self.client_info["single_shot"]:
+                    break
+
+                self.wait_for_slots(slots, start, claimed)
+        finally:
+            logger.info("Waiting for {} running jobs".format(slots.running()))
+            slots.stop()
+            self.runner_error = slots.runner_error
+            self.runner_killed = slots.runner_killed
+
+    def create_job_pipeline(self):
+        """
+        Create the pipeline for running jobs one after the other without waiting in between.
+        Return:
+          JobPipeline
+        """
+        return JobPipeline(self.client_info, self.command_q, pre_step=self._runner_pre_step,
+                           post_step=self._runner_post_step, thread_join_wait=self.thread_join_wait)
+
+    def claim_jobs(self):
+        """
+        Look for a job on the server.
+        Return:
+          list: (server, claimed job) for the jobs that were claimed
+        """
+        claimed = JobGetter(self.client_info).get_job()
+        if claimed:
+            return [(self.get_client_info('server'), claimed)]
+        return []
+
+    def prepare_job(self, server, claimed):
+        """
+        Get ready to run a job in the pipeline.
+        Input:
+          server: The server entry the job was claimed from, as returned by claim_jobs()
+          claimed[dict]: The claimed job
+        Return:
+          bool: True if the job should be failed
+        """
+        return False
+
+    def teardown_job(self, runner):
+        """
+        Clean up after a job in the pipeline. This is called in a separate thread.
+        Input:
+          runner[JobRunner]: The runner that ran the job
+        """
+        pass
+
+    def stop_claiming(self):
+        """
+        Return:
+          bool: Whether we should stop looking for jobs
+        """
+        return self.cancel_signal.triggered or self.graceful_signal.triggered or self.runner_error
+
+    def run_pipeline_job(self, pipeline, server, claimed, fail=False):
+        """
+        Run a claimed job in the pipeline and start the cleanup after it.
+        Input:
+          pipeline[JobPipeline]: The pipeline
+          server: The server entry the job was claimed from, as returned by claim_jobs()
+          claimed[dict]: The claimed job
+          fail[bool]: Whether to fail the job instead of running it
+        """
+        job_id = claimed["job_info"]["job_id"]
+        try:
+            fail = self.prepare_job(server, claimed) or fail
+        except Exception:
+            logger.warning("Error preparing for job {}; failing it: {}".format(job_id, traceback.format_exc()))
+            fail = True
+        self.cancel_signal.set_message({"job_id": job_id, "command": "cancel"})
+        url = self.get_client_info('server')
+        runner = pipeline.run_job(url, claimed, fail=fail)
+        self.runner_error = runner.error
+        self.runner_killed = runner.job_killed
+        pipeline.start_teardown(self.teardown_job, runner)
+        pipeline.finish_job(url, claimed, runner)
+
+    def run_pipeline(self, claim_jobs=None, should_exit=None):
+        """
+        Main client loop when running jobs in a pipeline.
+        The next job is claimed while cleaning up after the last one.
+        Input:
+          claim_jobs: Function that looks for jobs, see claim_jobs(). Defaults to claim_jobs().
+          should_exit: Function that returns True when it is time to exit. Defaults to exiting if single_shot is set.
+        """
+        if claim_jobs is None:
+            claim_jobs = self.claim_jobs
+        if should_exit is None:
+            should_exit = lambda: self.client_info["single_shot"]
+
+        pipeline = self.create_job_pipeline()
+        pipeline.start()
+        claims = []
+        try:
+            while True:
+                ran_job = False
+                start = time.time()
+                try:
+                    if not claims and not self.stop_claiming():
+                        claims = claim_jobs()
+                    while claims and not self.stop_claiming():
+                        server, claimed = claims[0]
+                        # The cleanup of the last job might still be going on
+                        fail = not pipeline.wait_for_teardown()
+                        claims.pop(0)
+                        self.run_pipeline_job(pipeline, server, claimed, fail=fail)
+                        ran_job = True
+                        self.job_done()
+                        if not claims and not self.stop_claiming() and not should_exit():
+                            claims = claim_jobs()
+                except Exception:
+                    logger.warning("Error: %s" % traceback.format_exc())
+
+                if self.cancel_signal.triggered or self.graceful_signal.triggered:
+                    logger.info("Received signal...exiting")
+                    break
+
+                if self.runner_error:
+                    logger.info("Error occurred in runner...exiting")
+                    break
+
+                if should_exit():
+                    break
+
+                if not ran_job:
+                    self.poll_sleep(start)
+        finally:
+            # Never leave a job claimed without telling the server what happened to it
+            runner_error, runner_killed = self.runner_error, self.runner_killed
+            for server, claimed in claims:
+                logger.warning("Failing job {} since the client is exiting".format(claimed["job_info"]["job_id"]))
+                try:
+                    pipeline.wait_for_teardown()
+                    self.run_pipeline_job(pipeline, server, claimed, fail=True)
+                except Exception:
+                    logger.warning("Error: %s" % traceback.format_exc())
+            self.runner_error, self.runner_killed = runner_error, runner_killed
+            pipeline.stop()
+
+    def job_done(self):
+        """
+        Called after each job in the pipeline has finished.
+        Raise an exception to stop running the claimed jobs for now.
+        """
+        pass
+
     def run(self):
         """
         Main client loop. Polls the server for jobs and runs them.
         """
+        if self.client_info.get("slots", 1) > 1:
+            return self.run_slots()
+        if self.client_info.get("pipeline"):
+            return self.run_pipeline()
 
         while True:
             do_poll = True
+            start = time.time()
             try:
                 getter = JobGetter(self.client_info)
                 claimed = getter.get_job()
@@ -288,4 +511,4 @@ class BaseClient(object):
                 break
 
             if do_poll:
-                time.sleep(self.get_client_info('poll'))
+                self.poll_sleep(start)
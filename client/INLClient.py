@@ -23,6 +23,7 @@ import time, traceback
 import shutil
 from inspect import signature
 from client.JobGetter import JobGetter
+from client.ServerPoller import ServerPoller
 import logging
 logger = logging.getLogger("civet_client")
 
@@ -48,6 +49,21 @@ class INLClient(BaseClient.BaseClient):
         # within the runner and stop polling if so
         self.stage_commands_failed = []
 
+    def server_client_info(self, server, client_info=None):
+        """
+        Get the client info to use to poll a server.
+        Input:
+          server: tuple: (The URL of the server, build_key, bool: whether to check SSL)
+          client_info[dict]: The client info to start from; defaults to the client info of the client
+        Returns:
+          dict: A copy of the client info, set up for the server
+        """
+        info = dict(self.client_info if client_info is None else client_info)
+        info["server"] = server[0]
+        info["build_keys"] = server[1]
+        info["ssl_verify"] = server[2]
+        return info
+
     def check_server(self, server):
         """
         Checks a single server for a job, and if found, runs it.
@@ -56,34 +72,201 @@ class INLClient(BaseClient.BaseClient):
         Returns:
           bool: True if we ran a job, False otherwise
         """
+        getter = JobGetter(self.server_client_info(server))
+        claimed = getter.get_job()
+        if claimed:
+            self.run_server_job(server, claimed)
+            return True
+        return False
+
+    def run_server_job(self, server, claimed, fail=False):
+        """
+        Runs a job claimed from a server.
+        Input:
+          server: tuple: (The URL of the server the job is from, build_key, bool: whether to check SSL)
+          claimed[dict]: The claimed job
+          fail[bool]: Whether to fail the job instead of running it
+        """
         self.client_info["server"] = server[0]
         self.client_info["build_keys"] = server[1]
         self.client_info["ssl_verify"] = server[2]
-        getter = JobGetter(self.client_info)
-        claimed = getter.get_job()
-        if claimed:
-            if self.get_client_info('manage_build_root'):
-                self.create_build_root()
+        if self.get_client_info('manage_build_root'):
+            self.create_build_root()
+
+        # Run the pre_job command, if any, and fail the job if it fails
+        fail_job = not self.run_stage_command('pre_job') or fail
+
+        self.set_environment('CIVET_SERVER', self.client_info['server'])
+
+        self.run_claimed_job(server[0], [ s[0] for s in settings.SERVERS ], claimed, fail=fail_job)
+        self.set_client_info('jobs_ran', self.get_client_info('jobs_ran') + 1)
 
-            # Run the pre_job command, if any, and fail the job if it fails
-            fail_job = not self.run_stage_command('pre_job')
+        if self.get_client_info('manage_build_root') and self.build_root_exists():
+            self.remove_build_root()
 
-            self.set_environment('CIVET_SERVER', self.client_info['server'])
+        # Run the post job cleanup, if any
+        # This will be checked for failure outside of this call
+        post_job_env = copy.deepcopy(os.environ)
+        post_job_env['CIVET_JOB_COMPLETED'] = '0' if self.runner_killed else '1'
+        self.run_stage_command('post_job', env=post_job_env)
 
-            self.run_claimed_job(server[0], [ s[0] for s in settings.SERVERS ], claimed, fail=fail_job)
-            self.set_client_info('jobs_ran', self.get_client_info('jobs_ran') + 1)
+    def claim_from_servers(self, poller):
+        """
+        Polls the servers for a job, in the order of settings.SERVERS, until one has a job.
+        Only one job is claimed since only one can be started right away.
+        Input:
+          poller[ServerPoller]: Does the polling
+        Returns:
+          list: (server, claimed job) for the job that was claimed, empty if there wasn't one
+        """
+        servers = poller.due_servers(settings.SERVERS)
+        idx, claimed = poller.claim_first([self.server_client_info(server) for server in servers])
+        if claimed:
+            return [(servers[idx], claimed)]
+        return []
 
-            if self.get_client_info('manage_build_root') and self.build_root_exists():
+    def poll_servers(self, poller):
+        """
+        Polls the servers for a job and runs it.
+        Input:
+          poller[ServerPoller]: Does the polling
+        Returns:
+          bool: True if we ran a job, False otherwise
+        """
+        ran_job = False
+        for server, claimed in self.claim_from_servers(poller):
+            # Never leave a claimed job without telling the server what happened to it
+            fail = self.cancel_signal.triggered
+            if fail:
+                logger.warning("Failing job {} from {}; the client was canceled".format(
+                    claimed["job_info"]["job_id"], server[0]))
+            self.run_server_job(server, claimed, fail=fail)
+            ran_job = True
+        return ran_job
+
+    def prepare_job(self, server, claimed):
+        """
+        Get ready to run a job in the pipeline.
+        Sets up the BUILD_ROOT and runs the pre_job command.
+        Input:
+          server: tuple: (The URL of the server the job is from, build_key, bool: whether to check SSL)
+          claimed[dict]: The claimed job
+        Returns:
+          bool: True if the job should be failed
+        """
+        self.client_info["server"] = server[0]
+        self.client_info["build_keys"] = server[1]
+        self.client_info["ssl_verify"] = server[2]
+        if self.get_client_info('manage_build_root'):
+            if self.build_root_exists():
+                logger.warning("BUILD_ROOT {} already exists; removing".format(self.get_build_root()))
                 self.remove_build_root()
+            self.create_build_root()
 
-            # Run the post job cleanup, if any
-            # This will be checked for failure outside of this call
-            post_job_env = copy.deepcopy(os.environ)
-            post_job_env['CIVET_JOB_COMPLETED'] = '0' if self.runner_killed else '1'
-            self.run_stage_command('post_job', env=post_job_env)
+        fail_job = not self.run_stage_command('pre_job')
+        self.set_environment('CIVET_SERVER', self.client_info['server'])
+        return fail_job
 
-            return True
-        return False
+    def teardown_job(self, runner):
+        """
+        Clean up after a job in the pipeline.
+        Removes the BUILD_ROOT and runs the post_job command.
+        Input:
+          runner[JobRunner]: The runner that ran the job
+        """
+        if self.get_client_info('manage_build_root') and self.build_root_exists():
+            self.remove_build_root()
+
+        post_job_env = copy.deepcopy(os.environ)
+        post_job_env['CIVET_JOB_COMPLETED'] = '0' if runner.job_killed else '1'
+        self.run_stage_command('post_job', env=post_job_env)
+
+    def job_done(self):
+        self.set_client_info('jobs_ran', self.get_client_info('jobs_ran') + 1)
+        self.check_stage_commands()
+
+    def should_exit(self, exit_if):
+        """
+        Input:
+          exit_if: See run()
+        Returns:
+          bool: Whether exit_if says it is time to exit
+        Raises:
+          BaseClient.ClientException: If exit_if doesn't return a bool
+        """
+        if exit_if is None:
+            return False
+        should_exit = exit_if(self)
+        if type(should_exit) != bool:
+            raise BaseClient.ClientException('exit_if must return type bool')
+        return should_exit
+
+    def poll_servers_slots(self, poller, slots):
+        """
+        Polls the servers for jobs for the free slots and starts running them.
+        The servers are polled at the same time, each for one of the free slots.
+        If there are fewer free slots than servers then the servers first
+        in settings.SERVERS are polled.
+        Input:
+          poller[ServerPoller]: Does the polling
+          slots[JobSlots]: The slots
+        Returns:
+          bool: True if we started a job, False otherwise
+        """
+        started = False
+        servers = poller.due_servers(settings.SERVERS)
+        while servers and not slots.runner_error:
+            pairs = list(zip(servers, slots.free_slots()))
+            if not pairs:
+                break
+            infos = [slots.slot_server_info(slot, server[0], server[1], server[2]) for server, slot in pairs]
+            claims = poller.poll(infos)
+            servers = []
+            for (server, slot), claimed in zip(pairs, claims):
+                if not claimed:
+                    continue
+                # The ServerUpdater uses this for all the servers, same as check_server()
+                self.client_info["ssl_verify"] = server[2]
+                slots.run_job(slot, server[0], claimed, before=self.before_slot_job, after=self.after_slot_job)
+                started = True
+                # It might have more jobs
+                servers.append(server)
+        return started
+
+    def before_slot_job(self, slot):
+        """
+        Called in the thread of a slot before running a job.
+        Sets up the build root of the slot and runs the pre_job command.
+        Input:
+          slot[JobSlots.JobSlot]: The slot running the job
+        Returns:
+          bool: True if the job should be failed
+        """
+        environment = slot.client_info['environment']
+        if self.get_client_info('manage_build_root'):
+            build_root = environment['BUILD_ROOT']
+            if self.build_root_exists(build_root):
+                logger.warning("BUILD_ROOT {} already exists; removing".format(build_root))
+                self.remove_build_root(build_root)
+            self.create_build_root(build_root)
+        environment['CIVET_SERVER'] = slot.client_info['server']
+        return not self.run_stage_command('pre_job', env=environment)
+
+    def after_slot_job(self, slot, runner):
+        """
+        Called in the thread of a slot after running a job.
+        Removes the build root of the slot and runs the post_job command.
+        Input:
+          slot[JobSlots.JobSlot]: The slot that ran the job
+          runner[JobRunner]: The runner of the job, None if there was an error creating it
+        """
+        environment = slot.client_info['environment']
+        if self.get_client_info('manage_build_root') and self.build_root_exists(environment['BUILD_ROOT']):
+            self.remove_build_root(environment['BUILD_ROOT'])
+
+        post_job_env = copy.deepcopy(environment)
+        post_job_env['CIVET_JOB_COMPLETED'] = '0' if runner is None or runner.job_killed else '1'
+        self.run_stage_command('post_job', env=post_job_env)
 
     def check_settings(self):
         """
@@ -126,22 +309,26 @@ class INLClient(BaseClient.BaseClient):
         """
         return self.get_environment('BUILD_ROOT')
 
-    def build_root_exists(self):
+    def build_root_exists(self, build_root=None):
         """
+        Input:
+          build_root: The build root to check; defaults to the BUILD_ROOT of the client
         Returns:
           True if the BUILD_ROOT exists, False otherwise
         """
-        return os.path.isdir(self.get_build_root())
+        return os.path.isdir(build_root or self.get_build_root())
 
-    def remove_build_root(self):
+    def remove_build_root(self, build_root=None):
         """
         Removes the build root.
+        Input:
+          build_root: The build root to remove; defaults to the BUILD_ROOT of the client
         Raises:
           BaseClient.ClientException: If BUILD_ROOT does not exist, or the directory removal failed.
         """
-        build_root = self.get_build_root()
+        build_root = build_root or self.get_build_root()
 
-        if self.build_root_exists():
+        if self.build_root_exists(build_root):
             logger.info('Removing BUILD_ROOT {}'.format(build_root))
 
             # Mark everything as writeable (needed for sandboxed dirs that are dirty)
@@ -152,14 +339,16 @@ class INLClient(BaseClient.BaseClient):
         else:
             raise BaseClient.ClientException('Failed to remove BUILD_ROOT {}; it does not exist'.format(build_root))
 
-    def create_build_root(self):
+    def create_build_root(self, build_root=None):
         """
         Creates the build root.
+        Input:
+          build_root: The build root to create; defaults to the BUILD_ROOT of the client
         Raises:
           BaseClient.ClientException: If the BUILD_ROOT directory could not be created or if it already exists.
         """
-        build_root = self.get_build_root()
-        if self.build_root_exists():
+        build_root = build_root or self.get_build_root()
+        if self.build_root_exists(build_root):
             raise BaseClient.ClientException('Failed to create BUILD_ROOT {}; it already exists'.format(build_root))
         else:
             try:
@@ -280,43 +469,77 @@ class INLClient(BaseClient.BaseClient):
         # Run the startup command
         self.run_stage_command('startup', check=True)
 
+        slots = None
+        if self.client_info.get('slots', 1) > 1:
+            slots = self.create_job_slots()
+            slots.start()
+        poller = ServerPoller()
+
+        try:
+            if slots is None and self.client_info.get('pipeline'):
+                self.run_pipeline(lambda: self.claim_from_servers(poller), lambda: self.should_exit(exit_if))
+            else:
+                self.poll_loop(poller, slots, exit_if)
+        finally:
+            poller.shutdown()
+            if slots is not None:
+                logger.info("Waiting for {} running jobs".format(slots.running()))
+                slots.stop()
+                self.set_client_info('jobs_ran', slots.jobs_ran)
+                self.runner_error = slots.runner_error
+                self.runner_killed = slots.runner_killed
+
+        if self.get_client_info('manage_build_root') and self.build_root_exists():
+            logger.warning("BUILD_ROOT {} still exists after exiting poll loop; removing"
+                           .format(self.get_build_root()))
+            self.remove_build_root()
+
+        # Run exit command
+        self.run_stage_command('exit')
+
+    def poll_loop(self, poller, slots, exit_if):
+        """
+        Polls the servers for jobs and runs them until it is time to exit.
+        Inputs:
+          poller[ServerPoller]: Polls the servers
+          slots[JobSlots]: The slots to run the jobs in, None to run one job at a time
+          exit_if: See run()
+        """
         while True:
-            if self.get_client_info('manage_build_root') and self.build_root_exists():
+            if slots is None and self.get_client_info('manage_build_root') and self.build_root_exists():
                 logger.warning("BUILD_ROOT {} already exists at beginning of poll loop; removing"
                                .format(self.get_build_root()))
                 self.remove_build_root()
 
             ran_job = False
-            for server in settings.SERVERS:
-                if self.cancel_signal.triggered or self.graceful_signal.triggered or self.runner_error:
-                    break
+            start = time.time()
+            can_poll = not (self.cancel_signal.triggered or self.graceful_signal.triggered or self.runner_error)
+            if slots is not None:
+                can_poll = can_poll and not slots.runner_error and slots.free_slots()
+            if can_poll:
                 try:
-                    if self.check_server(server):
-                        ran_job = True
+                    if slots is not None:
+                        ran_job = self.poll_servers_slots(poller, slots)
+                    else:
+                        ran_job = self.poll_servers(poller)
+                    if ran_job:
                         self.check_stage_commands()
                 except Exception:
                     logger.debug("Error: %s" % traceback.format_exc())
-                    break
 
+            if slots is not None:
+                self.set_client_info('jobs_ran', slots.jobs_ran)
+                self.runner_error = slots.runner_error
+                self.runner_killed = slots.runner_killed
             if self.cancel_signal.triggered or self.graceful_signal.triggered:
                 logger.info("Received signal...exiting")
                 break
             if self.runner_error:
                 logger.info("Error in runner...exiting")
                 break
-            if exit_if is not None:
-                should_exit = exit_if(self)
-                if type(should_exit) != bool:
-                    raise BaseClient.ClientException('exit_if must return type bool')
-                if should_exit:
-                    break
-            if not ran_job:
-                time.sleep(self.get_client_info('poll'))
-
-        if self.get_client_info('manage_build_root') and self.build_root_exists():
-            logger.warning("BUILD_ROOT {} still exists after exiting poll loop; removing"
-                           .format(self.get_build_root()))
-            self.remove_build_root()
-
-        # Run exit command
-        self.run_stage_command('exit')
+            if self.should_exit(exit_if):
+                break
+            if slots is not None:
+                self.wait_for_slots(slots, start, ran_job)
+            elif not ran_job:
+                self.poll_sleep(start)
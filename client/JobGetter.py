@@ -17,6 +17,7 @@ from __future__ import unicode_literals, absolute_import
 import requests
 import json
 import logging
+from client import ServerSession
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
@@ -34,11 +35,14 @@ class JobGetter(object):
             ssl_verify: Whether to use SSL verification when making a request.
             request_timeout: The timeout when making a request
             build_key: The build_key to be used.
+            long_poll: Optional. Number of seconds to ask the server to wait for a job to become ready.
         """
         super(JobGetter, self).__init__()
         self.client_info = client_info
         self._headers = {b"User-Agent": b"INL-CIVET-Client/1.0 (+https://github.com/idaholab/civet)"}
         self._url = f'{self.client_info["server"]}/client/get_job/'
+        # Set by get_job() when the server couldn't be talked to
+        self.failed = False
 
     def check_response(self, response_json):
         expected_values = {'job_id': [int, type(None)],
@@ -64,28 +68,44 @@ class JobGetter(object):
         return True
 
     def get_job(self):
+        """
+        Ask the server for a job.
+        Return:
+          dict: The claimed job, None if there wasn't one or there was an error.
+            self.failed is set if there was an error.
+        """
+        self.failed = False
         server = self.client_info["server"]
         logger.info(f'Polling for a job on server {server}')
 
         post_data = { 'client_name': self.client_info["client_name"],
                       'build_keys': self.client_info["build_keys"],
                       'build_configs': self.client_info["build_configs"] }
+        timeout = 5
+        wait = self.client_info.get("long_poll", 0)
+        if wait:
+            # The server holds on to the request until a job is ready or
+            # the wait is over. Older servers just ignore this.
+            post_data['wait'] = wait
+            timeout += wait
         post_json = json.dumps(post_data, separators=(",", ": "))
 
         try:
-            response = requests.post(self._url,
+            response = ServerSession.post(self._url,
                                     post_json,
                                     headers=self._headers,
                                     verify=self.client_info["ssl_verify"],
-                                    timeout=5)
+                                    timeout=timeout)
             response.raise_for_status()
             response_json = response.json()
         except:
             logger.warning('Failed to get job', exc_info=True)
+            self.failed = True
             return None
 
         # Make sure the values are all as we expect
         if not self.check_response(response_json):
+            self.failed = True
             return None
 
         # Job isn't available
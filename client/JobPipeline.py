@@ -0,0 +1,177 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Running jobs one after the other without waiting in between.
+
+Normally after a job finishes the client waits for all of its updates
+to be sent, stops the ServerUpdater, cleans up after the job and only
+then looks for the next job. If client_info["pipeline"] is set then:
+  - One ServerUpdater is used for all the jobs.
+  - The cleanup after a job (removing the BUILD_ROOT, the post_job command)
+    is started in a thread as soon as the job is done, while its last
+    updates are still being sent.
+  - The next job is claimed once the server has the results of the last
+    job, while the cleanup is still going on. The server cancels the
+    running jobs of a client that asks for a job, so it can't be any sooner.
+If the cleanup fails then the next job is failed instead of being left
+claimed but never run.
+"""
+from __future__ import unicode_literals, absolute_import
+import threading
+import traceback
+from client.JobRunner import JobRunner
+from client.JobSlots import CommandRouter
+from client.ServerUpdater import ServerUpdater, JobMessageQueue
+import logging
+logger = logging.getLogger("civet_client")
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+class JobPipeline(object):
+    """
+    Runs jobs one at a time with a single ServerUpdater
+    and does the cleanup after each job in a thread.
+    """
+    def __init__(self, client_info, command_q, pre_step=None, post_step=None, thread_join_wait=2*60*60):
+        """
+        Input:
+          client_info[dict]: The client info of the client
+          command_q[Queue]: The command queue the jobs read from. The cancel signal also puts commands on it.
+          pre_step: Passed to the JobRunner of each job
+          post_step: Passed to the JobRunner of each job
+          thread_join_wait[float]: Max number of seconds to wait for a thread or the updates of a job to finish
+        """
+        self.client_info = client_info
+        self.command_q = command_q
+        self.pre_step = pre_step
+        self.post_step = post_step
+        self.thread_join_wait = thread_join_wait
+        self.message_q = JobMessageQueue()
+        self.router = CommandRouter()
+        self.control_q = Queue()
+        self.updater = ServerUpdater(None, client_info, self.message_q, self.router, self.control_q)
+        self.updater_thread = None
+        self.teardown_thread = None
+        self.teardown_error = False
+
+    def start(self):
+        """
+        Start the ServerUpdater.
+        """
+        self.updater_thread = threading.Thread(target=ServerUpdater.run, args=(self.updater,))
+        self.updater_thread.start()
+
+    def stop(self):
+        """
+        Wait for the cleanup of the last job and stop the ServerUpdater.
+        """
+        self.wait_for_teardown()
+        self.control_q.put({"command": "Quit"}) # Any command will stop the ServerUpdater
+        if self.updater_thread is not None:
+            logger.info("Joining ServerUpdater")
+            self.updater_thread.join(self.thread_join_wait)
+            if self.updater_thread.is_alive():
+                logger.warning("Failed to join ServerUpdater thread. Jobs not updated correctly")
+
+    def clear_commands(self):
+        try:
+            while True:
+                self.command_q.get(block=False)
+        except Empty:
+            pass
+
+    def run_job(self, server, claimed, fail=False):
+        """
+        Run a claimed job. This doesn't wait for the updates of the job to be sent, see finish_job().
+        Input:
+          server[str]: URL of the server of the job
+          claimed[dict]: The claimed job
+          fail[bool]: Whether to fail the job instead of running it
+        Return:
+          JobRunner: The runner that ran the job
+        """
+        job_info = claimed["job_info"]
+        job_id = job_info["job_id"]
+        for entry in self.client_info["servers"]:
+            if entry != server:
+                self.control_q.put({"server": entry, "message": "Running job on another server"})
+            else:
+                self.control_q.put({"server": entry, "message": "Job {}: {}".format(job_id, job_info["recipe_name"])})
+
+        self.router.add_job(server, job_id, self.command_q)
+        runner = JobRunner(self.client_info, job_info, self.message_q, self.command_q, claimed["build_key"],
+                           pre_step=self.pre_step, post_step=self.post_step)
+        runner.run_job(fail=fail)
+        return runner
+
+    def finish_job(self, server, claimed, runner):
+        """
+        Wait for the updates of a job to be sent.
+        Input:
+          server[str]: URL of the server of the job
+          claimed[dict]: The claimed job
+          runner[JobRunner]: The runner that ran the job
+        Return:
+          bool: Whether all the updates were sent
+        """
+        job_id = claimed["job_info"]["job_id"]
+        sent = True
+        if not runner.stopped and not runner.canceled:
+            logger.info("Waiting for the messages of job {}".format(job_id))
+            sent = self.message_q.join_job(server, job_id, self.thread_join_wait)
+            if not sent:
+                logger.warning("Failed to send the messages of job {}: '{}'".format(
+                    job_id, claimed["job_info"]["recipe_name"]))
+        self.router.remove_job(server, job_id)
+        self.clear_commands()
+        return sent
+
+    def start_teardown(self, teardown, *args):
+        """
+        Start the cleanup after a job in a thread.
+        Input:
+          teardown: Function that does the cleanup. If it raises then teardown_error is set.
+          args: Passed to teardown
+        """
+        self.wait_for_teardown()
+        self.teardown_thread = threading.Thread(target=self._teardown, args=(teardown, args))
+        self.teardown_thread.start()
+
+    def _teardown(self, teardown, args):
+        try:
+            teardown(*args)
+        except Exception:
+            logger.warning("Error cleaning up after job: {}".format(traceback.format_exc()))
+            self.teardown_error = True
+
+    def wait_for_teardown(self):
+        """
+        Wait for the cleanup of the last job to finish.
+        Return:
+          bool: True if the cleanup succeeded. The error is reset.
+        """
+        if self.teardown_thread is not None:
+            self.teardown_thread.join(self.thread_join_wait)
+            if self.teardown_thread.is_alive():
+                logger.warning("Failed to join the cleanup thread")
+                self.teardown_error = True
+            else:
+                self.teardown_thread = None
+        ok = not self.teardown_error
+        self.teardown_error = False
+        return ok
@@ -15,6 +15,7 @@
 
 from __future__ import unicode_literals, absolute_import
 import os, re, time
+import codecs
 import copy
 import tempfile
 import subprocess, platform
@@ -24,14 +25,13 @@ import signal
 import traceback
 from distutils import spawn
 from typing import Callable
+from client import OutputReader
 logger = logging.getLogger("civet_client")
 
 try:
-    from queue import Queue, Empty
+    from queue import Empty
 except ImportError:
-    from Queue import Queue, Empty
-
-from threading import Thread
+    from Queue import Empty
 
 @contextlib.contextmanager
 def temp_file(*args, **kwargs):
@@ -49,6 +49,9 @@ def temp_file(*args, **kwargs):
         os.unlink(f.name)
 
 class JobRunner(object):
+    # Max number of seconds between checks for commands from the server
+    COMMAND_CHECK_INTERVAL = 0.1
+
     def __init__(self, client_info, job, message_q, command_q, build_key,
                  pre_step: Callable[[dict | None], bool] | None = None,
                  post_step: Callable[[dict | None], bool] | None = None):
@@ -200,21 +203,29 @@ class JobRunner(object):
                 self.build_key,
                 self.client_info["client_name"],
                 job_id)
-        self.add_message(final_url, job_msg)
+        self.add_message(final_url, job_msg, "job_finished")
 
         logger.info("Finished Job {}: {}".format(job_id, self.job_data['recipe_name']))
         return job_msg
 
-    def add_message(self, url, msg):
+    def add_message(self, url, msg, update_type=None, stepresult_id=None):
         """
         Puts a message on the message queue that will be read in by the ServerUpdater.
         Input:
           url: str: URL the ServerUpdater will post to.
           msg: dict: Payload to post to the URL
+          update_type: str: The kind of update, the name of the endpoint in url.
+            Along with the build key and step result, this allows the ServerUpdater to
+            send several messages in one batch.
+          stepresult_id: int: ID of the step result this message is for, if any
         """
         self.message_q.put({"server": self.client_info["server"],
+            "client_name": self.client_info["client_name"],
             "job_id": self.job_data["job_id"],
             "url": url,
+            "type": update_type,
+            "build_key": self.build_key,
+            "stepresult_id": stepresult_id,
             "payload": msg.copy()})
 
     def update_step(self, stage, step, chunk_data):
@@ -234,39 +245,7 @@ class JobRunner(object):
                 self.build_key,
                 self.client_info["client_name"],
                 step["stepresult_id"])
-        self.add_message(url, chunk_data)
-
-    def get_output_from_queue(self, q, timeout=1):
-        """
-        Grabs all the available output from the queue and returns it.
-        This is used with reading the output of a subprocess so everything on
-        the queue should just be strings.
-
-        On the first run through we block if timeout is non zero. This will slow down the overall
-        read process loop so that we are not constantly busy waiting trying
-        to read the output.
-        Input:
-          q: Queue to read from
-          timeout: int: How long to block while trying to read
-        Return:
-          list: str: Output read.
-        """
-        output = []
-        block = False
-        if timeout:
-            block = True
-
-        try:
-            while True:
-                line = q.get(block=block, timeout=timeout)
-                output.append(line)
-                block = False
-        except Empty:
-            """
-            We always return from here since eventually we will
-            read all the messages on the queue and trigger an Empty exception.
-            """
-            return output
+        self.add_message(url, chunk_data, keyword, step["stepresult_id"])
 
     def read_command(self):
         """
@@ -301,108 +280,73 @@ class JobRunner(object):
           dict: An updated step_data
         """
         # Save the first max/2 bytes of output and the last max/2
-        out_begin = []
-        out_end = []
-        # Don't worry that "out" might contain multibyte characters,
-        # just do rough size checks for lengths measured in bytes
-        out_begin_length = 0
-        out_total_length = 0
+        output = OutputReader.OutputBuffer(self.max_output_size)
+        # Output that hasn't been sent to the server yet
         chunk_out = []
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
         start_time = time.time()
         max_end_time = start_time + int(step["environment"].get("CIVET_MAX_STEP_TIME", self.max_step_time))
-        chunk_start_time = time.time()
+        next_update_time = start_time + self.client_info["update_step_time"]
         step_data["canceled"] = False
-        over_half_max = False
-        over_max = False
         keep_output = False
+        # Not part of the output so that it can't get dropped
+        cancel_string = ""
+
+        if self.is_windows():
+            reader = OutputReader.ThreadedPipeReader(proc.stdout)
+        else:
+            reader = OutputReader.PipeReader(proc.stdout)
 
-        # This allows non-blocking read on Unix & Windows
-        # See: http://stackoverflow.com/questions/375427/non-blocking-read-on-a-subprocess-pipe-in-python
-        def enqueue_output(out, queue):
-            for line in iter(out.readline, b''):
-                if line:
-                    # Make sure it doesn't have any bad unicode characters
-                    line = line.decode("utf-8", "replace")
-                queue.put(line)
-            out.close()
-
-        q = Queue()
-        t = Thread(target=enqueue_output, args=(proc.stdout, q))
-        t.daemon = True
-        t.start();
-
-        while proc.poll() is None:
+        while not reader.eof:
             if self.canceled or self.stopped:
                 logger.info("Killing job\n")
+                reader.close()
                 self.kill_job(proc)
                 step_data['canceled'] = True
                 step_data['output'] = ""
                 break
 
-            output = self.get_output_from_queue(q)
-            if output:
-                if over_half_max:
-                    # Keep the last half of the output separate, so we
-                    # can trim from the middle as needed
-                    out_end.extend(output)
-                    out_total_length += sum(len(l) for l in output)
-                    if not over_max:
-                        chunk_out.extend(output)
-                else:
-                    out_begin.extend(output)
-                    chunk_out.extend(output)
-
-                    out_begin_length += sum(len(l) for l in output)
-                    if out_begin_length > self.max_output_size/2:
-                        over_half_max = True
-                        out_total_length = out_begin_length
-
-            if over_half_max:
-                while len(out_end) and out_total_length > self.max_output_size:
-                    over_max = True
-                    # This is O(N^2) for large output, but we used to be
-                    # O(N^2) for all output and nobody noticed so the
-                    # constant must be small enough
-                    mid_output = out_end.pop(0)
-                    out_total_length -= sum(len(l) for l in mid_output)
-
-            diff = time.time() - chunk_start_time
-            if diff > self.client_info["update_step_time"]: # Report some output every x seconds
+            # Wake up when there is output, when an update is due or
+            # when the step runs out of time. Commands come in on a Queue,
+            # so also wake up often enough to check for those.
+            now = time.time()
+            timeout = min(next_update_time, max_end_time) - now
+            timeout = max(0, min(timeout, self.COMMAND_CHECK_INTERVAL))
+            data = reader.read(timeout)
+            if data:
+                output.append(data)
+                if not output.trimmed:
+                    chunk_out.append(decoder.decode(data))
+
+            now = time.time()
+            if now >= next_update_time: # Report some output every x seconds
                 step_data['output'] = "".join(chunk_out)
-                if over_max:
+                if output.trimmed:
                     step_data['output'] += "\n\n*****************************************************\n\n"
                     step_data['output'] += "CIVET: Output size exceeded limit (%s bytes), pausing live output!\n" % self.max_output_size
                     step_data['output'] += "\n*****************************************************\n\n"
-                step_data['time'] = int(time.time() - start_time)
+                step_data['time'] = int(now - start_time)
                 self.update_step("update", step, step_data)
                 chunk_out = []
+                next_update_time = now + self.client_info["update_step_time"]
 
-                chunk_start_time = time.time()
-
-            if time.time() > max_end_time:
+            if now > max_end_time and not self.canceled:
                 self.canceled = True
                 keep_output = True
                 cancel_string = "\n\n*****************************************************\n"
                 cancel_string += "CIVET: Cancelling job due to step taking longer than the max %s seconds\n" % self.max_step_time
                 cancel_string += "\n*****************************************************\n"
-                if over_half_max:
-                    out_end.extend(cancel_string)
-                else:
-                    out_begin.extend(cancel_string)
 
             self.read_command() # this will set the internal flags to cancel or stop
 
-        t.join() # make sure the step has no more output
-
-        # we might not have gotten everything
-        out_end.extend(self.get_output_from_queue(q, timeout=0))
         if not step_data['canceled'] or keep_output:
-            step_data['output'] = ''.join(out_begin)
-            if over_max:
+            step_data['output'] = output.get_head()
+            if output.trimmed:
                 step_data['output'] += "\n\n*****************************************************\n\n"
                 step_data['output'] += "CIVET: Output size exceeded limit (%s bytes), skipping intermediate output!\n" % self.max_output_size
                 step_data['output'] += "\n*****************************************************\n\n"
-            step_data['output'] += ''.join(out_end)
+            step_data['output'] += output.get_tail()
+            step_data['output'] += cancel_string
         step_data['complete'] = True
         step_data['time'] = int(time.time() - start_time) #would be float
         return step_data
@@ -0,0 +1,319 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Running several jobs at the same time on one client.
+
+Normally a client runs one job at a time. If client_info["slots"] is more
+than 1 then the client claims up to that many jobs and runs each of them
+in a slot:
+  - A slot claims jobs with its own client name, <client_name>_<slot>,
+    since the server cancels the running jobs of a client that asks for
+    another job.
+  - Each slot gets its own BUILD_ROOT, <BUILD_ROOT>_<slot>, so that the
+    jobs don't step on each other. The CIVET_SLOT, CIVET_NUM_SLOTS and
+    CIVET_SLOT_CPUS environment variables are set so that the recipes
+    can limit how many processes they use.
+  - A single ServerUpdater sends the updates of all the slots to the servers
+    over the shared connections (see ServerSession), and passes the commands
+    from the servers to the slot running the job.
+"""
+from __future__ import unicode_literals, absolute_import
+import copy
+import os
+import threading
+import traceback
+from client.JobGetter import JobGetter
+from client.JobRunner import JobRunner
+from client.ServerUpdater import ServerUpdater, JobMessageQueue
+import logging
+logger = logging.getLogger("civet_client")
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+def available_cpus():
+    """
+    Return:
+      int: Number of CPUs this process can use
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def available_memory():
+    """
+    Return:
+      float: GB of physical memory, or None if it isn't known
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / float(1024**3)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def num_slots(slots, slot_cpus=0, slot_memory=0):
+    """
+    Get the number of slots to use.
+    Input:
+      slots[int]: Number of slots asked for. If 0, it is derived from the resources of the machine.
+      slot_cpus[int]: Number of CPUs that a job needs. Only used if slots is 0.
+      slot_memory[float]: GB of memory that a job needs. Only used if slots is 0.
+    Return:
+      int: Number of slots, at least 1
+    """
+    if slots > 0:
+        return slots
+    slots = available_cpus() // max(slot_cpus, 1)
+    memory = available_memory()
+    if slot_memory > 0 and memory is not None:
+        slots = min(slots, int(memory // slot_memory))
+    return max(slots, 1)
+
+def slot_client_info(client_info, slot, slots):
+    """
+    Create the client info for a slot.
+    Input:
+      client_info[dict]: The client info of the client
+      slot[int]: Index of the slot
+      slots[int]: Number of slots
+    Return:
+      dict: A copy of client_info with the name and environment of the slot
+    """
+    info = copy.deepcopy(client_info)
+    info["client_name"] = "{}_{}".format(client_info["client_name"], slot)
+    environment = info.setdefault("environment", {})
+    if "BUILD_ROOT" in environment:
+        environment["BUILD_ROOT"] = "{}_{}".format(environment["BUILD_ROOT"], slot)
+    cpus = client_info.get("slot_cpus") or max(available_cpus() // slots, 1)
+    environment["CIVET_CLIENT_NAME"] = info["client_name"]
+    environment["CIVET_SLOT"] = str(slot)
+    environment["CIVET_NUM_SLOTS"] = str(slots)
+    environment["CIVET_SLOT_CPUS"] = str(cpus)
+    return info
+
+class CommandRouter(object):
+    """
+    Used as the command queue of the ServerUpdater and the signal handlers.
+    Commands for a job go to the command queue of the slot running it.
+    Commands that aren't for a job, like the one from the cancel
+    signal, go to all the slots.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def add_job(self, server, job_id, command_q):
+        with self._lock:
+            self._queues[(server, job_id)] = command_q
+
+    def remove_job(self, server, job_id):
+        with self._lock:
+            self._queues.pop((server, job_id), None)
+
+    def put(self, cmd):
+        with self._lock:
+            if "job_id" not in cmd:
+                queues = list(self._queues.values())
+            else:
+                command_q = self._queues.get((cmd.get("server"), cmd["job_id"]))
+                queues = [command_q] if command_q is not None else []
+        if not queues:
+            logger.info("Dropping command for a job that isn't running: {}".format(cmd))
+        for command_q in queues:
+            command_q.put(cmd)
+
+class JobSlot(object):
+    """
+    A slot that runs one job at a time.
+    """
+    def __init__(self, index, client_info):
+        self.index = index
+        self.client_info = client_info
+        self.command_q = Queue()
+        self.busy = False
+        self.job_id = None
+
+    def clear_commands(self):
+        try:
+            while True:
+                self.command_q.get(block=False)
+        except Empty:
+            pass
+
+class JobSlots(object):
+    """
+    Runs the jobs of the slots, each in its own thread.
+    """
+    def __init__(self, client_info, pre_step=None, post_step=None, thread_join_wait=2*60*60):
+        """
+        Input:
+          client_info[dict]: The client info of the client. client_info["slots"] is the number of slots.
+          pre_step: Passed to the JobRunner of each job
+          post_step: Passed to the JobRunner of each job
+          thread_join_wait[float]: Max number of seconds to wait for a thread to finish
+        """
+        self.client_info = client_info
+        self.num_slots = client_info["slots"]
+        self.pre_step = pre_step
+        self.post_step = post_step
+        self.thread_join_wait = thread_join_wait
+        self.slots = [JobSlot(i, slot_client_info(client_info, i, self.num_slots)) for i in range(self.num_slots)]
+        self.message_q = JobMessageQueue()
+        self.command_q = CommandRouter()
+        self.control_q = Queue()
+        self.updater = ServerUpdater(None, client_info, self.message_q, self.command_q, self.control_q)
+        self.updater_thread = None
+        self.threads = []
+        self.runner_error = False
+        self.runner_killed = False
+        self.jobs_ran = 0
+        self._lock = threading.Condition()
+
+    def start(self):
+        """
+        Start the ServerUpdater.
+        """
+        self.updater_thread = threading.Thread(target=ServerUpdater.run, args=(self.updater,))
+        self.updater_thread.start()
+
+    def stop(self):
+        """
+        Wait for the running jobs to finish and stop the ServerUpdater.
+        """
+        for thread in self.threads:
+            thread.join(self.thread_join_wait)
+        self.control_q.put({"command": "Quit"}) # Any command will stop the ServerUpdater
+        if self.updater_thread is not None:
+            logger.info("Joining ServerUpdater")
+            self.updater_thread.join(self.thread_join_wait)
+            if self.updater_thread.is_alive():
+                logger.warning("Failed to join ServerUpdater thread. Jobs not updated correctly")
+
+    def free_slots(self):
+        """
+        Return:
+          list[JobSlot]: The slots that aren't running a job
+        """
+        with self._lock:
+            return [slot for slot in self.slots if not slot.busy]
+
+    def running(self):
+        """
+        Return:
+          int: Number of slots that are running a job
+        """
+        return self.num_slots - len(self.free_slots())
+
+    def wait_for_free_slot(self, timeout=None):
+        """
+        Wait for a slot to be free.
+        Input:
+          timeout[float]: Max number of seconds to wait. None to wait forever.
+        Return:
+          bool: Whether there is a free slot
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: any(not slot.busy for slot in self.slots), timeout)
+
+    def slot_server_info(self, slot, server, build_keys, ssl_verify):
+        """
+        Set up a slot to claim a job from a server.
+        Input:
+          slot[JobSlot]: A free slot
+          server[str]: URL of the server
+          build_keys[list]: The build keys to claim jobs for
+          ssl_verify: Whether to use SSL verification, or the certificate to use
+        Return:
+          dict: The client info of the slot, to pass to JobGetter
+        """
+        slot.client_info["server"] = server
+        slot.client_info["build_keys"] = build_keys
+        slot.client_info["ssl_verify"] = ssl_verify
+        return slot.client_info
+
+    def get_job(self, slot, server, build_keys, ssl_verify):
+        """
+        Try to claim a job for a slot.
+        Input:
+          slot[JobSlot]: A free slot
+          server[str]: URL of the server
+          build_keys[list]: The build keys to claim jobs for
+          ssl_verify: Whether to use SSL verification, or the certificate to use
+        Return:
+          dict: The claimed job, as returned by JobGetter.get_job(), or None
+        """
+        return JobGetter(self.slot_server_info(slot, server, build_keys, ssl_verify)).get_job()
+
+    def update_status(self):
+        """
+        Update the message that the ServerUpdater pings the servers with.
+        """
+        msg = "Running {} of {} jobs".format(self.running(), self.num_slots)
+        for server in self.client_info["servers"]:
+            self.control_q.put({"server": server, "message": msg})
+
+    def run_job(self, slot, server, claimed, before=None, after=None):
+        """
+        Start running a claimed job in a slot.
+        Input:
+          slot[JobSlot]: The slot that claimed the job
+          server[str]: URL of the server of the job
+          claimed[dict]: The claimed job
+          before: Optional function that takes the slot and is called before running the job.
+                  If it returns True then the job is failed.
+          after: Optional function that takes the slot and the JobRunner (None if it couldn't be created)
+                 and is called after the job has finished.
+        """
+        with self._lock:
+            slot.busy = True
+            slot.job_id = claimed["job_info"]["job_id"]
+        self.command_q.add_job(server, slot.job_id, slot.command_q)
+        self.update_status()
+        thread = threading.Thread(target=self._run_job, args=(slot, server, claimed, before, after))
+        self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def _run_job(self, slot, server, claimed, before, after):
+        job_info = claimed["job_info"]
+        job_id = job_info["job_id"]
+        runner = None
+        try:
+            fail = bool(before(slot)) if before else False
+            runner = JobRunner(slot.client_info, job_info, self.message_q, slot.command_q, claimed["build_key"],
+                               pre_step=self.pre_step, post_step=self.post_step)
+            runner.run_job(fail=fail)
+            if not runner.stopped and not runner.canceled:
+                logger.info("Waiting for the messages of job {}".format(job_id))
+                self.message_q.join_job(server, job_id, self.thread_join_wait)
+            self.runner_error = self.runner_error or runner.error
+            self.runner_killed = self.runner_killed or runner.job_killed
+        except Exception:
+            logger.warning("Error in slot {} running job {}: {}".format(slot.index, job_id, traceback.format_exc()))
+        finally:
+            self.command_q.remove_job(server, job_id)
+            slot.clear_commands()
+            try:
+                if after:
+                    after(slot, runner)
+            except Exception:
+                logger.warning("Error in slot {} after job {}: {}".format(slot.index, job_id, traceback.format_exc()))
+            with self._lock:
+                self.jobs_ran += 1
+                slot.busy = False
+                slot.job_id = None
+                self._lock.notify_all()
+            self.update_status()
@@ -0,0 +1,207 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Reading the output of a step.
+
+PipeReader reads whatever is available on the pipe of the step process in
+large chunks, waiting on the pipe with selectors so that there is no
+reader thread. Windows can't select on pipes so ThreadedPipeReader does the
+same with a thread.
+OutputBuffer keeps the first and last max_size/2 bytes of the output.
+The last part is a list of chunks so old output is dropped a chunk at a
+time instead of copying everything that is kept.
+"""
+from __future__ import unicode_literals, absolute_import
+import os
+import selectors
+from collections import deque
+from threading import Thread
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+# Max number of bytes for a single read of the pipe
+CHUNK_SIZE = 64*1024
+# Max number of bytes returned from a single call to read().
+# Keeps a very chatty process from starving the cancel checks.
+MAX_READ_SIZE = 1024*1024
+# Max number of bytes past the limit that the first half of
+# the output is extended by to end on a full line
+MAX_LINE_SPLIT = 1024
+
+class PipeReader(object):
+    def __init__(self, pipe):
+        """
+        Input:
+          pipe: The file object to read from, like Popen.stdout
+        """
+        self.eof = False
+        self._fd = pipe.fileno()
+        os.set_blocking(self._fd, False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._fd, selectors.EVENT_READ)
+
+    def read(self, timeout):
+        """
+        Wait for output and read all that is available.
+        Input:
+          timeout: float: Max number of seconds to wait for output
+        Return:
+          bytes: The output. Empty if there wasn't any or we are at the end.
+        """
+        if self.eof:
+            return b""
+        data = []
+        total = 0
+        if self._selector.select(timeout):
+            while total < MAX_READ_SIZE:
+                try:
+                    chunk = os.read(self._fd, CHUNK_SIZE)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    self.close()
+                    break
+                data.append(chunk)
+                total += len(chunk)
+        return b"".join(data)
+
+    def close(self):
+        """
+        Stop reading. The pipe itself isn't closed.
+        """
+        if not self.eof:
+            self.eof = True
+            self._selector.close()
+
+class ThreadedPipeReader(object):
+    def __init__(self, pipe):
+        """
+        Same as PipeReader but uses a thread to read the pipe.
+        Input:
+          pipe: The file object to read from, like Popen.stdout
+        """
+        self.eof = False
+        self._q = Queue()
+        self._thread = Thread(target=self._enqueue_output, args=(pipe,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _enqueue_output(self, pipe):
+        try:
+            for chunk in iter(lambda: pipe.read1(CHUNK_SIZE), b''):
+                self._q.put(chunk)
+        except (OSError, ValueError):
+            # Closed when the job got killed
+            pass
+        self._q.put(b"")
+
+    def read(self, timeout):
+        """
+        See PipeReader.read()
+        """
+        if self.eof:
+            return b""
+        data = []
+        total = 0
+        try:
+            chunk = self._q.get(timeout=timeout)
+            while chunk:
+                data.append(chunk)
+                total += len(chunk)
+                # Check before taking another chunk off the queue so that
+                # it doesn't get lost
+                if total >= MAX_READ_SIZE:
+                    break
+                chunk = self._q.get(block=False)
+            if not chunk:
+                self.close()
+        except Empty:
+            pass
+        return b"".join(data)
+
+    def close(self):
+        self.eof = True
+
+class OutputBuffer(object):
+    def __init__(self, max_size):
+        """
+        Input:
+          max_size: int: Max number of bytes to keep
+        """
+        self.max_size = max_size
+        self.head = bytearray()
+        self.head_full = False
+        self.tail = deque()
+        self.tail_size = 0
+        self.trimmed = False
+
+    def append(self, data):
+        """
+        Add output. Once the first half is full, output goes to
+        the second half and the oldest output there is dropped.
+        Input:
+          data: bytes: The output to add
+        """
+        if not self.head_full:
+            room = self.max_size//2 - len(self.head)
+            if len(data) <= room:
+                self.head.extend(data)
+                return
+            # Keep the line that goes over the limit in the first half,
+            # unless it is really long
+            split = data.find(b"\n", room, room + MAX_LINE_SPLIT)
+            split = room if split < 0 else split + 1
+            self.head.extend(data[:split])
+            self.head_full = True
+            data = data[split:]
+            if not data:
+                return
+
+        self.tail.append(data)
+        self.tail_size += len(data)
+        limit = max(self.max_size - len(self.head), 0)
+        while self.tail_size > limit:
+            self.trimmed = True
+            excess = self.tail_size - limit
+            first = self.tail[0]
+            if len(first) <= excess:
+                self.tail.popleft()
+                self.tail_size -= len(first)
+            else:
+                self.tail[0] = first[excess:]
+                self.tail_size -= excess
+
+    def get_head(self):
+        """
+        Return:
+          str: The first half of the output
+        """
+        return self.head.decode("utf-8", "replace")
+
+    def get_tail(self):
+        """
+        Return:
+          str: The second half of the output. If output was dropped this
+            starts at the beginning of a line.
+        """
+        tail = b"".join(self.tail)
+        if self.trimmed:
+            newline = tail.find(b"\n")
+            if newline >= 0:
+                tail = tail[newline+1:]
+        return tail.decode("utf-8", "replace")
@@ -0,0 +1,160 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Polling several civet servers for jobs at the same time.
+
+Asking a server for a job claims it, so the servers are only all asked
+at once when there is a free slot for each of them. Otherwise they are
+asked one at a time, in priority order, until one has a job, so that no
+job sits claimed while another client could be running it.
+A server that can't be talked to isn't polled again until a backoff
+time has passed, so a down server doesn't hold up the others for long.
+The backoff doubles for every failure in a row, up to BACKOFF_MAX.
+"""
+from __future__ import unicode_literals, absolute_import
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from client.JobGetter import JobGetter
+import logging
+logger = logging.getLogger("civet_client")
+
+# Number of seconds to wait before polling a server again after it fails
+BACKOFF_START = 10
+# Max number of seconds to wait before polling a failing server again
+BACKOFF_MAX = 10*60
+
+class ServerHealth(object):
+    """
+    Keeps track of whether we can talk to a server.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.failures = 0
+        self.next_poll = 0
+
+    def due(self, now=None):
+        """
+        Return:
+          bool: Whether it is time to poll the server
+        """
+        if now is None:
+            now = time.time()
+        return now >= self.next_poll
+
+    def succeeded(self):
+        if self.failures:
+            logger.info("Server {} is back after {} failed polls".format(self.url, self.failures))
+        self.failures = 0
+        self.next_poll = 0
+
+    def failed(self, now=None):
+        if now is None:
+            now = time.time()
+        self.failures += 1
+        backoff = min(BACKOFF_START * 2**(self.failures - 1), BACKOFF_MAX)
+        self.next_poll = now + backoff
+        logger.warning("Failed to poll server {} {} time(s) in a row; not polling it for {} seconds".format(
+            self.url, self.failures, backoff))
+
+class ServerPoller(object):
+    """
+    Polls servers for jobs in a thread pool.
+    """
+    def __init__(self, max_workers=None):
+        """
+        Input:
+          max_workers[int]: Max number of servers to poll at the same time. Defaults to the ThreadPoolExecutor default.
+        """
+        self.health = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ServerPoller")
+
+    def get_health(self, url):
+        """
+        Return:
+          ServerHealth: The health of the server with the given URL
+        """
+        health = self.health.get(url)
+        if health is None:
+            health = ServerHealth(url)
+            self.health[url] = health
+        return health
+
+    def due_servers(self, servers):
+        """
+        Input:
+          servers[list]: Entries of settings.SERVERS, in priority order
+        Return:
+          list: The servers that are due to be polled, in the same order
+        """
+        now = time.time()
+        return [server for server in servers if self.get_health(server[0]).due(now)]
+
+    def get_job(self, client_info):
+        """
+        Ask a server for a job and keep track of whether it answered.
+        Called in a thread of the pool.
+        Input:
+          client_info[dict]: Passed to JobGetter; client_info["server"] is the server to poll
+        Return:
+          dict: The claimed job, or None
+        """
+        health = self.get_health(client_info["server"])
+        getter = JobGetter(client_info)
+        try:
+            claimed = getter.get_job()
+        except Exception:
+            logger.warning("Error polling {}: {}".format(client_info["server"], traceback.format_exc()))
+            health.failed()
+            return None
+
+        if getter.failed:
+            health.failed()
+        else:
+            health.succeeded()
+        return claimed
+
+    def poll(self, client_infos):
+        """
+        Poll servers for jobs at the same time.
+        Input:
+          client_infos[list]: The client info to use for each server. client_info["server"] is the server to poll.
+            Each one should be a separate dict since they are used at the same time.
+        Return:
+          list: The claimed job, or None, for each entry of client_infos, in the same order
+        """
+        futures = [self.executor.submit(self.get_job, client_info) for client_info in client_infos]
+        return [future.result() for future in futures]
+
+    def claim_first(self, client_infos):
+        """
+        Poll servers for a job one at a time until one of them has a job.
+        Only the last server is asked to wait for a job (long_poll), waiting
+        on the others would hold up polling the rest.
+        Input:
+          client_infos[list]: The client info to use for each server, in priority order. See poll().
+        Return:
+          (int, dict): The index in client_infos of the server and the claimed job, or (None, None)
+        """
+        for idx, client_info in enumerate(client_infos):
+            if idx < len(client_infos) - 1 and client_info.get("long_poll"):
+                client_info = dict(client_info, long_poll=0)
+            claimed = self.get_job(client_info)
+            if claimed:
+                return idx, claimed
+        return None, None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,130 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Shared HTTP sessions for talking to the civet servers.
+
+Each server gets one requests.Session so that the connections are kept
+alive between polling and the updates for a job instead of doing a new
+TCP (and TLS) handshake for every request.
+"""
+from __future__ import unicode_literals, absolute_import
+import threading
+import gzip
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+
+# Number of times to retry a request that couldn't connect or
+# that got a 503 while the server is restarting.
+RETRY_TOTAL = 3
+# Waits 0.5, 1, 2... seconds between retries
+RETRY_BACKOFF = 0.5
+# Request bodies at least this big get gzipped
+COMPRESS_MIN_SIZE = 64*1024
+# Max number of connections to keep open to a server
+POOL_SIZE = 4
+
+_sessions_lock = threading.Lock()
+_sessions = {}
+
+def server_key(url):
+    """
+    The sessions are shared between requests to the same scheme/host/port.
+    """
+    parts = urlsplit(url)
+    return "%s://%s" % (parts.scheme, parts.netloc)
+
+def create_session():
+    """
+    Create a new session with the retry policy.
+    The requests are POSTs which aren't idempotent, so we only retry
+    when we know the server didn't get the request: a failed connect
+    or a 503. A read error could mean the server already processed
+    the request, and the callers already deal with a failed request
+    by sending it again later.
+    """
+    retry = Retry(total=RETRY_TOTAL,
+            connect=RETRY_TOTAL,
+            read=0,
+            status=RETRY_TOTAL,
+            status_forcelist=[503],
+            allowed_methods=None,
+            backoff_factor=RETRY_BACKOFF,
+            raise_on_status=False,
+            )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=POOL_SIZE)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_session(url):
+    """
+    Get the shared session for the server of a URL.
+    Input:
+      url[str]: URL of a request to the server
+    Return:
+      requests.Session
+    """
+    key = server_key(url)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = create_session()
+            _sessions[key] = session
+        return session
+
+def close_sessions():
+    """
+    Close all the shared sessions.
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def compress(data, headers):
+    """
+    Gzip the data if it is big enough to be worth it.
+    Input:
+      data[bytes or str]: The request body
+      headers[dict]: The request headers
+    Return:
+      (data, headers): The possibly compressed data and the headers to send with it
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if len(data) < COMPRESS_MIN_SIZE:
+        return data, headers
+    headers = dict(headers)
+    headers["Content-Encoding"] = "gzip"
+    # Level 6 is plenty for text and doesn't slow down sending output much
+    return gzip.compress(data, compresslevel=6), headers
+
+def post(url, data, headers={}, verify=True, timeout=None):
+    """
+    POST data to a server using its shared session.
+    Input:
+      url[str]: URL to post to
+      data[bytes or str]: The request body
+      headers[dict]: Extra headers to send
+      verify[bool]: Whether to do SSL verification
+      timeout[float]: Request timeout
+    Return:
+      requests.Response
+    """
+    data, headers = compress(data, headers)
+    return get_session(url).post(url, data, headers=headers, verify=verify, timeout=timeout)
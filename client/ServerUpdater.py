@@ -19,11 +19,12 @@ import time
 import json, requests
 import traceback
 import logging
+from client import ServerSession
 
 try:
-    from queue import Empty
+    from queue import Queue, Empty
 except ImportError:
-    from Queue import Empty
+    from Queue import Queue, Empty
 
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
@@ -33,6 +34,63 @@ logger = logging.getLogger("civet_client")
 class StopException(Exception):
     pass
 
+# Types of messages that can be sent with the batch_update endpoint
+BATCH_TYPES = ["start_step_result", "update_step_result", "complete_step_result", "job_finished"]
+# Max number of messages to send in one batch
+MAX_BATCH_MESSAGES = 100
+# Returned by post_json() when the server doesn't have the batch_update endpoint
+BATCH_NOT_SUPPORTED = {"status": "NOT_SUPPORTED"}
+
+def job_key(msg):
+    """
+    The job that a message is for.
+    """
+    return (msg.get("server"), msg.get("job_id"))
+
+class JobMessageQueue(Queue):
+    """
+    A message queue that can be shared by several jobs.
+    Besides the normal Queue.join(), which waits for all the
+    messages to be sent, join_job() just waits for the messages
+    of one job.
+    The ServerUpdater calls message_done() instead of task_done()
+    for each message.
+    """
+    def __init__(self):
+        super(JobMessageQueue, self).__init__()
+        self.job_tasks = {}
+
+    def put(self, item, block=True, timeout=None):
+        key = job_key(item)
+        with self.all_tasks_done:
+            self.job_tasks[key] = self.job_tasks.get(key, 0) + 1
+        super(JobMessageQueue, self).put(item, block, timeout)
+
+    def message_done(self, item):
+        key = job_key(item)
+        with self.all_tasks_done:
+            count = self.job_tasks.get(key, 0) - 1
+            if count > 0:
+                self.job_tasks[key] = count
+            else:
+                self.job_tasks.pop(key, None)
+            self.all_tasks_done.notify_all()
+        self.task_done()
+
+    def join_job(self, server, job_id, timeout=None):
+        """
+        Wait for the messages of a job to be sent.
+        Input:
+          server[str]: URL of the server of the job
+          job_id[int]: ID of the job
+          timeout[float]: Max number of seconds to wait. None to wait forever.
+        Return:
+          bool: Whether all the messages were sent
+        """
+        key = (server, job_id)
+        with self.all_tasks_done:
+            return self.all_tasks_done.wait_for(lambda: key not in self.job_tasks, timeout)
+
 class ServerUpdater(object):
     def __init__(self, server, client_info, message_q, command_q, control_q):
         self.message_q = message_q
@@ -45,6 +103,8 @@ class ServerUpdater(object):
 
         self.update_servers()
         self.running = True
+        # Set to False if the server doesn't support batch updates
+        self.batch_updates = True
         # We want to make sure we don't send unicode headers
         # Helps prevent the dreaded "Error: [('SSL routines', 'ssl3_write_pending', 'bad write retry')]" errors
         self._headers = {b"User-Agent": b"INL-CIVET-Client/1.0 (+https://github.com/idaholab/civet)"}
@@ -97,14 +157,15 @@ class ServerUpdater(object):
         they will add something to the control queue
         """
         try:
-            msg = self.control_q.get(block=False)
-            if isinstance(msg, dict) and "server" in msg:
-                if "message" in msg:
-                    self.update_server_message(msg["server"], msg["message"])
-            else:
-                # Anything else on the queue and we stop
-                logger.info("ServerUpdater shutting down")
-                self.running = False
+            while self.running:
+                msg = self.control_q.get(block=False)
+                if isinstance(msg, dict) and "server" in msg:
+                    if "message" in msg:
+                        self.update_server_message(msg["server"], msg["message"])
+                else:
+                    # Anything else on the queue and we stop
+                    logger.info("ServerUpdater shutting down")
+                    self.running = False
         except Empty:
             pass
 
@@ -130,26 +191,129 @@ class ServerUpdater(object):
         except Empty:
             pass
 
+    def message_done(self, msg):
+        """
+        Marks a message from the message queue as done.
+        """
+        if isinstance(self.message_q, JobMessageQueue):
+            self.message_q.message_done(msg)
+        else:
+            self.message_q.task_done()
+
     def send_messages(self):
         """
         Just tries to clear the messages that we haven't sent yet.
+        Messages for the same job are sent together in one batch.
+        If the server tells us to stop a job then the rest of
+        the messages of that job are dropped.
         """
-        try:
-            last_success = 0
-            for idx, msg in enumerate(self.messages):
-                sent = self.post_message(msg)
-                if sent:
-                    last_success = idx+1
-                    self.message_q.task_done()
-                else:
-                    break
-            #self.messages = self.messages[last_success:]
-            self.messages = self.messages[last_success:]
-        except StopException:
-            for msg in self.messages[last_success:]:
-                self.message_q.task_done()
-            self.messages = []
-        self.servers[self.main_server]["last_time"] = time.time()
+        sent_count = 0
+        stopped = set()
+        for group in self.group_messages(self.messages[:]):
+            if job_key(group[0]) not in stopped:
+                try:
+                    sent = self.post_group(group)
+                    if not sent:
+                        break
+                except StopException:
+                    stopped.add(job_key(group[0]))
+            sent_count += len(group)
+
+        remaining = []
+        for idx, msg in enumerate(self.messages):
+            if idx < sent_count or job_key(msg) in stopped:
+                self.message_done(msg)
+            else:
+                remaining.append(msg)
+        self.messages = remaining
+        if self.main_server in self.servers:
+            self.servers[self.main_server]["last_time"] = time.time()
+
+    def can_batch(self, msg):
+        return self.batch_updates and msg.get("type") in BATCH_TYPES and msg.get("build_key") is not None
+
+    def group_messages(self, messages):
+        """
+        Splits the messages into groups that can be sent together.
+        Consecutive messages for the same job go into the same group.
+        Messages that can't be batched are in a group by themselves.
+        Input:
+          messages[list]: Messages to group, in order
+        Return:
+          list[list]: The groups, in order
+        """
+        groups = []
+        for msg in messages:
+            if groups and self.can_batch(msg):
+                prev = groups[-1][-1]
+                if self.can_batch(prev) and \
+                        len(groups[-1]) < MAX_BATCH_MESSAGES and \
+                        (prev["server"], prev["job_id"], prev["build_key"]) == (msg["server"], msg["job_id"], msg["build_key"]):
+                    groups[-1].append(msg)
+                    continue
+            groups.append([msg])
+        return groups
+
+    @staticmethod
+    def coalesce_updates(messages):
+        """
+        Merges updates of the same step result.
+        The output of consecutive updates of a step result is joined together
+        so that the server only has to save it once.
+        When a step is completed the client sends all the output, so any
+        earlier updates of its output are dropped.
+        Input:
+          messages[list]: Messages for the same job, in order
+        Return:
+          list[dict]: Updates for the batch_update endpoint
+        """
+        updates = []
+        for msg in messages:
+            data = msg["payload"].copy()
+            if isinstance(data.get("output"), b"".__class__):
+                data["output"] = data["output"].decode("utf-8", "replace")
+            update = {"type": msg["type"], "stepresult_id": msg.get("stepresult_id"), "data": data}
+            prev = updates[-1] if updates else None
+            if prev is not None and \
+                    prev["type"] == "update_step_result" and \
+                    update["type"] in ["update_step_result", "complete_step_result"] and \
+                    prev["stepresult_id"] == update["stepresult_id"]:
+                if update["type"] == "update_step_result" or not data.get("complete"):
+                    data["output"] = (prev["data"].get("output") or "") + (data.get("output") or "")
+                updates[-1] = update
+            else:
+                updates.append(update)
+        return updates
+
+    def post_group(self, group):
+        """
+        Sends a group of messages to the server.
+        Input:
+          group[list]: Messages as returned by group_messages()
+        Return:
+          True if we could talk to the server, False otherwise
+        """
+        if len(group) == 1 and not self.can_batch(group[0]):
+            return self.post_message(group[0])
+
+        first = group[0]
+        client_name = first.get("client_name", self.client_info["client_name"])
+        url = "{}/client/batch_update/{}/{}/{}/".format(first["server"],
+                first["build_key"],
+                client_name,
+                first["job_id"])
+        item = {"server": first["server"],
+                "job_id": first["job_id"],
+                "url": url,
+                "payload": {"updates": self.coalesce_updates(group)},
+                }
+        reply = self.post_json(item["url"], item["payload"], not_found_reply=BATCH_NOT_SUPPORTED, client_name=client_name)
+        if reply is BATCH_NOT_SUPPORTED:
+            # An older server. The messages will get sent separately next time.
+            logger.info("Server doesn't support batch updates, sending messages separately")
+            self.batch_updates = False
+            return False
+        return self.check_reply(item, reply)
 
     def post_message(self, item):
         """
@@ -163,8 +327,18 @@ class ServerUpdater(object):
         Returns:
           True if we could talk to the server, False otherwise
         """
-        reply = self.post_json(item["url"], item["payload"])
+        reply = self.post_json(item["url"], item["payload"], client_name=item.get("client_name"))
+        return self.check_reply(item, reply)
 
+    def check_reply(self, item, reply):
+        """
+        Checks the reply of the server to a message.
+        Input:
+          item[dict]: The message that was sent
+          reply[dict]: The reply from post_json()
+        Returns:
+          True if we could talk to the server, False otherwise
+        """
         if not reply:
             # Since all messages here are on the same server, if there is no
             # reply then there isn't any point in trying with others
@@ -234,7 +408,7 @@ class ServerUpdater(object):
             logger.warning("Failed to convert to json: \n%s\nData:%s" % (traceback.format_exc(), data))
             return {"status": "OK", "command": "stop"}, False
 
-    def post_json(self, request_url, data, timeout=None):
+    def post_json(self, request_url, data, timeout=None, not_found_reply=None, client_name=None):
         """
         Post the supplied dict holding JSON data to the url and return a dict
         with the JSON.
@@ -242,11 +416,13 @@ class ServerUpdater(object):
           request_url: The URL to post to.
           data: dict of data to post.
           timeout: The request timeout; defaults to self.client_info['request_timeout']
+          not_found_reply: If not None, this is returned if the server responds with a 404
+          client_name: The name of the client the data is from; defaults to self.client_info['client_name']
         Returns:
           A dict of the JSON reply if successful, otherwise None
         """
         # always include the name so the server can keep track
-        data["client_name"] = self.client_info["client_name"]
+        data["client_name"] = client_name or self.client_info["client_name"]
         logger.info("Posting to '{}'".format(request_url))
 
         if timeout is None:
@@ -256,11 +432,13 @@ class ServerUpdater(object):
             in_json, good = self.data_to_json(data)
             if not good:
                 return in_json
-            response = requests.post(request_url,
+            response = ServerSession.post(request_url,
                     in_json,
                     headers=self._headers,
                     verify=self.client_info["ssl_verify"],
                     timeout=timeout)
+            if response.status_code == 404 and not_found_reply is not None:
+                return not_found_reply
             if response.status_code == 400:
                 # This means that we shouldn't retry this request
                 logger.warning("Stopping because we got a 400 response while posting to: %s" % request_url)
@@ -20,7 +20,7 @@ import sys, os
 import platform
 # Need to add parent directory to the path so that imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
-from client import BaseClient
+from client import BaseClient, JobSlots
 from DaemonLite import DaemonLite
 
 class ClientDaemon(DaemonLite):
@@ -60,6 +60,35 @@ def commandline_client(args):
             type=int,
             default=30,
             help="Number of seconds to wait before polling for more jobs in continuous mode")
+    parser.add_argument("--long-poll",
+            dest='long_poll',
+            type=int,
+            default=0,
+            help="Number of seconds to ask the server to wait for a job to become ready before giving up. "
+                "The server limits this to its GET_JOB_MAX_WAIT setting.")
+    parser.add_argument("--slots",
+            dest='slots',
+            type=int,
+            default=1,
+            help="Number of jobs to run at the same time. "
+                "If 0, one job for every --slot-cpus CPUs and --slot-memory GB of memory.")
+    parser.add_argument("--slot-cpus",
+            dest='slot_cpus',
+            type=int,
+            default=0,
+            help="Number of CPUs for each job when running several jobs at the same time. "
+                "Jobs get this in the CIVET_SLOT_CPUS environment variable. "
+                "Defaults to the number of CPUs divided by the number of jobs.")
+    parser.add_argument("--slot-memory",
+            dest='slot_memory',
+            type=float,
+            default=0,
+            help="GB of memory for each job when using --slots 0")
+    parser.add_argument("--pipeline",
+            dest='pipeline',
+            action='store_true',
+            help="Look for the next job while cleaning up after the last one. "
+                "Ignored when running several jobs at the same time.")
     parser.add_argument("--daemon", dest='daemon', choices=['start', 'stop', 'restart'], help="Start a UNIX daemon.")
     parser.add_argument("--log-dir",
             dest='log_dir',
@@ -89,12 +118,16 @@ def commandline_client(args):
         "build_keys": [parsed.build_key],
         "single_shot": parsed.single_shot,
         "poll": parsed.poll,
+        "long_poll": parsed.long_poll,
         "daemon_cmd": parsed.daemon,
         "request_timeout": 30,
         "update_step_time": 20,
         "server_update_interval": 20,
         "server_update_timeout": 5,
-        "max_output_size": 5*1024*1024
+        "max_output_size": 5*1024*1024,
+        "slots": JobSlots.num_slots(parsed.slots, parsed.slot_cpus, parsed.slot_memory),
+        "slot_cpus": parsed.slot_cpus,
+        "pipeline": parsed.pipeline,
         }
 
     c = BaseClient.BaseClient(client_info)
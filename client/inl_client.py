@@ -21,7 +21,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 import socket
 import platform
 import logging, logging.handlers
-from client import INLClient, BaseClient
+from client import INLClient, BaseClient, JobSlots
 from DaemonLite import DaemonLite
 
 def commandline_client(args):
@@ -54,6 +54,34 @@ def commandline_client(args):
             dest='poll_time',
             help='Sets the client polling time in seconds (default: 60s)',
             default=60)
+    parser.add_argument('--long-poll',
+            type=int,
+            dest='long_poll',
+            help='Number of seconds to ask each server to wait for a job to become ready (default: 0s)',
+            default=0)
+    parser.add_argument('--slots',
+            dest='slots',
+            type=int,
+            default=1,
+            help="Number of jobs to run at the same time. "
+                "If 0, one job for every --slot-cpus CPUs and --slot-memory GB of memory.")
+    parser.add_argument('--slot-cpus',
+            dest='slot_cpus',
+            type=int,
+            default=0,
+            help="Number of CPUs for each job when running several jobs at the same time. "
+                "Jobs get this in the CIVET_SLOT_CPUS environment variable. "
+                "Defaults to the number of CPUs divided by the number of jobs.")
+    parser.add_argument('--slot-memory',
+            dest='slot_memory',
+            type=float,
+            default=0,
+            help="GB of memory for each job when using --slots 0")
+    parser.add_argument('--pipeline',
+            dest='pipeline',
+            action='store_true',
+            help="Look for the next job while cleaning up after the last one. "
+                "Ignored when running several jobs at the same time.")
     parser.add_argument('--startup-command',
                         type=str,
                         dest='startup_command',
@@ -98,6 +126,7 @@ def commandline_client(args):
         "build_keys": [],
         "single_shot": False,
         "poll": parsed.poll_time,
+        "long_poll": parsed.long_poll,
         "daemon_cmd": parsed.daemon,
         "request_timeout": 120,
         "update_step_time": 30,
@@ -106,6 +135,9 @@ def commandline_client(args):
         # the ping message doesn't become the default message
         "server_update_interval": 50,
         "max_output_size": 5*1024*1024,
+        "slots": JobSlots.num_slots(parsed.slots, parsed.slot_cpus, parsed.slot_memory),
+        "slot_cpus": parsed.slot_cpus,
+        "pipeline": parsed.pipeline,
         "startup_command": parsed.startup_command,
         "pre_job_command": parsed.pre_job_command,
         "pre_step_command": parsed.pre_step_command,
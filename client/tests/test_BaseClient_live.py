@@ -20,7 +20,7 @@ from mock import patch
 import os, subprocess
 import threading
 import time
-from ci import views
+from ci import views, models
 from ci.tests import utils as test_utils
 from client.tests import LiveClientTester, utils
 
@@ -59,6 +59,43 @@ class Tests(LiveClientTester.LiveClientTester):
             utils.check_complete_job(self, job, c)
             self.assertFalse(c.runner_killed)
 
+    def test_run_slots(self):
+        with test_utils.RecipeDir() as recipe_dir:
+            c, job0 = self.create_client_and_job(recipe_dir, "Slot0", sleep=2)
+            job1 = utils.create_client_job(recipe_dir, name="Slot1", sleep=2)
+            c.client_info["slots"] = 2
+            c.client_info["server_update_timeout"] = 1
+            self.set_counts()
+            start = time.time()
+            c.run()
+            # The jobs ran at the same time
+            self.assertLess(time.time() - start, 12)
+            self.compare_counts(num_clients=2, num_events_completed=1, num_jobs_completed=2, active_branches=1)
+            self.assertFalse(c.runner_killed)
+            clients = set()
+            for job in [job0, job1]:
+                job.refresh_from_db()
+                self.assertEqual(job.status, models.JobStatus.SUCCESS)
+                clients.add(job.client.name)
+                slot = job.client.name[-1]
+                for result in job.step_results.all():
+                    self.assertIn("/foo/bar_%s/global" % slot, result.output)
+            self.assertEqual(clients, set(["client_name_0", "client_name_1"]))
+
+    def test_run_pipeline(self):
+        with test_utils.RecipeDir() as recipe_dir:
+            c, job0 = self.create_client_and_job(recipe_dir, "Pipeline0", sleep=1)
+            job1 = utils.create_client_job(recipe_dir, name="Pipeline1", sleep=1)
+            c.client_info["pipeline"] = True
+            c.client_info["server_update_timeout"] = 1
+            self.set_counts()
+            c.run_pipeline(should_exit=lambda: models.Job.objects.filter(complete=True).count() == 2)
+            self.compare_counts(num_events_completed=1, num_jobs_completed=2, active_branches=1, num_clients=1)
+            self.assertFalse(c.runner_killed)
+            for job in [job0, job1]:
+                job.refresh_from_db()
+                self.assertEqual(job.status, models.JobStatus.SUCCESS)
+
     def test_run_graceful(self):
         with test_utils.RecipeDir() as recipe_dir:
             c, job = self.create_client_and_job(recipe_dir, "Graceful", sleep=2)
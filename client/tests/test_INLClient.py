@@ -19,7 +19,8 @@ from django.test import override_settings
 from ci.tests import utils as test_utils
 from client import inl_client
 import os, shutil, tempfile
-from client import settings, BaseClient
+from client import settings, BaseClient, INLClient
+from mock import patch, MagicMock
 from client.tests import utils
 
 @override_settings(INSTALLED_GITSERVERS=[test_utils.github_config()])
@@ -170,3 +171,54 @@ class Tests(SimpleTestCase):
         with self.assertRaises(BaseClient.ClientException) as e:
             c.run_stage_command('foo')
         self.assertEqual("Invalid stage command stage foo", str(e.exception))
+
+    def test_slot_jobs(self):
+        with tempfile.TemporaryDirectory() as temp_dir, tempfile.NamedTemporaryFile() as tmp:
+            build_root = temp_dir + "/build_root"
+            args = self.default_args + ['--slots', '2',
+                    '--pre-job-command', f'echo "pre $BUILD_ROOT $CIVET_SERVER $CIVET_SLOT" >> {tmp.name}',
+                    '--post-job-command', f'echo "post $BUILD_ROOT $CIVET_JOB_COMPLETED" >> {tmp.name}']
+            c = self.create_client(args)['client']
+            self.assertEqual(c.get_client_info('slots'), 2)
+            c.set_environment('BUILD_ROOT', build_root)
+            c.set_client_info('manage_build_root', True)
+            slots = c.create_job_slots()
+            slot = slots.slots[1]
+            slot.client_info['server'] = 'server'
+            self.assertEqual(slot.client_info['client_name'], c.get_client_info('client_name') + '_1')
+
+            self.assertFalse(c.before_slot_job(slot))
+            self.assertTrue(os.path.isdir(build_root + '_1'))
+            self.assertFalse(c.build_root_exists())
+            c.after_slot_job(slot, None)
+            self.assertFalse(os.path.isdir(build_root + '_1'))
+            self.assertEqual(open(tmp.name, 'r').read(),
+                    f'pre {build_root}_1 server 1\npost {build_root}_1 0\n')
+            c.check_stage_commands()
+
+    @patch.object(INLClient.INLClient, 'run_server_job')
+    def test_poll_servers(self, mock_run):
+        c = self.create_client(self.default_args)['client']
+        settings.SERVERS = [("server0", [0], False), ("server1", [1], False), ("server2", [2], False)]
+        poller = MagicMock()
+        poller.due_servers.return_value = settings.SERVERS[1:]
+        poller.claim_first.return_value = (1, {"job_info": {"job_id": 2}})
+        self.assertTrue(c.poll_servers(poller))
+        infos = poller.claim_first.call_args[0][0]
+        self.assertEqual([(i["server"], i["build_keys"]) for i in infos], [("server1", [1]), ("server2", [2])])
+        # Only one job is claimed
+        mock_run.assert_called_once_with(settings.SERVERS[2], {"job_info": {"job_id": 2}}, fail=False)
+        self.assertEqual(c.claim_from_servers(poller), [(settings.SERVERS[2], {"job_info": {"job_id": 2}})])
+
+        # The claimed job gets failed instead of left claimed
+        mock_run.reset_mock()
+        c.cancel_signal.triggered = True
+        self.assertTrue(c.poll_servers(poller))
+        mock_run.assert_called_once_with(settings.SERVERS[2], {"job_info": {"job_id": 2}}, fail=True)
+        c.cancel_signal.triggered = False
+
+        mock_run.reset_mock()
+        poller.claim_first.return_value = (None, None)
+        self.assertFalse(c.poll_servers(poller))
+        self.assertEqual(c.claim_from_servers(poller), [])
+        mock_run.assert_not_called()
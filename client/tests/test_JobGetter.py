@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from __future__ import unicode_literals, absolute_import
-import copy, requests
+import copy, requests, json
 from . import utils
 from django.test import override_settings
 from ci.tests import utils as test_utils
@@ -61,7 +61,7 @@ class Tests(DBTester.DBTester):
         response['foo'] = 'bar'
         self.assertEqual(g.check_response(response), False)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_get_job(self, mock_post):
         g = self.create_getter()
 
@@ -69,20 +69,33 @@ class Tests(DBTester.DBTester):
         mock_post.return_value = test_utils.Response(good_response)
         response = g.get_job()
         self.assertIsNotNone(response)
+        self.assertFalse(g.failed)
 
         # threw on post
         mock_post.return_value = test_utils.Response(good_response, do_raise=True)
         self.assertIsNone(g.get_job())
+        self.assertTrue(g.failed)
 
         # bad values
         response = copy.deepcopy(good_response)
         del response['job_id']
         mock_post.return_value = test_utils.Response(response)
         self.assertIsNone(g.get_job())
+        self.assertTrue(g.failed)
 
         # Job not available
         response = copy.deepcopy(good_response)
         response['job_id'] = None
         mock_post.return_value = test_utils.Response(response)
         self.assertIsNone(g.get_job())
+        self.assertFalse(g.failed)
+
+        # Long polling
+        self.assertNotIn('wait', json.loads(mock_post.call_args[0][1]))
+        self.assertEqual(mock_post.call_args[1]['timeout'], 5)
+        g.client_info['long_poll'] = 20
+        mock_post.return_value = test_utils.Response(good_response)
+        self.assertIsNotNone(g.get_job())
+        self.assertEqual(json.loads(mock_post.call_args[0][1])['wait'], 20)
+        self.assertEqual(mock_post.call_args[1]['timeout'], 25)
 
@@ -87,7 +87,7 @@ class Tests(LiveClientTester.LiveClientTester):
         self.assertEqual(ret, None)
 
         # bad server
-        with patch.object(requests, "post") as mock_post:
+        with patch.object(requests.Session, "post") as mock_post:
             mock_post.return_value = test_utils.Response(json_data={})
             self.client_info["server"] = "dummy_server"
             self.set_counts()
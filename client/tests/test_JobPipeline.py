@@ -0,0 +1,122 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase
+from mock import patch
+from client import JobPipeline, BaseClient
+from client.tests import utils
+from ci.tests import utils as test_utils
+import requests
+import threading
+
+BaseClient.setup_logger()
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+class FakeRunner(object):
+    """
+    Takes the place of JobRunner.
+    """
+    ran = []
+
+    def __init__(self, client_info, job, message_q, command_q, build_key, pre_step=None, post_step=None):
+        self.client_info = client_info
+        self.job = job
+        self.message_q = message_q
+        self.stopped = False
+        self.canceled = False
+        self.error = False
+        self.job_killed = False
+
+    def run_job(self, fail=False):
+        FakeRunner.ran.append((self.job["job_id"], fail))
+        self.error = fail
+        self.message_q.put({"server": self.client_info["server"],
+            "job_id": self.job["job_id"],
+            "url": "url",
+            "payload": {"message": "done"}})
+
+class Tests(SimpleTestCase):
+    def setUp(self):
+        FakeRunner.ran = []
+        self.client_info = utils.default_client_info()
+        self.client_info["server_update_timeout"] = 0.1
+
+    def claimed(self, job_id):
+        return {"job_info": utils.create_job_dict(pk=job_id), "build_key": 1234}
+
+    def test_teardown(self):
+        pipeline = JobPipeline.JobPipeline(self.client_info, Queue())
+        self.assertTrue(pipeline.wait_for_teardown())
+        release = threading.Event()
+        pipeline.start_teardown(release.wait, 10)
+        self.assertTrue(pipeline.teardown_thread.is_alive())
+        release.set()
+        self.assertTrue(pipeline.wait_for_teardown())
+
+        def fail():
+            raise Exception("oh no!")
+        pipeline.start_teardown(fail)
+        self.assertFalse(pipeline.wait_for_teardown())
+        # The error is reset
+        self.assertTrue(pipeline.wait_for_teardown())
+
+    @patch.object(requests.Session, 'post')
+    @patch.object(JobPipeline, "JobRunner", FakeRunner)
+    def test_run_job(self, mock_post):
+        mock_post.return_value = test_utils.Response({"status": "OK"})
+        command_q = Queue()
+        pipeline = JobPipeline.JobPipeline(self.client_info, command_q)
+        pipeline.start()
+        try:
+            server = self.client_info["server"]
+            claimed = self.claimed(1)
+            runner = pipeline.run_job(server, claimed)
+            command_q.put({"command": "cancel"})
+            self.assertTrue(pipeline.finish_job(server, claimed, runner))
+            self.assertTrue(command_q.empty())
+        finally:
+            pipeline.stop()
+        self.assertEqual(FakeRunner.ran, [(1, False)])
+        self.assertEqual(pipeline.message_q.unfinished_tasks, 0)
+        self.assertFalse(pipeline.updater_thread.is_alive())
+
+    @patch.object(requests.Session, 'post')
+    @patch.object(JobPipeline, "JobRunner", FakeRunner)
+    def test_run_pipeline(self, mock_post):
+        mock_post.return_value = test_utils.Response({"status": "OK"})
+        c = utils.create_base_client()
+        c.client_info["server_update_timeout"] = 0.1
+        server = c.client_info["server"]
+        claims = [[(server, self.claimed(1)), (server, self.claimed(2)), (server, self.claimed(3))], []]
+        teardowns = []
+
+        def teardown(runner):
+            teardowns.append(runner.job["job_id"])
+            if runner.job["job_id"] == 1:
+                raise Exception("oh no!")
+
+        with patch.object(c, "claim_jobs", side_effect=claims), \
+                patch.object(c, "teardown_job", side_effect=teardown):
+            c.run_pipeline()
+
+        # The cleanup after the first job failed so the second job was failed,
+        # which stops the client. The third job was failed since the client exited.
+        self.assertEqual(FakeRunner.ran, [(1, False), (2, True), (3, True)])
+        self.assertEqual(teardowns, [1, 2, 3])
+        self.assertTrue(c.runner_error)
@@ -56,11 +56,14 @@ class Tests(SimpleTestCase):
         self.assertEqual(results['client_name'], runner.client_info["client_name"])
         self.assertEqual(self.message_q.qsize(), 1)
         msg = self.message_q.get(block=False)
-        self.assertEqual(len(msg), 4)
+        self.assertEqual(len(msg), 8)
         server = runner.client_info["server"]
         self.assertEqual(msg["server"], server)
         self.assertTrue(msg["url"].startswith(server))
         self.assertEqual(msg["job_id"], runner.job_data["job_id"])
+        self.assertEqual(msg["type"], "job_finished")
+        self.assertEqual(msg["build_key"], runner.build_key)
+        self.assertEqual(msg["stepresult_id"], None)
         self.assertEqual(msg["payload"], results)
 
     @patch.object(JobRunner.JobRunner, 'run_step')
@@ -127,25 +130,16 @@ class Tests(SimpleTestCase):
             r.update_step(stage, step, chunk_data)
             self.assertEqual(self.message_q.qsize(), 1)
             msg = self.message_q.get(block=False)
-            self.assertEqual(len(msg), 4)
+            self.assertEqual(len(msg), 8)
             server = r.client_info["server"]
             self.assertEqual(msg["server"], server)
             self.assertTrue(msg["url"].startswith(server))
             self.assertIn(stage, msg["url"])
             self.assertEqual(msg["job_id"], r.job_data["job_id"])
+            self.assertEqual(msg["type"], "%s_step_result" % stage)
+            self.assertEqual(msg["stepresult_id"], 1)
             self.assertEqual(msg["payload"], chunk_data)
 
-    def test_get_output_from_queue(self):
-        r = self.create_runner()
-        q0 = {"msg": 1}
-        q1 = {"msg": 2}
-        self.message_q.put(q0)
-        self.message_q.put(q1)
-        output = r.get_output_from_queue(self.message_q)
-        self.assertEqual(len(output), 2)
-        self.assertEqual(output[0], q0)
-        self.assertEqual(output[1], q1)
-
     def test_read_command(self):
         r = self.create_runner()
         # test a command to another job
@@ -292,6 +286,23 @@ class Tests(SimpleTestCase):
                     r.kill_job(proc)
 
 
+    def test_read_lots_of_output(self):
+        r = self.create_runner()
+        r.client_info["update_step_time"] = 1
+        r.max_output_size = 64*1024
+        with JobRunner.temp_file() as script_file:
+            script_file.write(b"seq 300000")
+            script_file.close()
+            with open(os.devnull, "wb") as devnull:
+                proc = r.create_process(script_file.name, {}, devnull)
+                out = r.read_process_output(proc, r.job_data["steps"][0], {})
+                proc.wait()
+                lines = out["output"].splitlines()
+                self.assertEqual(lines[0], "1")
+                self.assertIn("Output size exceeded", out["output"])
+                self.assertEqual(lines[-1], "300000")
+                self.assertLess(len(out["output"]), r.max_output_size + 1024)
+
     def test_run_step(self):
         r = self.create_runner()
         r.client_info["update_step_time"] = 1
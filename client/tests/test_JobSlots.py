@@ -0,0 +1,171 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase
+from mock import patch
+from client import JobSlots, BaseClient
+from client.ServerUpdater import JobMessageQueue
+from client.tests import utils
+from ci.tests import utils as test_utils
+import requests
+import threading
+
+BaseClient.setup_logger()
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+class FakeRunner(object):
+    """
+    Takes the place of JobRunner. Blocks until the test lets it go.
+    """
+    started = []
+    release = threading.Event()
+
+    def __init__(self, client_info, job, message_q, command_q, build_key, pre_step=None, post_step=None):
+        self.client_info = client_info
+        self.job = job
+        self.message_q = message_q
+        self.stopped = False
+        self.canceled = False
+        self.error = False
+        self.job_killed = False
+
+    def run_job(self, fail=False):
+        FakeRunner.started.append((self.client_info["client_name"], self.job["job_id"], fail))
+        FakeRunner.release.wait(10)
+        self.message_q.put({"server": self.client_info["server"],
+            "job_id": self.job["job_id"],
+            "url": "url",
+            "payload": {"message": "done"}})
+
+class Tests(SimpleTestCase):
+    def setUp(self):
+        FakeRunner.started = []
+        FakeRunner.release = threading.Event()
+        self.client_info = utils.default_client_info()
+        self.client_info["environment"] = {"BUILD_ROOT": "/foo/bar"}
+        self.client_info["slots"] = 2
+
+    def test_num_slots(self):
+        self.assertEqual(JobSlots.num_slots(3), 3)
+        with patch.object(JobSlots, "available_cpus", return_value=16), \
+                patch.object(JobSlots, "available_memory", return_value=64.0):
+            self.assertEqual(JobSlots.num_slots(0, 4), 4)
+            self.assertEqual(JobSlots.num_slots(0, 4, 32), 2)
+            self.assertEqual(JobSlots.num_slots(0, 32), 1)
+            self.assertEqual(JobSlots.num_slots(0), 16)
+        with patch.object(JobSlots, "available_cpus", return_value=16), \
+                patch.object(JobSlots, "available_memory", return_value=None):
+            self.assertEqual(JobSlots.num_slots(0, 4, 32), 4)
+
+    def test_slot_client_info(self):
+        with patch.object(JobSlots, "available_cpus", return_value=16):
+            info = JobSlots.slot_client_info(self.client_info, 1, 4)
+        self.assertEqual(info["client_name"], "client_name_1")
+        self.assertEqual(info["environment"]["BUILD_ROOT"], "/foo/bar_1")
+        self.assertEqual(info["environment"]["CIVET_CLIENT_NAME"], "client_name_1")
+        self.assertEqual(info["environment"]["CIVET_SLOT"], "1")
+        self.assertEqual(info["environment"]["CIVET_NUM_SLOTS"], "4")
+        self.assertEqual(info["environment"]["CIVET_SLOT_CPUS"], "4")
+        # The client info of the client isn't changed
+        self.assertEqual(self.client_info["client_name"], "client_name")
+        self.assertEqual(self.client_info["environment"], {"BUILD_ROOT": "/foo/bar"})
+
+        self.client_info["slot_cpus"] = 2
+        info = JobSlots.slot_client_info(self.client_info, 0, 4)
+        self.assertEqual(info["environment"]["CIVET_SLOT_CPUS"], "2")
+
+    def read_q(self, q):
+        items = []
+        try:
+            while True:
+                items.append(q.get(block=False))
+        except Empty:
+            return items
+
+    def test_command_router(self):
+        router = JobSlots.CommandRouter()
+        q0 = Queue()
+        q1 = Queue()
+        router.add_job("server", 1, q0)
+        router.add_job("server", 2, q1)
+        router.put({"server": "server", "job_id": 2, "command": "cancel"})
+        # Not running
+        router.put({"server": "other", "job_id": 1, "command": "cancel"})
+        self.assertEqual(self.read_q(q0), [])
+        self.assertEqual(self.read_q(q1), [{"server": "server", "job_id": 2, "command": "cancel"}])
+        # From the cancel signal, goes to all of them
+        router.put({"command": "cancel"})
+        self.assertEqual(self.read_q(q0), [{"command": "cancel"}])
+        self.assertEqual(self.read_q(q1), [{"command": "cancel"}])
+        router.remove_job("server", 1)
+        router.put({"server": "server", "job_id": 1, "command": "stop"})
+        self.assertEqual(self.read_q(q0), [])
+
+    def test_join_job(self):
+        q = JobMessageQueue()
+        msg0 = {"server": "server", "job_id": 1}
+        msg1 = {"server": "server", "job_id": 2}
+        q.put(msg0)
+        q.put(msg1)
+        q.put(msg1)
+        self.assertFalse(q.join_job("server", 1, 0.01))
+        q.message_done(q.get())
+        self.assertTrue(q.join_job("server", 1, 0.01))
+        self.assertFalse(q.join_job("server", 2, 0.01))
+        q.message_done(q.get())
+        q.message_done(q.get())
+        self.assertTrue(q.join_job("server", 2, 0.01))
+        self.assertEqual(q.unfinished_tasks, 0)
+
+    def claimed(self, job_id):
+        return {"job_info": utils.create_job_dict(pk=job_id), "build_key": 1234}
+
+    @patch.object(requests.Session, 'post')
+    @patch.object(JobSlots, "JobRunner", FakeRunner)
+    def test_run_job(self, mock_post):
+        mock_post.return_value = test_utils.Response({"status": "OK"})
+        slots = JobSlots.JobSlots(self.client_info)
+        slots.updater.client_info["server_update_timeout"] = 0.1
+        slots.start()
+        before = []
+        after = []
+        try:
+            self.assertEqual(len(slots.free_slots()), 2)
+            for slot, job_id in zip(slots.free_slots(), [1, 2]):
+                slot.client_info["server"] = "server"
+                slots.run_job(slot, "server", self.claimed(job_id),
+                        before=lambda s: before.append(s.index) or s.index == 1,
+                        after=lambda s, runner: after.append((s.index, runner.job["job_id"])))
+            self.assertEqual(slots.free_slots(), [])
+            self.assertEqual(slots.running(), 2)
+            self.assertFalse(slots.wait_for_free_slot(0.01))
+        finally:
+            FakeRunner.release.set()
+            self.assertTrue(slots.wait_for_free_slot(10))
+            slots.stop()
+
+        self.assertEqual(sorted(FakeRunner.started), [("client_name_0", 1, False), ("client_name_1", 2, True)])
+        self.assertEqual(sorted(before), [0, 1])
+        self.assertEqual(sorted(after), [(0, 1), (1, 2)])
+        self.assertEqual(len(slots.free_slots()), 2)
+        self.assertEqual(slots.jobs_ran, 2)
+        self.assertEqual(slots.message_q.unfinished_tasks, 0)
+        self.assertFalse(slots.updater_thread.is_alive())
+        self.assertEqual(mock_post.call_count, 2)
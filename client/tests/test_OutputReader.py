@@ -0,0 +1,115 @@
+
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.test import SimpleTestCase
+from client import OutputReader
+import subprocess
+import time
+
+class Tests(SimpleTestCase):
+    def create_process(self, script):
+        return subprocess.Popen(['/bin/bash', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def read_all(self, reader, timeout=5):
+        output = b""
+        end = time.time() + timeout
+        while not reader.eof and time.time() < end:
+            output += reader.read(1)
+        return output
+
+    def check_reader(self, reader_class):
+        proc = self.create_process("for i in $(seq 10000); do echo line $i; done")
+        reader = reader_class(proc.stdout)
+        output = self.read_all(reader)
+        proc.wait()
+        self.assertTrue(reader.eof)
+        lines = output.decode("utf-8").splitlines()
+        self.assertEqual(len(lines), 10000)
+        self.assertEqual(lines[0], "line 1")
+        self.assertEqual(lines[-1], "line 10000")
+        self.assertEqual(reader.read(1), b"")
+        proc.stdout.close()
+
+        # No output, it just times out
+        proc = self.create_process("sleep 2")
+        reader = reader_class(proc.stdout)
+        start = time.time()
+        self.assertEqual(reader.read(0.2), b"")
+        self.assertLess(time.time() - start, 1.5)
+        self.assertFalse(reader.eof)
+        reader.close()
+        self.assertTrue(reader.eof)
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+    def test_pipe_reader(self):
+        self.check_reader(OutputReader.PipeReader)
+
+    def test_threaded_pipe_reader(self):
+        self.check_reader(OutputReader.ThreadedPipeReader)
+
+    def test_threaded_pipe_reader_large(self):
+        # All the output is queued up before the first read
+        size = 3*OutputReader.MAX_READ_SIZE + 100
+        proc = self.create_process("head -c %s /dev/zero" % size)
+        reader = OutputReader.ThreadedPipeReader(proc.stdout)
+        reader._thread.join(5)
+        self.assertFalse(reader._thread.is_alive())
+        proc.wait()
+        output = reader.read(1)
+        self.assertGreaterEqual(len(output), OutputReader.MAX_READ_SIZE)
+        self.assertLess(len(output), OutputReader.MAX_READ_SIZE + OutputReader.CHUNK_SIZE)
+        self.assertFalse(reader.eof)
+        output += self.read_all(reader)
+        self.assertEqual(len(output), size)
+        self.assertTrue(reader.eof)
+        proc.stdout.close()
+
+    def test_output_buffer(self):
+        buf = OutputReader.OutputBuffer(20)
+        buf.append(b"12345\n")
+        buf.append(b"abc")
+        self.assertFalse(buf.head_full)
+        self.assertEqual(buf.get_head(), "12345\nabc")
+        self.assertEqual(buf.get_tail(), "")
+
+        # The line that goes over half is kept in the first part
+        buf.append(b"defg\nhij\n")
+        self.assertTrue(buf.head_full)
+        self.assertEqual(buf.get_head(), "12345\nabcdefg\n")
+        self.assertEqual(buf.get_tail(), "hij\n")
+        self.assertFalse(buf.trimmed)
+
+        # Old output in the second part gets dropped, up to the next full line
+        buf.append(b"klm\n")
+        buf.append(b"nopq\n")
+        self.assertTrue(buf.trimmed)
+        self.assertEqual(buf.tail_size, 20 - len(buf.head))
+        self.assertEqual(buf.get_head(), "12345\nabcdefg\n")
+        self.assertEqual(buf.get_tail(), "nopq\n")
+
+        # A lot of output at once
+        buf.append(b"x\n"*1000)
+        self.assertEqual(buf.tail_size, 6)
+        self.assertEqual(len(buf.tail), 1)
+        self.assertEqual(buf.get_tail(), "x\nx\n")
+
+        # No newline in the first part
+        buf = OutputReader.OutputBuffer(10)
+        buf.append(("é"*20).encode("utf-8"))
+        self.assertTrue(buf.head_full)
+        self.assertEqual(buf.get_head(), "é"*2 + "�")
+        self.assertEqual(len(buf.head) + buf.tail_size, 10)
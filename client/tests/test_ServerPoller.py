@@ -0,0 +1,107 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase
+from mock import patch
+from client import ServerPoller, BaseClient
+from client.JobGetter import JobGetter
+from client.tests import utils
+import threading
+
+BaseClient.setup_logger()
+
+class Tests(SimpleTestCase):
+    def client_info(self, server):
+        info = utils.default_client_info()
+        info["server"] = server
+        return info
+
+    def test_health(self):
+        health = ServerPoller.ServerHealth("server")
+        self.assertTrue(health.due(0))
+        health.failed(100)
+        self.assertFalse(health.due(100 + ServerPoller.BACKOFF_START - 1))
+        self.assertTrue(health.due(100 + ServerPoller.BACKOFF_START))
+        health.failed(100)
+        self.assertEqual(health.next_poll, 100 + 2*ServerPoller.BACKOFF_START)
+        for i in range(20):
+            health.failed(100)
+        self.assertEqual(health.next_poll, 100 + ServerPoller.BACKOFF_MAX)
+        health.succeeded()
+        self.assertEqual(health.failures, 0)
+        self.assertTrue(health.due(0))
+
+    def test_poll(self):
+        poller = ServerPoller.ServerPoller()
+        polled = threading.Barrier(3, timeout=10)
+
+        def get_job(getter):
+            # All the servers are polled at the same time
+            polled.wait()
+            server = getter.client_info["server"]
+            getter.failed = server == "down"
+            if server == "error":
+                raise Exception("oh no!")
+            if server in ["down", "none"]:
+                return None
+            return {"server": server}
+
+        try:
+            with patch.object(JobGetter, "get_job", autospec=True, side_effect=get_job):
+                claims = poller.poll([self.client_info(s) for s in ["down", "none", "up"]])
+                self.assertEqual(claims, [None, None, {"server": "up"}])
+                polled = threading.Barrier(1, timeout=10)
+                self.assertEqual(poller.poll([self.client_info("error")]), [None])
+        finally:
+            poller.shutdown()
+
+        self.assertEqual(poller.get_health("down").failures, 1)
+        self.assertEqual(poller.get_health("error").failures, 1)
+        self.assertEqual(poller.get_health("none").failures, 0)
+        self.assertEqual(poller.get_health("up").failures, 0)
+        servers = [("down", [1], False), ("error", [1], False), ("none", [1], False), ("up", [1], False)]
+        self.assertEqual(poller.due_servers(servers), servers[2:])
+
+    def test_claim_first(self):
+        poller = ServerPoller.ServerPoller()
+        polled = []
+
+        def get_job(getter):
+            server = getter.client_info["server"]
+            polled.append((server, getter.client_info.get("long_poll")))
+            getter.failed = server == "down"
+            if server in ["down", "none"]:
+                return None
+            return {"server": server}
+
+        try:
+            with patch.object(JobGetter, "get_job", autospec=True, side_effect=get_job):
+                infos = [self.client_info(s) for s in ["down", "none", "up", "up2"]]
+                for info in infos:
+                    info["long_poll"] = 10
+                # Stops at the first job, so only one gets claimed
+                self.assertEqual(poller.claim_first(infos), (2, {"server": "up"}))
+                self.assertEqual(polled, [("down", 0), ("none", 0), ("up", 0)])
+
+                # Only the last one waits for a job
+                polled.clear()
+                self.assertEqual(poller.claim_first(infos[:2]), (None, None))
+                self.assertEqual(polled, [("down", 0), ("none", 10)])
+                self.assertEqual(infos[0]["long_poll"], 10)
+                self.assertEqual(poller.claim_first([]), (None, None))
+        finally:
+            poller.shutdown()
+        self.assertEqual(poller.get_health("down").failures, 2)
+        self.assertEqual(poller.get_health("none").failures, 0)
@@ -0,0 +1,73 @@
+# Copyright 2016-2025 Battelle Energy Alliance, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals, absolute_import
+from django.test import SimpleTestCase
+from client import ServerSession
+from mock import patch
+import requests
+import gzip
+
+class Tests(SimpleTestCase):
+    def tearDown(self):
+        ServerSession.close_sessions()
+
+    def test_get_session(self):
+        s0 = ServerSession.get_session("https://server0/client/get_job/")
+        s1 = ServerSession.get_session("https://server0/client/update_step_result/1/2/3/")
+        self.assertIs(s0, s1)
+        self.assertIsInstance(s0, requests.Session)
+
+        # different port is a different server
+        s2 = ServerSession.get_session("https://server0:8443/client/get_job/")
+        self.assertIsNot(s0, s2)
+        s3 = ServerSession.get_session("http://server0/client/get_job/")
+        self.assertIsNot(s0, s3)
+
+        adapter = s0.get_adapter("https://server0/")
+        self.assertEqual(adapter.max_retries.total, ServerSession.RETRY_TOTAL)
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertEqual(list(adapter.max_retries.status_forcelist), [503])
+
+        ServerSession.close_sessions()
+        self.assertIsNot(s0, ServerSession.get_session("https://server0/client/get_job/"))
+
+    def test_compress(self):
+        headers = {"User-Agent": "agent"}
+        data, new_headers = ServerSession.compress("small", headers)
+        self.assertEqual(data, b"small")
+        self.assertEqual(new_headers, headers)
+
+        big = "x" * ServerSession.COMPRESS_MIN_SIZE
+        data, new_headers = ServerSession.compress(big, headers)
+        self.assertLess(len(data), len(big))
+        self.assertEqual(gzip.decompress(data), big.encode("utf-8"))
+        self.assertEqual(new_headers["Content-Encoding"], "gzip")
+        self.assertEqual(new_headers["User-Agent"], "agent")
+        # The passed in headers aren't changed
+        self.assertNotIn("Content-Encoding", headers)
+
+    @patch.object(requests.Session, 'post')
+    def test_post(self, mock_post):
+        ServerSession.post("https://server0/url", "data", headers={"h": "v"}, verify=False, timeout=5)
+        self.assertEqual(mock_post.call_count, 1)
+        args, kwargs = mock_post.call_args
+        self.assertEqual(args, ("https://server0/url", b"data"))
+        self.assertEqual(kwargs, {"headers": {"h": "v"}, "verify": False, "timeout": 5})
+
+        big = "x" * ServerSession.COMPRESS_MIN_SIZE
+        ServerSession.post("https://server0/url", big)
+        args, kwargs = mock_post.call_args
+        self.assertEqual(gzip.decompress(args[1]), big.encode("utf-8"))
+        self.assertEqual(kwargs["headers"], {"Content-Encoding": "gzip"})
@@ -17,7 +17,7 @@ from __future__ import unicode_literals, absolute_import
 from django.test import SimpleTestCase
 from django.test import override_settings
 from ci.tests import utils as test_utils
-import requests, time
+import requests, time, json
 from client import ServerUpdater, BaseClient
 from client.tests import utils
 from mock import patch
@@ -39,7 +39,7 @@ class Tests(SimpleTestCase):
         self.thread = None
         self.updater = None
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     @patch.object(requests, 'get')
     def tearDown(self, mock_get, mock_post):
         if self.thread:
@@ -63,7 +63,7 @@ class Tests(SimpleTestCase):
         self.assertEqual(updater.messages, [])
         return updater
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_run(self, mock_post):
         u = self.create_updater()
         u.client_info["server_update_timeout"] = 1
@@ -106,7 +106,7 @@ class Tests(SimpleTestCase):
         u.update_server_message("bad_server", msg)
         self.assertEqual(u.servers.get("bad_server", None), None)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_read_queue(self, mock_post):
         u = self.create_updater()
         server = u.client_info["servers"][0]
@@ -130,7 +130,7 @@ class Tests(SimpleTestCase):
         u.read_queue()
         return items
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_ok(self, mock_post):
         u = self.create_updater()
         mock_post.return_value = test_utils.Response({"status": "OK"})
@@ -142,29 +142,37 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, [])
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_400(self, mock_post):
         u = self.create_updater()
         # got the stop signal
         self.load_messages(u)
         response_data = {"status": "OK"}
-        mock_post.side_effect = [test_utils.Response(response_data), test_utils.Response(response_data, status_code=400)]
+        mock_post.side_effect = [test_utils.Response(response_data),
+                test_utils.Response(response_data, status_code=400),
+                test_utils.Response(response_data)]
         u.send_messages()
         self.assertEqual(u.messages, [])
-        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(u.message_q.unfinished_tasks, 0)
+        # The message of the other job still gets sent
+        self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_413(self, mock_post):
         u = self.create_updater()
         # got the stop signal
         self.load_messages(u)
         response_data = {"status": "OK"}
-        mock_post.side_effect = [test_utils.Response(response_data), test_utils.Response(response_data, status_code=413)]
+        mock_post.side_effect = [test_utils.Response(response_data),
+                test_utils.Response(response_data, status_code=413),
+                test_utils.Response(response_data)]
         u.send_messages()
         self.assertEqual(u.messages, [])
-        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(u.message_q.unfinished_tasks, 0)
+        # The message of the other job still gets sent
+        self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_500(self, mock_post):
         u = self.create_updater()
         mock_post.return_value = test_utils.Response({"status": "OK"}, status_code=500)
@@ -176,7 +184,7 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, [])
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_cancel(self, mock_post):
         u = self.create_updater()
         # got the cancel signal
@@ -187,7 +195,7 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, [])
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_bad_first(self, mock_post):
         u = self.create_updater()
         # server not responding on first response
@@ -199,7 +207,7 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, items)
         self.assertEqual(mock_post.call_count, 1)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_bad_last(self, mock_post):
         u = self.create_updater()
         # server not responding on last response
@@ -213,7 +221,7 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, items[2:])
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_invalid_json(self, mock_post):
         u = self.create_updater()
         # server not responding correctly
@@ -225,7 +233,7 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, [])
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_send_messages_invalid(self, mock_post):
         u = self.create_updater()
         # server not responding correctly
@@ -238,7 +246,93 @@ class Tests(SimpleTestCase):
         self.assertEqual(u.messages, [])
         self.assertEqual(mock_post.call_count, 3)
 
-    @patch.object(requests, 'post')
+    def create_update(self, u, update_type, stepresult_id, output=None, complete=False, job_id=1):
+        payload = {"output": output, "complete": complete}
+        return {"server": u.main_server,
+                "job_id": job_id,
+                "url": "%s/client/%s/" % (u.main_server, update_type),
+                "type": update_type,
+                "build_key": 123,
+                "stepresult_id": stepresult_id,
+                "payload": payload,
+                }
+
+    def test_coalesce_updates(self):
+        u = self.create_updater()
+        messages = [self.create_update(u, "start_step_result", 1, ""),
+                self.create_update(u, "update_step_result", 1, "a"),
+                self.create_update(u, "update_step_result", 1, b"b"),
+                self.create_update(u, "complete_step_result", 1, "c", complete=False),
+                self.create_update(u, "start_step_result", 2, ""),
+                self.create_update(u, "update_step_result", 2, "d"),
+                self.create_update(u, "complete_step_result", 2, "all output", complete=True),
+                self.create_update(u, "job_finished", None),
+                ]
+        updates = u.coalesce_updates(messages)
+        self.assertEqual([(up["type"], up["stepresult_id"], up["data"]["output"]) for up in updates],
+                [("start_step_result", 1, ""),
+                ("complete_step_result", 1, "abc"),
+                ("start_step_result", 2, ""),
+                ("complete_step_result", 2, "all output"),
+                ("job_finished", None, None),
+                ])
+        # The messages aren't changed
+        self.assertEqual(messages[1]["payload"]["output"], "a")
+
+    @patch.object(requests.Session, 'post')
+    def test_send_messages_batch(self, mock_post):
+        u = self.create_updater()
+        mock_post.return_value = test_utils.Response({"status": "OK", "command": None})
+        items = [self.create_update(u, "start_step_result", 1, ""),
+                self.create_update(u, "update_step_result", 1, "a"),
+                self.create_update(u, "update_step_result", 1, "b"),
+                self.create_update(u, "update_step_result", 1, "c", job_id=2),
+                {"server": u.main_server, "job_id": 2, "url": "url", "payload": {"message": "message"}},
+                ]
+        for item in items:
+            u.message_q.put(item)
+        u.read_queue()
+        u.send_messages()
+        self.assertEqual(u.messages, [])
+        self.assertEqual(u.message_q.unfinished_tasks, 0)
+        # Once for each job and once for the message that can't be batched
+        self.assertEqual(mock_post.call_count, 3)
+        url = mock_post.call_args_list[0][0][0]
+        self.assertEqual(url, "%s/client/batch_update/123/%s/1/" % (u.main_server, u.client_info["client_name"]))
+        data = json.loads(mock_post.call_args_list[0][0][1])
+        self.assertEqual(len(data["updates"]), 2)
+        self.assertEqual(data["updates"][1]["data"]["output"], "ab")
+        self.assertEqual(mock_post.call_args_list[2][0][0], "url")
+
+        # Got a cancel
+        mock_post.return_value = test_utils.Response({"status": "OK", "command": "cancel"})
+        u.message_q.put(items[0])
+        u.read_queue()
+        u.send_messages()
+        self.assertEqual(self.read_q(self.command_q), [{"server": u.main_server, "job_id": 1, "command": "cancel"}])
+
+        # Server not responding, keep the messages
+        mock_post.return_value = test_utils.Response({}, do_raise=True)
+        for item in items[:2]:
+            u.message_q.put(item)
+        u.read_queue()
+        u.send_messages()
+        self.assertEqual(u.messages, items[:2])
+
+        # Server doesn't know about batch updates, send them separately
+        mock_post.reset_mock()
+        mock_post.return_value = test_utils.Response({}, status_code=404)
+        u.send_messages()
+        self.assertEqual(u.batch_updates, False)
+        self.assertEqual(u.messages, items[:2])
+        mock_post.return_value = test_utils.Response({"status": "OK"})
+        u.send_messages()
+        self.assertEqual(u.messages, [])
+        self.assertEqual(u.message_q.unfinished_tasks, 0)
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(mock_post.call_args_list[1][0][0], items[0]["url"])
+
+    @patch.object(requests.Session, 'post')
     def test_ping_servers(self, mock_post):
         u = self.create_updater()
         mock_post.return_value = test_utils.Response({"not_empty": True})
@@ -255,7 +349,7 @@ class Tests(SimpleTestCase):
         u.ping_servers()
         self.assertEqual(mock_post.call_count, 2)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_ping_server(self, mock_post):
         u = self.create_updater()
         mock_post.return_value = test_utils.Response({"not_empty": True})
@@ -267,7 +361,7 @@ class Tests(SimpleTestCase):
         ret = u.ping_server("server", "message")
         self.assertEqual(ret, False)
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_post_json(self, mock_post):
         u = self.create_updater()
         in_data = {'foo': 'bar'}
@@ -288,7 +382,7 @@ class Tests(SimpleTestCase):
         ret = u.post_json(url, in_data)
         self.assertEqual(ret, {"status": "OK", "command": "stop"})
 
-    @patch.object(requests, 'post')
+    @patch.object(requests.Session, 'post')
     def test_bad_output(self, mock_post):
         u = self.create_updater()
         mock_post.return_value = test_utils.Response({"not_empty": True})
@@ -64,6 +64,7 @@ def default_client_info():
         "build_keys": [1234],
         "single_shot": "False",
         "poll": 30,
+        "long_poll": 0,
         "daemon_cmd": "",
         "request_timeout": 30,
         "update_step_time": 20,